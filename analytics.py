@@ -0,0 +1,219 @@
+"""analytics.py
+
+School-wide result statistics on columnar NumPy arrays.
+
+load() makes one pass over data["assignments"] and data["results"] and turns every result into
+a row of flat arrays: categorical codes for class, kind and CTF subtype (indices into the
+Frame's category lists), score in [0, 1], solved flag, attempts and time-to-solve in seconds.
+All reports are then group-by aggregations over those arrays (np.bincount for counts and sums,
+one lexsort for per-group percentiles), so nothing iterates over result dicts twice.
+
+Time-to-solve is submitted_at minus started_at (recorded when the student opens the task since
+this module exists) or, for older results, minus the assignment's open_at / created_at.
+"""
+
+from __future__ import annotations
+
+from datetime import datetime
+from typing import Any, Dict, List, Optional, Sequence
+
+import numpy as np
+
+KINDS = ["test", "ctf", "homework"]
+PCTS = (10, 50, 90)
+
+
+def _ts(s: Optional[str]) -> float:
+    if not s:
+        return np.nan
+    try:
+        return datetime.fromisoformat(s).timestamp()
+    except (TypeError, ValueError):
+        return np.nan
+
+
+class Frame:
+    """Results as parallel arrays; cls/kind/subtype are codes into classes/KINDS/subtypes."""
+
+    __slots__ = ("n", "cls", "kind", "subtype", "score", "solved", "attempts", "seconds", "classes", "subtypes")
+
+    def __init__(self, classes: List[str], subtypes: List[str], cls: np.ndarray, kind: np.ndarray,
+                 subtype: np.ndarray, score: np.ndarray, solved: np.ndarray, attempts: np.ndarray,
+                 seconds: np.ndarray):
+        self.classes, self.subtypes = classes, subtypes
+        self.cls, self.kind, self.subtype = cls, kind, subtype
+        self.score, self.solved, self.attempts, self.seconds = score, solved, attempts, seconds
+        self.n = len(score)
+
+
+def load(data: Dict[str, Any]) -> Frame:
+    """Columnar view of all results that belong to a known assignment."""
+    classes: Dict[str, int] = {}
+    subtypes: Dict[str, int] = {"-": 0}
+    # по заданию: индекс строки в a_* массивах, дальше результаты ссылаются на него
+    a_index: Dict[str, int] = {}
+    a_cls: List[int] = []
+    a_kind: List[int] = []
+    a_sub: List[int] = []
+    a_start: List[float] = []
+    ctf = data.get("ctf_tasks", {})
+    for aid, a in data.get("assignments", {}).items():
+        if not isinstance(a, dict) or a.get("kind") not in KINDS:
+            continue
+        sub = "-"
+        if a["kind"] == "ctf":
+            t = ctf.get(a.get("ref_id")) or {}
+            sub = f"{t.get('kind', '?')}/{t.get('subtype', '-')}"
+        a_index[aid] = len(a_cls)
+        a_cls.append(classes.setdefault(a.get("class_id") or "-", len(classes)))
+        a_kind.append(KINDS.index(a["kind"]))
+        a_sub.append(subtypes.setdefault(sub, len(subtypes)))
+        a_start.append(_ts(a.get("open_at") or a.get("created_at")))
+
+    rows: List[int] = []
+    score: List[float] = []
+    solved: List[bool] = []
+    attempts: List[int] = []
+    submitted: List[float] = []
+    started: List[float] = []
+    for r in data.get("results", {}).values():
+        if not isinstance(r, dict):
+            continue
+        i = a_index.get(r.get("assignment_id"))
+        if i is None:
+            continue
+        kind = r.get("kind")
+        if kind == "test":
+            top = r.get("total_questions") or 0
+            s = (r.get("correct_answers") or 0) / top if top else 0.0
+            ok = top > 0 and s == 1.0
+        elif kind == "ctf":
+            ok = bool(r.get("is_correct"))
+            s = float(ok)
+        else:
+            ok = bool(r.get("format_ok"))
+            s = float(ok)
+        rows.append(i)
+        score.append(s)
+        solved.append(ok)
+        attempts.append(int(r.get("attempts") or 1))
+        submitted.append(_ts(r.get("submitted_at")))
+        started.append(_ts(r.get("started_at")))
+
+    idx = np.array(rows, dtype=np.int64)
+    start = np.array(started, dtype=np.float64)
+    start = np.where(np.isnan(start), np.array(a_start, dtype=np.float64)[idx] if a_start else start, start)
+    seconds = np.array(submitted, dtype=np.float64) - start
+    seconds[seconds < 0] = np.nan
+    return Frame(
+        list(classes), list(subtypes),
+        np.array(a_cls, dtype=np.int32)[idx] if a_cls else np.zeros(0, np.int32),
+        np.array(a_kind, dtype=np.int8)[idx] if a_kind else np.zeros(0, np.int8),
+        np.array(a_sub, dtype=np.int32)[idx] if a_sub else np.zeros(0, np.int32),
+        np.array(score, dtype=np.float64), np.array(solved, dtype=bool),
+        np.array(attempts, dtype=np.int32), seconds,
+    )
+
+
+def group_stats(codes: np.ndarray, ncat: int, values: np.ndarray, pcts: Sequence[int] = PCTS) -> Dict[str, np.ndarray]:
+    """Per-category n, mean and percentiles (linear interpolation, like np.percentile) of values.
+
+    NaN values are ignored. Empty categories get n=0 and NaN statistics.
+    """
+    keep = ~np.isnan(values)
+    c, v = codes[keep], values[keep]
+    order = np.lexsort((v, c))
+    c, v = c[order], v[order]
+    n = np.bincount(c, minlength=ncat)[:ncat]
+    total = np.bincount(c, weights=v, minlength=ncat)[:ncat]
+    empty = n == 0
+    out = {"n": n, "mean": np.divide(total, n, out=np.full(ncat, np.nan), where=~empty)}
+    if not len(v):
+        for p in pcts:
+            out[f"p{p}"] = np.full(ncat, np.nan)
+        return out
+    start = np.concatenate(([0], np.cumsum(n)[:-1]))
+    last = np.clip(start + n - 1, 0, len(v) - 1)
+    for p in pcts:
+        pos = start + np.maximum(n - 1, 0) * (p / 100.0)
+        lo = np.clip(np.floor(pos).astype(np.int64), 0, len(v) - 1)
+        hi = np.minimum(lo + 1, last)
+        q = v[lo] + (v[hi] - v[lo]) * (pos - lo)
+        q[empty] = np.nan
+        out[f"p{p}"] = q
+    return out
+
+
+def solve_rate(codes: np.ndarray, ncat: int, solved: np.ndarray) -> np.ndarray:
+    n = np.bincount(codes, minlength=ncat)[:ncat]
+    ok = np.bincount(codes, weights=solved.astype(np.float64), minlength=ncat)[:ncat]
+    return np.divide(ok, n, out=np.full(ncat, np.nan), where=n > 0)
+
+
+def report(f: Frame) -> Dict[str, Any]:
+    """All aggregates the /analytics command shows, as plain numbers/lists."""
+    nk, nc, ns = len(KINDS), len(f.classes), len(f.subtypes)
+    by_kind = group_stats(f.kind, nk, f.score)
+    by_kind["solved"] = solve_rate(f.kind, nk, f.solved)
+    solved_secs = np.where(f.solved, f.seconds, np.nan)
+    by_kind_time = group_stats(f.kind, nk, solved_secs, (50, 90))
+
+    by_class = group_stats(f.cls, nc, f.score, ())
+    by_class["solved"] = solve_rate(f.cls, nc, f.solved)
+
+    is_ctf = f.kind == KINDS.index("ctf")
+    sc = f.subtype[is_ctf]
+    by_sub = group_stats(sc, ns, f.attempts[is_ctf].astype(np.float64), ())
+    by_sub["solved"] = solve_rate(sc, ns, f.solved[is_ctf])
+    by_sub_time = group_stats(sc, ns, solved_secs[is_ctf], (50,))
+
+    tests = f.score[f.kind == KINDS.index("test")]
+    hist = np.histogram(tests, bins=10, range=(0.0, 1.0))[0] if len(tests) else np.zeros(10, np.int64)
+    return {
+        "n": f.n,
+        "kinds": [{"kind": k, "n": int(by_kind["n"][i]), "mean": by_kind["mean"][i], "solved": by_kind["solved"][i],
+                   **{f"p{p}": by_kind[f"p{p}"][i] for p in PCTS},
+                   "t50": by_kind_time["p50"][i], "t90": by_kind_time["p90"][i]}
+                  for i, k in enumerate(KINDS) if by_kind["n"][i]],
+        "classes": [{"class_id": c, "n": int(by_class["n"][i]), "mean": by_class["mean"][i], "solved": by_class["solved"][i]}
+                    for i, c in enumerate(f.classes) if by_class["n"][i]],
+        "subtypes": [{"subtype": s, "n": int(by_sub["n"][i]), "solved": by_sub["solved"][i],
+                      "attempts": by_sub["mean"][i], "t50": by_sub_time["p50"][i]}
+                     for i, s in enumerate(f.subtypes) if by_sub["n"][i]],
+        "test_hist": [int(x) for x in hist],
+    }
+
+
+def _pct(x: float) -> str:
+    return "—" if np.isnan(x) else f"{x * 100:.0f}%"
+
+
+def _dur(sec: float) -> str:
+    if np.isnan(sec):
+        return "—"
+    if sec < 3600:
+        return f"{sec / 60:.0f}м"
+    if sec < 86400:
+        return f"{sec / 3600:.1f}ч"
+    return f"{sec / 86400:.1f}д"
+
+
+def render(rep: Dict[str, Any], class_names: Dict[str, str]) -> str:
+    lines = [f"Результатов: {rep['n']}", "", "По типам (балл p10/p50/p90, решено, время решения p50/p90):"]
+    for k in rep["kinds"]:
+        lines.append(f"  {k['kind']:<9}{k['n']:>8}  {_pct(k['p10'])}/{_pct(k['p50'])}/{_pct(k['p90'])}"
+                     f"  решено {_pct(k['solved'])}  {_dur(k['t50'])}/{_dur(k['t90'])}")
+    if rep["subtypes"]:
+        lines += ["", "CTF по подтипам (решено, попыток в среднем, время p50):"]
+        for s in sorted(rep["subtypes"], key=lambda s: -s["n"]):
+            lines.append(f"  {s['subtype']:<16}{s['n']:>7}  {_pct(s['solved'])}  {s['attempts']:.1f}  {_dur(s['t50'])}")
+    if rep["classes"]:
+        lines += ["", "Классы (средний балл, решено):"]
+        for c in sorted(rep["classes"], key=lambda c: -c["n"]):
+            lines.append(f"  {class_names.get(c['class_id'], c['class_id']):<16}{c['n']:>7}  {_pct(c['mean'])}  {_pct(c['solved'])}")
+    if sum(rep["test_hist"]):
+        top = max(rep["test_hist"])
+        lines += ["", "Распределение баллов за тесты:"]
+        for i, x in enumerate(rep["test_hist"]):
+            lines.append(f"  {i * 10:>3}-{i * 10 + 10:<3}% {'█' * round(20 * x / top):<20} {x}")
+    return "\n".join(lines)
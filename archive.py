@@ -0,0 +1,155 @@
+"""archive.py
+
+Cold storage for finished school terms.
+
+Closed assignments from before a cutoff, together with their results, are moved out of the hot
+data dict into one gzip-compressed JSON segment per term (<dir>/<term>.json.gz), described by a
+small manifest (<dir>/manifest.json: per term the file, counts and the submission date range).
+Terms are school-year halves: "2024-2025-1" is September–December 2024, "2024-2025-2" is
+January–August 2025. An assignment belongs to the term it was created in; its results go with it.
+"Closed" means what the bot's assignment_window_status() says: a due_at that has passed (here,
+before the cutoff). An assignment without a deadline (every test and CTF) is open for good and
+stays in the hot data, however old it is.
+
+Nothing in the archive is read on a normal load_data(). A report that asks for old terms calls
+load()/merged(), which decompress only those segments (and cache them until the file changes).
+Moving is idempotent: segments are merged by id and written atomically before the caller saves
+the trimmed hot data, so a crash in between leaves duplicates that the next run absorbs.
+"""
+
+from __future__ import annotations
+
+import gzip
+import json
+import os
+from datetime import datetime, timezone
+from typing import Any, Dict, Iterable, List, Optional, Tuple
+
+MANIFEST = "manifest.json"
+
+
+def _dt(s: Optional[str]) -> Optional[datetime]:
+    if not s:
+        return None
+    try:
+        d = datetime.fromisoformat(s)
+    except (TypeError, ValueError):
+        return None
+    return d if d.tzinfo else d.replace(tzinfo=timezone.utc)
+
+
+def term_of(d: datetime) -> str:
+    if d.month >= 9:
+        return f"{d.year}-{d.year + 1}-1"
+    return f"{d.year - 1}-{d.year}-2"
+
+
+def term_start(d: datetime) -> datetime:
+    """Start of the term containing d (1 September or 1 January, in d's timezone)."""
+    return d.replace(month=9 if d.month >= 9 else 1, day=1, hour=0, minute=0, second=0, microsecond=0)
+
+
+def _closed(a: Dict[str, Any], results: List[Dict[str, Any]], cutoff: datetime) -> bool:
+    created = _dt(a.get("created_at"))
+    if created is None or created >= cutoff:
+        return False
+    due = _dt(a.get("due_at"))
+    if due is None or due >= cutoff:
+        return False  # без дедлайна задание открыто всегда: ученик может быть посреди него
+    # сдачи после дедлайна (если их как-то приняли) держат задание в горячих данных
+    return all((_dt(r.get("submitted_at")) or cutoff) < cutoff for r in results)
+
+
+class Archive:
+    def __init__(self, root: str):
+        self.root = root
+        self._cache: Dict[str, Tuple[float, Dict[str, Any]]] = {}
+
+    def _path(self, name: str) -> str:
+        return os.path.join(self.root, name)
+
+    def manifest(self) -> Dict[str, Any]:
+        try:
+            with open(self._path(MANIFEST), "r", encoding="utf-8") as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return {"segments": {}}
+
+    def terms(self) -> List[str]:
+        return sorted(self.manifest().get("segments", {}))
+
+    def load(self, term: str) -> Dict[str, Any]:
+        """{"assignments": {...}, "results": {...}} of one archived term ({} parts if absent)."""
+        seg = self.manifest().get("segments", {}).get(term)
+        if not seg:
+            return {"assignments": {}, "results": {}}
+        path = self._path(seg["file"])
+        mtime = os.path.getmtime(path)
+        hit = self._cache.get(term)
+        if hit and hit[0] == mtime:
+            return hit[1]
+        with gzip.open(path, "rt", encoding="utf-8") as f:
+            part = json.load(f)
+        self._cache[term] = (mtime, part)
+        return part
+
+    def merged(self, data: Dict[str, Any], terms: Iterable[str]) -> Dict[str, Any]:
+        """Shallow copy of data with the given archived terms added back (for reports)."""
+        out = dict(data)
+        out["assignments"] = dict(data.get("assignments", {}))
+        out["results"] = dict(data.get("results", {}))
+        for term in terms:
+            part = self.load(term)
+            out["assignments"].update(part["assignments"])
+            out["results"].update(part["results"])
+        return out
+
+    def _write(self, term: str, part: Dict[str, Any]) -> Dict[str, Any]:
+        name = f"{term}.json.gz"
+        tmp = self._path(name + ".tmp")
+        with gzip.open(tmp, "wt", encoding="utf-8", compresslevel=6) as f:
+            json.dump(part, f, ensure_ascii=False)
+        os.replace(tmp, self._path(name))
+        self._cache.pop(term, None)
+        dates = [r.get("submitted_at") for r in part["results"].values() if r.get("submitted_at")]
+        return {"file": name, "assignments": len(part["assignments"]), "results": len(part["results"]),
+                "first": min(dates) if dates else None, "last": max(dates) if dates else None,
+                "bytes": os.path.getsize(self._path(name))}
+
+    def archive(self, data: Dict[str, Any], cutoff: datetime) -> Dict[str, List[Dict[str, Any]]]:
+        """Move closed assignments created before cutoff (and their results) out of data.
+
+        Returns term -> moved assignments. data is modified in place; save it afterwards.
+        """
+        by_aid: Dict[str, List[Tuple[str, Dict[str, Any]]]] = {}
+        for rid, r in data.get("results", {}).items():
+            if isinstance(r, dict) and r.get("assignment_id"):
+                by_aid.setdefault(r["assignment_id"], []).append((rid, r))
+        moving: Dict[str, List[str]] = {}
+        for aid, a in data.get("assignments", {}).items():
+            if isinstance(a, dict) and _closed(a, [r for _, r in by_aid.get(aid, [])], cutoff):
+                moving.setdefault(term_of(_dt(a["created_at"])), []).append(aid)
+        if not moving:
+            return {}
+        os.makedirs(self.root, exist_ok=True)
+        man = self.manifest()
+        moved: Dict[str, List[Dict[str, Any]]] = {}
+        for term, aids in sorted(moving.items()):
+            part = self.load(term)
+            part = {"assignments": dict(part["assignments"]), "results": dict(part["results"])}
+            for aid in aids:
+                part["assignments"][aid] = data["assignments"][aid]
+                part["results"].update(by_aid.get(aid, []))
+            man.setdefault("segments", {})[term] = self._write(term, part)
+            moved[term] = [data["assignments"][aid] for aid in aids]
+        # манифест пишем после сегментов: он ссылается только на уже записанные файлы
+        tmp = self._path(MANIFEST + ".tmp")
+        with open(tmp, "w", encoding="utf-8") as f:
+            json.dump(man, f, ensure_ascii=False, indent=2)
+        os.replace(tmp, self._path(MANIFEST))
+        for aids in moving.values():
+            for aid in aids:
+                for rid, _ in by_aid.get(aid, []):
+                    data["results"].pop(rid, None)
+                data["assignments"].pop(aid, None)
+        return moved
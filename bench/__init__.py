@@ -0,0 +1 @@
+"""Benchmarks for the bot. Run a module with `python -m bench.<name>`."""
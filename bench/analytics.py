@@ -0,0 +1,151 @@
+"""School-wide result statistics: dict/list-comprehension aggregation vs analytics.py.
+
+    python -m bench.analytics [--results 1000000] [--classes 60] [--assignments 3000]
+
+Generates a synthetic data dict shaped like bot_data.json (classes, tests, CTF tasks with
+crypto/web subtypes, assignments, results with submitted_at/started_at), then computes the
+per-kind, per-class and per-CTF-subtype numbers two ways: the way the results handlers do it
+(a comprehension over data["results"] per group, statistics on Python lists), and
+analytics.load() + analytics.report(). The numbers are checked to agree before timing.
+"""
+
+from __future__ import annotations
+
+import argparse
+import statistics
+import time
+from datetime import datetime, timedelta, timezone
+from typing import Any, Dict
+
+import numpy as np
+
+import analytics
+
+SUBTYPES = [("crypto", s) for s in ("obf", "caesar", "vig", "xor", "b64")] + [("web", s) for s in ("insecure", "sqli", "xss")]
+
+
+def synthetic(n_results: int, n_classes: int, n_assignments: int, seed: int = 0) -> Dict[str, Any]:
+    rng = np.random.default_rng(seed)
+    t0 = datetime(2025, 9, 1, tzinfo=timezone.utc)
+    data: Dict[str, Any] = {"classes": {}, "tests": {}, "ctf_tasks": {}, "assignments": {}, "results": {}}
+    for c in range(n_classes):
+        data["classes"][f"K{c}"] = {"id": f"K{c}", "name": f"{5 + c % 7}{'АБВГ'[c % 4]}-{c}"}
+    kinds = rng.choice(["test", "ctf", "homework"], n_assignments, p=[0.5, 0.35, 0.15])
+    for a, kind in enumerate(kinds):
+        aid, ref = f"A{a}", f"X{a}"
+        created = t0 + timedelta(hours=int(rng.integers(0, 24 * 240)))
+        if kind == "ctf":
+            k, s = SUBTYPES[int(rng.integers(len(SUBTYPES)))]
+            data["ctf_tasks"][ref] = {"id": ref, "kind": k, "subtype": s}
+        elif kind == "test":
+            data["tests"][ref] = {"id": ref, "questions": []}
+        data["assignments"][aid] = {"id": aid, "class_id": f"K{int(rng.integers(n_classes))}", "kind": str(kind),
+                                    "ref_id": ref, "created_at": created.isoformat()}
+    aids = list(data["assignments"])
+    pick = rng.integers(0, len(aids), n_results)
+    delay = rng.exponential(3600 * 6, n_results)
+    think = rng.exponential(900, n_results)
+    skill = rng.random(n_results)
+    for i in range(n_results):
+        a = data["assignments"][aids[pick[i]]]
+        sub = datetime.fromisoformat(a["created_at"]) + timedelta(seconds=float(delay[i]))
+        r: Dict[str, Any] = {"id": f"R{i}", "kind": a["kind"], "assignment_id": a["id"], "student_id": str(i % 5000),
+                             "submitted_at": sub.isoformat()}
+        if i % 2:
+            r["started_at"] = (sub - timedelta(seconds=float(think[i]))).isoformat()
+        if a["kind"] == "test":
+            r["total_questions"] = 10
+            r["correct_answers"] = int(min(10, round(skill[i] * 11)))
+        elif a["kind"] == "ctf":
+            r["is_correct"] = bool(skill[i] > 0.4)
+            r["attempts"] = 1 + int(skill[i] * 10) % 5
+        else:
+            r["format_ok"] = bool(skill[i] > 0.2)
+        data["results"][r["id"]] = r
+    return data
+
+
+def _secs(r: Dict[str, Any], a: Dict[str, Any]) -> float:
+    start = r.get("started_at") or a.get("open_at") or a.get("created_at")
+    return datetime.fromisoformat(r["submitted_at"]).timestamp() - datetime.fromisoformat(start).timestamp()
+
+
+def dict_report(data: Dict[str, Any]) -> Dict[str, Any]:
+    """The same numbers the way the handlers compute things: a comprehension per group."""
+    res, asg, ctf = data["results"], data["assignments"], data["ctf_tasks"]
+    out: Dict[str, Any] = {"kinds": {}, "classes": {}, "subtypes": {}}
+    for kind in analytics.KINDS:
+        rs = [r for r in res.values() if r.get("kind") == kind and r.get("assignment_id") in asg]
+        if not rs:
+            continue
+        if kind == "test":
+            sc = [r["correct_answers"] / r["total_questions"] for r in rs]
+            ok = [s == 1.0 for s in sc]
+        else:
+            ok = [bool(r.get("is_correct") if kind == "ctf" else r.get("format_ok")) for r in rs]
+            sc = [float(x) for x in ok]
+        t = [_secs(r, asg[r["assignment_id"]]) for r, o in zip(rs, ok) if o]
+        out["kinds"][kind] = (len(rs), statistics.fmean(sc), statistics.median(sc), sum(ok) / len(rs),
+                              statistics.median(t) if t else float("nan"))
+    for cid in data["classes"]:
+        allowed = {aid for aid, a in asg.items() if a.get("class_id") == cid}
+        rs = [r for r in res.values() if r.get("assignment_id") in allowed]
+        if rs:
+            sc = [r["correct_answers"] / r["total_questions"] if r["kind"] == "test"
+                  else float(bool(r.get("is_correct") if r["kind"] == "ctf" else r.get("format_ok"))) for r in rs]
+            out["classes"][cid] = (len(rs), statistics.fmean(sc))
+    for k, s in SUBTYPES:
+        allowed = {aid for aid, a in asg.items() if a.get("kind") == "ctf"
+                   and ctf.get(a.get("ref_id"), {}).get("kind") == k and ctf.get(a.get("ref_id"), {}).get("subtype") == s}
+        rs = [r for r in res.values() if r.get("assignment_id") in allowed]
+        if rs:
+            out["subtypes"][f"{k}/{s}"] = (len(rs), sum(1 for r in rs if r.get("is_correct")) / len(rs),
+                                           statistics.fmean(r["attempts"] for r in rs))
+    return out
+
+
+def check_same(a: Dict[str, Any], rep: Dict[str, Any]) -> None:
+    for k in rep["kinds"]:
+        n, mean, p50, solved, t50 = a["kinds"][k["kind"]]
+        assert n == k["n"] and np.allclose([mean, p50, solved, t50], [k["mean"], k["p50"], k["solved"], k["t50"]],
+                                           equal_nan=True), (k, a["kinds"][k["kind"]])
+    for c in rep["classes"]:
+        assert a["classes"][c["class_id"]][0] == c["n"] and np.isclose(a["classes"][c["class_id"]][1], c["mean"]), c
+    for s in rep["subtypes"]:
+        n, solved, att = a["subtypes"][s["subtype"]]
+        assert n == s["n"] and np.allclose([solved, att], [s["solved"], s["attempts"]]), s
+    assert len(a["kinds"]) == len(rep["kinds"]) and len(a["classes"]) == len(rep["classes"])
+    assert len(a["subtypes"]) == len(rep["subtypes"])
+
+
+def main() -> None:
+    ap = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    ap.add_argument("--results", type=int, default=1_000_000)
+    ap.add_argument("--classes", type=int, default=60)
+    ap.add_argument("--assignments", type=int, default=3000)
+    args = ap.parse_args()
+
+    t0 = time.perf_counter()
+    data = synthetic(args.results, args.classes, args.assignments)
+    print(f"generated {args.results} results in {time.perf_counter() - t0:.1f} s")
+
+    t0 = time.perf_counter()
+    base = dict_report(data)
+    t_dict = time.perf_counter() - t0
+
+    t0 = time.perf_counter()
+    frame = analytics.load(data)
+    t_load = time.perf_counter() - t0
+    t0 = time.perf_counter()
+    rep = analytics.report(frame)
+    t_report = time.perf_counter() - t0
+    check_same(base, rep)
+
+    print(f"{'dict comprehensions':<28}{t_dict:>9.2f} s")
+    print(f"{'analytics.load':<28}{t_load:>9.2f} s")
+    print(f"{'analytics.report':<28}{t_report * 1000:>9.1f} ms")
+    print(f"speedup (load + report): {t_dict / (t_load + t_report):.1f}x, report alone: {t_dict / t_report:.0f}x")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,128 @@
+"""Microbenchmark: new cipher engine vs the old per-character implementations.
+
+    python -m bench.ciphers [--repeat 5]
+
+Checks that caesar/vigenere/xor_hex produce identical output and that the noise
+ciphers keep the plaintext at the same positions, then prints timings for 1 KB – 1 MB.
+"""
+
+from __future__ import annotations
+
+import argparse
+import base64
+import random
+import re
+import string
+import time
+from typing import Callable, Tuple
+
+import ciphers
+
+SIZES = [1 << 10, 16 << 10, 256 << 10, 1 << 20]
+
+SAMPLE = ("Агент передал сообщение через старый канал связи, флаг lapin{s3cr3t_flag9} "
+          "спрятан в середине. The quick brown fox jumps over the lazy dog 0123456789. ")
+
+
+# --- старые реализации (как были в simple_bor_v7.py) ---
+
+def legacy_caesar(s: str, shift: int) -> str:
+    abc = string.ascii_lowercase + string.ascii_uppercase + string.digits
+    out = []
+    for ch in s:
+        if ch in abc:
+            out.append(abc[(abc.index(ch) + shift) % len(abc)])
+        else:
+            out.append(ch)
+    return "".join(out)
+
+
+def legacy_vigenere(s: str, key: str) -> str:
+    key = re.sub(r"[^a-z]", "", (key or "").lower()) or "key"
+    out = []; j = 0
+    for ch in s:
+        if ch.isalpha():
+            k = ord(key[j % len(key)]) - 97
+            base = 97 if ch.islower() else 65
+            out.append(chr((ord(ch) - base + k) % 26 + base)); j += 1
+        else:
+            out.append(ch)
+    return "".join(out)
+
+
+def legacy_xor_hex(s: str, key: str) -> str:
+    kb = (key or "k").encode()
+    b = s.encode()
+    return bytes([b[i] ^ kb[i % len(kb)] for i in range(len(b))]).hex()
+
+
+def legacy_obfuscate2(s: str) -> Tuple[str, str]:
+    noise = string.ascii_letters + string.digits
+    out = []
+    for ch in s:
+        out.append(ch); out.append(random.choice(noise))
+    return "".join(out), ""
+
+
+def legacy_base64_noise(s: str) -> Tuple[str, str]:
+    b64 = base64.b64encode(s.encode()).decode()
+    noise = string.ascii_letters + string.digits
+    out = []
+    for i, ch in enumerate(b64):
+        out.append(ch)
+        if (i + 1) % 5 == 0: out.append(random.choice(noise))
+    return "".join(out), ""
+
+
+def make_text(size: int) -> str:
+    return (SAMPLE * (size // len(SAMPLE) + 1))[:size]
+
+
+def best_of(fn: Callable[[], object], repeat: int) -> float:
+    best = float("inf")
+    for _ in range(repeat):
+        t0 = time.perf_counter()
+        fn()
+        best = min(best, time.perf_counter() - t0)
+    return best
+
+
+def check_equivalence(text: str) -> None:
+    assert ciphers.caesar(text, 17) == legacy_caesar(text, 17)
+    assert ciphers.caesar(text, -5) == legacy_caesar(text, -5)
+    assert ciphers.vigenere(text, "Key-x") == legacy_vigenere(text, "Key-x")
+    assert ciphers.xor_hex(text, "k3y0") == legacy_xor_hex(text, "k3y0")
+    obf, _ = ciphers.obfuscate2(text)
+    assert obf[0::2] == text and len(obf) == 2 * len(text)
+    b64, _ = ciphers.base64_noise(text)
+    plain_b64 = base64.b64encode(text.encode()).decode()
+    assert len(b64) == len(legacy_base64_noise(text)[0])
+    assert "".join(ch for i, ch in enumerate(b64) if (i + 1) % 6) == plain_b64
+
+
+def main() -> None:
+    ap = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    ap.add_argument("--repeat", type=int, default=5)
+    args = ap.parse_args()
+
+    check_equivalence(make_text(5000))
+    print("equivalence: ok")
+
+    cases = [
+        ("caesar", lambda t: legacy_caesar(t, 13), lambda t: ciphers.caesar(t, 13)),
+        ("vigenere", lambda t: legacy_vigenere(t, "lapin"), lambda t: ciphers.vigenere(t, "lapin")),
+        ("xor_hex", lambda t: legacy_xor_hex(t, "k3y0k3y0"), lambda t: ciphers.xor_hex(t, "k3y0k3y0")),
+        ("obfuscate2", legacy_obfuscate2, ciphers.obfuscate2),
+        ("base64_noise", legacy_base64_noise, ciphers.base64_noise),
+    ]
+    print(f"{'cipher':<14}{'size':>8}{'legacy ms':>12}{'new ms':>10}{'speedup':>10}")
+    for name, old, new in cases:
+        for size in SIZES:
+            text = make_text(size)
+            t_old = best_of(lambda: old(text), args.repeat)
+            t_new = best_of(lambda: new(text), args.repeat)
+            print(f"{name:<14}{size // 1024:>6} KB{t_old * 1e3:>12.2f}{t_new * 1e3:>10.2f}{t_old / t_new:>9.1f}x")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,212 @@
+"""Seeded synthetic bot_data.json: teachers, classes, students, content, assignments, results.
+
+    python -m bench.dataset [--out bench_data.json] [--teachers 50] [--students 5000]
+                            [--assignments 2000] [--results 200000] [--seed 0]
+
+The records have the shapes the bot writes itself. Users have a registration profile.
+Classes have invites. Tests have 4-option questions, CTF tasks are crypto tasks with real
+challenges from ciphers.py, and homeworks have a format regex. Assignments carry the fields
+make_assignment() sets. A test result stores its answers and wrong_answers, and a CTF
+result stores its attempts. Derived keys (gradebooks, item_stats, invite_index) are built
+with the same functions ensure() uses, so loading the file does no backfill work. Every
+student has at most one result per assignment, as in the bot. The same seed gives the same
+data, except for the noise in obf/b64 challenges, which ciphers.py draws from `secrets`.
+"""
+
+from __future__ import annotations
+
+import argparse
+import hashlib
+import json
+import random
+import string
+import time
+from datetime import datetime, timedelta, timezone
+from typing import Any, Dict, List
+
+import gradebook
+import item_stats
+from ciphers import encrypt_crypto
+
+FIRST = ["Анна", "Иван", "Мария", "Пётр", "Олег", "Ольга", "Дарья", "Егор", "Софья", "Максим", "Алиса", "Никита"]
+LAST = ["Иванов", "Смирнов", "Кузнецов", "Попов", "Васильев", "Петров", "Соколов", "Морозов", "Волков", "Лебедев"]
+TOPICS = ["Дроби", "Логарифмы", "Сети", "Криптография", "Алгоритмы", "Python", "Графы", "Системы счисления"]
+SUBTYPES = ["obf", "caesar", "vig", "xor", "b64"]
+T0 = datetime(2025, 9, 1, tzinfo=timezone.utc)
+
+
+def _id(rng: random.Random, prefix: str, taken: Dict[str, Any]) -> str:
+    while True:
+        i = prefix + "".join(rng.choices("0123456789", k=8))
+        if i not in taken:
+            return i
+
+
+def _iso(d: datetime) -> str:
+    return d.isoformat()
+
+
+def _meta(rng: random.Random, sub: str) -> Dict[str, Any]:
+    # как crypto_meta() в боте, но от своего rng
+    meta: Dict[str, Any] = {"max_attempts": 5}
+    if sub == "caesar":
+        meta["shift"] = rng.randint(3, 20)
+    elif sub == "vig":
+        meta["key"] = "".join(rng.choices(string.ascii_lowercase, k=6))
+    elif sub == "xor":
+        meta["key"] = "".join(rng.choices(string.ascii_lowercase + string.digits, k=8))
+    elif sub == "b64":
+        meta["rule"] = "remove_every_6th"
+    else:
+        meta["rule"] = "remove_every_2nd"
+    return meta
+
+
+def generate(teachers: int = 50, students: int = 5000, assignments: int = 2000, results: int = 200000,
+             classes_per_teacher: int = 1, seed: int = 0) -> Dict[str, Any]:
+    rng = random.Random(seed)
+    data: Dict[str, Any] = {k: {} for k in ("users", "classes", "tests", "ctf_tasks", "homeworks", "assignments", "results")}
+    data["ctf_fingerprints"] = []
+
+    def person(uid: str, role: str) -> Dict[str, Any]:
+        first, last = rng.choice(FIRST), rng.choice(LAST)
+        return {"role": role, "username": first, "profile": {"first_name": first, "last_name": last,
+                                                             "email": f"u{uid}@school.example"}}
+
+    tids: List[str] = []
+    for t in range(teachers):
+        uid = str(100000 + t)
+        data["users"][uid] = person(uid, "teacher")
+        tids.append(uid)
+
+    class_ids: List[str] = []
+    by_teacher: Dict[str, List[str]] = {t: [] for t in tids}
+    for t in tids:
+        for k in range(classes_per_teacher):
+            cid = _id(rng, "CL", data["classes"])
+            c = {"id": cid, "name": f"{rng.randint(5, 11)}{'АБВГ'[k % 4]}-{t[-2:]}", "teacher_id": t,
+                 "access_code": "".join(rng.choices("ABCDEFGHJKLMNPQRSTUVWXYZ23456789", k=6)),
+                 "created_at": _iso(T0 - timedelta(days=rng.randint(1, 30))), "invites": {}}
+            for _ in range(rng.randint(0, 5)):
+                code = "".join(rng.choices("ABCDEFGHJKLMNPQRSTUVWXYZ23456789", k=8))
+                c["invites"][code] = {"code": code, "expires_at": _iso(T0 + timedelta(days=rng.randint(-30, 300))),
+                                      "max_uses": rng.choice([1, 1, 30]), "uses": 0, "created_at": c["created_at"]}
+            data["classes"][cid] = c
+            class_ids.append(cid)
+            by_teacher[t].append(cid)
+
+    members: Dict[str, List[str]] = {cid: [] for cid in class_ids}
+    for s in range(students):
+        uid = str(1000000 + s)
+        u = person(uid, "student")
+        u["class_id"] = class_ids[s % len(class_ids)]
+        data["users"][uid] = u
+        members[u["class_id"]].append(uid)
+
+    content: Dict[str, List[tuple]] = {t: [] for t in tids}
+    for t in tids:
+        for _ in range(rng.randint(6, 14)):
+            tid = _id(rng, "T", data["tests"])
+            qs = [{"question": f"Вопрос {q + 1} по теме", "options": [f"вариант {o + 1}" for o in range(4)],
+                   "correct": rng.randrange(4), "explanation": "Потому что так."} for q in range(10)]
+            data["tests"][tid] = {"id": tid, "teacher_id": t, "topic": rng.choice(TOPICS), "difficulty": "medium",
+                                  "questions": qs, "created_at": _iso(T0 + timedelta(days=rng.randint(0, 200)))}
+            content[t].append(("test", tid))
+        for _ in range(rng.randint(3, 8)):
+            cid = _id(rng, "C", data["ctf_tasks"])
+            sub = rng.choice(SUBTYPES)
+            meta = _meta(rng, sub)
+            flag = f"lapin{{{rng.getrandbits(32):08x}}}"
+            plain = f"Секретное сообщение: флаг {flag} спрятан здесь."
+            chall, hint = encrypt_crypto(sub, plain, meta)
+            data["ctf_tasks"][cid] = {"id": cid, "teacher_id": t, "kind": "crypto", "subtype": sub, "title": f"Шифр {sub}",
+                                      "description": "Найдите флаг lapin{...} в восстановленном тексте.",
+                                      "challenge": chall, "instruction": hint, "expected_plain": flag,
+                                      "expected_hash": hashlib.sha256(flag.lower().encode("utf-8")).hexdigest(),  # sha(norm(flag))
+                                      "meta": meta, "difficulty": "medium",
+                                      "created_at": _iso(T0 + timedelta(days=rng.randint(0, 200)))}
+            content[t].append(("ctf", cid))
+        for _ in range(rng.randint(1, 5)):
+            hid = _id(rng, "H", data["homeworks"])
+            data["homeworks"][hid] = {"id": hid, "teacher_id": t, "title": f"ДЗ: {rng.choice(TOPICS)}",
+                                      "text": "Решите задачи 1–5.", "format_regex": r"\d+", "open_at": None, "due_at": None,
+                                      "created_at": _iso(T0 + timedelta(days=rng.randint(0, 200)))}
+            content[t].append(("homework", hid))
+
+    for _ in range(assignments):
+        t = rng.choice(tids)
+        kind, ref = rng.choice(content[t])
+        aid = _id(rng, "A", data["assignments"])
+        coll, field, prefix = {"test": ("tests", "topic", "Тест: "), "ctf": ("ctf_tasks", "title", "CTF: "),
+                               "homework": ("homeworks", "title", "ДЗ: ")}[kind]
+        created = T0 + timedelta(days=rng.randint(0, 240), minutes=rng.randint(0, 1439))
+        a = {"id": aid, "class_id": rng.choice(by_teacher[t]), "teacher_id": t, "kind": kind, "ref_id": ref,
+             "title": f"{prefix}{data[coll][ref].get(field, '')}", "created_at": _iso(created)}
+        if kind == "homework":
+            a.update({"open_at": None, "due_at": _iso(created + timedelta(days=7)), "remind_hours": [24, 1], "remind_sent": {}})
+        data["assignments"][aid] = a
+
+    # одна сдача на (задание, ученик): выбираем пары без повторов
+    aids = list(data["assignments"])
+    sizes = [len(members[data["assignments"][a]["class_id"]]) for a in aids]
+    offsets = [0]
+    for n in sizes:
+        offsets.append(offsets[-1] + n)
+    total = offsets[-1]
+    picks = sorted(rng.sample(range(total), min(results, total)))
+    ai = 0
+    for p in picks:
+        while offsets[ai + 1] <= p:
+            ai += 1
+        a = data["assignments"][aids[ai]]
+        sid = members[a["class_id"]][p - offsets[ai]]
+        skill = rng.random()
+        sub = datetime.fromisoformat(a["created_at"]) + timedelta(seconds=rng.expovariate(1 / (3600 * 20)))
+        rid = _id(rng, "R", data["results"])
+        r: Dict[str, Any] = {"id": rid, "kind": a["kind"], "assignment_id": a["id"], "student_id": sid,
+                             "student_name": data["users"][sid]["username"], "teacher_id": a["teacher_id"],
+                             "submitted_at": _iso(sub)}
+        if rng.random() < 0.7:
+            r["started_at"] = _iso(sub - timedelta(seconds=rng.expovariate(1 / 900)))
+        if a["kind"] == "test":
+            qs = data["tests"][a["ref_id"]]["questions"]
+            answers = [q["correct"] if rng.random() < 0.3 + 0.7 * skill else rng.randrange(4) for q in qs]
+            wrong = [{"question": q["question"], "user_answer": q["options"][x], "correct_answer": q["options"][q["correct"]],
+                      "explanation": q["explanation"]} for q, x in zip(qs, answers) if x != q["correct"]]
+            r.update({"test_id": a["ref_id"], "correct_answers": len(qs) - len(wrong), "total_questions": len(qs),
+                      "wrong_answers": wrong, "answers": answers})
+        elif a["kind"] == "ctf":
+            r.update({"task_id": a["ref_id"], "is_correct": skill > 0.35, "attempts": 1 + int((1 - skill) * 6)})
+        else:
+            r.update({"homework_id": a["ref_id"], "answer": str(rng.randint(1, 999)), "format_ok": True})
+        data["results"][rid] = r
+
+    data["gradebooks"] = gradebook.build(data)
+    data["item_stats"] = item_stats.build(data)
+    data["invite_index"] = {code: cid for cid, c in data["classes"].items() for code in c["invites"]}
+    return data
+
+
+def main() -> None:
+    ap = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    ap.add_argument("--out", default="bench_data.json")
+    ap.add_argument("--teachers", type=int, default=50)
+    ap.add_argument("--students", type=int, default=5000)
+    ap.add_argument("--assignments", type=int, default=2000)
+    ap.add_argument("--results", type=int, default=200000)
+    ap.add_argument("--classes-per-teacher", type=int, default=1)
+    ap.add_argument("--seed", type=int, default=0)
+    args = ap.parse_args()
+
+    t0 = time.perf_counter()
+    data = generate(args.teachers, args.students, args.assignments, args.results, args.classes_per_teacher, args.seed)
+    with open(args.out, "w", encoding="utf-8") as f:
+        json.dump(data, f, ensure_ascii=False, indent=2)
+    print(f"{args.out}: {len(data['users'])} users, {len(data['classes'])} classes, {len(data['assignments'])} assignments, "
+          f"{len(data['results'])} results ({time.perf_counter() - t0:.1f} s)")
+    if len(data["results"]) < args.results:
+        print(f"note: only {len(data['results'])} (assignment, student) pairs exist; raise --students or --assignments for more")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,420 @@
+"""End-to-end load test against a local fake Telegram Bot API.
+
+    python -m bench.fake_tg [--users 1000] [--mix register:1,test:2,ctf:1] [--mode polling|webhook]
+                            [--ramp 50] [--think-ms 1000] [--telegram-limits]
+
+FakeTelegram is an aiohttp server that speaks the part of the Bot API the bot uses: getMe,
+getUpdates (long polling with offsets), setWebhook/deleteWebhook, sendMessage, sendDocument,
+editMessageText, editMessageReplyMarkup and answerCallbackQuery. Any other method gets
+{"ok": true}. Updates from virtual users are served through getUpdates, or POSTed to the
+bot's webhook once it has called setWebhook. Everything the bot sends is routed to the
+virtual user who owns the chat.
+
+The harness generates a small school (bench.dataset, no results yet) and starts
+simple_bor_v7.py as a subprocess with TELEGRAM_API_URL pointing here. Then it starts `users`
+virtual users, `ramp` per second. Each one replays a script:
+  register  /start, role button, the five profile questions, a class access code;
+  test      "📚 Мои задания", pages until it finds a test, opens it, answers every question;
+  ctf       the same for a CTF task, then one wrong flag and the right one.
+A user waits for the bot's reply to each step and then "thinks" for think-ms before the next
+one. The reported latency runs from the moment an update is handed to the bot (queued for
+getUpdates, or POSTed) to the first message the bot sends back to that chat. By default the
+bot's global send limit is lifted (SEND_RATE), so the numbers show the bot and not Telegram's
+30 msg/s. --telegram-limits keeps that limit.
+"""
+
+from __future__ import annotations
+
+import argparse
+import asyncio
+import json
+import os
+import random
+import signal
+import sys
+import tempfile
+import time
+from collections import Counter, defaultdict, deque
+from typing import Any, Callable, Deque, Dict, List, Optional, Tuple
+from urllib.parse import parse_qsl
+
+import aiohttp
+from aiohttp import web
+
+from bench.dataset import generate
+from bench.webhook import free_port, pct, serve
+
+TOKEN = "123456:fake"
+SECRET = "fake-secret"
+BOT = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "simple_bor_v7.py")
+
+
+class Reply:
+    __slots__ = ("method", "text", "buttons", "message_id", "at")
+
+    def __init__(self, method: str, text: str, buttons: List[Tuple[str, str]], message_id: int, at: float):
+        self.method = method
+        self.text = text
+        self.buttons = buttons      # (текст, callback_data) инлайн-кнопок
+        self.message_id = message_id
+        self.at = at
+
+
+def _buttons(markup: Any) -> List[Tuple[str, str]]:
+    if isinstance(markup, str):
+        try:
+            markup = json.loads(markup)
+        except ValueError:
+            return []
+    if not isinstance(markup, dict):
+        return []
+    return [(b.get("text", ""), b.get("callback_data", "")) for row in markup.get("inline_keyboard", []) for b in row]
+
+
+class FakeTelegram:
+    def __init__(self, token: str = TOKEN):
+        self.token = token
+        self.calls: Counter = Counter()
+        self.chats: Dict[int, "asyncio.Queue[Reply]"] = {}
+        self.ready = asyncio.Event()        # бот начал поллинг или поставил вебхук
+        self.webhook: Optional[Tuple[str, str]] = None
+        self.delivery_errors = 0
+        self._pending: Deque[Dict[str, Any]] = deque()
+        self._arrived = asyncio.Event()
+        self._update_id = 0
+        self._message_id = 0
+        self._session: Optional[aiohttp.ClientSession] = None
+        self._tasks: set = set()
+
+    # --- сторона пользователей ---
+
+    def chat(self, chat_id: int) -> "asyncio.Queue[Reply]":
+        return self.chats.setdefault(chat_id, asyncio.Queue())
+
+    def next_message_id(self) -> int:
+        self._message_id += 1
+        return self._message_id
+
+    def push(self, update: Dict[str, Any]) -> float:
+        """Hand an update to the bot; returns the time it became available."""
+        self._update_id += 1
+        update["update_id"] = self._update_id
+        if self.webhook:
+            t = asyncio.ensure_future(self._post(update))
+            self._tasks.add(t)
+            t.add_done_callback(self._tasks.discard)
+        else:
+            self._pending.append(update)
+            self._arrived.set()
+        return time.perf_counter()
+
+    async def _post(self, update: Dict[str, Any]) -> None:
+        url, secret = self.webhook
+        if self._session is None:
+            self._session = aiohttp.ClientSession(connector=aiohttp.TCPConnector(limit=100))
+        try:
+            async with self._session.post(url, json=update, headers={"X-Telegram-Bot-Api-Secret-Token": secret}) as r:
+                if r.status != 200:
+                    self.delivery_errors += 1
+        except aiohttp.ClientError:
+            self.delivery_errors += 1
+
+    # --- сторона бота (HTTP) ---
+
+    async def _params(self, request: web.Request) -> Dict[str, Any]:
+        # async-клиент telebot шлёт параметры формой даже в GET; файлы — multipart
+        if request.content_type.startswith("multipart/"):
+            form = await request.post()
+            return {k: v for k, v in form.items() if isinstance(v, str)}
+        body = (await request.text()) if request.body_exists else ""
+        return {**request.query, **dict(parse_qsl(body))}
+
+    def _message(self, chat_id: int, text: str = "", message_id: Optional[int] = None) -> Dict[str, Any]:
+        return {"message_id": message_id or self.next_message_id(), "date": int(time.time()), "text": text,
+                "chat": {"id": chat_id, "type": "private"}, "from": {"id": 1, "is_bot": True, "first_name": "bot"}}
+
+    def _deliver(self, method: str, p: Dict[str, Any], message_id: Optional[int] = None) -> Dict[str, Any]:
+        chat_id = int(p.get("chat_id", 0))
+        msg = self._message(chat_id, p.get("text") or p.get("caption") or "", message_id)
+        self.chat(chat_id).put_nowait(Reply(method, msg["text"], _buttons(p.get("reply_markup")), msg["message_id"],
+                                            time.perf_counter()))
+        return msg
+
+    async def handle(self, request: web.Request) -> web.Response:
+        method = request.match_info["method"]
+        if request.match_info["token"] != self.token:
+            return web.json_response({"ok": False, "error_code": 401, "description": "Unauthorized"}, status=401)
+        self.calls[method] += 1
+        p = await self._params(request)
+        if method == "getUpdates":
+            return web.json_response({"ok": True, "result": await self._get_updates(p)})
+        if method == "getMe":
+            result: Any = {"id": 1, "is_bot": True, "first_name": "bot", "username": "fake_bot"}
+        elif method in ("sendMessage", "sendDocument"):
+            result = self._deliver(method, p)
+        elif method in ("editMessageText", "editMessageReplyMarkup"):
+            result = self._deliver(method, p, int(p.get("message_id", 0)) or None)
+        elif method == "setWebhook":
+            # remove_webhook() — это setWebhook с пустым url
+            self.webhook = (p["url"], p.get("secret_token", "")) if p.get("url") else None
+            if self.webhook:
+                self.ready.set()
+            result = True
+        else:
+            result = True       # answerCallbackQuery, deleteWebhook, setMyCommands, ...
+        return web.json_response({"ok": True, "result": result})
+
+    async def _get_updates(self, p: Dict[str, Any]) -> List[Dict[str, Any]]:
+        self.ready.set()
+        offset = int(p.get("offset", 0) or 0)
+        limit = int(p.get("limit", 100) or 100)
+        end = time.perf_counter() + float(p.get("timeout", 0) or 0)
+        while True:
+            while self._pending and self._pending[0]["update_id"] < offset:
+                self._pending.popleft()
+            if self._pending or time.perf_counter() >= end:
+                return [self._pending[i] for i in range(min(limit, len(self._pending)))]
+            self._arrived.clear()
+            try:
+                await asyncio.wait_for(self._arrived.wait(), end - time.perf_counter())
+            except asyncio.TimeoutError:
+                pass
+
+    def app(self) -> web.Application:
+        app = web.Application(client_max_size=64 * 2**20)
+        app.router.add_route("*", "/bot{token}/{method}", self.handle)
+        return app
+
+    async def close(self) -> None:
+        if self._session:
+            await self._session.close()
+
+
+class VirtualUser:
+    def __init__(self, tg: FakeTelegram, uid: int, timeout: float, stats: "Stats"):
+        self.tg, self.uid, self.timeout, self.stats = tg, uid, timeout, stats
+        self.inbox = tg.chat(uid)
+        self._user = {"id": uid, "is_bot": False, "first_name": f"U{uid}"}
+
+    async def _step(self, name: str, update: Dict[str, Any], expect: int) -> List[Reply]:
+        while not self.inbox.empty():
+            self.inbox.get_nowait()  # хвосты прошлого шага (лишние сообщения бота)
+        sent = self.tg.push(update)
+        replies: List[Reply] = []
+        try:
+            while len(replies) < expect:
+                replies.append(await asyncio.wait_for(self.inbox.get(), self.timeout))
+        except asyncio.TimeoutError:
+            self.stats.timeouts[name] += 1
+            raise
+        self.stats.lat[name].append((replies[0].at - sent) * 1000)
+        return replies
+
+    async def say(self, name: str, text: str, expect: int = 1) -> List[Reply]:
+        msg = self.tg._message(self.uid, text)
+        msg["from"] = self._user
+        if text.startswith("/"):
+            msg["entities"] = [{"type": "bot_command", "offset": 0, "length": len(text.split()[0])}]
+        return await self._step(name, {"message": msg}, expect)
+
+    async def press(self, name: str, data: str, on: Reply, expect: int = 1) -> List[Reply]:
+        cq = {"id": str(self.tg.next_message_id()), "from": self._user, "chat_instance": str(self.uid),
+              "data": data, "message": self.tg._message(self.uid, on.text, on.message_id)}
+        return await self._step(name, {"callback_query": cq}, expect)
+
+
+class Stats:
+    def __init__(self):
+        self.lat: Dict[str, List[float]] = defaultdict(list)
+        self.timeouts: Counter = Counter()
+        self.done: Counter = Counter()
+        self.skipped: Counter = Counter()
+        self.failed: Counter = Counter()
+
+
+async def find_task(vu: VirtualUser, prefix: str, think: Callable[[], Any]) -> Optional[Tuple[str, Reply]]:
+    """Open "Мои задания" and page until a button whose label starts with prefix."""
+    menu = (await vu.say("menu", "📚 Мои задания"))[0]
+    for _ in range(20):
+        for label, data in menu.buttons:
+            if label.startswith(prefix) and data.startswith("pk:st:"):
+                return data, menu
+        nxt = [d for label, d in menu.buttons if d.startswith("pg:st:n:")]
+        if not nxt:
+            return None
+        await think()
+        menu = (await vu.press("menu page", nxt[0], menu))[0]
+    return None
+
+
+async def script_register(vu: VirtualUser, ctx: Dict[str, Any], think: Callable[[], Any]) -> bool:
+    role = (await vu.say("/start", "/start"))[0]
+    await think()
+    await vu.press("role", "role_student", role)
+    for text in ("Иванов", "Иван", "-", "14", f"u{vu.uid}@school.example"):
+        await think()
+        await vu.say("registration", text)
+    await think()
+    return (await vu.say("class code", ctx["rng"].choice(ctx["codes"])))[0].text.startswith("✅")
+
+
+async def script_test(vu: VirtualUser, ctx: Dict[str, Any], think: Callable[[], Any]) -> Optional[bool]:
+    found = await find_task(vu, "Тест", think)
+    if not found:
+        return None
+    await think()
+    r = await vu.press("open test", found[0], found[1])
+    for _ in range(100):
+        if r[-1].text.startswith("✅ Готово"):
+            return True
+        await think()
+        r = await vu.say("answer", str(ctx["rng"].randint(1, 4)))
+    return False
+
+
+async def script_ctf(vu: VirtualUser, ctx: Dict[str, Any], think: Callable[[], Any]) -> Optional[bool]:
+    found = await find_task(vu, "CTF", think)
+    if not found:
+        return None
+    await think()
+    await vu.press("open ctf", found[0], found[1], expect=2)  # условие + код задачи
+    await think()
+    await vu.say("flag", "lapin{wrong}")
+    await think()
+    return (await vu.say("flag", ctx["flags"][found[0].split(":", 2)[2]]))[0].text.startswith("✅")
+
+
+SCRIPTS = {"register": script_register, "test": script_test, "ctf": script_ctf}
+
+
+def parse_mix(mix: str) -> List[str]:
+    out: List[str] = []
+    for part in mix.split(","):
+        name, _, w = part.partition(":")
+        if name not in SCRIPTS:
+            raise SystemExit(f"unknown script {name!r}; known: {', '.join(SCRIPTS)}")
+        out += [name] * int(w or 1)
+    return out
+
+
+def school(n_students: int, seed: int) -> Tuple[Dict[str, Any], Dict[str, Any]]:
+    data = generate(teachers=max(1, n_students // 100), students=max(1, n_students),
+                    assignments=max(20, n_students // 5), results=0, seed=seed)
+    ctx = {"codes": [c["access_code"] for c in data["classes"].values()],
+           "flags": {aid: data["ctf_tasks"][a["ref_id"]]["expected_plain"]
+                     for aid, a in data["assignments"].items() if a["kind"] == "ctf"},
+           "students": [int(u) for u, x in data["users"].items() if x["role"] == "student"]}
+    return data, ctx
+
+
+async def start_bot(tmp: str, api_port: int, mode: str, limits: bool) -> Tuple["asyncio.subprocess.Process", Any]:
+    env = dict(os.environ, BOT_TOKEN=TOKEN, TELEGRAM_API_URL=f"http://127.0.0.1:{api_port}",
+               DATA_FILE=os.path.join(tmp, "bot_data.json"), DATA_DIR="", STATE_FILE=os.path.join(tmp, "user_states.pkl"),
+               ARCHIVE_DIR=os.path.join(tmp, "archive"), YANDEX_API_KEY="", YANDEX_FOLDER_ID="", WEBHOOK_URL="")
+    if not limits:
+        env["SEND_RATE"] = "100000"
+    if mode == "webhook":
+        port = free_port()
+        env.update(WEBHOOK_URL=f"http://127.0.0.1:{port}", WEBHOOK_HOST="127.0.0.1", WEBHOOK_PORT=str(port),
+                   WEBHOOK_SECRET=SECRET)
+    log = open(os.path.join(tmp, "bot.log"), "wb")
+    proc = await asyncio.create_subprocess_exec(sys.executable, BOT, cwd=tmp, env=env, stdout=log, stderr=log)
+    return proc, log
+
+
+async def stop_bot(proc: "asyncio.subprocess.Process") -> None:
+    if proc.returncode is None:
+        proc.send_signal(signal.SIGINT)
+        try:
+            await asyncio.wait_for(proc.wait(), 20)
+        except asyncio.TimeoutError:
+            proc.kill()
+            await proc.wait()
+
+
+async def run(args: argparse.Namespace, tmp: str) -> None:
+    mix = parse_mix(args.mix)
+    kinds = [mix[i % len(mix)] for i in range(args.users)]
+    rng = random.Random(args.seed)
+    rng.shuffle(kinds)
+    data, ctx = school(sum(k != "register" for k in kinds), args.seed)
+    ctx["rng"] = rng
+    with open(os.path.join(tmp, "bot_data.json"), "w", encoding="utf-8") as f:
+        json.dump(data, f, ensure_ascii=False, indent=2)
+
+    tg = FakeTelegram()
+    port = free_port()
+    runner = await serve(tg.app(), port)
+    proc, log = await start_bot(tmp, port, args.mode, args.telegram_limits)
+    try:
+        try:
+            await asyncio.wait_for(tg.ready.wait(), 60)
+        except asyncio.TimeoutError:
+            raise SystemExit(f"bot did not start; see {os.path.join(tmp, 'bot.log')}:\n" + open(log.name, encoding="utf-8", errors="replace").read()[-2000:])
+        if args.mode == "webhook":
+            await asyncio.sleep(0.5)  # setWebhook вызывается после старта сервера — дадим ему подняться
+
+        stats = Stats()
+        students = iter(ctx["students"])
+
+        async def think() -> None:
+            if args.think_ms:
+                await asyncio.sleep(rng.uniform(0.5, 1.5) * args.think_ms / 1000)
+
+        async def one(i: int, kind: str) -> None:
+            await asyncio.sleep(i / args.ramp)
+            uid = 9_000_000 + i if kind == "register" else next(students)
+            vu = VirtualUser(tg, uid, args.timeout, stats)
+            try:
+                ok = await SCRIPTS[kind](vu, ctx, think)
+            except asyncio.TimeoutError:
+                ok = False
+            if ok is None:
+                stats.skipped[kind] += 1
+            elif ok:
+                stats.done[kind] += 1
+            else:
+                stats.failed[kind] += 1
+
+        t0 = time.perf_counter()
+        await asyncio.gather(*(one(i, k) for i, k in enumerate(kinds)))
+        wall = time.perf_counter() - t0
+    finally:
+        await stop_bot(proc)
+        log.close()
+        await tg.close()
+        await runner.cleanup()
+
+    all_lat = [x for xs in stats.lat.values() for x in xs]
+    sent = sum(tg.calls[m] for m in ("sendMessage", "sendDocument", "editMessageText", "editMessageReplyMarkup"))
+    print(f"mode {args.mode}, {args.users} users in {wall:.1f} s: {len(all_lat)} updates answered "
+          f"({len(all_lat) / wall:.0f}/s), {sent} messages from the bot ({sent / wall:.0f}/s)")
+    for kind in SCRIPTS:
+        if kinds.count(kind):
+            print(f"  {kind:<9} {kinds.count(kind):>6} users: {stats.done[kind]} done, {stats.failed[kind]} failed, "
+                  f"{stats.skipped[kind]} skipped (no such task in the class)")
+    print(f"{'step':<16}{'n':>8}{'p50 ms':>10}{'p90 ms':>10}{'p99 ms':>10}{'max ms':>10}{'timeouts':>10}")
+    for name, xs in list(stats.lat.items()) + [("all", all_lat)]:
+        print(f"{name:<16}{len(xs):>8}{pct(xs, 0.5):>10.1f}{pct(xs, 0.9):>10.1f}{pct(xs, 0.99):>10.1f}"
+              f"{max(xs, default=0):>10.1f}{(stats.timeouts[name] if name != 'all' else sum(stats.timeouts.values())):>10}")
+    if tg.delivery_errors:
+        print(f"webhook deliveries failed: {tg.delivery_errors}")
+
+
+def main() -> None:
+    ap = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    ap.add_argument("--users", type=int, default=1000)
+    ap.add_argument("--mix", default="register:1,test:2,ctf:1", help="script:weight,...")
+    ap.add_argument("--mode", choices=("polling", "webhook"), default="polling")
+    ap.add_argument("--ramp", type=float, default=50, help="virtual users started per second")
+    ap.add_argument("--think-ms", type=float, default=1000, help="mean pause between a reply and the next step")
+    ap.add_argument("--timeout", type=float, default=30, help="seconds to wait for a reply before giving up")
+    ap.add_argument("--telegram-limits", action="store_true", help="keep the bot's 30 msg/s global send limit")
+    ap.add_argument("--seed", type=int, default=0)
+    args = ap.parse_args()
+    with tempfile.TemporaryDirectory(prefix="bench-fake-tg-") as tmp:
+        asyncio.run(run(args, tmp))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,344 @@
+"""Local stand-in for the YandexGPT completion endpoint.
+
+    python -m bench.fake_yagpt serve [--port 8090] [--mode synthetic|replay|record] [--cassette yagpt.jsonl]
+                                     [--latency-ms 800] [--jitter 0.4] [--error-rate 0] [--truncate-rate 0]
+                                     [--duplicate-rate 0]
+    python -m bench.fake_yagpt check [--n 20] [same fault options]
+
+Point the bot (or ctf_yagpt_unique) at it with
+YANDEX_URL=http://127.0.0.1:8090/foundationModels/v1/completion. YANDEX_API_KEY and
+YANDEX_FOLDER_ID may be any non-empty values.
+
+Modes:
+  synthetic  answers are generated from the prompt. Tagged prompts (<TITLE>...</TITLE>) get
+             tagged blocks, prompts with a JSON spec ("title":str, ...) get that JSON object,
+             and the test prompt gets {"questions": [...]} with the requested count. The first
+             lapin{...} of the prompt is embedded exactly once, in PLAINTEXT/CODE (or the
+             plaintext/code field), so the callers' validators pass. Every answer differs.
+  record     requests are forwarded to --upstream (the real API, with the caller's
+             Authorization/x-folder-id) and appended to the cassette.
+  replay     answers come from the cassette. Lookup ignores nonce lines and the concrete flags,
+             so retries and new flags still hit; recorded flags are swapped for the new ones.
+             Other inputs (topic, cipher parameters) are part of the key.
+             Several recordings of one prompt are served round-robin. --on-miss decides what
+             an unknown prompt gets.
+
+Faults apply in every mode:
+  latency    log-normal, with the median at latency-ms;
+  errors     HTTP 429/500 with a Yandex-style error body;
+  truncation the answer is cut and marked ALTERNATIVE_STATUS_TRUNCATED_FINAL;
+  duplicates the previous answer to the same prompt is repeated, which exercises the
+             fingerprint/retry paths.
+GET /stats returns the counters.
+
+`check` starts the server in-process and runs the real generators against it: gen_test,
+gen_crypto_bundle_yagpt and gen_web_bundle_yagpt from the bot, and ctf_yagpt_unique's
+unique crypto/web bundles. It reports the success rate and p50/p99 per generator.
+"""
+
+from __future__ import annotations
+
+import argparse
+import asyncio
+import hashlib
+import json
+import math
+import os
+import random
+import re
+import sys
+import tempfile
+import time
+from collections import Counter
+from typing import Any, Awaitable, Callable, Dict, List, Optional, Tuple
+
+import aiohttp
+from aiohttp import web
+
+from bench.webhook import free_port, pct, serve
+from ciphers import FLAG_RE
+
+UPSTREAM = "https://llm.api.cloud.yandex.net/foundationModels/v1/completion"
+PATH = "/foundationModels/v1/completion"
+NONCE_RE = re.compile(r"(?im)^.*nonce.*$")
+TAG_RE = re.compile(r"<([A-Z_]+)>")
+JSON_KEY_RE = re.compile(r'"(\w+)":\s*str')
+
+WORDS = ["сервер", "ключ", "пароль", "журнал", "шифр", "сообщение", "архив", "сеть", "токен", "запрос",
+         "лаборатория", "протокол", "хеш", "модуль", "доступ", "отчёт", "сигнал", "файл", "код", "узел"]
+
+
+def prompt_text(payload: Dict[str, Any]) -> str:
+    return "\n".join(str(m.get("text", "")) for m in payload.get("messages", []) if isinstance(m, dict))
+
+
+def prompt_key(prompt: str) -> str:
+    """Prompt identity for replay/duplicates: without nonce lines and concrete flags."""
+    return hashlib.sha256(FLAG_RE.sub("lapin{*}", NONCE_RE.sub("", prompt)).encode("utf-8")).hexdigest()[:20]
+
+
+def remap_flags(text: str, old: List[str], new: List[str]) -> str:
+    for a, b in zip(old, new):
+        if a != b:
+            text = text.replace(a, b)
+    return text
+
+
+def completion(text: str, status: str = "ALTERNATIVE_STATUS_FINAL") -> Dict[str, Any]:
+    return {"result": {"alternatives": [{"message": {"role": "assistant", "text": text}, "status": status}],
+                       "usage": {"inputTextTokens": "0", "completionTokens": str(len(text) // 4),
+                                 "totalTokens": str(len(text) // 4)},
+                       "modelVersion": "fake"}}
+
+
+# --------------- synthetic answers ---------------
+
+def _sentence(rng: random.Random) -> str:
+    w = rng.sample(WORDS, 5)
+    return f"{w[0].capitalize()} {w[1]} передал {w[2]} через {w[3]}, но {w[4]} №{rng.randrange(10**5)} остался открыт."
+
+
+def _field(name: str, flag: str, rng: random.Random) -> str:
+    name = name.lower()
+    if name == "plaintext":
+        s = [_sentence(rng) for _ in range(rng.randint(3, 6))]
+        s.insert(rng.randrange(1, len(s)), f"Контрольная строка: {flag}.")
+        return " ".join(s)
+    if name == "code":
+        fn = rng.choice(WORDS[:10])
+        return (f'from flask import Flask, request\n\napp = Flask(__name__)\nFLAG = "{flag}"  # {rng.randrange(10**6)}\n\n'
+                f'@app.route("/{fn}")\ndef {fn}_view():\n    name = request.args.get("q", "")\n'
+                f'    return "<h1>" + name + "</h1>"  # вывод без экранирования\n')
+    if name in ("teacher_guide", "guide"):
+        return "\n".join(f"{i}) {_sentence(rng)}" for i in range(1, rng.randint(5, 8)))
+    if name == "title":
+        return f"{rng.choice(WORDS).capitalize()} и {rng.choice(WORDS)} #{rng.randrange(10**4)}"
+    return " ".join(_sentence(rng) for _ in range(rng.randint(1, 2)))
+
+
+def synthetic(prompt: str, rng: random.Random) -> str:
+    flags = FLAG_RE.findall(prompt)
+    flag = flags[0] if flags else f"lapin{{{rng.getrandbits(40):010x}}}"
+    tags = list(dict.fromkeys(TAG_RE.findall(prompt)))
+    if tags:
+        return "\n".join(f"<{t}>\n{_field(t, flag, rng)}\n</{t}>" for t in tags)
+    if '"questions"' in prompt:
+        m = re.search(r"Вопросов:\s*(\d+)", prompt)
+        qs = [{"question": f"{_sentence(rng)} Что верно?", "options": [_sentence(rng) for _ in range(4)],
+               "correct": rng.randrange(4), "explanation": _sentence(rng)} for _ in range(int(m.group(1)) if m else 5)]
+        return json.dumps({"questions": qs}, ensure_ascii=False)
+    keys = list(dict.fromkeys(JSON_KEY_RE.findall(prompt)))
+    if keys:
+        return json.dumps({k: _field(k, flag, rng) for k in keys}, ensure_ascii=False)
+    return _sentence(rng)
+
+
+# --------------- server ---------------
+
+class FakeYandexGPT:
+    def __init__(self, mode: str = "synthetic", cassette: str = "", upstream: str = UPSTREAM, on_miss: str = "error",
+                 latency_ms: float = 0.0, jitter: float = 0.4, error_rate: float = 0.0, truncate_rate: float = 0.0,
+                 duplicate_rate: float = 0.0, seed: int = 0):
+        self.mode, self.cassette, self.upstream, self.on_miss = mode, cassette, upstream, on_miss
+        self.latency, self.jitter = latency_ms / 1000, jitter
+        self.error_rate, self.truncate_rate, self.duplicate_rate = error_rate, truncate_rate, duplicate_rate
+        self.rng = random.Random(seed)
+        self.stats: Counter = Counter()
+        self._tapes: Dict[str, List[Dict[str, Any]]] = {}
+        self._turn: Counter = Counter()
+        self._last: Dict[str, Tuple[str, List[str]]] = {}    # key -> (текст, флаги промпта)
+        self._session: Optional[aiohttp.ClientSession] = None
+        if mode == "replay":
+            self._load()
+
+    def _load(self) -> None:
+        with open(self.cassette, "r", encoding="utf-8") as f:
+            for line in f:
+                if line.strip():
+                    rec = json.loads(line)
+                    self._tapes.setdefault(rec["key"], []).append(rec)
+
+    async def _answer(self, request: web.Request, payload: Dict[str, Any], prompt: str) -> Tuple[int, Dict[str, Any]]:
+        key, flags = prompt_key(prompt), FLAG_RE.findall(prompt)
+        if self.mode == "record":
+            if self._session is None:
+                self._session = aiohttp.ClientSession()
+            headers = {h: request.headers[h] for h in ("Authorization", "x-folder-id") if h in request.headers}
+            async with self._session.post(self.upstream, json=payload, headers=headers, timeout=120) as r:
+                status, body = r.status, await r.json(content_type=None)
+            with open(self.cassette, "a", encoding="utf-8") as f:
+                f.write(json.dumps({"key": key, "flags": flags, "status": status, "body": body}, ensure_ascii=False) + "\n")
+            self.stats["recorded"] += 1
+            return status, body
+        if self.mode == "replay":
+            tape = self._tapes.get(key)
+            if tape:
+                rec = tape[self._turn[key] % len(tape)]
+                self._turn[key] += 1
+                self.stats["replayed"] += 1
+                return rec["status"], json.loads(remap_flags(json.dumps(rec["body"], ensure_ascii=False), rec.get("flags", []), flags))
+            self.stats["miss"] += 1
+            if self.on_miss == "error":
+                return 404, {"error": {"httpCode": 404, "message": f"no recording for prompt {key}"}}
+        self.stats["synthetic"] += 1
+        return 200, completion(synthetic(prompt, self.rng))
+
+    async def handle(self, request: web.Request) -> web.Response:
+        self.stats["requests"] += 1
+        try:
+            payload = await request.json()
+        except ValueError:
+            return web.json_response({"error": {"httpCode": 400, "message": "bad json"}}, status=400)
+        if self.latency:
+            await asyncio.sleep(self.latency * math.exp(self.rng.gauss(0, self.jitter)))
+        if self.rng.random() < self.error_rate:
+            code = self.rng.choice((429, 500))
+            self.stats[f"error_{code}"] += 1
+            msg = "ai.textGenerationCompletionSessionsCount.count gauge quota limit exceed" if code == 429 else "Internal error"
+            return web.json_response({"error": {"grpcCode": 8 if code == 429 else 13, "httpCode": code, "message": msg}}, status=code)
+        prompt = prompt_text(payload)
+        key, flags = prompt_key(prompt), FLAG_RE.findall(prompt)
+        if key in self._last and self.rng.random() < self.duplicate_rate:
+            text, old = self._last[key]
+            self.stats["duplicate"] += 1
+            return web.json_response(completion(remap_flags(text, old, flags)))
+        status, body = await self._answer(request, payload, prompt)
+        alts = body.get("result", {}).get("alternatives", []) if status == 200 else []
+        if alts:
+            text = alts[0].get("message", {}).get("text", "")
+            self._last[key] = (text, flags)
+            if text and self.rng.random() < self.truncate_rate:
+                self.stats["truncated"] += 1
+                body = completion(text[:int(len(text) * self.rng.uniform(0.3, 0.9))], "ALTERNATIVE_STATUS_TRUNCATED_FINAL")
+        return web.json_response(body, status=status)
+
+    async def stats_view(self, request: web.Request) -> web.Response:
+        return web.json_response(dict(self.stats))
+
+    def app(self) -> web.Application:
+        app = web.Application()
+        app.router.add_post(PATH, self.handle)
+        app.router.add_get("/stats", self.stats_view)
+        return app
+
+    async def close(self) -> None:
+        if self._session:
+            await self._session.close()
+
+
+def make_server(args: argparse.Namespace) -> FakeYandexGPT:
+    return FakeYandexGPT(args.mode, args.cassette, args.upstream, args.on_miss, args.latency_ms, args.jitter,
+                         args.error_rate, args.truncate_rate, args.duplicate_rate, args.seed)
+
+
+async def run_serve(args: argparse.Namespace) -> None:
+    fake = make_server(args)
+    runner = await serve(fake.app(), args.port)
+    print(f"YANDEX_URL=http://127.0.0.1:{args.port}{PATH}  (mode {args.mode})", flush=True)
+    try:
+        await asyncio.Event().wait()
+    finally:
+        await fake.close()
+        await runner.cleanup()
+
+
+# --------------- check: настоящие генераторы против фейка ---------------
+
+async def run_check(args: argparse.Namespace) -> None:
+    fake = make_server(args)
+    port = free_port()
+    runner = await serve(fake.app(), port)
+    tmp = tempfile.mkdtemp(prefix="bench-yagpt-")
+    os.environ.update({"YANDEX_URL": f"http://127.0.0.1:{port}{PATH}", "YANDEX_API_KEY": "fake", "YANDEX_FOLDER_ID": "fake",
+                       "BOT_TOKEN": "123456:fake", "DATA_FILE": os.path.join(tmp, "bot_data.json"), "DATA_DIR": "",
+                       "STATE_FILE": os.path.join(tmp, "user_states.pkl")})
+    import ctf_yagpt_unique as cu
+    import simple_bor_v7 as sb
+
+    async def test_ok() -> bool:
+        qs = await sb.gen_test("Сети", 5, "medium")
+        return bool(qs) and len(qs) == 5
+
+    async def crypto_ok() -> bool:
+        flag = sb.gen_flag()
+        b = await sb.gen_crypto_bundle_yagpt("Шифры", False, flag, "caesar", {**sb.crypto_meta("caesar"), "shift": 7}, sb.gen_id("N", 10))
+        return bool(b) and sb.flag_once_ok(b["plaintext"]) and flag in b["plaintext"]
+
+    async def web_ok() -> bool:
+        flag = sb.gen_flag()
+        b = await sb.gen_web_bundle_yagpt("XSS (code review)", flag, flag, sb.gen_id("N", 10))
+        return bool(b) and len(FLAG_RE.findall(b["code"])) == 1
+
+    store: Dict[str, Any] = {}
+
+    async def unique_crypto_ok() -> bool:
+        flag = sb.gen_flag()
+        out = await cu.generate_unique_crypto_bundle(data=store, api_key="fake", folder_id="fake", topic="Шифры",
+                                                     flag=flag, subtype="vig", params={"key": "lapin"})
+        return flag in out["plaintext"] and "⚠️" not in out["teacher_guide"]
+
+    async def unique_web_ok() -> bool:
+        flag = sb.gen_flag()
+        out = await cu.generate_unique_web_bundle(data=store, api_key="fake", folder_id="fake", vuln_type="XSS",
+                                                  embedded_flag=flag, expected_answer=flag)
+        return flag in out["code"] and "⚠️" not in out["teacher_guide"]
+
+    cases: List[Tuple[str, Callable[[], Awaitable[bool]]]] = [
+        ("gen_test", test_ok), ("gen_crypto_bundle_yagpt", crypto_ok), ("gen_web_bundle_yagpt", web_ok),
+        ("unique crypto bundle", unique_crypto_ok), ("unique web bundle", unique_web_ok)]
+    sem = asyncio.Semaphore(args.concurrency)
+    print(f"{'generator':<26}{'ok':>6}{'fail':>6}{'error':>7}{'p50 ms':>10}{'p99 ms':>10}")
+    try:
+        for name, fn in cases:
+            res: Counter = Counter()
+            lat: List[float] = []
+
+            async def one() -> None:
+                async with sem:
+                    t0 = time.perf_counter()
+                    try:
+                        res["ok" if await fn() else "fail"] += 1
+                    except Exception:
+                        res["error"] += 1  # ctf_yagpt_unique бросает на HTTP-ошибках и битом выводе
+                    lat.append((time.perf_counter() - t0) * 1000)
+
+            await asyncio.gather(*(one() for _ in range(args.n)))
+            print(f"{name:<26}{res['ok']:>6}{res['fail']:>6}{res['error']:>7}{pct(lat, 0.5):>10.1f}{pct(lat, 0.99):>10.1f}")
+        print("server:", ", ".join(f"{k} {v}" for k, v in sorted(fake.stats.items())))
+    finally:
+        sb.user_states.close()
+        await fake.close()
+        await runner.cleanup()
+
+
+def main() -> None:
+    ap = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    sub = ap.add_subparsers(dest="cmd", required=True)
+    for name in ("serve", "check"):
+        p = sub.add_parser(name)
+        p.add_argument("--mode", choices=("synthetic", "replay", "record"), default="synthetic")
+        p.add_argument("--cassette", default="yagpt.jsonl", help="JSONL recordings for record/replay")
+        p.add_argument("--upstream", default=UPSTREAM, help="real endpoint for --mode record")
+        p.add_argument("--on-miss", choices=("error", "synthetic"), default="error", help="replay of an unknown prompt")
+        p.add_argument("--latency-ms", type=float, default=800 if name == "serve" else 0, help="median answer delay")
+        p.add_argument("--jitter", type=float, default=0.4, help="sigma of the log-normal delay")
+        p.add_argument("--error-rate", type=float, default=0.0)
+        p.add_argument("--truncate-rate", type=float, default=0.0)
+        p.add_argument("--duplicate-rate", type=float, default=0.0)
+        p.add_argument("--seed", type=int, default=0)
+        if name == "serve":
+            p.add_argument("--port", type=int, default=8090)
+        else:
+            p.add_argument("--n", type=int, default=20, help="calls per generator")
+            p.add_argument("--concurrency", type=int, default=8)
+    args = ap.parse_args()
+    if args.mode == "replay" and not os.path.exists(args.cassette):
+        sys.exit(f"cassette {args.cassette} not found")
+    try:
+        asyncio.run(run_serve(args) if args.cmd == "serve" else run_check(args))
+    except KeyboardInterrupt:
+        pass
+
+
+if __name__ == "__main__":
+    main()
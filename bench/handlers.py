@@ -0,0 +1,224 @@
+"""Handler-level latency and peak memory on a synthetic school.
+
+    python -m bench.handlers [--data bench_data.json] [--results 200000] [--runs 20] [--io-runs 5] [--sharded]
+
+Imports simple_bor_v7 against a generated data file (bench.dataset; generated into a temp
+dir unless --data is given, --sharded migrates it to a DATA_DIR first). Both `bot` and
+`outbox` are replaced by FakeBot, which records the sends instead of calling Telegram.
+Handlers are then called directly with fabricated Message/CallbackQuery objects, from
+random students/teachers of the dataset. Every case gets one warm-up call first, which
+builds the lazy indexes. Then `runs` timed calls give p50/p99. One more call under
+tracemalloc gives the peak memory it allocated, including allocations in the storage
+thread pool.
+"""
+
+from __future__ import annotations
+
+import argparse
+import asyncio
+import json
+import os
+import random
+import sys
+import tempfile
+import time
+import tracemalloc
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+from telebot import types
+
+from bench.webhook import pct
+
+TOKEN = "123456:bench"
+
+
+class FakeBot:
+    """Stands in for both `bot` and `outbox`: every send is appended to `sent` and succeeds at once."""
+
+    def __init__(self):
+        self.sent: List[Tuple[str, Any, Optional[str]]] = []
+
+    def _record(self, method: str, chat_id: Any, text: Optional[str] = None) -> "asyncio.Future[bool]":
+        self.sent.append((method, chat_id, text))
+        fut = asyncio.get_running_loop().create_future()
+        fut.set_result(True)
+        return fut
+
+    # интерфейс SendQueue (outbox.*)
+    def send_message(self, chat_id, text, priority: int = 0, **kwargs):
+        return self._record("send_message", chat_id, text)
+
+    def reply_to(self, message, text, priority: int = 0, **kwargs):
+        return self._record("reply_to", message.chat.id, text)
+
+    def send_document(self, chat_id, document, priority: int = 0, **kwargs):
+        return self._record("send_document", chat_id, kwargs.get("caption"))
+
+    def edit_message_text(self, text, chat_id, message_id, priority: int = 0, **kwargs):
+        return self._record("edit_message_text", chat_id, text)
+
+    def edit_message_reply_markup(self, chat_id, message_id, reply_markup=None, priority: int = 0):
+        return self._record("edit_message_reply_markup", chat_id)
+
+    # то, что хендлеры зовут у bot напрямую
+    async def answer_callback_query(self, callback_query_id, text=None, show_alert=None, **kwargs):
+        self.sent.append(("answer_callback_query", callback_query_id, text))
+        return True
+
+
+def message(i: int, uid: str, text: str) -> types.Message:
+    return types.Message.de_json({"message_id": i, "date": 0, "text": text,
+                                  "chat": {"id": int(uid), "type": "private"},
+                                  "from": {"id": int(uid), "is_bot": False, "first_name": "U"}})
+
+
+def callback(i: int, uid: str, data: str) -> types.CallbackQuery:
+    return types.CallbackQuery.de_json({"id": str(i), "chat_instance": "bench", "data": data,
+                                        "from": {"id": int(uid), "is_bot": False, "first_name": "U"},
+                                        "message": {"message_id": i, "date": 0, "text": "menu",
+                                                    "chat": {"id": int(uid), "type": "private"}}})
+
+
+async def _call(fn: Callable[[Any], Any], arg: Any) -> None:
+    r = fn(arg)
+    if asyncio.iscoroutine(r):
+        await r
+
+
+async def measure(fn: Callable[[Any], Any], args: List[Any], runs: int,
+                  setup: Optional[Callable[[Any], None]] = None) -> Dict[str, float]:
+    """p50/p99 of fn(arg) over `runs` calls (args cycled) and the peak memory of one more call."""
+    if setup:
+        setup(args[0])
+    await _call(fn, args[0])  # прогрев: ленивые индексы, timeline, кэши
+    lat: List[float] = []
+    for i in range(runs):
+        arg = args[i % len(args)]
+        if setup:
+            setup(arg)
+        t0 = time.perf_counter()
+        await _call(fn, arg)
+        lat.append((time.perf_counter() - t0) * 1000)
+    arg = args[runs % len(args)]
+    if setup:
+        setup(arg)
+    tracemalloc.start()
+    base = tracemalloc.get_traced_memory()[0]
+    await _call(fn, arg)
+    peak = tracemalloc.get_traced_memory()[1] - base
+    tracemalloc.stop()
+    return {"p50": pct(lat, 0.5), "p99": pct(lat, 0.99), "peak_mb": peak / 2**20}
+
+
+async def run(args: argparse.Namespace, tmp: str) -> None:
+    import simple_bor_v7 as sb  # после настройки окружения в main()
+
+    fake = FakeBot()
+    sb.bot = sb.outbox = fake
+    data = sb.load_data()
+    rng = random.Random(0)
+    users = data["users"]
+    students = [u for u, x in users.items() if x.get("role") == "student" and x.get("class_id")]
+    teachers = [u for u, x in users.items() if x.get("role") == "teacher"]
+    class_of = {t: [c for c in data["classes"].values() if c.get("teacher_id") == t] for t in teachers}
+    teachers = [t for t in teachers if class_of[t]]
+    aids = list(data["assignments"])
+    codes = list(data["invite_index"])
+    n = max(args.runs, 50)
+
+    rows: List[Tuple[str, Dict[str, float], int]] = []
+
+    async def case(name: str, fn: Callable[[Any], Any], cases: List[Any], runs: int,
+                   setup: Optional[Callable[[Any], None]] = None) -> None:
+        before = len(fake.sent)
+        rows.append((name, await measure(fn, cases, runs, setup), len(fake.sent) - before))
+        print(f"  {name} done", file=sys.stderr)
+
+    # --- хранилище ---
+    await case("load_data", lambda _: sb.load_data(), [None], args.io_runs)
+    snap = sb.load_data()
+    rids = list(snap["results"])
+
+    def touch(rid: str) -> None:
+        snap["results"][rid]["bench"] = snap["results"][rid].get("bench", 0) + 1
+    await case("save_data (1 result changed)", lambda _: sb.save_data(snap), rng.sample(rids, n), args.io_runs, touch)
+
+    # --- вспомогательные функции на горячем пути ---
+    pairs = [(rng.choice(aids), rng.choice(students)) for _ in range(n)]
+    await case("has_result", lambda p: sb.has_result(data, *p), pairs, args.runs * 10)
+    invites = [rng.choice(codes) if codes and i % 2 else f"NOPE{i:04d}" for i in range(n)]
+    await case("find_invite", lambda c: sb.find_invite(data, c), invites, args.runs * 10)
+
+    # --- хендлеры ---
+    await case("s_tasks", sb.s_tasks, [message(i, rng.choice(students), "📚 Мои задания") for i in range(n)], args.runs)
+    await case("s_results", sb.s_results, [message(i, rng.choice(students), "📈 Мои результаты") for i in range(n)], args.runs)
+
+    tres: List[types.Message] = []
+    for i in range(n):
+        t = rng.choice(teachers)
+        tres.append(message(i, t, f"Класс: {rng.choice(class_of[t])['name']}"))
+    await case("t_results_flow: class", sb.t_results_flow, tres, args.runs,
+               lambda m: sb.user_states.__setitem__(str(m.from_user.id), {"flow": "tres", "step": "class"}))
+    tstud: List[Tuple[types.Message, str]] = []
+    for i in range(n):
+        t = rng.choice(teachers)
+        c = rng.choice(class_of[t])
+        sid = rng.choice([s for s in students if users[s]["class_id"] == c["id"]] or students)
+        tstud.append((message(i, t, f"Ученик: x ({sid})"), c["id"]))
+    await case("t_results_flow: student", lambda p: sb.t_results_flow(p[0]), tstud, args.runs,
+               lambda p: sb.user_states.__setitem__(str(p[0].from_user.id), {"flow": "tres", "step": "student", "cid": p[1]}))
+
+    pages: List[types.CallbackQuery] = []
+    for i in range(n):
+        sid = rng.choice(students)
+        kb = sb.menu_page("st", sid, data)
+        nxt = [b.callback_data for row in (kb.keyboard if kb else []) for b in row if b.callback_data.startswith("pg:")]
+        pages.append(callback(i, sid, nxt[0] if nxt else "pg:st:c:"))
+    await case("cb_menu: student page", sb.cb_menu, pages, args.runs)
+
+    # --- шифры ---
+    plain = "Секретное сообщение: флаг lapin{0123abcd} спрятан здесь. " * 4
+    jobs = [(sub, sb.crypto_meta(sub)) for sub in ("obf", "caesar", "vig", "xor", "b64") for _ in range(10)]
+    await case("encrypt_crypto", lambda j: sb.encrypt_crypto(j[0], plain, j[1]), jobs, args.runs * 10)
+    enc = [(sub, sb.encrypt_crypto(sub, plain, meta)[0], meta) for sub, meta in jobs]
+    await case("decrypt_crypto", lambda j: sb.decrypt_crypto(*j), enc, args.runs * 10)
+
+    print(f"{'case':<32}{'p50 ms':>10}{'p99 ms':>10}{'peak MB':>10}{'sends':>8}")
+    for name, r, sends in rows:
+        print(f"{name:<32}{r['p50']:>10.3f}{r['p99']:>10.3f}{r['peak_mb']:>10.2f}{sends:>8}")
+    sb.user_states.close()
+
+
+def main() -> None:
+    ap = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    ap.add_argument("--data", help="existing bot_data.json-style file (default: generate one)")
+    ap.add_argument("--results", type=int, default=200000, help="results to generate when --data is not given")
+    ap.add_argument("--runs", type=int, default=20, help="timed calls per handler")
+    ap.add_argument("--io-runs", type=int, default=5, help="timed calls of load_data/save_data")
+    ap.add_argument("--sharded", action="store_true", help="run on the sharded layout (storage.py)")
+    args = ap.parse_args()
+
+    with tempfile.TemporaryDirectory(prefix="bench-handlers-") as tmp:
+        path = os.path.join(tmp, "bot_data.json")
+        if args.data:
+            with open(args.data, "r", encoding="utf-8") as f, open(path, "w", encoding="utf-8") as out:
+                out.write(f.read())
+        else:
+            from bench.dataset import generate
+            t0 = time.perf_counter()
+            with open(path, "w", encoding="utf-8") as f:
+                json.dump(generate(results=args.results), f, ensure_ascii=False, indent=2)
+            print(f"generated {args.results} results in {time.perf_counter() - t0:.1f} s", file=sys.stderr)
+        os.environ.update({"BOT_TOKEN": TOKEN, "DATA_FILE": path,
+                           "STATE_FILE": os.path.join(tmp, "user_states.pkl"), "ARCHIVE_DIR": os.path.join(tmp, "archive")})
+        if args.sharded:
+            import storage
+            storage.main(["migrate", "--src", path, "--dst", os.path.join(tmp, "data")])
+            os.environ["DATA_DIR"] = os.path.join(tmp, "data")
+        else:
+            os.environ["DATA_DIR"] = ""
+        asyncio.run(run(args, tmp))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,145 @@
+"""Dispatch cost per update: telebot predicate chain vs router.Router.
+
+    python -m bench.router [--updates 20000]
+
+Both bots get the bot's handler layout (/start, then the flow and button handlers in their
+registration order, then the fallback). The legacy bot registers one lambda predicate per
+handler like simple_bor_v7 used to; the other registers a single catch-all that calls
+Router.dispatch. States live in an in-memory StateStore as in the bot. Handlers are no-ops,
+so the timing is dispatch only. Before timing, every (flow, text) combination is checked to
+resolve to the same handler in both.
+"""
+
+from __future__ import annotations
+
+import argparse
+import asyncio
+import time
+from typing import Any, Callable, List, Optional, Tuple
+
+from telebot import types
+from telebot.async_telebot import AsyncTeleBot
+
+from router import Router
+from state_store import StateStore
+
+TOKEN = "123456:bench"
+
+# порядок регистрации, как в simple_bor_v7.py: ("flow", name) или ("text", button)
+LAYOUT: List[Tuple[str, str]] = [
+    ("flow", "reg"), ("text", "✅ Создать класс"), ("flow", "class"), ("text", "🧑‍🏫 Ваши классы"),
+    ("text", "🔐 Инвайт в класс"), ("flow", "class_invite"), ("text", "🔒 Приватность класса"),
+    ("flow", "class_privacy"), ("text", "🧪 Создать задание"), ("flow", "task"), ("flow", "test_create"),
+    ("flow", "hw_create"), ("flow", "ctf_create"), ("text", "📚 Мои задания"), ("flow", "open_task"),
+    ("flow", "submit_homework"), ("flow", "take_test"), ("flow", "solve_ctf"), ("text", "📈 Мои результаты"),
+    ("text", "📊 Результаты"), ("flow", "tres"), ("text", "📒 Журнал"), ("flow", "gradebook"),
+    ("text", "📤 Экспорт"), ("flow", "export"),
+    ("text", "📚 Ваши тесты"), ("flow", "t_test_manage"),
+    ("text", "🏁 Ваши CTF"), ("flow", "t_ctf_manage"), ("text", "ℹ️ Помощь"),
+]
+
+
+def make_handler(name: str, hits: List[str]) -> Callable[[Any], Any]:
+    async def handler(m):
+        hits.append(name)
+    return handler
+
+
+def legacy_bot(states: StateStore, hits: List[str]) -> AsyncTeleBot:
+    bot = AsyncTeleBot(TOKEN)
+    bot.register_message_handler(make_handler("start", hits), commands=["start"])
+    for kind, key in LAYOUT:
+        if kind == "flow":
+            pred = (lambda k: lambda m: states.get(str(m.from_user.id), {}).get("flow") == k)(key)
+        else:
+            pred = (lambda k: lambda m: m.text == k)(key)
+        bot.register_message_handler(make_handler(f"{kind}:{key}", hits), func=pred)
+    bot.register_message_handler(make_handler("fallback", hits), func=lambda m: True)
+    return bot
+
+
+def router_bot(states: StateStore, hits: List[str]) -> AsyncTeleBot:
+    bot = AsyncTeleBot(TOKEN)
+    router = Router(lambda m: (states.get(str(m.from_user.id)) or {}).get("flow"))
+    bot.register_message_handler(make_handler("start", hits), commands=["start"])
+    for kind, key in LAYOUT:
+        (router.flow if kind == "flow" else router.text)(key)(make_handler(f"{kind}:{key}", hits))
+    router.default(make_handler("fallback", hits))
+    bot.register_message_handler(router.dispatch, content_types=["text"])
+    return bot
+
+
+def message(i: int, uid: int, text: str) -> types.Update:
+    ent = [{"type": "bot_command", "offset": 0, "length": len(text)}] if text.startswith("/") else []
+    return types.Update.de_json({"update_id": i, "message": {
+        "message_id": i, "date": 0, "text": text, "entities": ent,
+        "chat": {"id": uid, "type": "private"}, "from": {"id": uid, "is_bot": False, "first_name": "U"}}})
+
+
+async def check_same(states: StateStore) -> int:
+    a: List[str] = []
+    b: List[str] = []
+    legacy, routed = legacy_bot(states, a), router_bot(states, b)
+    flows: List[Optional[str]] = [None, "unknown"] + [k for kind, k in LAYOUT if kind == "flow"]
+    texts = ["/start", "что-то", "1"] + [k for kind, k in LAYOUT if kind == "text"]
+    n = 0
+    for flow in flows:
+        states.clear()
+        if flow is not None:
+            states["1"] = {"flow": flow}
+        for text in texts:
+            n += 1
+            await legacy.process_new_updates([message(n, 1, text)])
+            await routed.process_new_updates([message(n, 1, text)])
+    assert a == b, [(x, y) for x, y in zip(a, b) if x != y][:5]
+    return n
+
+
+async def timed(bot: AsyncTeleBot, updates: List[types.Update]) -> float:
+    t0 = time.perf_counter()
+    for i in range(0, len(updates), 100):
+        await bot.process_new_updates(updates[i:i + 100])
+    return (time.perf_counter() - t0) / len(updates) * 1e6
+
+
+async def run(n: int) -> None:
+    states = StateStore()  # как user_states в боте, без файла
+    print(f"equivalence: {await check_same(states)} (flow, text) combinations resolve identically")
+
+    states.clear()
+    for uid in range(1000, 2000):
+        states[str(uid)] = {"flow": "t_ctf_manage"}          # последний flow в цепочке
+    cases = {
+        "unmatched text -> fallback": [message(i, 5000 + i % 1000, "привет") for i in range(n)],
+        "button (last in chain)": [message(i, 5000 + i % 1000, "ℹ️ Помощь") for i in range(n)],
+        "active flow (last in chain)": [message(i, 1000 + i % 1000, "1") for i in range(n)],
+    }
+    hits: List[str] = []
+    legacy, routed = legacy_bot(states, hits), router_bot(states, hits)
+    print(f"{'case':<30}{'predicates us/upd':>20}{'router us/upd':>16}")
+    for name, ups in cases.items():
+        await timed(legacy, ups[:1000])
+        await timed(routed, ups[:1000])
+        t_old = await timed(legacy, ups)
+        t_new = await timed(routed, ups)
+        print(f"{name:<30}{t_old:>20.1f}{t_new:>16.1f}")
+
+    m = message(0, 1000, "1").message
+    router = Router(lambda msg: (states.get(str(msg.from_user.id)) or {}).get("flow"))
+    for kind, key in LAYOUT:
+        (router.flow if kind == "flow" else router.text)(key)(make_handler(key, hits))
+    t0 = time.perf_counter()
+    for _ in range(n):
+        router.resolve(m)
+    print(f"Router.resolve alone: {(time.perf_counter() - t0) / n * 1e6:.2f} us")
+
+
+def main() -> None:
+    ap = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    ap.add_argument("--updates", type=int, default=20000)
+    args = ap.parse_args()
+    asyncio.run(run(args.updates))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,61 @@
+"""Benchmark of the automatic crypto solver (crypto_solver.py).
+
+    python -m bench.solver [--keys 10000] [--repeat 5]
+
+Times batch scoring of candidate Vigenère/XOR keys and full solve() runs per subtype.
+"""
+
+from __future__ import annotations
+
+import argparse
+import time
+
+import numpy as np
+
+import ciphers
+import crypto_solver
+
+TEXT = ("Сотрудник лаборатории обнаружил странное письмо в архиве. The note contained the access code "
+        "lapin{k3y7x9q2mz1a} for the staging server. Никто не знал, кто его отправил, но подпись выглядела "
+        "знакомой. The team decided to check the event log before reporting it.")
+FLAG = "lapin{k3y7x9q2mz1a}"
+
+
+def best_of(fn, repeat: int) -> float:
+    best = float("inf")
+    for _ in range(repeat):
+        t0 = time.perf_counter()
+        fn()
+        best = min(best, time.perf_counter() - t0)
+    return best
+
+
+def main() -> None:
+    ap = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    ap.add_argument("--keys", type=int, default=10000)
+    ap.add_argument("--repeat", type=int, default=5)
+    args = ap.parse_args()
+    rng = np.random.default_rng(0)
+
+    vig_chall = ciphers.vigenere(TEXT, "key")
+    vig_keys = rng.integers(0, 26, size=(args.keys, 3))
+    t = best_of(lambda: crypto_solver.score_vigenere_keys(vig_chall, vig_keys), args.repeat)
+    print(f"score_vigenere_keys: {args.keys} keys x {len(TEXT)} chars  {t * 1e3:8.2f} ms")
+
+    xor_raw = bytes.fromhex(ciphers.xor_hex(TEXT, "k3"))
+    xor_keys = rng.integers(32, 127, size=(args.keys, 2), dtype=np.uint8)
+    t = best_of(lambda: crypto_solver.score_xor_keys(xor_raw, xor_keys), args.repeat)
+    print(f"score_xor_keys:      {args.keys} keys x {len(xor_raw)} bytes  {t * 1e3:8.2f} ms")
+
+    print()
+    print(f"{'subtype':<8}{'recovered':>10}{'candidates':>12}{'solve ms':>10}{'difficulty':>12}")
+    for sub, meta in [("caesar", {"shift": 13}), ("vig", {"key": "qwerty"}), ("xor", {"key": "ab12cd34"}),
+                      ("b64", {}), ("obf", {})]:
+        chall, _ = ciphers.encrypt_crypto(sub, TEXT, meta)
+        rep = crypto_solver.solve(sub, chall, FLAG)
+        t = best_of(lambda: crypto_solver.solve(sub, chall, FLAG), args.repeat)
+        print(f"{sub:<8}{str(rep['recovered']):>10}{rep['candidates']:>12}{t * 1e3:>10.2f}{rep['difficulty']:>12}")
+
+
+if __name__ == "__main__":
+    main()
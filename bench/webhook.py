@@ -0,0 +1,169 @@
+"""Throughput benchmark: webhook ingestion vs getUpdates polling.
+
+    python -m bench.webhook [--updates 2000] [--rate 500] [--rtt-ms 60]
+
+Updates "arrive at Telegram" at a fixed rate. In webhook mode they are POSTed to the
+aiohttp app from webhook.py (one-way network delay rtt/2, concurrent like Telegram's
+webhook connections). In polling mode a local fake Bot API serves long-poll getUpdates
+(full rtt per request) and the same loop as infinity_polling fetches and processes them.
+Reports throughput and arrival -> handler latency p50/p99 for both.
+"""
+
+from __future__ import annotations
+
+import argparse
+import asyncio
+import json
+import socket
+import statistics
+import time
+from typing import Any, Dict, List
+from urllib.parse import parse_qsl
+
+import aiohttp
+from aiohttp import web
+from telebot import asyncio_helper
+from telebot.async_telebot import AsyncTeleBot
+
+import webhook
+
+TOKEN = "123456:bench"
+SECRET = "bench-secret"
+
+
+def free_port() -> int:
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+def make_updates(n: int) -> List[Dict[str, Any]]:
+    now = int(time.time())
+    return [{"update_id": i + 1,
+             "message": {"message_id": i + 1, "date": now, "text": "ℹ️ Помощь",
+                         "chat": {"id": 1000 + i % 500, "type": "private"},
+                         "from": {"id": 1000 + i % 500, "is_bot": False, "first_name": "U"}}}
+            for i in range(n)]
+
+
+def make_bot(processed: Dict[int, float]) -> AsyncTeleBot:
+    bot = AsyncTeleBot(TOKEN)
+
+    @bot.message_handler(func=lambda m: True)
+    async def handle(m):
+        processed[m.message_id] = time.perf_counter()
+
+    return bot
+
+
+def pct(xs: List[float], q: float) -> float:
+    xs = sorted(xs)
+    return xs[min(len(xs) - 1, int(q * len(xs)))] if xs else 0.0
+
+
+def report(name: str, arrivals: Dict[int, float], processed: Dict[int, float]) -> None:
+    lat = [(processed[i] - arrivals[i]) * 1000 for i in processed]
+    span = max(processed.values()) - min(arrivals.values())
+    print(f"{name:<8} processed {len(processed):>6}  {len(processed) / span:>8.0f} upd/s  "
+          f"p50 {pct(lat, 0.5):>7.1f} ms  p99 {pct(lat, 0.99):>7.1f} ms  mean {statistics.mean(lat):>7.1f} ms")
+
+
+async def serve(app: web.Application, port: int) -> web.AppRunner:
+    runner = web.AppRunner(app)
+    await runner.setup()
+    await web.TCPSite(runner, "127.0.0.1", port).start()
+    return runner
+
+
+async def wait_all(processed: Dict[int, float], n: int, timeout: float = 120) -> None:
+    end = time.time() + timeout
+    while len(processed) < n and time.time() < end:
+        await asyncio.sleep(0.01)
+
+
+async def bench_webhook(updates: List[Dict[str, Any]], rate: float, rtt: float) -> None:
+    processed: Dict[int, float] = {}
+    q: "asyncio.Queue[Dict[str, Any]]" = asyncio.Queue()
+    consumer = webhook.start_consumer(make_bot(processed), q)
+    port = free_port()
+    runner = await serve(webhook.make_app(SECRET, q), port)
+    url = f"http://127.0.0.1:{port}/webhook"
+    arrivals: Dict[int, float] = {}
+
+    t0 = time.perf_counter()
+    async with aiohttp.ClientSession(connector=aiohttp.TCPConnector(limit=40)) as s:
+        async def one(i: int, u: Dict[str, Any]) -> None:
+            at = t0 + i / rate
+            await asyncio.sleep(max(0.0, at - time.perf_counter()))
+            arrivals[u["message"]["message_id"]] = at
+            await asyncio.sleep(rtt / 2)
+            async with s.post(url, data=json.dumps(u), headers={webhook.SECRET_HEADER: SECRET,
+                                                                "Content-Type": "application/json"}) as r:
+                await r.read()
+        await asyncio.gather(*(one(i, u) for i, u in enumerate(updates)))
+
+    await wait_all(processed, len(updates))
+    consumer.cancel()
+    await runner.cleanup()
+    report("webhook", arrivals, processed)
+
+
+async def bench_polling(updates: List[Dict[str, Any]], rate: float, rtt: float) -> None:
+    processed: Dict[int, float] = {}
+    bot = make_bot(processed)
+    arrivals: Dict[int, float] = {}
+    state = {"t0": 0.0}
+
+    async def get_updates(request: web.Request) -> web.Response:
+        # async-клиент telebot шлёт параметры формой даже в GET, а request.post() читает тело только у POST
+        body = (await request.text()) if request.body_exists else ""
+        params = {**request.query, **dict(parse_qsl(body))}
+        offset = int(params.get("offset", 0) or 0)
+        limit = int(params.get("limit", 100) or 100)
+        timeout = float(params.get("timeout", 20) or 20)
+        await asyncio.sleep(rtt / 2)
+        end = time.perf_counter() + timeout
+        while True:
+            now = time.perf_counter()
+            avail = [u for u in updates[max(0, offset - 1):max(0, offset - 1) + limit]
+                     if state["t0"] + (u["update_id"] - 1) / rate <= now]
+            if avail or now >= end:
+                break
+            await asyncio.sleep(0.002)
+        await asyncio.sleep(rtt / 2)
+        return web.json_response({"ok": True, "result": avail})
+
+    app = web.Application()
+    app.router.add_route("*", f"/bot{TOKEN}/getUpdates", get_updates)
+    port = free_port()
+    runner = await serve(app, port)
+    asyncio_helper.API_URL = f"http://127.0.0.1:{port}/bot{{0}}/{{1}}"
+
+    state["t0"] = time.perf_counter()
+    for i, u in enumerate(updates):
+        arrivals[u["message"]["message_id"]] = state["t0"] + i / rate
+    offset = 0
+    while len(processed) < len(updates):
+        got = await bot.get_updates(offset=offset, limit=100, timeout=20)
+        if got:
+            await bot.process_new_updates(got)
+            offset = got[-1].update_id + 1
+    await bot.close_session()
+    await runner.cleanup()
+    report("polling", arrivals, processed)
+
+
+def main() -> None:
+    ap = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    ap.add_argument("--updates", type=int, default=2000)
+    ap.add_argument("--rate", type=float, default=500, help="update arrival rate, per second")
+    ap.add_argument("--rtt-ms", type=float, default=60, help="simulated round trip to Telegram")
+    args = ap.parse_args()
+    updates = make_updates(args.updates)
+    rtt = args.rtt_ms / 1000
+    asyncio.run(bench_webhook(updates, args.rate, rtt))
+    asyncio.run(bench_polling(updates, args.rate, rtt))
+
+
+if __name__ == "__main__":
+    main()
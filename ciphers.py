@@ -0,0 +1,251 @@
+"""ciphers.py
+
+Cipher engine for crypto CTF tasks (caesar / vigenere / xor_hex / obfuscate2 / base64_noise).
+
+- Caesar uses precomputed str.translate tables (one per shift, cached).
+- Vigenère and the noise ciphers work on whole code-point arrays via NumPy.
+- XOR works on the whole byte string at once.
+- Noise for obfuscate2/base64_noise comes from one bulk secrets.token_bytes call.
+- encrypt_batch() encrypts many task variants at once in a process pool.
+- decrypt_crypto() inverts every subtype, so a generated challenge can be round-trip checked.
+
+For a given key the output is identical to the old per-character implementations
+(for the noise ciphers only the noise characters differ, their positions are the same).
+"""
+
+from __future__ import annotations
+
+import base64
+import os
+import re
+import secrets
+import string
+import threading
+from concurrent.futures import ProcessPoolExecutor
+from functools import lru_cache
+from typing import Any, Dict, List, Optional, Tuple
+
+import numpy as np
+
+# флаг заданий: его ищут валидация генерации, автосолвер и фейковый YandexGPT
+FLAG_RE = re.compile(r"lapin\{[^\}]{3,64}\}")
+
+CAESAR_ABC = string.ascii_lowercase + string.ascii_uppercase + string.digits
+NOISE_ABC = string.ascii_letters + string.digits
+
+# таблица байт -> символ шума; байты >= _NOISE_LIMIT отбрасываем, чтобы не было перекоса по модулю
+_NOISE_LIMIT = 256 - 256 % len(NOISE_ABC)
+_NOISE_CODES = np.frombuffer(NOISE_ABC.encode("ascii"), dtype=np.uint8)
+
+_BMP = 0x10000
+
+# пакетное шифрование вариантов: меньше POOL_MIN_JOBS задач шифруем прямо в потоке
+POOL_WORKERS = max(1, min(4, os.cpu_count() or 1))
+POOL_MIN_JOBS = 8
+
+
+def _to_codepoints(s: str) -> np.ndarray:
+    return np.frombuffer(s.encode("utf-32-le"), dtype=np.uint32).astype(np.int64)
+
+
+def _from_codepoints(cp: np.ndarray) -> str:
+    return cp.astype(np.uint32).tobytes().decode("utf-32-le")
+
+
+@lru_cache(maxsize=1)
+def _bmp_tables() -> Tuple[np.ndarray, np.ndarray]:
+    """str.isalpha()/str.islower() for every BMP code point (built once, ~10 ms)."""
+    chars = [chr(i) for i in range(_BMP)]
+    alpha = np.fromiter((ch.isalpha() for ch in chars), dtype=bool, count=_BMP)
+    lower = np.fromiter((ch.islower() for ch in chars), dtype=bool, count=_BMP)
+    return alpha, lower
+
+
+def _alpha_lower_masks(cp: np.ndarray) -> Tuple[np.ndarray, np.ndarray]:
+    """Vectorized str.isalpha()/str.islower() over an array of code points."""
+    alpha_t, lower_t = _bmp_tables()
+    bmp = cp < _BMP
+    if bmp.all():
+        return alpha_t[cp], lower_t[cp]
+    alpha = np.zeros(cp.size, dtype=bool)
+    lower = np.zeros(cp.size, dtype=bool)
+    alpha[bmp] = alpha_t[cp[bmp]]
+    lower[bmp] = lower_t[cp[bmp]]
+    # символы вне BMP (эмодзи и т.п.) редки — проверяем по одному
+    for i in np.flatnonzero(~bmp).tolist():
+        ch = chr(int(cp[i]))
+        alpha[i], lower[i] = ch.isalpha(), ch.islower()
+    return alpha, lower
+
+
+def noise_codes(n: int) -> np.ndarray:
+    """n random noise characters (as uint8 codes) from a single bulk token_bytes draw."""
+    out = np.empty(0, dtype=np.uint8)
+    while out.size < n:
+        need = n - out.size
+        raw = np.frombuffer(secrets.token_bytes(need + need // 8 + 16), dtype=np.uint8)
+        raw = raw[raw < _NOISE_LIMIT]
+        out = np.concatenate([out, _NOISE_CODES[raw % len(NOISE_ABC)]])
+    return out[:n]
+
+
+@lru_cache(maxsize=128)
+def _caesar_tables(shift: int) -> Tuple[dict, np.ndarray]:
+    """str.translate table + the same mapping as a 128-entry code-point lookup."""
+    k = shift % len(CAESAR_ABC)
+    table = str.maketrans(CAESAR_ABC, CAESAR_ABC[k:] + CAESAR_ABC[:k])
+    lut = np.arange(128, dtype=np.int64)
+    for src, dst in table.items():
+        lut[src] = dst
+    return table, lut
+
+
+def caesar(s: str, shift: int) -> str:
+    table, lut = _caesar_tables(shift)
+    if s.isascii():
+        # для ASCII str.translate работает по быстрому пути CPython
+        return s.translate(table)
+    cp = _to_codepoints(s)
+    m = cp < 128
+    cp[m] = lut[cp[m]]
+    return _from_codepoints(cp)
+
+
+def _vig_key(key: str) -> np.ndarray:
+    key = "".join(ch for ch in (key or "").lower() if "a" <= ch <= "z") or "key"
+    return np.frombuffer(key.encode("ascii"), dtype=np.uint8).astype(np.int64) - 97
+
+
+def _vigenere(s: str, key: str, sign: int) -> str:
+    if not s:
+        return s
+    k = _vig_key(key) * sign
+    cp = _to_codepoints(s)
+    alpha, lower = _alpha_lower_masks(cp)
+    idx = np.flatnonzero(alpha)
+    # как и раньше: ключ сдвигается только на буквах, база 97/65 по регистру
+    base = np.where(lower[idx], 97, 65)
+    cp[idx] = (cp[idx] - base + k[np.arange(idx.size) % k.size]) % 26 + base
+    return _from_codepoints(cp)
+
+
+def vigenere(s: str, key: str) -> str:
+    return _vigenere(s, key, 1)
+
+
+def xor_hex(s: str, key: str) -> str:
+    kb = np.frombuffer((key or "k").encode(), dtype=np.uint8)
+    b = np.frombuffer(s.encode(), dtype=np.uint8)
+    return np.bitwise_xor(b, np.resize(kb, b.size)).tobytes().hex()
+
+
+def obfuscate2(s: str) -> Tuple[str, str]:
+    cp = _to_codepoints(s)
+    out = np.empty(cp.size * 2, dtype=np.int64)
+    out[0::2] = cp
+    out[1::2] = noise_codes(cp.size)
+    return _from_codepoints(out), "Удалите каждый 2-й символ, начиная со 2-го."
+
+
+def base64_noise(s: str) -> Tuple[str, str]:
+    b64 = np.frombuffer(base64.b64encode(s.encode()), dtype=np.uint8)
+    full = b64.size // 5
+    # после каждого 5-го символа — один символ шума
+    body = np.hstack([b64[:full * 5].reshape(full, 5), noise_codes(full).reshape(full, 1)]).ravel()
+    out = np.concatenate([body, b64[full * 5:]])
+    return out.tobytes().decode("ascii"), "Удалите каждый 6-й символ (шум), затем декодируйте Base64."
+
+
+def encrypt_crypto(sub: str, plaintext: str, meta: Dict[str, Any]) -> Tuple[str, str]:
+    """Encrypt plaintext for crypto subtype obf/caesar/vig/xor/b64. Returns (challenge, auto_hint)."""
+    if sub == "caesar":
+        return caesar(plaintext, int(meta["shift"])), f"Caesar, сдвиг {meta['shift']}."
+    if sub == "vig":
+        return vigenere(plaintext, str(meta["key"])), f"Vigenère, ключ {meta['key']}."
+    if sub == "xor":
+        return xor_hex(plaintext, str(meta["key"])), f"XOR-hex, ключ {meta['key']}."
+    if sub == "b64":
+        return base64_noise(plaintext)
+    return obfuscate2(plaintext)
+
+
+# подсказки ученику без ключа/сдвига (auto_hint из encrypt_crypto их называет — он для учителя)
+PUBLIC_HINTS = {
+    "caesar": "Шифр Цезаря по алфавиту a-z, A-Z, 0-9: подберите сдвиг, при котором появляется lapin{...}.",
+    "vig": "Шифр Виженера с коротким ключом-словом: восстановите ключ по известному началу флага lapin{.",
+    "xor": "XOR с коротким ключом, результат в hex: переведите hex в байты и найдите ключ по началу флага lapin{.",
+}
+
+
+def public_hint(sub: str, auto_hint: str) -> str:
+    """Hint safe to show a student: auto_hint for the keyless subtypes (obf/b64), a template otherwise."""
+    return PUBLIC_HINTS.get(sub, auto_hint)
+
+
+def _encrypt_chunk(jobs: List[Tuple[str, str, Dict[str, Any]]]) -> List[Tuple[str, str]]:
+    return [encrypt_crypto(sub, text, meta) for sub, text, meta in jobs]
+
+
+_pool: Optional[ProcessPoolExecutor] = None
+_pool_lock = threading.Lock()
+
+
+def _get_pool() -> ProcessPoolExecutor:
+    global _pool
+    with _pool_lock:
+        if _pool is None:
+            _pool = ProcessPoolExecutor(max_workers=POOL_WORKERS)
+        return _pool
+
+
+def encrypt_batch(jobs: List[Tuple[str, str, Dict[str, Any]]]) -> List[Tuple[str, str]]:
+    """Encrypt many (sub, plaintext, meta) jobs; large batches are split across a process pool.
+
+    Blocking — call it from a worker thread (e.g. loop.run_in_executor).
+    """
+    if len(jobs) < POOL_MIN_JOBS:
+        return _encrypt_chunk(jobs)
+    n = min(POOL_WORKERS, len(jobs))
+    chunks = [jobs[i::n] for i in range(n)]
+    parts = list(_get_pool().map(_encrypt_chunk, chunks))
+    # возвращаем в исходном порядке (чанки нарезаны с шагом n)
+    out: List[Tuple[str, str]] = [("", "")] * len(jobs)
+    for i, part in enumerate(parts):
+        out[i::n] = part
+    return out
+
+
+def caesar_decrypt(s: str, shift: int) -> str:
+    return caesar(s, -shift)
+
+
+def vigenere_decrypt(s: str, key: str) -> str:
+    return _vigenere(s, key, -1)
+
+
+def xor_unhex(s: str, key: str) -> str:
+    kb = np.frombuffer((key or "k").encode(), dtype=np.uint8)
+    b = np.frombuffer(bytes.fromhex(s), dtype=np.uint8)
+    return np.bitwise_xor(b, np.resize(kb, b.size)).tobytes().decode("utf-8", errors="replace")
+
+
+def deobfuscate2(s: str) -> str:
+    return s[0::2]
+
+
+def base64_denoise(s: str) -> str:
+    b64 = "".join(s[i:i + 5] for i in range(0, len(s), 6))
+    return base64.b64decode(b64).decode("utf-8", errors="replace")
+
+
+def decrypt_crypto(sub: str, challenge: str, meta: Dict[str, Any]) -> str:
+    """Inverse of encrypt_crypto (used to verify that the flag survives the round trip)."""
+    if sub == "caesar":
+        return caesar_decrypt(challenge, int(meta["shift"]))
+    if sub == "vig":
+        return vigenere_decrypt(challenge, str(meta["key"]))
+    if sub == "xor":
+        return xor_unhex(challenge, str(meta["key"]))
+    if sub == "b64":
+        return base64_denoise(challenge)
+    return deobfuscate2(challenge)
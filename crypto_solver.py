@@ -0,0 +1,273 @@
+"""crypto_solver.py
+
+Automatic solver used to score how hard a generated crypto CTF is to break without the key.
+
+- Caesar: all 62 shifts are decrypted at once as a (62 x N) NumPy matrix.
+- Vigenère / XOR: short keys are brute-forced in batch (score_vigenere_keys / score_xor_keys),
+  longer keys are attacked column by column (every key position independently, all shifts at once).
+- Candidates are ranked by chi-squared against English and Russian letter frequencies;
+  a task counts as broken if the best candidate contains the lapin{...} flag.
+
+Works on the exact cipher variants from ciphers.py (note that our Vigenère maps Cyrillic letters
+onto Latin ones, so Russian text is scored through that projection).
+"""
+
+from __future__ import annotations
+
+import math
+import time
+from typing import Any, Dict, List, Optional, Tuple
+
+import numpy as np
+
+from ciphers import CAESAR_ABC, FLAG_RE, base64_denoise, caesar_decrypt, deobfuscate2, vigenere_decrypt, xor_unhex
+
+_EN = np.array([8.167, 1.492, 2.782, 4.253, 12.702, 2.228, 2.015, 6.094, 6.966, 0.153, 0.772, 4.025, 2.406,
+                6.749, 7.507, 1.929, 0.095, 5.987, 6.327, 9.056, 2.758, 0.978, 2.360, 0.150, 1.974, 0.074])
+EN_FREQ = _EN / _EN.sum()
+
+RU_LETTERS = "абвгдеёжзийклмнопрстуфхцчшщъыьэюя"
+_RU = np.array([8.01, 1.59, 4.54, 1.70, 2.98, 8.45, 0.04, 0.94, 1.65, 7.35, 1.21, 3.49, 4.40, 3.21, 6.70, 10.97,
+                2.81, 4.73, 5.47, 6.26, 2.62, 0.26, 0.97, 0.48, 1.44, 0.73, 0.36, 0.04, 1.90, 1.74, 0.32, 0.64, 2.01])
+RU_FREQ = _RU / _RU.sum()
+
+_EPS = 1e-4
+
+
+def _ru_projected() -> np.ndarray:
+    # наш Vigenère переводит строчную кириллицу в латиницу как (ord(ch)-97) % 26
+    out = np.zeros(26)
+    for ch, p in zip(RU_LETTERS, RU_FREQ):
+        out[(ord(ch) - 97) % 26] += p
+    return out
+
+
+def _byte_model() -> np.ndarray:
+    """Expected UTF-8 byte distribution of mixed Russian/English prose (for XOR columns)."""
+    m = np.full(256, _EPS / 256)
+    m[ord(" ")] += 0.15
+    for ch in ".,-{}_":
+        m[ord(ch)] += 0.005
+    for i, p in enumerate(EN_FREQ):
+        m[97 + i] += 0.30 * p
+    for ch, p in zip(RU_LETTERS, RU_FREQ):
+        lead, trail = ch.encode("utf-8")
+        m[lead] += 0.25 * p
+        m[trail] += 0.25 * p
+    for d in range(10):
+        m[48 + d] += 0.002
+    return m / m.sum()
+
+
+RU_PROJ_FREQ = _ru_projected()
+MIXED_FREQ = (EN_FREQ + RU_PROJ_FREQ) / 2
+BYTE_FREQ = _byte_model()
+
+
+def chi2(counts: np.ndarray, model: np.ndarray) -> np.ndarray:
+    """Chi-squared of each row of counts (K x M) against model (M,). Lower is better."""
+    counts = np.atleast_2d(counts)
+    if counts.dtype != np.float32:
+        counts = counts.astype(np.float64)
+    n = counts.sum(axis=1)
+    m = (model + _EPS).astype(counts.dtype)
+    # sum((c - n*m)^2 / (n*m)) = sum(c^2/m)/n - 2n + n*sum(m): одно умножение матрицы на вектор
+    safe_n = np.where(n > 0, n, 1.0)
+    return np.where(n > 0, (counts ** 2) @ (1.0 / m) / safe_n - 2 * n + n * m.sum(), 0.0)
+
+
+def _row_counts(values: np.ndarray, m: int) -> np.ndarray:
+    """Histogram of every row of a (K x N) int matrix with values in [0, m)."""
+    k = values.shape[0]
+    offs = (np.arange(k, dtype=np.int64) * m)[:, None]
+    return np.bincount((values + offs).ravel(), minlength=k * m).reshape(k, m)
+
+
+def _letter_score(counts: np.ndarray) -> np.ndarray:
+    # текст может быть английским, русским (через проекцию) или смешанным — берём лучшую из моделей
+    return np.minimum.reduce([chi2(counts, EN_FREQ), chi2(counts, RU_PROJ_FREQ), chi2(counts, MIXED_FREQ)])
+
+
+# --------------- Caesar ---------------
+
+def caesar_candidates(challenge: str) -> Tuple[np.ndarray, np.ndarray]:
+    """Scores for all 62 shifts at once. Returns (shifts sorted best-first, their chi2)."""
+    pos = {ch: i for i, ch in enumerate(CAESAR_ABC)}
+    idx = np.fromiter((pos.get(ch, -1) for ch in challenge), dtype=np.int64, count=len(challenge))
+    idx = idx[idx >= 0]
+    n = len(CAESAR_ABC)
+    shifts = np.arange(n)
+    if idx.size == 0:
+        return shifts, np.zeros(n)
+    dec = (idx[None, :] - shifts[:, None]) % n                  # 62 x N
+    letters = np.where(dec < 52, dec % 26, 26)                   # 26 = цифра
+    counts = _row_counts(letters, 27)[:, :26]
+    scores = chi2(counts, EN_FREQ)
+    order = np.argsort(scores, kind="stable")
+    return shifts[order], scores[order]
+
+
+# --------------- Vigenère ---------------
+
+def _vig_stream(challenge: str) -> np.ndarray:
+    """Letter values (0..25) of the alphabetic positions, i.e. the positions the key walks over."""
+    return np.array([(ord(ch) - (97 if ch.islower() else 65)) % 26 for ch in challenge if ch.isalpha()], dtype=np.int64)
+
+
+def score_vigenere_keys(challenge: str, keys: np.ndarray) -> np.ndarray:
+    """Batch brute force: chi2 for each key in keys (K x L matrix of 0..25 shifts, one key length).
+
+    Histograms are built once per key column; each key is then a gather of L shifted histograms,
+    so the cost is O(K * L * 26) and does not depend on the text length.
+    """
+    v = _vig_stream(challenge)
+    keys = np.atleast_2d(keys).astype(np.int64)
+    L = keys.shape[1]
+    counts = np.zeros((keys.shape[0], 26), dtype=np.float32)
+    # h[letters][k][c] = сколько букв c получится в столбце при сдвиге ключа k
+    letters = (np.arange(26)[None, :] + np.arange(26)[:, None]) % 26
+    for j in range(L):
+        h = np.bincount(v[j::L], minlength=26).astype(np.float32)
+        counts += h[letters][keys[:, j]]
+    return _letter_score(counts)
+
+
+def vigenere_key_guess(challenge: str, key_len: int) -> Tuple[str, int]:
+    """Column attack: every key position is scored for all 26 shifts at once. Returns (key, candidates)."""
+    v = _vig_stream(challenge)
+    key = []
+    shifts = np.arange(26)
+    for j in range(key_len):
+        col = v[j::key_len]
+        if col.size == 0:
+            key.append("a")
+            continue
+        counts = _row_counts((col[None, :] - shifts[:, None]) % 26, 26)
+        key.append(chr(97 + int(np.argmin(_letter_score(counts)))))
+    return "".join(key), 26 * key_len
+
+
+# --------------- XOR ---------------
+
+def score_xor_keys(cipher: bytes, keys: np.ndarray) -> np.ndarray:
+    """Batch brute force: chi2 of the decrypted bytes for each key (K x L uint8 matrix).
+
+    Same trick as score_vigenere_keys: per-column byte histograms, permuted by XOR with the key byte.
+    """
+    b = np.frombuffer(cipher, dtype=np.uint8)
+    keys = np.atleast_2d(keys).astype(np.int64)
+    L = keys.shape[1]
+    counts = np.zeros((keys.shape[0], 256), dtype=np.float32)
+    perm = np.bitwise_xor(np.arange(256)[None, :], np.arange(256)[:, None])
+    for j in range(L):
+        h = np.bincount(b[j::L], minlength=256).astype(np.float32)
+        counts += h[perm][keys[:, j]]
+    return chi2(counts, BYTE_FREQ)
+
+
+def xor_key_guess(cipher: bytes, key_len: int, alphabet: bytes) -> Tuple[bytes, int]:
+    b = np.frombuffer(cipher, dtype=np.uint8)
+    cands = np.frombuffer(alphabet, dtype=np.uint8)
+    key = bytearray()
+    for j in range(key_len):
+        col = b[j::key_len]
+        if col.size == 0:
+            key.append(cands[0])
+            continue
+        counts = _row_counts(np.bitwise_xor(col[None, :], cands[:, None]).astype(np.int64), 256)
+        key.append(int(cands[int(np.argmin(chi2(counts, BYTE_FREQ)))]))
+    return bytes(key), len(cands) * key_len
+
+
+# --------------- отчёт ---------------
+
+XOR_KEY_ALPHABET = bytes(range(32, 127))
+
+
+def _found(text: str, expected_flag: Optional[str]) -> Optional[str]:
+    if expected_flag:
+        return expected_flag if expected_flag in (text or "") else None
+    m = FLAG_RE.search(text or "")
+    return m.group(0) if m else None
+
+
+def difficulty_score(recovered: bool, candidates: int) -> int:
+    """0..100: 100 — не взламывается автоматически; иначе растёт с log10 числа перебранных вариантов."""
+    if not recovered:
+        return 100
+    return min(99, int(round(10 * math.log10(max(1, candidates)))))
+
+
+def difficulty_label(score: int) -> str:
+    if score >= 100:
+        return "не взламывается автоматически"
+    if score < 20:
+        return "лёгкая"
+    if score < 50:
+        return "средняя"
+    return "сложная"
+
+
+def solve(sub: str, challenge: str, expected_flag: Optional[str] = None, max_key_len: int = 8) -> Dict[str, Any]:
+    """Try to recover lapin{...} from a challenge without the key.
+
+    Returns {"subtype","recovered","flag","key","candidates","elapsed_ms","difficulty","label"}.
+    """
+    t0 = time.perf_counter()
+    flag: Optional[str] = None
+    key: Any = None
+    candidates = 1
+    try:
+        if sub == "caesar":
+            shifts, _ = caesar_candidates(challenge)
+            candidates = len(shifts)
+            # сдвиги по возрастанию chi2; латиницы в русском тексте мало, поэтому проверяем все 62
+            for sh in shifts.tolist():
+                flag = _found(caesar_decrypt(challenge, sh), expected_flag)
+                if flag:
+                    key = sh
+                    break
+        elif sub == "vig":
+            candidates = 0
+            best: List[Tuple[float, str]] = []
+            for L in range(1, max_key_len + 1):
+                k, n = vigenere_key_guess(challenge, L)
+                candidates += n
+                kv = np.frombuffer(k.encode("ascii"), dtype=np.uint8).astype(np.int64) - 97
+                best.append((float(score_vigenere_keys(challenge, kv)[0]), k))
+            for _, k in sorted(best):
+                flag = _found(vigenere_decrypt(challenge, k), expected_flag)
+                if flag:
+                    key = k
+                    break
+        elif sub == "xor":
+            raw = bytes.fromhex(challenge)
+            candidates = 0
+            best_x: List[Tuple[float, bytes]] = []
+            for L in range(1, max_key_len + 1):
+                k, n = xor_key_guess(raw, L, XOR_KEY_ALPHABET)
+                candidates += n
+                best_x.append((float(score_xor_keys(raw, np.frombuffer(k, dtype=np.uint8))[0]), k))
+            for _, k in sorted(best_x):
+                flag = _found(xor_unhex(challenge, k.decode("latin-1")), expected_flag)
+                if flag:
+                    key = k.decode("latin-1")
+                    break
+        elif sub == "b64":
+            flag = _found(base64_denoise(challenge), expected_flag)
+        else:
+            flag = _found(deobfuscate2(challenge), expected_flag)
+    except (ValueError, UnicodeError):
+        flag = None
+    recovered = flag is not None
+    score = difficulty_score(recovered, candidates)
+    return {
+        "subtype": sub,
+        "recovered": recovered,
+        "flag": flag,
+        "key": key,
+        "candidates": candidates,
+        "elapsed_ms": round((time.perf_counter() - t0) * 1000, 2),
+        "difficulty": score,
+        "label": difficulty_label(score),
+    }
@@ -10,6 +10,9 @@ Uniqueness: store fingerprints in your bot_data.json under data['ctf_fingerprint
 If generated content repeats, module retries with a new nonce.
 
 NOTE: This module does NOT depend on your bot framework; it only provides async generators.
+
+Tracing: if tracing.py is importable and TRACE_FILE is set, every generate_unique_* call
+writes a trace (one span per attempt, LLM call and fingerprint check); see tracing.py.
 """
 
 from __future__ import annotations
@@ -23,7 +26,25 @@ from typing import Any, Dict, List, Optional, Tuple
 
 import aiohttp
 
-YANDEX_URL = "https://llm.api.cloud.yandex.net/foundationModels/v1/completion"
+try:
+    from tracing import span as _span, child as _child
+except ImportError:  # standalone copy without tracing.py: spans are no-ops
+    class _NoSpan:
+        def set(self, **attrs: Any) -> "_NoSpan":
+            return self
+
+        def __enter__(self) -> "_NoSpan":
+            return self
+
+        def __exit__(self, *exc: Any) -> None:
+            pass
+
+    def _span(name: str, **attrs: Any) -> _NoSpan:
+        return _NoSpan()
+
+    _child = _span
+
+YANDEX_URL = os.getenv("YANDEX_URL", "https://llm.api.cloud.yandex.net/foundationModels/v1/completion")
 
 
 def sha256_text(s: str) -> str:
@@ -72,16 +93,18 @@ async def yagpt_completion(
         "messages": messages,
     }
 
-    async with aiohttp.ClientSession() as session:
-        async with session.post(YANDEX_URL, headers=headers, json=payload, timeout=timeout_s) as resp:
-            if resp.status != 200:
-                body = await resp.text()
-                raise RuntimeError(f"YandexGPT HTTP {resp.status}: {body[:300]}")
-            data = await resp.json()
-            alts = data.get("result", {}).get("alternatives", [])
-            if not alts:
-                return ""
-            return alts[0].get("message", {}).get("text", "") or ""
+    with _child("yagpt", model=model) as sp:
+        async with aiohttp.ClientSession() as session:
+            async with session.post(YANDEX_URL, headers=headers, json=payload, timeout=timeout_s) as resp:
+                sp.set(status=resp.status)
+                if resp.status != 200:
+                    body = await resp.text()
+                    raise RuntimeError(f"YandexGPT HTTP {resp.status}: {body[:300]}")
+                data = await resp.json()
+                alts = data.get("result", {}).get("alternatives", [])
+                if not alts:
+                    return ""
+                return alts[0].get("message", {}).get("text", "") or ""
 
 
 def ensure_fingerprint_store(data: Dict[str, Any]) -> List[str]:
@@ -267,25 +290,34 @@ async def generate_unique_crypto_bundle(
 ) -> Dict[str, str]:
     """Returns unique (within data['ctf_fingerprints']) text+guides for crypto."""
 
-    for attempt in range(1, max_attempts + 1):
-        nonce = f"{secrets.token_hex(6)}-{attempt}"
-        out = await generate_crypto_text_and_guides(
-            api_key=api_key,
-            folder_id=folder_id,
-            topic=topic,
-            flag=flag,
-            subtype=subtype,
-            params=params,
-            attempt_nonce=nonce,
-        )
-        fp = sha256_text(out["plaintext"] + "\n" + out["teacher_guide"])
-        if not is_duplicate(data, fp):
-            remember_fingerprint(data, fp)
-            return out
-
-    # if all attempts duplicate, still return last one but mark it
-    out["teacher_guide"] = out.get("teacher_guide", "") + "\n\n⚠️ Не удалось гарантировать уникальность после нескольких попыток."
-    return out
+    with _span("unique.crypto", subtype=subtype) as job:
+        for attempt in range(1, max_attempts + 1):
+            with _span("attempt", n=attempt) as att:
+                nonce = f"{secrets.token_hex(6)}-{attempt}"
+                with _span("llm"):
+                    out = await generate_crypto_text_and_guides(
+                        api_key=api_key,
+                        folder_id=folder_id,
+                        topic=topic,
+                        flag=flag,
+                        subtype=subtype,
+                        params=params,
+                        attempt_nonce=nonce,
+                    )
+                with _span("validate.fingerprint"):
+                    fp = sha256_text(out["plaintext"] + "\n" + out["teacher_guide"])
+                    dup = is_duplicate(data, fp)
+                if not dup:
+                    remember_fingerprint(data, fp)
+                    att.set(outcome="ok")
+                    job.set(outcome="ok", attempts=attempt)
+                    return out
+                att.set(outcome="rejected", reason="duplicate")
+
+        # if all attempts duplicate, still return last one but mark it
+        job.set(outcome="duplicate", attempts=max_attempts)
+        out["teacher_guide"] = out.get("teacher_guide", "") + "\n\n⚠️ Не удалось гарантировать уникальность после нескольких попыток."
+        return out
 
 
 async def generate_unique_web_bundle(
@@ -300,20 +332,29 @@ async def generate_unique_web_bundle(
 ) -> Dict[str, str]:
     """Returns unique (within data['ctf_fingerprints']) web code+guides."""
 
-    for attempt in range(1, max_attempts + 1):
-        nonce = f"{secrets.token_hex(6)}-{attempt}"
-        out = await generate_web_code_and_guides(
-            api_key=api_key,
-            folder_id=folder_id,
-            vuln_type=vuln_type,
-            embedded_flag=embedded_flag,
-            expected_answer=expected_answer,
-            attempt_nonce=nonce,
-        )
-        fp = sha256_text(out["code"] + "\n" + out["teacher_guide"])
-        if not is_duplicate(data, fp):
-            remember_fingerprint(data, fp)
-            return out
-
-    out["teacher_guide"] = out.get("teacher_guide", "") + "\n\n⚠️ Не удалось гарантировать уникальность после нескольких попыток."
-    return out
+    with _span("unique.web", subtype=vuln_type) as job:
+        for attempt in range(1, max_attempts + 1):
+            with _span("attempt", n=attempt) as att:
+                nonce = f"{secrets.token_hex(6)}-{attempt}"
+                with _span("llm"):
+                    out = await generate_web_code_and_guides(
+                        api_key=api_key,
+                        folder_id=folder_id,
+                        vuln_type=vuln_type,
+                        embedded_flag=embedded_flag,
+                        expected_answer=expected_answer,
+                        attempt_nonce=nonce,
+                    )
+                with _span("validate.fingerprint"):
+                    fp = sha256_text(out["code"] + "\n" + out["teacher_guide"])
+                    dup = is_duplicate(data, fp)
+                if not dup:
+                    remember_fingerprint(data, fp)
+                    att.set(outcome="ok")
+                    job.set(outcome="ok", attempts=attempt)
+                    return out
+                att.set(outcome="rejected", reason="duplicate")
+
+        job.set(outcome="duplicate", attempts=max_attempts)
+        out["teacher_guide"] = out.get("teacher_guide", "") + "\n\n⚠️ Не удалось гарантировать уникальность после нескольких попыток."
+        return out
@@ -0,0 +1,112 @@
+"""export.py
+
+Export of a class's results (tests, CTF, homework) as CSV or, if openpyxl is installed, XLSX.
+
+Rows are produced by a generator over data["results"] and written one by one into a
+SpooledTemporaryFile: it stays in memory up to SPOOL_MAX bytes and rolls over to a temp file
+beyond that, so memory stays bounded however many results a class has. The caller uploads
+the returned file object with send_document and closes it afterwards.
+
+Cells are made safe on the way out (safe_row): names and homework answers are typed by
+students, so text that Excel or openpyxl would take as a formula (=, +, -, @, tab or CR
+first) gets a leading apostrophe, and control characters that XML cannot hold (openpyxl
+raises on them) are removed.
+"""
+
+from __future__ import annotations
+
+import csv
+import io
+import re
+import tempfile
+from typing import Any, Dict, Iterator, List, Optional
+
+try:
+    from openpyxl import Workbook
+except ImportError:  # XLSX — опционально
+    Workbook = None
+
+SPOOL_MAX = 1 << 20
+
+FORMULA_START = ("=", "+", "-", "@", "\t", "\r")
+# те же символы, что openpyxl.cell.cell.ILLEGAL_CHARACTERS_RE (недопустимы в XML 1.0)
+_CONTROL = re.compile(r"[\x00-\x08\x0b\x0c\x0e-\x1f]")
+
+COLUMNS = ["submitted_at", "student_id", "student_name", "assignment_id", "assignment", "kind",
+           "correct_answers", "total_questions", "is_correct", "attempts", "answer", "format_ok", "variant"]
+
+
+def xlsx_available() -> bool:
+    return Workbook is not None
+
+
+def iter_rows(data: Dict[str, Any], class_id: str) -> Iterator[List[Any]]:
+    """Result rows of one class, in storage order. Lazy: nothing is materialized."""
+    assignments = {aid: a for aid, a in data.get("assignments", {}).items()
+                   if isinstance(a, dict) and a.get("class_id") == class_id}
+    users = data.get("users", {})
+    for r in data.get("results", {}).values():
+        if not isinstance(r, dict):
+            continue
+        a = assignments.get(r.get("assignment_id"))
+        if a is None:
+            continue
+        u = users.get(r.get("student_id"), {})
+        p = u.get("profile") or {}
+        name = " ".join([p.get("last_name", ""), p.get("first_name", "")]).strip() or r.get("student_name", "")
+        kind = r.get("kind")
+        yield [
+            r.get("submitted_at", ""), r.get("student_id", ""), name, a["id"], a.get("title", ""), kind,
+            r.get("correct_answers", "") if kind == "test" else "",
+            r.get("total_questions", "") if kind == "test" else "",
+            _yn(r.get("is_correct")) if kind == "ctf" else "",
+            r.get("attempts", "") if kind == "ctf" else "",
+            r.get("answer", "") if kind == "homework" else "",
+            _yn(r.get("format_ok")) if kind == "homework" else "",
+            r.get("variant", ""),
+        ]
+
+
+def _yn(v: Optional[bool]) -> str:
+    return "" if v is None else ("yes" if v else "no")
+
+
+def safe_cell(v: Any) -> Any:
+    """Text cell that opens as text in Excel: no control characters, no formula."""
+    if not isinstance(v, str):
+        return v
+    v = _CONTROL.sub("", v)
+    return "'" + v if v.startswith(FORMULA_START) else v
+
+
+def safe_row(row: List[Any]) -> List[Any]:
+    return [safe_cell(v) for v in row]
+
+
+def write_csv(rows: Iterator[List[Any]]) -> "tempfile.SpooledTemporaryFile[bytes]":
+    """CSV (UTF-8 with BOM, so Excel opens Cyrillic correctly). Returns the file rewound to 0."""
+    buf = tempfile.SpooledTemporaryFile(max_size=SPOOL_MAX)
+    text = io.TextIOWrapper(buf, encoding="utf-8-sig", newline="", write_through=False)
+    w = csv.writer(text)
+    w.writerow(COLUMNS)
+    for row in rows:
+        w.writerow(safe_row(row))
+    text.flush()
+    text.detach()
+    buf.seek(0)
+    return buf
+
+
+def write_xlsx(rows: Iterator[List[Any]], title: str = "results") -> "tempfile.SpooledTemporaryFile[bytes]":
+    """XLSX via openpyxl's write-only (streaming) workbook. Returns the file rewound to 0."""
+    if Workbook is None:
+        raise RuntimeError("openpyxl is not installed")
+    wb = Workbook(write_only=True)
+    ws = wb.create_sheet(title[:31] or "results")
+    ws.append(COLUMNS)
+    for row in rows:
+        ws.append(safe_row(row))
+    buf = tempfile.SpooledTemporaryFile(max_size=SPOOL_MAX)
+    wb.save(buf)
+    buf.seek(0)
+    return buf
@@ -0,0 +1,91 @@
+"""gradebook.py
+
+Materialized per-class gradebook: data["gradebooks"][class_id][student_id][assignment_id] -> cell.
+
+A cell keeps the best score so far, whether the assignment was solved, the number of attempts
+and the time of the last submission. record() folds one new result into its cell, so the
+gradebook is kept up to date by the save_*_res functions without ever rescanning
+data["results"]; build() does that scan once to backfill gradebooks for older data.
+"""
+
+from __future__ import annotations
+
+from typing import Any, Dict, List, Optional, Tuple
+
+EMPTY = "·"
+# таблица длиннее этого уходит документом (лимит сообщения Telegram — 4096 символов)
+MESSAGE_LIMIT = 3500
+
+
+def cell_update(cell: Optional[Dict[str, Any]], r: Dict[str, Any]) -> Dict[str, Any]:
+    """Merge a result into a cell (returns the cell, creating it if needed)."""
+    kind = r.get("kind")
+    if kind == "test":
+        score, top = int(r.get("correct_answers") or 0), int(r.get("total_questions") or 0)
+        ok, tries = top > 0 and score == top, 1
+    elif kind == "ctf":
+        ok = bool(r.get("is_correct"))
+        score, top, tries = int(ok), 1, int(r.get("attempts") or 1)
+    else:
+        ok = bool(r.get("format_ok"))
+        score, top, tries = int(ok), 1, 1
+    if cell is None:
+        cell = {"kind": kind, "score": score, "max": top, "ok": ok, "attempts": 0, "at": ""}
+    if score >= cell["score"]:
+        cell["score"], cell["max"] = score, top
+    cell["ok"] = cell["ok"] or ok
+    cell["attempts"] += tries
+    cell["at"] = max(cell["at"], r.get("submitted_at") or "")
+    return cell
+
+
+def record(gradebooks: Dict[str, Any], class_id: Optional[str], r: Dict[str, Any]) -> None:
+    if not class_id:
+        return
+    row = gradebooks.setdefault(class_id, {}).setdefault(r["student_id"], {})
+    row[r["assignment_id"]] = cell_update(row.get(r["assignment_id"]), r)
+
+
+def drop(gradebooks: Dict[str, Any], assignments: List[Dict[str, Any]]) -> None:
+    """Remove the cells of assignments that left the hot data (e.g. archived)."""
+    for a in assignments:
+        for row in gradebooks.get(a.get("class_id"), {}).values():
+            row.pop(a["id"], None)
+
+
+def build(data: Dict[str, Any]) -> Dict[str, Any]:
+    """Gradebooks for all classes from scratch (one pass over results, in submission order)."""
+    gradebooks: Dict[str, Any] = {}
+    res = [r for r in data.get("results", {}).values()
+           if isinstance(r, dict) and r.get("assignment_id") and r.get("student_id")]
+    res.sort(key=lambda r: r.get("submitted_at") or "")
+    for r in res:
+        a = data.get("assignments", {}).get(r["assignment_id"])
+        if isinstance(a, dict):
+            record(gradebooks, a.get("class_id"), r)
+    return gradebooks
+
+
+def cell_text(cell: Optional[Dict[str, Any]]) -> str:
+    if not cell:
+        return EMPTY
+    if cell["kind"] == "test":
+        return f"{cell['score']}/{cell['max']}"
+    mark = "✓" if cell["ok"] else "✗"
+    return f"{mark}{cell['attempts']}" if cell["kind"] == "ctf" else mark
+
+
+def render(gb: Dict[str, Any], students: List[Tuple[str, str]], columns: List[Tuple[str, str]]) -> str:
+    """Plain-text table: one row per student, one numbered column per assignment, legend below.
+
+    Test cells are score/max, CTF cells ✓/✗ with attempts, homework cells ✓/✗.
+    """
+    name_w = max([len("Ученик")] + [len(n) for _, n in students])
+    cells = [[cell_text(gb.get(sid, {}).get(aid)) for aid, _ in columns] for sid, _ in students]
+    widths = [max([len(str(j + 1))] + [len(row[j]) for row in cells]) for j in range(len(columns))]
+    lines = ["Ученик".ljust(name_w) + "".join(f" {str(j + 1).rjust(w)}" for j, w in enumerate(widths))]
+    for (sid, name), row in zip(students, cells):
+        lines.append(name.ljust(name_w) + "".join(f" {c.rjust(w)}" for c, w in zip(row, widths)))
+    lines.append("")
+    lines += [f"{j + 1}. {title}" for j, (_, title) in enumerate(columns)]
+    return "\n".join(lines)
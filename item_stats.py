@@ -0,0 +1,128 @@
+"""item_stats.py
+
+Per-question item analysis for tests: data["item_stats"][test_id].
+
+For every test the aggregate keeps the number of submissions, a histogram of total scores and,
+per question, how often each option was chosen plus how many correct answers came from each
+total-score bucket. record() folds one submission in with O(questions) work, and everything
+shown to the teacher is derived from these counters without touching data["results"]:
+
+* difficulty p — share of submissions that answered the question correctly;
+* distractor frequency — share of submissions that chose each option;
+* discrimination D — p in the top 27% by total score minus p in the bottom 27%. The groups are
+  cut from the score histogram; ties on the boundary score are taken proportionally.
+
+The chosen options come from the result's "answers" (indices, stored since this module exists)
+or, for older results, are recovered from wrong_answers by matching the option text. Stats are
+dropped when a test's questions change in a way that changes their meaning (see reset()).
+"""
+
+from __future__ import annotations
+
+from typing import Any, Dict, List, Optional
+
+GROUP = 0.27
+# меньше ответов — D не показываем, группы из одного-двух учеников ничего не значат
+MIN_N = 5
+
+
+def empty(test: Dict[str, Any]) -> Dict[str, Any]:
+    qs = test.get("questions") or []
+    nq = len(qs)
+    return {"n": 0, "nq": nq, "scores": [0] * (nq + 1),
+            "items": [{"opts": [0] * max(4, len(q.get("options") or [])), "hits": [0] * (nq + 1)} for q in qs]}
+
+
+def choices(test: Dict[str, Any], r: Dict[str, Any]) -> Optional[List[int]]:
+    """Option index chosen for every question, or None if the result does not fit the current questions."""
+    qs = test.get("questions") or []
+    ans = r.get("answers")
+    if isinstance(ans, list) and len(ans) == len(qs):
+        return [int(a) for a in ans]
+    if not qs or r.get("total_questions") != len(qs):
+        return None
+    wrong = {w.get("question"): w.get("user_answer") for w in r.get("wrong_answers") or [] if isinstance(w, dict)}
+    out: List[int] = []
+    for q in qs:
+        if q.get("question") in wrong:
+            try:
+                out.append((q.get("options") or []).index(wrong[q.get("question")]))
+            except ValueError:
+                return None
+        else:
+            out.append(int(q.get("correct", 0)))
+    # текст вопросов мог поменяться после сдачи — тогда восстановленные ответы не сходятся со счётом
+    if sum(1 for q, a in zip(qs, out) if a == q.get("correct")) != r.get("correct_answers"):
+        return None
+    return out
+
+
+def record(stats: Dict[str, Any], test: Optional[Dict[str, Any]], r: Dict[str, Any]) -> None:
+    if not isinstance(test, dict) or not r.get("test_id"):
+        return
+    ch = choices(test, r)
+    if ch is None:
+        return
+    qs = test.get("questions") or []
+    s = stats.get(r["test_id"])
+    if not s or s["nq"] != len(qs):
+        s = stats[r["test_id"]] = empty(test)
+    score = sum(1 for q, a in zip(qs, ch) if a == q.get("correct"))
+    s["n"] += 1
+    s["scores"][score] += 1
+    for q, a, it in zip(qs, ch, s["items"]):
+        if 0 <= a < len(it["opts"]):
+            it["opts"][a] += 1
+        if a == q.get("correct"):
+            it["hits"][score] += 1
+
+
+def reset(stats: Dict[str, Any], test_id: str) -> None:
+    """Forget a test's stats (options or the correct answer changed, questions added or removed)."""
+    stats.pop(test_id, None)
+
+
+def build(data: Dict[str, Any]) -> Dict[str, Any]:
+    """Stats for all tests from scratch (one pass over results, in submission order)."""
+    stats: Dict[str, Any] = {}
+    res = [r for r in data.get("results", {}).values() if isinstance(r, dict) and r.get("kind") == "test"]
+    res.sort(key=lambda r: r.get("submitted_at") or "")
+    for r in res:
+        record(stats, data.get("tests", {}).get(r.get("test_id")), r)
+    return stats
+
+
+def _group(scores: List[int], hits: List[int], size: int, top: bool) -> float:
+    """Correct answers within the `size` lowest (or highest) scoring submissions."""
+    left, got = size, 0.0
+    for k in (reversed(range(len(scores))) if top else range(len(scores))):
+        if left <= 0:
+            break
+        if scores[k]:
+            take = min(left, scores[k])
+            got += hits[k] * take / scores[k]
+            left -= take
+    return got
+
+
+def item(s: Dict[str, Any], qi: int) -> Dict[str, Any]:
+    """{"n", "p", "d" (None if too few submissions), "opts": [share per option]}."""
+    n = s["n"]
+    it = s["items"][qi]
+    if not n:
+        return {"n": 0, "p": None, "d": None, "opts": [0.0] * len(it["opts"])}
+    d = None
+    if n >= MIN_N:
+        g = max(1, round(GROUP * n))
+        d = (_group(s["scores"], it["hits"], g, True) - _group(s["scores"], it["hits"], g, False)) / g
+    return {"n": n, "p": sum(it["hits"]) / n, "d": d, "opts": [c / n for c in it["opts"]]}
+
+
+def line(s: Optional[Dict[str, Any]], qi: int, correct: int) -> str:
+    """One-line summary for the question view, e.g. "📊 p=0.62 · D=0.35 · выбор: 1) 62%✓ 2) 20% …"."""
+    if not s or qi >= len(s["items"]) or not s["n"]:
+        return "   📊 ответов пока нет"
+    st = item(s, qi)
+    d = "—" if st["d"] is None else f"{st['d']:.2f}"
+    opts = " ".join(f"{j + 1}) {round(v * 100)}%" + ("✓" if j == correct else "") for j, v in enumerate(st["opts"]))
+    return f"   📊 p={st['p']:.2f} · D={d} · выбор: {opts}"
@@ -0,0 +1,132 @@
+"""paging.py
+
+Cursor pagination for inline-keyboard menus.
+
+Lists are kept as sorted (key, id) pairs. A page is addressed by a keyset cursor, i.e. the id
+of the item next to it, "the items after X" or "the items before X". The cursor's position is
+found with bisect, so building a page costs O(log n + page size) however long the list is, and
+pages stay correct when items are added between taps. Ids in this bot are short
+(prefix + 8 digits), so a cursor fits into Telegram's 64-byte callback_data with room to spare.
+
+callback_data layout: "pg:<menu>:<n|p>:<id>" for page turns, "pk:<menu>:<id>" for a pick.
+"""
+
+from __future__ import annotations
+
+import bisect
+from typing import Any, Callable, Dict, Iterable, List, Optional, Tuple
+
+PAGE_SIZE = 8
+CALLBACK_LIMIT = 64
+NEXT, PREV, CURRENT = "n", "p", "c"
+
+
+class Page:
+    __slots__ = ("ids", "prev", "next")
+
+    def __init__(self, ids: List[str], prev: Optional[str], next: Optional[str]):
+        self.ids = ids
+        self.prev = prev    # курсор для «назад» (первый id страницы) или None
+        self.next = next    # курсор для «вперёд» (последний id страницы) или None
+
+
+def window(order: List[Tuple[Any, str]], pos: Optional[int], direction: str = NEXT,
+           size: int = PAGE_SIZE, desc: bool = True) -> Page:
+    """Page of a sorted (key, id) list shown in descending (newest-first) or ascending order.
+
+    pos is the cursor's index in `order` (None — first page); direction says whether the page
+    is the one after the cursor, the one before it, or the one starting at it (CURRENT, to
+    redraw a page in place), in display order.
+    """
+    n = len(order)
+    if pos is None:
+        start = 0
+    else:
+        d = n - 1 - pos if desc else pos          # позиция курсора в порядке показа
+        start = d + 1 if direction == NEXT else d if direction == CURRENT else max(0, d - size)
+    end = min(n, start + size)
+    if desc:
+        ids = [order[i][1] for i in range(n - 1 - start, n - 1 - end, -1)]
+    else:
+        ids = [order[i][1] for i in range(start, end)]
+    return Page(ids, ids[0] if ids and start > 0 else None, ids[-1] if ids and end < n else None)
+
+
+class SortedIndex:
+    """Sorted (key, id) list with id -> key, for one owner's items (e.g. a teacher's tests)."""
+
+    def __init__(self, desc: bool = True):
+        self.desc = desc
+        self._order: List[Tuple[Any, str]] = []
+        self._keys: Dict[str, Any] = {}
+
+    def __len__(self) -> int:
+        return len(self._order)
+
+    def ids(self) -> List[str]:
+        return [i for _, i in self._order]
+
+    def add(self, item_id: str, key: Any) -> None:
+        if item_id in self._keys:
+            if self._keys[item_id] == key:
+                return
+            self.remove(item_id)
+        self._keys[item_id] = key
+        bisect.insort(self._order, (key, item_id))
+
+    def remove(self, item_id: str) -> None:
+        key = self._keys.pop(item_id, None)
+        if key is None:
+            return
+        i = bisect.bisect_left(self._order, (key, item_id))
+        if i < len(self._order) and self._order[i][1] == item_id:
+            del self._order[i]
+
+    def page(self, cursor: Optional[str] = None, direction: str = NEXT, size: int = PAGE_SIZE) -> Page:
+        pos = None
+        if cursor in self._keys:
+            pos = bisect.bisect_left(self._order, (self._keys[cursor], cursor))
+        return window(self._order, pos, direction, size, self.desc)
+
+
+class Menus:
+    """menu -> owner -> SortedIndex. Each menu is built once from data by its `items` function
+    (owner, id, key triples) and then kept up to date with add()."""
+
+    def __init__(self):
+        self._items: Dict[str, Callable[[Dict[str, Any]], Iterable[Tuple[str, str, Any]]]] = {}
+        self._desc: Dict[str, bool] = {}
+        self._idx: Dict[str, Dict[str, SortedIndex]] = {}
+
+    def register(self, menu: str, items: Callable[[Dict[str, Any]], Iterable[Tuple[str, str, Any]]], desc: bool = True) -> None:
+        self._items[menu] = items
+        self._desc[menu] = desc
+
+    def get(self, menu: str, owner: str, data: Dict[str, Any]) -> SortedIndex:
+        if menu not in self._idx:
+            idx = self._idx[menu] = {}
+            for o, item_id, key in self._items[menu](data):
+                idx.setdefault(o, SortedIndex(self._desc[menu])).add(item_id, key)
+        return self._idx[menu].setdefault(owner, SortedIndex(self._desc[menu]))
+
+    def add(self, menu: str, owner: str, item_id: str, key: Any) -> None:
+        # пока меню не построено, новый элемент подхватит build
+        if menu in self._idx:
+            self._idx[menu].setdefault(owner, SortedIndex(self._desc[menu])).add(item_id, key)
+
+
+def cb(*parts: str) -> str:
+    data = ":".join(parts)
+    if len(data.encode("utf-8")) > CALLBACK_LIMIT:
+        raise ValueError(f"callback_data over {CALLBACK_LIMIT} bytes: {data!r}")
+    return data
+
+
+def parse(data: str) -> Tuple[str, str, Optional[str], Optional[str]]:
+    """("pg"|"pk", menu, direction or None, id)."""
+    parts = data.split(":", 3)
+    if parts[0] == "pg" and len(parts) == 4:
+        return "pg", parts[1], parts[2], parts[3]
+    if parts[0] == "pk" and len(parts) >= 3:
+        return "pk", parts[1], None, ":".join(parts[2:])
+    return parts[0], parts[1] if len(parts) > 1 else "", None, None
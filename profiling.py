@@ -0,0 +1,265 @@
+"""profiling.py
+
+On-demand profiling of the running bot (/profile, SIGUSR1).
+
+Nothing is installed while profiling is off. start() wraps every telebot and Router handler,
+and stop() puts the originals back, so the normal path runs no extra frames. Background jobs
+pass through job() and aload_data() through around_load(); both check `active` first.
+
+While a capture runs, each handler (and each job, as job.<name>) has its own
+cProfile.Profile. The wrapper steps the handler's coroutine by hand and enables the profile
+only around each step. Time spent awaiting I/O, and other handlers running in the meantime,
+therefore stay out of it. With memory=True tracemalloc is on as well, and every load_data()
+call is bracketed by two snapshots. tracemalloc sees all threads, so allocations of a
+concurrent load/save in the storage pool can show up in the diff.
+
+A capture ends after N updates, after T seconds, or on stop(). It writes to
+<out_dir>/<YYYYmmdd-HHMMSS>/:
+  <handler>.prof  per handler, in pstats format (python -m pstats, snakeviz);
+  summary.txt     calls, wall/CPU time and top functions per handler;
+  load_data.txt   top allocation sites per load_data() call (memory captures only).
+"""
+
+from __future__ import annotations
+
+import asyncio
+import cProfile
+import functools
+import logging
+import os
+import pstats
+import time
+import tracemalloc
+from collections import Counter, defaultdict
+from typing import Any, Callable, Dict, List, Optional
+
+from telebot.asyncio_handler_backends import BaseMiddleware
+
+log = logging.getLogger(__name__)
+
+
+class _Steps:
+    """Awaitable that runs a coroutine step by step, with `prof` enabled only inside each step."""
+
+    __slots__ = ("coro", "prof")
+
+    def __init__(self, coro, prof: cProfile.Profile):
+        self.coro = coro
+        self.prof = prof
+
+    def __await__(self):
+        coro, prof = self.coro, self.prof
+        value, exc = None, None
+        while True:
+            prof.enable()
+            try:
+                fut = coro.send(value) if exc is None else coro.throw(exc)
+            except StopIteration as e:
+                return e.value
+            finally:
+                prof.disable()
+            try:
+                value, exc = (yield fut), None
+            except GeneratorExit:
+                coro.close()
+                raise
+            except BaseException as e:  # отмена задачи и т.п. — пробрасываем внутрь корутины
+                value, exc = None, e
+
+
+class _Counter(BaseMiddleware):
+    def __init__(self, profiler: "Profiler"):
+        self.update_types = ["message", "callback_query"]
+        self.profiler = profiler
+
+    async def pre_process(self, message, data):
+        pass
+
+    async def post_process(self, message, data, exception):
+        self.profiler.tick()
+
+
+class Profiler:
+    def __init__(self, bot, router, out_dir: str = "profiles", skip: tuple = ()):
+        self.bot = bot
+        self.router = router
+        self.skip = skip  # обработчики-диспетчеры: их шаги вложены в шаги хендлеров, профили бы пересекались
+        self.out_dir = out_dir
+        self.active = False
+        self.memory = False
+        self._traced = False
+        self._mw = _Counter(self)
+        self._timer: Optional[asyncio.TimerHandle] = None
+        self._on_done: Optional[Callable[[str, str], Any]] = None
+        self._reset()
+
+    def _reset(self) -> None:
+        self.left = 0
+        self.until = 0.0
+        self.started = 0.0
+        self.profiles: Dict[str, cProfile.Profile] = {}
+        self.calls: Counter = Counter()
+        self.wall: Dict[str, float] = defaultdict(float)
+        self.loads: List[tuple] = []
+
+    # --------------- управление ---------------
+
+    def start(self, updates: int = 0, seconds: float = 0.0, memory: bool = False,
+              on_done: Optional[Callable[[str, str], Any]] = None) -> bool:
+        """Capture the next `updates` updates and/or `seconds` seconds. False if already running."""
+        if self.active:
+            return False
+        self._reset()
+        self.active, self.memory, self._on_done = True, memory, on_done
+        self.left, self.started = updates, time.time()
+        for h in self._handlers():
+            h["function"] = self._wrap(h["function"])
+        self.router.wrap(self._wrap)
+        if updates:
+            self.bot.middlewares.append(self._mw)
+        if seconds:
+            self.until = self.started + seconds
+            self._timer = asyncio.get_running_loop().call_later(seconds, self.stop)
+        if memory and not tracemalloc.is_tracing():
+            tracemalloc.start(10)
+            self._traced = True
+        return True
+
+    def stop(self) -> Optional[str]:
+        """End the capture, restore the handlers and write the files. Returns the directory."""
+        if not self.active:
+            return None
+        self.active = False
+        for h in self._handlers():
+            h["function"] = _unwrap(h["function"])
+        self.router.wrap(_unwrap)
+        if self._mw in self.bot.middlewares:
+            self.bot.middlewares.remove(self._mw)
+        if self._timer:
+            self._timer.cancel()
+            self._timer = None
+        if self._traced:
+            tracemalloc.stop()
+            self._traced = False
+        self.memory = False
+        path, summary = self._dump()
+        log.warning("profile written to %s", path)
+        if self._on_done:
+            self._on_done(path, summary)
+        return path
+
+    def toggle(self, updates: int = 200) -> None:
+        """SIGUSR1: start a capture of the next `updates` updates, or stop the running one."""
+        if self.active:
+            self.stop()
+        else:
+            self.start(updates=updates)
+            log.warning("profiling the next %d updates", updates)
+
+    def tick(self) -> None:
+        if self.left:
+            self.left -= 1
+            if not self.left:
+                asyncio.get_running_loop().call_soon(self.stop)  # не трогаем middlewares посреди их обхода
+
+    def status(self) -> str:
+        parts = [f"{sum(self.calls.values())} вызовов за {time.time() - self.started:.0f} с"]
+        if self.left:
+            parts.append(f"осталось апдейтов: {self.left}")
+        if self.until:
+            parts.append(f"до конца: {max(0.0, self.until - time.time()):.0f} с")
+        if self.memory:
+            parts.append("tracemalloc")
+        return ", ".join(parts)
+
+    # --------------- обёртки ---------------
+
+    def _handlers(self) -> List[Dict[str, Any]]:
+        return [h for h in self.bot.message_handlers + self.bot.callback_query_handlers if h["function"] not in self.skip]
+
+    async def _run(self, name: str, coro):
+        prof = self.profiles.get(name)
+        if prof is None:
+            prof = self.profiles[name] = cProfile.Profile()
+        self.calls[name] += 1
+        t0 = time.perf_counter()
+        try:
+            return await _Steps(coro, prof)
+        finally:
+            self.wall[name] += time.perf_counter() - t0
+
+    def _wrap(self, fn: Callable[..., Any]) -> Callable[..., Any]:
+        name = fn.__name__
+
+        @functools.wraps(fn)
+        async def wrapper(*args, **kwargs):
+            coro = fn(*args, **kwargs)
+            if not self.active:  # захват кончился, пока ссылка на обёртку ещё жила
+                return await coro
+            return await self._run(name, coro)
+        wrapper._profiling = True
+        return wrapper
+
+    def job(self, coro):
+        """Background job (run_async): profiled as job.<name> while a capture runs."""
+        if not self.active:
+            return coro
+        return self._run("job." + coro.cr_code.co_name, coro)
+
+    def around_load(self, fn: Callable[[], Any]) -> Callable[[], Any]:
+        """load_data for the storage pool: bracketed by tracemalloc snapshots in memory captures."""
+        if not self.memory:
+            return fn
+
+        def call():
+            tracemalloc.reset_peak()
+            before, t0 = tracemalloc.take_snapshot(), time.perf_counter()
+            out = fn()
+            dt, peak = time.perf_counter() - t0, tracemalloc.get_traced_memory()[1]
+            top = tracemalloc.take_snapshot().compare_to(before, "lineno")[:15]
+            self.loads.append((dt, peak, top))
+            return out
+        return call
+
+    # --------------- вывод ---------------
+
+    def _dump(self) -> tuple:
+        base = path = os.path.join(self.out_dir, time.strftime("%Y%m%d-%H%M%S", time.localtime(self.started)))
+        k = 1
+        while os.path.exists(path):
+            k += 1
+            path = f"{base}-{k}"
+        os.makedirs(path)
+        lines = [f"capture: {time.time() - self.started:.1f} s, {sum(self.calls.values())} calls"]
+        for name, n in self.calls.most_common():
+            prof = self.profiles[name]
+            prof.dump_stats(os.path.join(path, f"{name}.prof"))
+            st = pstats.Stats(prof)
+            lines.append(f"\n{name}: {n} calls, wall {self.wall[name] * 1000 / n:.1f} ms/call, "
+                         f"cpu {st.total_tt * 1000 / n:.1f} ms/call")
+            top = sorted(st.stats.items(), key=lambda kv: kv[1][3], reverse=True)
+            shown = 0
+            for (file, line, func), (cc, nc, tt, ct, callers) in top:
+                if file == __file__ or "_lsprof" in func or "'coroutine' objects" in func:  # сам механизм шагов
+                    continue
+                lines.append(f"  {ct * 1000:9.1f} ms cum {tt * 1000:9.1f} ms own  {nc:>7}  "
+                             f"{os.path.basename(file)}:{line}({func})")
+                shown += 1
+                if shown == 8:
+                    break
+        if self.loads:
+            with open(os.path.join(path, "load_data.txt"), "w", encoding="utf-8") as f:
+                for i, (dt, peak, top) in enumerate(self.loads, 1):
+                    f.write(f"load_data #{i}: {dt * 1000:.1f} ms, traced peak {peak / 2**20:.1f} MB\n")
+                    f.writelines(f"  {s}\n" for s in top)
+                    f.write("\n")
+            dt, peak, _ = max(self.loads, key=lambda x: x[1])
+            lines.append(f"\nload_data: {len(self.loads)} calls, max traced peak {peak / 2**20:.1f} MB ({dt * 1000:.0f} ms)")
+        summary = "\n".join(lines)
+        with open(os.path.join(path, "summary.txt"), "w", encoding="utf-8") as f:
+            f.write(summary + "\n")
+        return path, summary
+
+
+def _unwrap(fn: Callable[..., Any]) -> Callable[..., Any]:
+    return fn.__wrapped__ if getattr(fn, "_profiling", False) else fn
@@ -0,0 +1,101 @@
+"""reminders.py
+
+Deadline reminders for assignments with remind_hours (e.g. [24, 1] — a day and an hour before due_at).
+
+ReminderScheduler keeps a min-heap of (fire_at, seq, assignment_id, hours) events and a single
+asyncio task that sleeps until the earliest one instead of polling all assignments. When an
+event fires it awaits the callback fire(assignment_id, hours); the callback decides who gets
+the reminder and records remind_sent[str(hours)] (the students it went to), so a restart,
+which re-schedules everything, skips reminders that were already handled.
+"""
+
+from __future__ import annotations
+
+import asyncio
+import heapq
+import logging
+import time
+from datetime import datetime
+from typing import Any, Awaitable, Callable, Dict, List, Optional, Tuple
+
+log = logging.getLogger(__name__)
+
+# долгий сон режем на куски, чтобы не разъезжаться с настенными часами
+MAX_SLEEP = 3600.0
+
+
+def due_ts(a: Dict[str, Any]) -> Optional[float]:
+    try:
+        return datetime.fromisoformat(a["due_at"]).timestamp() if a.get("due_at") else None
+    except (TypeError, ValueError):
+        return None
+
+
+def reminder_events(a: Dict[str, Any]) -> List[Tuple[float, int]]:
+    """(fire_at, hours) for every remind_hours entry of an assignment that has a deadline."""
+    due = due_ts(a)
+    if due is None:
+        return []
+    return [(due - h * 3600, int(h)) for h in a.get("remind_hours") or []]
+
+
+def superseded(a: Dict[str, Any], hours: int, now: float) -> bool:
+    """True if a closer reminder is already due too (the bot was down) — send only that one."""
+    due = due_ts(a)
+    return due is not None and any(h < hours and due - h * 3600 <= now for h in a.get("remind_hours") or [])
+
+
+class ReminderScheduler:
+    def __init__(self, fire: Callable[[str, int], Awaitable[None]]):
+        self.fire = fire
+        self._heap: List[Tuple[float, int, str, int]] = []
+        self._seq = 0
+        self._wake: Optional[asyncio.Event] = None
+        self._task: Optional[asyncio.Task] = None
+
+    def schedule(self, aid: str, a: Dict[str, Any], now: Optional[float] = None) -> int:
+        """Queue the assignment's reminders that are still ahead of its deadline. Returns how many."""
+        now = time.time() if now is None else now
+        due = due_ts(a)
+        if due is None or due <= now:
+            return 0
+        sent = a.get("remind_sent") or {}
+        n = 0
+        for when, h in reminder_events(a):
+            if str(h) in sent:
+                continue
+            self._seq += 1
+            heapq.heappush(self._heap, (when, self._seq, aid, h))
+            n += 1
+        if n and self._wake is not None:
+            self._wake.set()
+        return n
+
+    def load(self, data: Dict[str, Any]) -> int:
+        return sum(self.schedule(aid, a) for aid, a in data.get("assignments", {}).items()
+                   if isinstance(a, dict) and a.get("remind_hours"))
+
+    def pending(self) -> int:
+        return len(self._heap)
+
+    def start(self) -> "asyncio.Task[None]":
+        if self._task is None:
+            self._wake = asyncio.Event()
+            self._task = asyncio.get_running_loop().create_task(self._run(), name="reminders")
+        return self._task
+
+    async def _run(self) -> None:
+        while True:
+            self._wake.clear()
+            now = time.time()
+            while self._heap and self._heap[0][0] <= now:
+                _, _, aid, h = heapq.heappop(self._heap)
+                try:
+                    await self.fire(aid, h)
+                except Exception as e:
+                    log.warning("reminder %s/%sh failed: %s", aid, h, e)
+            timeout = MAX_SLEEP if not self._heap else min(MAX_SLEEP, self._heap[0][0] - time.time())
+            try:
+                await asyncio.wait_for(self._wake.wait(), max(0.0, timeout))
+            except asyncio.TimeoutError:
+                pass
@@ -0,0 +1,250 @@
+"""send_queue.py
+
+Rate-limited outbound queue for Telegram sends.
+
+Handlers enqueue a send and return immediately; a few delivery tasks on the bot's event
+loop perform the actual (async) Bot API calls while respecting Telegram's flood limits:
+- per chat: token bucket (~1 msg/s, small burst), messages of one chat stay in FIFO order;
+- global: token bucket (~30 msg/s) shared by all chats;
+- chats whose next message is interactive (a reply to the user) go before bulk sends;
+- on HTTP 429 the message is put back and its chat is paused for retry_after seconds.
+
+Every send returns an asyncio future that resolves to True/False once the send is delivered or
+given up on; most callers ignore it, uploads await it before closing their file.
+"""
+
+from __future__ import annotations
+
+import asyncio
+import heapq
+import io
+import logging
+import time
+from collections import deque
+from typing import Any, Deque, Dict, List, Optional, Set, Tuple
+
+from telebot.asyncio_helper import ApiTelegramException
+
+INTERACTIVE = 0
+BULK = 1
+
+log = logging.getLogger(__name__)
+
+
+class TokenBucket:
+    def __init__(self, rate: float, burst: float):
+        self.rate = rate
+        self.burst = burst
+        self.tokens = burst
+        self.ts = time.monotonic()
+
+    def _refill(self, now: float) -> None:
+        self.tokens = min(self.burst, self.tokens + (now - self.ts) * self.rate)
+        self.ts = now
+
+    def delay(self, now: float) -> float:
+        """Seconds until one token is available (0 if available now)."""
+        self._refill(now)
+        return 0.0 if self.tokens >= 1 else (1 - self.tokens) / self.rate
+
+    def take(self, now: float) -> None:
+        self._refill(now)
+        self.tokens -= 1
+
+    def pause(self, now: float, seconds: float) -> None:
+        self._refill(now)
+        self.tokens = min(self.tokens, 1 - seconds * self.rate)
+
+    def full(self, now: float) -> bool:
+        self._refill(now)
+        return self.tokens >= self.burst
+
+
+class _Unclosable(io.RawIOBase):
+    """Read-only view of a file for one upload attempt: aiohttp closes what it uploads,
+    but the file must survive a 429 retry, so close() here is a no-op."""
+
+    def __init__(self, f):
+        self._f = f
+
+    def readable(self) -> bool:
+        return True
+
+    def readinto(self, b) -> int:
+        data = self._f.read(len(b))
+        b[:len(data)] = data
+        return len(data)
+
+    def close(self) -> None:
+        pass
+
+
+class SendQueue:
+    """Outbound queue: send_message/reply_to/send_document/edit_message_text are non-blocking.
+
+    bot is an AsyncTeleBot. Delivery tasks are started on the running loop by the first submit.
+    """
+
+    def __init__(self, bot, per_chat_rate: float = 1.0, per_chat_burst: float = 3,
+                 global_rate: float = 30.0, global_burst: float = 30, workers: int = 4, max_retries: int = 5):
+        self.bot = bot
+        self.per_chat_rate = per_chat_rate
+        self.per_chat_burst = per_chat_burst
+        self.max_retries = max_retries
+        self._global = TokenBucket(global_rate, global_burst)
+        self._buckets: Dict[Any, TokenBucket] = {}
+        self._pending: Dict[Any, Deque[list]] = {}
+        self._ready: List[Tuple[int, int, Any]] = []       # (priority, seq, chat) — чаты, готовые к отправке
+        self._sleeping: List[Tuple[float, int, Any]] = []  # (when, seq, chat) — ждут токен своего чата
+        self._scheduled: Set[Any] = set()
+        self._inflight: Set[Any] = set()
+        self._seq = 0
+        self._size = 0
+        self._workers = workers
+        self._tasks: List[asyncio.Task] = []
+        self._wake: Optional[asyncio.Event] = None
+
+    # --------------- API ---------------
+
+    def send_message(self, chat_id, text, priority: int = INTERACTIVE, **kwargs) -> "asyncio.Future[bool]":
+        return self.submit(chat_id, "send_message", (chat_id, text), kwargs, priority)
+
+    def reply_to(self, message, text, priority: int = INTERACTIVE, **kwargs) -> "asyncio.Future[bool]":
+        return self.submit(message.chat.id, "reply_to", (message, text), kwargs, priority)
+
+    def send_document(self, chat_id, document, priority: int = BULK, **kwargs) -> "asyncio.Future[bool]":
+        """document may be bytes or a seekable file object; a file is rewound before every attempt
+        and left open — close it after the returned future resolves."""
+        return self.submit(chat_id, "send_document", (chat_id, document), kwargs, priority)
+
+    def edit_message_text(self, text, chat_id, message_id, priority: int = INTERACTIVE, **kwargs) -> "asyncio.Future[bool]":
+        return self.submit(chat_id, "edit_message_text", (text, chat_id, message_id), kwargs, priority)
+
+    def edit_message_reply_markup(self, chat_id, message_id, reply_markup=None, priority: int = INTERACTIVE) -> "asyncio.Future[bool]":
+        return self.submit(chat_id, "edit_message_reply_markup", (chat_id, message_id), {"reply_markup": reply_markup}, priority)
+
+    def submit(self, chat_id, method: str, args: tuple, kwargs: Dict[str, Any],
+               priority: int = INTERACTIVE) -> "asyncio.Future[bool]":
+        self._start()
+        fut = asyncio.get_running_loop().create_future()
+        self._seq += 1
+        self._pending.setdefault(chat_id, deque()).append([priority, self._seq, method, args, kwargs, 0, fut])
+        self._size += 1
+        self._schedule(chat_id, time.monotonic())
+        self._wake.set()
+        return fut
+
+    def qsize(self) -> int:
+        return self._size
+
+    async def join(self, timeout: Optional[float] = None) -> bool:
+        """Wait until everything queued so far has been delivered (or dropped)."""
+        end = None if timeout is None else time.monotonic() + timeout
+        while self._size or self._inflight:
+            if end is not None and time.monotonic() >= end:
+                return False
+            await asyncio.sleep(0.01)
+        return True
+
+    def _start(self) -> None:
+        if self._tasks:
+            return
+        loop = asyncio.get_running_loop()
+        self._wake = asyncio.Event()
+        self._tasks = [loop.create_task(self._run(), name=f"send-queue-{i}") for i in range(self._workers)]
+
+    # --------------- планирование ---------------
+
+    def _bucket(self, chat_id) -> TokenBucket:
+        b = self._buckets.get(chat_id)
+        if b is None:
+            b = self._buckets[chat_id] = TokenBucket(self.per_chat_rate, self.per_chat_burst)
+        return b
+
+    def _schedule(self, chat_id, now: float) -> None:
+        """Put chat into ready/sleeping heap if it has pending sends and is not already there."""
+        if chat_id in self._scheduled or chat_id in self._inflight:
+            return
+        q = self._pending.get(chat_id)
+        if not q:
+            self._pending.pop(chat_id, None)
+            b = self._buckets.get(chat_id)
+            if b is not None and b.full(now):
+                del self._buckets[chat_id]
+            return
+        self._scheduled.add(chat_id)
+        d = self._bucket(chat_id).delay(now)
+        if d <= 0:
+            heapq.heappush(self._ready, (q[0][0], q[0][1], chat_id))
+        else:
+            heapq.heappush(self._sleeping, (now + d, q[0][1], chat_id))
+
+    async def _next(self) -> Tuple[Any, list]:
+        while True:
+            # сбрасываем флаг до проверки: submit/_done между проверкой и wait его снова поднимут
+            self._wake.clear()
+            now = time.monotonic()
+            while self._sleeping and self._sleeping[0][0] <= now:
+                _, _, chat_id = heapq.heappop(self._sleeping)
+                self._scheduled.discard(chat_id)
+                self._schedule(chat_id, now)
+            timeout = None
+            if self._ready:
+                gd = self._global.delay(now)
+                if gd <= 0:
+                    _, _, chat_id = heapq.heappop(self._ready)
+                    self._scheduled.discard(chat_id)
+                    item = self._pending[chat_id].popleft()
+                    self._size -= 1
+                    self._global.take(now)
+                    self._bucket(chat_id).take(now)
+                    # пока сообщение чата в полёте, следующее не отправляем — порядок сохраняется
+                    self._inflight.add(chat_id)
+                    return chat_id, item
+                timeout = gd
+            if self._sleeping:
+                t = self._sleeping[0][0] - now
+                timeout = t if timeout is None else min(timeout, t)
+            try:
+                await asyncio.wait_for(self._wake.wait(), timeout)
+            except asyncio.TimeoutError:
+                pass
+
+    def _done(self, chat_id, retry: Optional[list] = None, pause: float = 0.0) -> None:
+        now = time.monotonic()
+        self._inflight.discard(chat_id)
+        if retry is not None:
+            self._pending.setdefault(chat_id, deque()).appendleft(retry)
+            self._size += 1
+            self._bucket(chat_id).pause(now, pause)
+        self._schedule(chat_id, now)
+        self._wake.set()
+
+    # --------------- доставка ---------------
+
+    async def _run(self) -> None:
+        while True:
+            chat_id, item = await self._next()
+            _, _, method, args, kwargs, tries, fut = item
+            ok = False
+            try:
+                call_args = []
+                for a in args:
+                    if hasattr(a, "seek") and hasattr(a, "read"):
+                        a.seek(0)
+                        a = _Unclosable(a)
+                    call_args.append(a)
+                await getattr(self.bot, method)(*call_args, **kwargs)
+                ok = True
+            except ApiTelegramException as e:
+                if e.error_code == 429 and tries < self.max_retries:
+                    params = (e.result_json or {}).get("parameters") or {}
+                    item[5] = tries + 1
+                    self._done(chat_id, retry=item, pause=float(params.get("retry_after", 1)))
+                    continue
+                log.warning("send %s to %s failed: %s", method, chat_id, e)
+            except Exception as e:
+                log.warning("send %s to %s failed: %s", method, chat_id, e)
+            if not fut.done():
+                fut.set_result(ok)
+            self._done(chat_id)
@@ -1,26 +1,114 @@
-﻿import os, json, re, random, string, hashlib, asyncio, threading
+﻿import os, json, re, random, string, hashlib, asyncio, time, signal
+from concurrent.futures import ThreadPoolExecutor
 import html as _html
 from datetime import datetime, timezone, timedelta
 from typing import Dict, Any, Optional, List, Tuple
 
-import telebot
-from telebot import types
+from telebot import types, asyncio_helper
+from telebot.async_telebot import AsyncTeleBot
+from telebot.asyncio_handler_backends import BaseMiddleware
 import aiohttp
 from dotenv import load_dotenv
 
+from ciphers import FLAG_RE, encrypt_crypto, decrypt_crypto, encrypt_batch, public_hint
+from crypto_solver import solve as solve_crypto
+from send_queue import SendQueue, INTERACTIVE, BULK
+from state_store import StateStore
+from router import Router
+from reminders import ReminderScheduler, superseded
+from timeline import Timeline
+import analytics
+import archive
+import gradebook
+import paging
+import storage
+import item_stats
+import export
+import metrics
+import profiling
+import tracing
+
 load_dotenv()
 BOT_TOKEN = os.getenv("BOT_TOKEN")
 ADMIN_CODE = os.getenv("ADMIN_CODE", "admin123")
 YANDEX_API_KEY = os.getenv("YANDEX_API_KEY", "")
 YANDEX_FOLDER_ID = os.getenv("YANDEX_FOLDER_ID", "")
-DATA_FILE = "bot_data.json"
-YANDEX_URL = "https://llm.api.cloud.yandex.net/foundationModels/v1/completion"
+DATA_FILE = os.getenv("DATA_FILE", "bot_data.json")
+# если задан DATA_DIR — данные лежат по шардам (global + class/* + teacher/*, см. storage.py)
+DATA_DIR = os.getenv("DATA_DIR", "")
+# завершённые четверти/полугодия уезжают сюда сжатыми сегментами (см. archive.py, /archive)
+ARCHIVE_DIR = os.getenv("ARCHIVE_DIR", "archive")
+# webhook-режим: если WEBHOOK_URL не задан — работаем через polling
+WEBHOOK_URL = os.getenv("WEBHOOK_URL", "")
+WEBHOOK_SECRET = os.getenv("WEBHOOK_SECRET", "")
+WEBHOOK_HOST = os.getenv("WEBHOOK_HOST", "0.0.0.0")
+WEBHOOK_PORT = int(os.getenv("WEBHOOK_PORT", "8080"))
+# незавершённые диалоги (user_states) переживают рестарт и протухают через STATE_TTL_HOURS
+STATE_FILE = os.getenv("STATE_FILE", "user_states.pkl")
+STATE_TTL_HOURS = float(os.getenv("STATE_TTL_HOURS", "72"))
+STATE_MAX_MB = float(os.getenv("STATE_MAX_MB", "64"))
+# свой адрес completion-эндпоинта (например, bench/fake_yagpt.py) вместо облачного
+YANDEX_URL = os.getenv("YANDEX_URL", "https://llm.api.cloud.yandex.net/foundationModels/v1/completion")
+# свой адрес Bot API (локальный telegram-bot-api или bench/fake_tg.py) вместо api.telegram.org
+TELEGRAM_API_URL = os.getenv("TELEGRAM_API_URL", "")
+# общий лимит исходящих сообщений в секунду; больше 30 — только для локального/фейкового API
+SEND_RATE = float(os.getenv("SEND_RATE", "30"))
+# метрики в формате Prometheus на http://METRICS_HOST:METRICS_PORT/metrics (0 — не поднимать)
+METRICS_HOST = os.getenv("METRICS_HOST", "127.0.0.1")
+METRICS_PORT = int(os.getenv("METRICS_PORT", "0"))
+# /profile и SIGUSR1: куда писать профили и кому можно /profile (пусто — никому, остаётся только SIGUSR1)
+PROFILE_DIR = os.getenv("PROFILE_DIR", "profiles")
+PROFILE_ADMINS = {x.strip() for x in os.getenv("PROFILE_ADMINS", "").split(",") if x.strip()}
+# трассы генерации CTF (JSON lines, см. tracing.py; python -m tracing summary); пусто — не писать
+TRACE_FILE = os.getenv("TRACE_FILE", "")
 
 if not BOT_TOKEN:
     raise RuntimeError("BOT_TOKEN is not set")
-bot = telebot.TeleBot(BOT_TOKEN)
+if TELEGRAM_API_URL:
+    asyncio_helper.API_URL = TELEGRAM_API_URL.rstrip("/") + "/bot{0}/{1}"
+    asyncio_helper.FILE_URL = TELEGRAM_API_URL.rstrip("/") + "/file/bot{0}/{1}"
+tracing.configure(TRACE_FILE)
+bot = AsyncTeleBot(BOT_TOKEN)
+# все исходящие сообщения идут через очередь с лимитами Telegram (хендлеры не ждут сеть)
+outbox = SendQueue(bot, global_rate=SEND_RATE, global_burst=max(30.0, SEND_RATE))
+
+cold = archive.Archive(ARCHIVE_DIR)
+user_states = StateStore(STATE_FILE, ttl=STATE_TTL_HOURS * 3600, max_bytes=int(STATE_MAX_MB * 2**20))
+
+class StateFlush(BaseMiddleware):
+    """Persists user_states after each update (flows change their state dict in place)."""
+    def __init__(self):
+        self.update_types = ["message", "callback_query"]
+
+    async def pre_process(self, message, data):
+        pass
 
-user_states: Dict[str, Dict[str, Any]] = {}
+    async def post_process(self, message, data, exception):
+        # свой uid проверяем всегда: его ключ мог забрать flush другого апдейта, пока хендлер ждал aload_data
+        user_states.flush(str(message.from_user.id))
+
+bot.setup_middleware(StateFlush())
+router = Router(lambda m: (user_states.get(str(m.from_user.id)) or {}).get("flow"))
+
+# метрики пишутся всегда (доли микросекунды на событие), наружу — только при METRICS_PORT
+registry = metrics.Registry()
+M_HANDLER = registry.histogram("bot_handler_seconds", "Handler latency by handler function", ("handler",))
+M_STORAGE = registry.histogram("bot_storage_seconds", "aload_data/asave_data duration, including the wait for the storage pool", ("op",))
+M_DATA_BYTES = registry.gauge("bot_storage_data_bytes", "Size of the data files at the last load")
+M_WRITTEN = registry.counter("bot_storage_written_bytes_total", "Bytes written by asave_data")
+M_YAGPT = registry.histogram("bot_yagpt_seconds", "YandexGPT call latency by flow and HTTP status", ("flow", "status"))
+M_ATTEMPTS = registry.counter("bot_generation_attempts_total", "Generation attempts (one YandexGPT call each) by flow", ("flow",))
+M_REJECTED = registry.counter("bot_generation_rejected_total", "Generated content rejected by validation", ("flow", "reason"))
+M_GENERATED = registry.counter("bot_generation_total", "Finished generation jobs by flow and outcome", ("flow", "outcome"))
+registry.gauge("bot_user_states", "Dialogs in user_states", fn=lambda: len(user_states))
+registry.gauge("bot_user_states_bytes", "Pickled size of user_states", fn=lambda: user_states.stats()["bytes"])
+registry.gauge("bot_outbox_queue", "Sends waiting in the outbound queue", fn=outbox.qsize)
+
+# постраничные меню учителя: индекс по владельцу строится из data один раз, дальше — add() при создании
+menus = paging.Menus()
+menus.register("tt", lambda d: ((t.get("teacher_id"), tid, t.get("created_at","")) for tid,t in d["tests"].items() if isinstance(t,dict)))
+menus.register("tc", lambda d: ((t.get("teacher_id"), tid, t.get("created_at","")) for tid,t in d["ctf_tasks"].items() if isinstance(t,dict)))
+menus.register("cl", lambda d: ((c.get("teacher_id"), cid, c.get("name","")) for cid,c in d["classes"].items() if isinstance(c,dict)), desc=False)
 
 def now_iso() -> str:
     return datetime.now(timezone.utc).isoformat()
@@ -90,7 +178,9 @@ def assignment_window_status(a: Dict[str, Any], now: datetime) -> Tuple[str, Opt
     return "open", open_at, due_at
 
 def assignment_status_label(a: Dict[str, Any], now: datetime) -> str:
-    status, open_at, due_at = assignment_window_status(a, now)
+    return window_label(*assignment_window_status(a, now))
+
+def window_label(status: str, open_at: Optional[datetime], due_at: Optional[datetime]) -> str:
     if status == "not_open":
         return f"⏳ с {fmt_dt_msk(open_at)}"
     if status == "closed":
@@ -107,17 +197,38 @@ def assignment_can_submit(a: Dict[str, Any], now: datetime) -> Tuple[bool, str]:
         return False, f"Срок сдачи истёк ({fmt_dt_msk(due_at)})."
     return True, ""
 
-def find_invite(data: Dict[str, Any], code: str) -> Tuple[Optional[str], Optional[Dict[str, Any]]]:
+INVITE_ALPHABET = string.ascii_uppercase + string.digits
+BULK_INVITES_MAX = 500
+
+def invite_index(data: Dict[str, Any]) -> Dict[str, str]:
+    """code -> class_id for all invites (data["invite_index"] is kept in sync by make_invites)."""
+    idx = {}
     for cid, c in data.get("classes", {}).items():
-        if not isinstance(c, dict):
-            continue
-        invs = c.get("invites", {})
-        if not isinstance(invs, dict):
+        if isinstance(c, dict) and isinstance(c.get("invites"), dict):
+            for code in c["invites"]:
+                idx[code] = cid
+    return idx
+
+def find_invite(data: Dict[str, Any], code: str) -> Tuple[Optional[str], Optional[Dict[str, Any]]]:
+    cid = data.get("invite_index", {}).get(code)
+    c = data.get("classes", {}).get(cid) if cid else None
+    inv = c.get("invites", {}).get(code) if isinstance(c, dict) else None
+    return (cid, inv) if isinstance(inv, dict) else (None, None)
+
+def make_invites(data: Dict[str, Any], class_id: str, n: int, expires_at: datetime, max_uses: int = 1) -> List[str]:
+    """Create n invite codes for a class in memory; the caller saves once."""
+    invs = data["classes"][class_id].setdefault("invites", {})
+    idx = data["invite_index"]
+    codes: List[str] = []
+    created = now_iso()
+    while len(codes) < n:
+        code = "".join(random.choices(INVITE_ALPHABET, k=8))
+        if code in idx:
             continue
-        inv = invs.get(code)
-        if isinstance(inv, dict):
-            return cid, inv
-    return None, None
+        invs[code] = {"code": code, "expires_at": expires_at.isoformat(), "max_uses": max_uses, "uses": 0, "created_at": created}
+        idx[code] = class_id
+        codes.append(code)
+    return codes
 
 def invite_valid(inv: Dict[str, Any], now: datetime) -> Tuple[bool, str]:
     exp = dt_from_iso(inv.get("expires_at"))
@@ -149,11 +260,16 @@ def has_result(data: Dict[str, Any], assignment_id: str, student_id: str) -> boo
             return True
     return False
 
-def send_code_block(chat_id: int, code: str, reply_markup=None) -> None:
+def submitted_by(data: Dict[str, Any], assignment_id: str) -> set:
+    """student_id of everyone with a result for the assignment: one pass instead of has_result per student."""
+    return {r.get("student_id") for r in data.get("results", {}).values()
+            if isinstance(r, dict) and r.get("assignment_id") == assignment_id}
+
+def send_code_block(chat_id: int, code: str, reply_markup=None, priority: int = INTERACTIVE) -> None:
     """Send code safely using Telegram HTML <pre><code> to avoid Markdown entity errors."""
     snippet = code if len(code) < 3500 else code[:3500] + "\n... (обрезано)"
     esc = _html.escape(snippet)
-    bot.send_message(chat_id, f"<pre><code>{esc}</code></pre>", parse_mode="HTML", reply_markup=reply_markup)
+    outbox.send_message(chat_id, f"<pre><code>{esc}</code></pre>", parse_mode="HTML", reply_markup=reply_markup, priority=priority)
 
 
 def extract_json_obj(txt: str) -> Optional[Dict[str, Any]]:
@@ -190,11 +306,14 @@ def add_fingerprint(data: Dict[str,Any], fp: str) -> None:
     if len(data["ctf_fingerprints"]) > 3000:
         data["ctf_fingerprints"] = data["ctf_fingerprints"][-2000:]
 
+CRYPTO_TITLES = {"obf":"Crypto: Обфускация","caesar":"Crypto: Caesar","vig":"Crypto: Vigenère","xor":"Crypto: XOR-hex","b64":"Crypto: Base64+шум"}
+MAX_CTF_VARIANTS = 60
+
 def flag_once_ok(text: str) -> bool:
     if not text: 
         return False
     # ищем именно lapin{...}
-    flags = re.findall(r"lapin\{[^\}]{3,64}\}", text)
+    flags = FLAG_RE.findall(text)
     return len(flags) == 1
 
 async def gen_crypto_bundle_yagpt(topic_or_text: str, has_text: bool, flag: str, subtype: str, params: Dict[str,Any], nonce: str) -> Optional[Dict[str, str]]:
@@ -223,12 +342,14 @@ Nonce для уникальности: {nonce}
 Формат ответа: строго JSON:
 {{"title":str,"plaintext":str,"student_hint":str,"teacher_guide":str}}
 Без текста вне JSON."""
-    txt = await yandex_completion(prompt, temperature=0.55, max_tokens=1200)
+    txt = await yandex_completion(prompt, temperature=0.55, max_tokens=1200, flow="crypto")
     obj = extract_json_obj(txt or "")
     if not obj: 
+        if txt: M_REJECTED.labels("crypto", "json").inc()
         return None
     for k in ("title","plaintext","student_hint","teacher_guide"):
         if not isinstance(obj.get(k), str) or not obj[k].strip():
+            M_REJECTED.labels("crypto", "json").inc()
             return None
     return {k: obj[k].strip() for k in ("title","plaintext","student_hint","teacher_guide")}
 
@@ -257,12 +378,14 @@ Nonce для уникальности: {nonce}
 Формат: строго JSON:
 {{"title":str,"description":str,"student_instruction":str,"code":str,"teacher_guide":str}}
 Без текста вне JSON."""
-    txt = await yandex_completion(prompt, temperature=0.65, max_tokens=1600)
+    txt = await yandex_completion(prompt, temperature=0.65, max_tokens=1600, flow="web")
     obj = extract_json_obj(txt or "")
     if not obj: 
+        if txt: M_REJECTED.labels("web", "json").inc()
         return None
     for k in ("title","description","student_instruction","code","teacher_guide"):
         if not isinstance(obj.get(k), str) or not obj[k].strip():
+            M_REJECTED.labels("web", "json").inc()
             return None
     return {k: obj[k].strip() for k in ("title","description","student_instruction","code","teacher_guide")}
 
@@ -279,32 +402,68 @@ def ensure(data: Any) -> Dict[str, Any]:
             if not isinstance(t, dict): continue
             cid, tid = t.get("class_id"), t.get("id")
             if cid and tid and (cid, tid) not in pairs:
-                aid = gen_id("A")
+                # id детерминирован: до первого save миграция повторяется на каждом load и не должна плодить новые id
+                aid = "A" + str(int(sha(f"{cid}:{tid}"), 16))[:8]
                 data["assignments"][aid] = {"id":aid,"class_id":cid,"teacher_id":t.get("teacher_id"),"kind":"test","ref_id":tid,"title":f"Тест: {t.get('topic','')}", "created_at": now_iso()}
                 pairs.add((cid, tid))
     except Exception:
         pass
+    if not isinstance(data.get("gradebooks"), dict):
+        # разовый бэкфилл: дальше журнал обновляется в save_*_res
+        data["gradebooks"] = gradebook.build(data)
+    if not isinstance(data.get("item_stats"), dict):
+        data["item_stats"] = item_stats.build(data)
+    if not isinstance(data.get("invite_index"), dict):
+        data["invite_index"] = invite_index(data)
     return data
 
+def record_result(data: Dict[str, Any], r: Dict[str, Any]) -> None:
+    gradebook.record(data["gradebooks"], data["assignments"].get(r["assignment_id"],{}).get("class_id"), r)
+    if r.get("kind")=="test":
+        item_stats.record(data["item_stats"], data["tests"].get(r.get("test_id")), r)
+
+store = storage.open_store(DATA_FILE, DATA_DIR)
+
 def load_data() -> Dict[str, Any]:
-    if os.path.exists(DATA_FILE):
-        try:
-            with open(DATA_FILE, "r", encoding="utf-8") as f:
-                return ensure(json.load(f))
-        except Exception:
-            return ensure({})
-    return ensure({})
+    try:
+        return ensure(store.read())
+    except Exception:
+        return ensure({})
 
 def save_data(data: Dict[str, Any]) -> None:
-    with open(DATA_FILE, "w", encoding="utf-8") as f:
-        json.dump(ensure(data), f, ensure_ascii=False, indent=2)
+    store.save(ensure(data))
+
+# хендлеры живут в одном event loop; файловый ввод-вывод уносим в небольшой пул потоков
+_io_pool = ThreadPoolExecutor(max_workers=2, thread_name_prefix="storage")
+_tasks: set = set()
+
+async def aload_data() -> Dict[str, Any]:
+    t0 = time.perf_counter()
+    data = await asyncio.get_running_loop().run_in_executor(_io_pool, profiler.around_load(load_data))
+    M_STORAGE.labels("load").observe(time.perf_counter() - t0)
+    M_DATA_BYTES.set(getattr(data, "nbytes", 0))
+    return data
+
+def prepare_data(data: Dict[str, Any]) -> Tuple[int, Dict[str, Any]]:
+    return store.prepare(ensure(data))
+
+async def asave_data(data: Dict[str, Any]) -> None:
+    # data у каждого хендлера своя (aload_data парсит заново), а сам он ждёт здесь, так что её
+    # никто не меняет: ensure() и json.dumps идут в пуле, loop тем временем обслуживает других.
+    # Пишутся только шарды, изменившиеся с момента загрузки — хендлеры разных классов пишут разные файлы
+    t0 = time.perf_counter()
+    loop = asyncio.get_running_loop()
+    seq, changed = await loop.run_in_executor(_io_pool, prepare_data, data)
+    sizes = await asyncio.gather(*(loop.run_in_executor(_io_pool, store.write, name, text, seq) for name, text in changed.items()))
+    M_STORAGE.labels("save").observe(time.perf_counter() - t0)
+    M_WRITTEN.inc(sum(sizes))
 
 def run_async(coro):
-    def runner():
-        loop = asyncio.new_event_loop()
-        asyncio.set_event_loop(loop)
-        loop.run_until_complete(coro)
-    threading.Thread(target=runner, daemon=True).start()
+    # фоновая задача в общем loop; держим ссылку, чтобы её не собрал GC
+    task = asyncio.get_running_loop().create_task(profiler.job(coro))
+    _tasks.add(task)
+    task.add_done_callback(_tasks.discard)
+    return task
 
 def kb_teacher():
     kb = types.ReplyKeyboardMarkup(resize_keyboard=True, row_width=2)
@@ -312,6 +471,7 @@ def kb_teacher():
     kb.add("✅ Создать класс","🧑‍🏫 Ваши классы")
     kb.add("🧪 Создать задание","📚 Ваши тесты")
     kb.add("🏁 Ваши CTF","📊 Результаты")
+    kb.add("📒 Журнал","📤 Экспорт")
     kb.add("ℹ️ Помощь")
     return kb
 
@@ -337,9 +497,9 @@ def role_choice(chat_id: int, name: str):
     mk = types.InlineKeyboardMarkup()
     mk.add(types.InlineKeyboardButton("👨‍🏫 Создатель", callback_data="role_teacher"),
            types.InlineKeyboardButton("🎓 Обучающийся", callback_data="role_student"))
-    bot.send_message(chat_id, f"Привет, {name}! Выберите роль:", reply_markup=mk)
+    outbox.send_message(chat_id, f"Привет, {name}! Выберите роль:", reply_markup=mk)
 
-async def yandex_completion(prompt: str, temperature: float = 0.3, max_tokens: int = 1000) -> Optional[str]:
+async def yandex_completion(prompt: str, temperature: float = 0.3, max_tokens: int = 1000, flow: str = "other") -> Optional[str]:
     if not YANDEX_API_KEY or not YANDEX_FOLDER_ID:
         return None
     headers = {"Authorization": f"Api-Key {YANDEX_API_KEY}", "x-folder-id": YANDEX_FOLDER_ID, "Content-Type": "application/json"}
@@ -349,26 +509,39 @@ async def yandex_completion(prompt: str, temperature: float = 0.3, max_tokens: i
         "messages": [{"role":"system","text":"Ты преподаватель кибербезопасности. Не давай инструкций по взлому."},
                      {"role":"user","text": prompt}],
     }
-    async with aiohttp.ClientSession() as s:
-        try:
-            async with s.post(YANDEX_URL, headers=headers, json=payload, timeout=40) as r:
-                if r.status != 200: return None
-                j = await r.json()
-                alts = j.get("result", {}).get("alternatives", [])
-                if not alts: return None
-                return alts[0].get("message", {}).get("text", "")
-        except Exception:
-            return None
+    t0, status = time.perf_counter(), "error"
+    with tracing.child("yagpt", flow=flow) as sp:
+        async with aiohttp.ClientSession() as s:
+            try:
+                async with s.post(YANDEX_URL, headers=headers, json=payload, timeout=40) as r:
+                    status = r.status
+                    if r.status != 200: return None
+                    j = await r.json()
+                    alts = j.get("result", {}).get("alternatives", [])
+                    if not alts: return None
+                    if alts[0].get("status") == "ALTERNATIVE_STATUS_TRUNCATED_FINAL": status = "truncated"
+                    return alts[0].get("message", {}).get("text", "")
+            except asyncio.TimeoutError:
+                status = "timeout"
+                return None
+            except Exception:
+                return None
+            finally:
+                M_YAGPT.labels(flow, status).observe(time.perf_counter() - t0)
+                sp.set(status=status)
 
 async def gen_test(topic: str, n: int, diff: str) -> Optional[List[Dict[str, Any]]]:
     prompt = f"""Сгенерируй тест по кибербезопасности на тему "{topic}".
 Вопросов: {n}. Сложность: {diff}.
 Безопасность: без пошагового взлома/эксплуатации.
 Формат: строго JSON {{\"questions\":[{{\"question\":str,\"options\":[4 str],\"correct\":0..3,\"explanation\":str}}...]}} без текста вне JSON."""
-    txt = await yandex_completion(prompt, 0.3, 1400)
+    M_ATTEMPTS.labels("test").inc()
+    txt = await yandex_completion(prompt, 0.3, 1400, flow="test")
     if not txt: return None
     a, b = txt.find("{"), txt.rfind("}")+1
-    if a<0 or b<=0: return None
+    if a<0 or b<=0:
+        M_REJECTED.labels("test", "json").inc()
+        return None
     try:
         obj = json.loads(txt[a:b])
         qs = []
@@ -379,57 +552,69 @@ async def gen_test(topic: str, n: int, diff: str) -> Optional[List[Dict[str, Any
             if len(q["options"])!=4 or not (0<=q["correct"]<=3): 
                 continue
             qs.append({"question": q["question"].strip(), "options": [str(x) for x in q["options"]], "correct": q["correct"], "explanation": str(q.get("explanation",""))})
+        if not qs: M_REJECTED.labels("test", "json").inc()
         return qs[:n] if qs else None
     except Exception:
+        M_REJECTED.labels("test", "json").inc()
         return None
 
 def gen_flag() -> str:
     return "lapin{" + "".join(random.choices(string.ascii_lowercase+string.digits, k=12)) + "}"
 
-def caesar(s: str, shift: int) -> str:
-    abc = string.ascii_lowercase + string.ascii_uppercase + string.digits
-    out=[]
-    for ch in s:
-        if ch in abc:
-            out.append(abc[(abc.index(ch)+shift)%len(abc)])
-        else:
-            out.append(ch)
-    return "".join(out)
-
-def vigenere(s: str, key: str) -> str:
-    key = re.sub(r"[^a-z]", "", (key or "").lower()) or "key"
-    out=[]; j=0
-    for ch in s:
-        if ch.isalpha():
-            k = ord(key[j%len(key)])-97
-            base = 97 if ch.islower() else 65
-            out.append(chr((ord(ch)-base+k)%26+base)); j+=1
-        else:
-            out.append(ch)
-    return "".join(out)
-
-def xor_hex(s: str, key: str) -> str:
-    kb = (key or "k").encode()
-    b = s.encode()
-    return bytes([b[i]^kb[i%len(kb)] for i in range(len(b))]).hex()
-
-def obfuscate2(s: str) -> Tuple[str,str]:
-    noise = string.ascii_letters+string.digits
-    out=[]
-    for ch in s:
-        out.append(ch); out.append(random.choice(noise))
-    return "".join(out), "Удалите каждый 2-й символ, начиная со 2-го."
-
-def base64_noise(s: str) -> Tuple[str,str]:
-    import base64
-    b64 = base64.b64encode(s.encode()).decode()
-    noise = string.ascii_letters+string.digits
-    out=[]
-    for i,ch in enumerate(b64):
-        out.append(ch)
-        if (i+1)%5==0: out.append(random.choice(noise))
-    return "".join(out), "Удалите каждый 6-й символ (шум), затем декодируйте Base64."
-
+def crypto_meta(sub: str) -> Dict[str,Any]:
+    # случайные параметры (чтобы задачи отличались)
+    meta: Dict[str,Any] = {"max_attempts": 5}
+    if sub == "caesar":
+        meta["shift"] = random.randint(3, 20)
+    elif sub == "vig":
+        meta["key"] = "".join(random.choices(string.ascii_lowercase, k=6))
+    elif sub == "xor":
+        meta["key"] = "".join(random.choices(string.ascii_lowercase + string.digits, k=8))
+    elif sub == "b64":
+        meta["rule"] = "remove_every_6th"
+    else:
+        meta["rule"] = "remove_every_2nd"
+    return meta
+
+def build_crypto_variants(sub: str, plaintext: str, base: Dict[str,Any], n: int) -> List[Dict[str,Any]]:
+    """Из одного plaintext делает n вариантов: свой флаг, ключ/сдвиг, challenge и expected_hash.
+    Вариант 0 — базовый (уже зашифрованный) challenge; остальные шифруются пакетно в process pool.
+    Подсказка у всех вариантов общая (task["instruction"]): auto_hint называет ключ и ученику не показывается."""
+    variants = [base]
+    jobs = []
+    for _ in range(n - 1):
+        flag = gen_flag()
+        meta = crypto_meta(sub)
+        variants.append({"expected_plain": flag, "expected_hash": sha(norm(flag)), "meta": meta})
+        jobs.append((sub, FLAG_RE.sub(flag, plaintext, count=1), meta))
+    for v, (chall, _) in zip(variants[1:], encrypt_batch(jobs)):
+        v["challenge"] = chall
+    return variants
+
+def difficulty_line(d: Dict[str,Any]) -> str:
+    if d.get("recovered"):
+        return f"🧮 Сложность {d.get('difficulty')}/100 ({d.get('label')}): автосолвер нашёл флаг без ключа, перебрав {d.get('candidates')} вариантов за {d.get('elapsed_ms')} мс."
+    return f"🧮 Сложность {d.get('difficulty')}/100: автосолвер не нашёл флаг без ключа ({d.get('candidates')} вариантов, {d.get('elapsed_ms')} мс)."
+
+def ctf_variant(data: Dict[str,Any], task: Dict[str,Any], sid: str) -> Tuple[Optional[int], Dict[str,Any]]:
+    """Вариант CTF для ученика: (индекс, поля варианта) или (None, task) если вариантов нет.
+    Новым ученикам варианты раздаются по кругу; выбор сохраняется в task["variant_of"] (нужен save_data)."""
+    variants = task.get("variants")
+    if not isinstance(variants, list) or not variants:
+        return None, task
+    vmap = task.setdefault("variant_of", {})
+    if sid not in vmap:
+        vmap[sid] = len(vmap) % len(variants)
+    idx = int(vmap[sid]) % len(variants)
+    return idx, variants[idx]
+
+def ctf_shown_variant(task: Dict[str,Any], vi: Optional[int]) -> Dict[str,Any]:
+    """Поля варианта, который ученик получил в open_task (st["variant"]); ничего не назначает.
+    variant_of из свежего load_data тут не годится: параллельный open_task мог затереть запись ученика."""
+    variants = task.get("variants")
+    if vi is None or not isinstance(variants, list) or not variants:
+        return task
+    return variants[int(vi) % len(variants)]
 
 def build_teacher_guide_crypto(title: str, subtype: str, hint: str, meta: Dict[str,Any], expected_flag: str) -> str:
     steps = []
@@ -538,28 +723,40 @@ FLAG = \"{flag}\""""),
 <!-- {flag} -->"""),
 }
 
+def question_prompt(q: Dict[str, Any], i: int) -> str:
+    opts="\n".join([f"{j+1}. {o}" for j,o in enumerate(q["options"])])
+    return f"Вопрос {i+1}:\n{q['question']}\n\n{opts}\n\nОтвет: 1-4"
+
 # --------------- START / REG ---------------
 
 @bot.message_handler(commands=["start"])
-def start(message):
-    data = load_data()
+async def start(message):
+    data = await aload_data()
     uid = str(message.from_user.id)
     u = data["users"].get(uid)
     if not u or need_reg(u):
         role_choice(message.chat.id, message.from_user.first_name or "друг")
         return
-    bot.send_message(message.chat.id, "Меню.", reply_markup=kb_teacher() if u["role"]=="teacher" else kb_student())
+    # тест, прерванный рестартом или паузой, продолжаем с текущего вопроса
+    st = user_states.get(uid) or {}
+    if st.get("flow")=="take_test":
+        qs = data["tests"].get(st.get("tid"),{}).get("questions",[])
+        if st.get("i",0) < len(qs):
+            outbox.send_message(message.chat.id, f"▶️ Продолжаем тест ({st['i']}/{len(qs)} отвечено).\n\n"+question_prompt(qs[st["i"]], st["i"]), reply_markup=types.ReplyKeyboardRemove())
+            return
+        user_states.pop(uid,None)
+    outbox.send_message(message.chat.id, "Меню.", reply_markup=kb_teacher() if u["role"]=="teacher" else kb_student())
 
 @bot.callback_query_handler(func=lambda c: c.data in ("role_teacher","role_student"))
-def cb_role(c):
+async def cb_role(c):
     uid = str(c.from_user.id)
     role = "teacher" if c.data=="role_teacher" else "student"
     user_states[uid] = {"flow":"reg","step":"last","role":role,"profile":{}}
-    bot.answer_callback_query(c.id)
-    bot.send_message(c.message.chat.id, "Регистрация: фамилия?", reply_markup=kb_cancel())
+    await bot.answer_callback_query(c.id)
+    outbox.send_message(c.message.chat.id, "Регистрация: фамилия?", reply_markup=kb_cancel())
 
-@bot.message_handler(func=lambda m: user_states.get(str(m.from_user.id),{}).get("flow")=="reg")
-def reg(m):
+@router.flow("reg")
+async def reg(m):
     uid = str(m.from_user.id)
     st = user_states[uid]
     if m.text=="❌ Отмена":
@@ -569,120 +766,121 @@ def reg(m):
     t=(m.text or "").strip()
     p=st["profile"]
     if st["step"]=="last":
-        p["last_name"]=t; st["step"]="first"; bot.reply_to(m,"Имя?"); return
+        p["last_name"]=t; st["step"]="first"; outbox.reply_to(m,"Имя?"); return
     if st["step"]=="first":
-        p["first_name"]=t; st["step"]="mid"; bot.reply_to(m,"Отчество (или '-')?"); return
+        p["first_name"]=t; st["step"]="mid"; outbox.reply_to(m,"Отчество (или '-')?"); return
     if st["step"]=="mid":
-        p["middle_name"]="" if t=="-" else t; st["step"]="age"; bot.reply_to(m,"Возраст (число)?"); return
+        p["middle_name"]="" if t=="-" else t; st["step"]="age"; outbox.reply_to(m,"Возраст (число)?"); return
     if st["step"]=="age":
-        if not t.isdigit(): bot.reply_to(m,"Возраст числом."); return
-        p["age"]=int(t); st["step"]="email"; bot.reply_to(m,"Email?"); return
+        if not t.isdigit(): outbox.reply_to(m,"Возраст числом."); return
+        p["age"]=int(t); st["step"]="email"; outbox.reply_to(m,"Email?"); return
     if st["step"]=="email":
-        if not re.match(r"^[^@\s]+@[^@\s]+\.[^@\s]+$", t): bot.reply_to(m,"Похоже не email, попробуйте ещё."); return
+        if not re.match(r"^[^@\s]+@[^@\s]+\.[^@\s]+$", t): outbox.reply_to(m,"Похоже не email, попробуйте ещё."); return
         p["email"]=t
-        data=load_data()
+        data=await aload_data()
         u=data["users"].get(uid,{})
         u["role"]=st["role"]; u["profile"]=p; u["username"]=m.from_user.first_name or "Пользователь"
-        data["users"][uid]=u; save_data(data)
+        data["users"][uid]=u; await asave_data(data)
         st["step"]="admin" if u["role"]=="teacher" else "class_code"
-        bot.send_message(m.chat.id, "Код учителя?" if u["role"]=="teacher" else "Код класса?", reply_markup=kb_cancel()); return
+        outbox.send_message(m.chat.id, "Код учителя?" if u["role"]=="teacher" else "Код класса?", reply_markup=kb_cancel()); return
     if st["step"]=="admin":
-        if t!=ADMIN_CODE: bot.reply_to(m,"Неверно. Попробуйте снова."); return
+        if t!=ADMIN_CODE: outbox.reply_to(m,"Неверно. Попробуйте снова."); return
         user_states.pop(uid,None)
-        bot.send_message(m.chat.id,"✅ Вы учитель.", reply_markup=kb_teacher()); return
+        outbox.send_message(m.chat.id,"✅ Вы учитель.", reply_markup=kb_teacher()); return
     if st["step"]=="class_code":
-        data=load_data()
+        data=await aload_data()
         now = now_msk()
         cid, inv = find_invite(data, t)
         if cid and inv:
             ok, msg = invite_valid(inv, now)
             if not ok:
-                bot.reply_to(m, msg)
+                outbox.reply_to(m, msg)
                 return
             inv["uses"] = int(inv.get("uses", 0)) + 1
             inv.setdefault("used_by", []).append(uid)
             inv["last_used_at"] = now_iso()
             data["users"][uid]["class_id"] = cid
-            save_data(data)
+            await asave_data(data)
             user_states.pop(uid,None)
-            bot.send_message(m.chat.id,"✅ Вы в классе по инвайту.", reply_markup=kb_student()); return
+            outbox.send_message(m.chat.id,"✅ Вы в классе по инвайту.", reply_markup=kb_student()); return
         cid=None
         for k,v in data["classes"].items():
             if isinstance(v,dict) and v.get("access_code")==t:
                 if v.get("private"):
-                    bot.reply_to(m,"Класс приватный. Нужен инвайт.")
+                    outbox.reply_to(m,"Класс приватный. Нужен инвайт.")
                     return
                 cid=k
                 break
-        if not cid: bot.reply_to(m,"Класс не найден. Попробуйте снова."); return
-        data["users"][uid]["class_id"]=cid; save_data(data)
+        if not cid: outbox.reply_to(m,"Класс не найден. Попробуйте снова."); return
+        data["users"][uid]["class_id"]=cid; await asave_data(data)
         user_states.pop(uid,None)
-        bot.send_message(m.chat.id,"✅ Вы в классе.", reply_markup=kb_student()); return
+        outbox.send_message(m.chat.id,"✅ Вы в классе.", reply_markup=kb_student()); return
 
 # --------------- TEACHER: CLASSES ---------------
 
-@bot.message_handler(func=lambda m: m.text=="✅ Создать класс")
-def t_create_class(m):
-    data=load_data(); uid=str(m.from_user.id)
-    if data["users"].get(uid,{}).get("role")!="teacher": bot.reply_to(m,"Только учителю."); return
+@router.text("✅ Создать класс")
+async def t_create_class(m):
+    data=await aload_data(); uid=str(m.from_user.id)
+    if data["users"].get(uid,{}).get("role")!="teacher": outbox.reply_to(m,"Только учителю."); return
     user_states[uid]={"flow":"class","step":"name"}
-    bot.send_message(m.chat.id,"Название класса?", reply_markup=kb_cancel())
+    outbox.send_message(m.chat.id,"Название класса?", reply_markup=kb_cancel())
 
-@bot.message_handler(func=lambda m: user_states.get(str(m.from_user.id),{}).get("flow")=="class")
-def t_create_class_flow(m):
+@router.flow("class")
+async def t_create_class_flow(m):
     uid=str(m.from_user.id)
     if m.text=="❌ Отмена":
-        user_states.pop(uid,None); bot.send_message(m.chat.id,"Отменено.", reply_markup=kb_teacher()); return
+        user_states.pop(uid,None); outbox.send_message(m.chat.id,"Отменено.", reply_markup=kb_teacher()); return
     name=(m.text or "").strip()
-    if len(name)<2: bot.reply_to(m,"Коротко. Ещё раз."); return
-    data=load_data()
+    if len(name)<2: outbox.reply_to(m,"Коротко. Ещё раз."); return
+    data=await aload_data()
     cid=gen_id("CL"); code="".join(random.choices(string.ascii_uppercase+string.digits,k=6))
     data["classes"][cid]={"id":cid,"name":name,"teacher_id":uid,"access_code":code,"created_at":now_iso()}
-    save_data(data); user_states.pop(uid,None)
+    await asave_data(data); user_states.pop(uid,None)
+    menus.add("cl", uid, cid, name)
     safe_name = _html.escape(name)
-    bot.send_message(m.chat.id, f"✅ Класс создан: {safe_name}\nКод: <code>{code}</code>", parse_mode="HTML", reply_markup=kb_teacher())
+    outbox.send_message(m.chat.id, f"✅ Класс создан: {safe_name}\nКод: <code>{code}</code>", parse_mode="HTML", reply_markup=kb_teacher())
 
-@bot.message_handler(func=lambda m: m.text=="🧑‍🏫 Ваши классы")
-def t_classes(m):
-    data=load_data(); uid=str(m.from_user.id)
-    if data["users"].get(uid,{}).get("role")!="teacher": bot.reply_to(m,"Только учителю."); return
+@router.text("🧑‍🏫 Ваши классы")
+async def t_classes(m):
+    data=await aload_data(); uid=str(m.from_user.id)
+    if data["users"].get(uid,{}).get("role")!="teacher": outbox.reply_to(m,"Только учителю."); return
     cls=[c for c in data["classes"].values() if isinstance(c,dict) and c.get("teacher_id")==uid]
-    if not cls: bot.send_message(m.chat.id,"Классов нет.", reply_markup=kb_teacher()); return
+    if not cls: outbox.send_message(m.chat.id,"Классов нет.", reply_markup=kb_teacher()); return
     out=["🧑‍🏫 Ваши классы:"]
     for c in cls:
         studs=[u for u in data["users"].values() if isinstance(u,dict) and u.get("role")=="student" and u.get("class_id")==c.get("id")]
         out.append(f"• {c.get('name')} — код {c.get('access_code')} — учеников {len(studs)}")
-    bot.send_message(m.chat.id,"\n".join(out), reply_markup=kb_teacher())
+    outbox.send_message(m.chat.id,"\n".join(out), reply_markup=kb_teacher())
 
 # --------------- TEACHER: CLASS INVITES / PRIVACY ---------------
 
-@bot.message_handler(func=lambda m: m.text=="🔐 Инвайт в класс")
-def t_class_invite(m):
-    data=load_data(); uid=str(m.from_user.id)
+@router.text("🔐 Инвайт в класс")
+async def t_class_invite(m):
+    data=await aload_data(); uid=str(m.from_user.id)
     if data["users"].get(uid,{}).get("role")!="teacher":
-        bot.reply_to(m,"Только учителю.")
+        outbox.reply_to(m,"Только учителю.")
         return
     cls=[c for c in data["classes"].values() if isinstance(c,dict) and c.get("teacher_id")==uid]
     if not cls:
-        bot.send_message(m.chat.id,"Классов нет.", reply_markup=kb_teacher())
+        outbox.send_message(m.chat.id,"Классов нет.", reply_markup=kb_teacher())
         return
     kb=types.ReplyKeyboardMarkup(resize_keyboard=True, one_time_keyboard=True)
     for c in cls:
         kb.add(f"Класс: {c['name']}")
     kb.add("❌ Отмена")
     user_states[uid]={"flow":"class_invite","step":"class"}
-    bot.send_message(m.chat.id,"Выберите класс:", reply_markup=kb)
+    outbox.send_message(m.chat.id,"Выберите класс:", reply_markup=kb)
 
-@bot.message_handler(func=lambda m: user_states.get(str(m.from_user.id),{}).get("flow")=="class_invite")
-def t_class_invite_flow(m):
+@router.flow("class_invite")
+async def t_class_invite_flow(m):
     uid=str(m.from_user.id); st=user_states[uid]
     if m.text=="❌ Отмена":
-        user_states.pop(uid,None); bot.send_message(m.chat.id,"Ок.", reply_markup=kb_teacher()); return
+        user_states.pop(uid,None); outbox.send_message(m.chat.id,"Ок.", reply_markup=kb_teacher()); return
     t=(m.text or "").strip()
-    data=load_data()
+    data=await aload_data()
     if st["step"]=="class":
         if not t.startswith("Класс: "):
-            bot.reply_to(m,"Кнопкой.")
+            outbox.reply_to(m,"Кнопкой.")
             return
         name=t.replace("Класс: ","",1).strip()
         cid=None
@@ -691,62 +889,73 @@ def t_class_invite_flow(m):
                 cid=k
                 break
         if not cid:
-            bot.reply_to(m,"Класс не найден.")
+            outbox.reply_to(m,"Класс не найден.")
             return
         st["cid"]=cid; st["step"]="exp_date"
-        bot.send_message(m.chat.id,"Дата окончания инвайта (ДД.ММ.ГГГГ или 'сегодня/завтра'):", reply_markup=kb_cancel())
+        outbox.send_message(m.chat.id,"Дата окончания инвайта (ДД.ММ.ГГГГ или 'сегодня/завтра'):", reply_markup=kb_cancel())
         return
     if st["step"]=="exp_date":
         if t=="❌ Отмена":
-            user_states.pop(uid,None); bot.send_message(m.chat.id,"Ок.", reply_markup=kb_teacher()); return
+            user_states.pop(uid,None); outbox.send_message(m.chat.id,"Ок.", reply_markup=kb_teacher()); return
         d=parse_date_token(t)
         if not d:
-            bot.reply_to(m,"Нужна дата: ДД.ММ.ГГГГ или 'сегодня/завтра'.")
+            outbox.reply_to(m,"Нужна дата: ДД.ММ.ГГГГ или 'сегодня/завтра'.")
             return
         st["exp_date"]=d; st["step"]="exp_time"
-        bot.send_message(m.chat.id,"Время (ЧЧ:ММ, МСК):", reply_markup=kb_cancel())
+        outbox.send_message(m.chat.id,"Время (ЧЧ:ММ, МСК):", reply_markup=kb_cancel())
         return
     if st["step"]=="exp_time":
         if t=="❌ Отмена":
-            user_states.pop(uid,None); bot.send_message(m.chat.id,"Ок.", reply_markup=kb_teacher()); return
+            user_states.pop(uid,None); outbox.send_message(m.chat.id,"Ок.", reply_markup=kb_teacher()); return
         hm=parse_time_token(t)
         if not hm:
-            bot.reply_to(m,"Время в формате ЧЧ:ММ.")
+            outbox.reply_to(m,"Время в формате ЧЧ:ММ.")
             return
         exp_dt=combine_date_time(st["exp_date"], hm)
         if exp_dt <= now_msk():
-            bot.reply_to(m,"Время уже прошло. Укажите будущее.")
+            outbox.reply_to(m,"Время уже прошло. Укажите будущее.")
             return
-        st["exp_dt"]=exp_dt; st["step"]="max_uses"
-        bot.send_message(m.chat.id,"Сколько использований? (1-100, по умолчанию 1):", reply_markup=kb_cancel())
+        st["exp_dt"]=exp_dt; st["step"]="count"
+        outbox.send_message(m.chat.id,f"Сколько кодов? (1-{BULK_INVITES_MAX}; если больше одного — все одноразовые):", reply_markup=kb_cancel())
+        return
+    if st["step"]=="count":
+        if not t.isdigit() or not 1 <= int(t) <= BULK_INVITES_MAX:
+            outbox.reply_to(m,f"Число 1-{BULK_INVITES_MAX}.")
+            return
+        if int(t)==1:
+            st["step"]="max_uses"
+            outbox.send_message(m.chat.id,"Сколько использований? (1-100, по умолчанию 1):", reply_markup=kb_cancel())
+            return
+        cid=st["cid"]
+        c=data["classes"].get(cid)
+        if not c:
+            user_states.pop(uid,None); outbox.send_message(m.chat.id,"Класс не найден.", reply_markup=kb_teacher()); return
+        # все коды — одной записью
+        codes=make_invites(data, cid, int(t), st["exp_dt"])
+        await asave_data(data)
+        user_states.pop(uid,None)
+        body="\n".join(codes)+"\n"
+        outbox.send_document(m.chat.id, body.encode("utf-8"), visible_file_name=f"invites_{c.get('name','class')}.txt",
+                             caption=f"✅ {len(codes)} одноразовых инвайтов в «{c.get('name')}», действуют до {fmt_dt_msk(st['exp_dt'])}",
+                             priority=INTERACTIVE, reply_markup=kb_teacher())
         return
     if st["step"]=="max_uses":
         if t=="❌ Отмена":
-            user_states.pop(uid,None); bot.send_message(m.chat.id,"Ок.", reply_markup=kb_teacher()); return
+            user_states.pop(uid,None); outbox.send_message(m.chat.id,"Ок.", reply_markup=kb_teacher()); return
         max_uses = 1
         if t and t.isdigit():
             max_uses = int(t)
         if max_uses < 1 or max_uses > 100:
-            bot.reply_to(m,"1-100.")
+            outbox.reply_to(m,"1-100.")
             return
         cid=st["cid"]
         c=data["classes"].get(cid)
         if not c:
-            user_states.pop(uid,None); bot.send_message(m.chat.id,"Класс не найден.", reply_markup=kb_teacher()); return
-        c.setdefault("invites", {})
-        code="".join(random.choices(string.ascii_uppercase+string.digits, k=8))
-        while code in c["invites"]:
-            code="".join(random.choices(string.ascii_uppercase+string.digits, k=8))
-        c["invites"][code]={
-            "code": code,
-            "expires_at": st["exp_dt"].isoformat(),
-            "max_uses": max_uses,
-            "uses": 0,
-            "created_at": now_iso()
-        }
-        save_data(data)
+            user_states.pop(uid,None); outbox.send_message(m.chat.id,"Класс не найден.", reply_markup=kb_teacher()); return
+        code=make_invites(data, cid, 1, st["exp_dt"], max_uses)[0]
+        await asave_data(data)
         user_states.pop(uid,None)
-        bot.send_message(
+        outbox.send_message(
             m.chat.id,
             f"✅ Инвайт создан:\nКод: <code>{code}</code>\nДействует до: {fmt_dt_msk(st['exp_dt'])}",
             parse_mode="HTML",
@@ -754,33 +963,33 @@ def t_class_invite_flow(m):
         )
         return
 
-@bot.message_handler(func=lambda m: m.text=="🔒 Приватность класса")
-def t_class_privacy(m):
-    data=load_data(); uid=str(m.from_user.id)
+@router.text("🔒 Приватность класса")
+async def t_class_privacy(m):
+    data=await aload_data(); uid=str(m.from_user.id)
     if data["users"].get(uid,{}).get("role")!="teacher":
-        bot.reply_to(m,"Только учителю.")
+        outbox.reply_to(m,"Только учителю.")
         return
     cls=[c for c in data["classes"].values() if isinstance(c,dict) and c.get("teacher_id")==uid]
     if not cls:
-        bot.send_message(m.chat.id,"Классов нет.", reply_markup=kb_teacher())
+        outbox.send_message(m.chat.id,"Классов нет.", reply_markup=kb_teacher())
         return
     kb=types.ReplyKeyboardMarkup(resize_keyboard=True, one_time_keyboard=True)
     for c in cls:
         kb.add(f"Класс: {c['name']}")
     kb.add("❌ Отмена")
     user_states[uid]={"flow":"class_privacy","step":"class"}
-    bot.send_message(m.chat.id,"Выберите класс:", reply_markup=kb)
+    outbox.send_message(m.chat.id,"Выберите класс:", reply_markup=kb)
 
-@bot.message_handler(func=lambda m: user_states.get(str(m.from_user.id),{}).get("flow")=="class_privacy")
-def t_class_privacy_flow(m):
+@router.flow("class_privacy")
+async def t_class_privacy_flow(m):
     uid=str(m.from_user.id); st=user_states[uid]
     if m.text=="❌ Отмена":
-        user_states.pop(uid,None); bot.send_message(m.chat.id,"Ок.", reply_markup=kb_teacher()); return
+        user_states.pop(uid,None); outbox.send_message(m.chat.id,"Ок.", reply_markup=kb_teacher()); return
     t=(m.text or "").strip()
-    data=load_data()
+    data=await aload_data()
     if st["step"]=="class":
         if not t.startswith("Класс: "):
-            bot.reply_to(m,"Кнопкой.")
+            outbox.reply_to(m,"Кнопкой.")
             return
         name=t.replace("Класс: ","",1).strip()
         cid=None
@@ -789,7 +998,7 @@ def t_class_privacy_flow(m):
                 cid=k
                 break
         if not cid:
-            bot.reply_to(m,"Класс не найден.")
+            outbox.reply_to(m,"Класс не найден.")
             return
         st["cid"]=cid; st["step"]="toggle"
         c=data["classes"][cid]
@@ -797,148 +1006,150 @@ def t_class_privacy_flow(m):
         kb=types.ReplyKeyboardMarkup(resize_keyboard=True, one_time_keyboard=True)
         kb.add("🔒 Включить", "🔓 Выключить")
         kb.add("❌ Отмена")
-        bot.send_message(m.chat.id,f"Статус: {status}. Изменить?", reply_markup=kb)
+        outbox.send_message(m.chat.id,f"Статус: {status}. Изменить?", reply_markup=kb)
         return
     if st["step"]=="toggle":
         cid=st["cid"]
         c=data["classes"].get(cid)
         if not c:
-            user_states.pop(uid,None); bot.send_message(m.chat.id,"Класс не найден.", reply_markup=kb_teacher()); return
+            user_states.pop(uid,None); outbox.send_message(m.chat.id,"Класс не найден.", reply_markup=kb_teacher()); return
         if t=="🔒 Включить":
             c["private"]=True
         elif t=="🔓 Выключить":
             c["private"]=False
         else:
-            bot.reply_to(m,"Кнопкой.")
+            outbox.reply_to(m,"Кнопкой.")
             return
-        save_data(data)
+        await asave_data(data)
         user_states.pop(uid,None)
-        bot.send_message(m.chat.id,"✅ Обновлено.", reply_markup=kb_teacher())
+        outbox.send_message(m.chat.id,"✅ Обновлено.", reply_markup=kb_teacher())
         return
 
 # --------------- TEACHER: CREATE TASK ---------------
 
-@bot.message_handler(func=lambda m: m.text=="🧪 Создать задание")
-def t_create_task(m):
-    data=load_data(); uid=str(m.from_user.id)
-    if data["users"].get(uid,{}).get("role")!="teacher": bot.reply_to(m,"Только учителю."); return
+@router.text("🧪 Создать задание")
+async def t_create_task(m):
+    data=await aload_data(); uid=str(m.from_user.id)
+    if data["users"].get(uid,{}).get("role")!="teacher": outbox.reply_to(m,"Только учителю."); return
     kb=types.ReplyKeyboardMarkup(resize_keyboard=True, one_time_keyboard=True, row_width=2)
     kb.add("📝 Создать тест","🏁 Создать CTF"); kb.add("❌ Отмена")
     user_states[uid]={"flow":"task","step":"pick"}
-    bot.send_message(m.chat.id,"Тип задания?", reply_markup=kb)
+    outbox.send_message(m.chat.id,"Тип задания?", reply_markup=kb)
 
-@bot.message_handler(func=lambda m: user_states.get(str(m.from_user.id),{}).get("flow")=="task")
-def t_create_task_flow(m):
+@router.flow("task")
+async def t_create_task_flow(m):
     uid=str(m.from_user.id)
     if m.text=="❌ Отмена":
-        user_states.pop(uid,None); bot.send_message(m.chat.id,"Ок.", reply_markup=kb_teacher()); return
+        user_states.pop(uid,None); outbox.send_message(m.chat.id,"Ок.", reply_markup=kb_teacher()); return
     if m.text=="📝 Создать тест":
         user_states[uid]={"flow":"test_create","step":"topic"}
-        bot.send_message(m.chat.id,"Тема теста?", reply_markup=kb_cancel()); return
+        outbox.send_message(m.chat.id,"Тема теста?", reply_markup=kb_cancel()); return
     if m.text=="🏁 Создать CTF":
         kb=types.ReplyKeyboardMarkup(resize_keyboard=True, one_time_keyboard=True, row_width=2)
         kb.add("🔐 Crypto","🌐 Web"); kb.add("❌ Отмена")
         user_states[uid]={"flow":"ctf_create","step":"kind"}
-        bot.send_message(m.chat.id,"CTF направление?", reply_markup=kb); return
-    bot.reply_to(m,"Выберите кнопкой.")
+        outbox.send_message(m.chat.id,"CTF направление?", reply_markup=kb); return
+    outbox.reply_to(m,"Выберите кнопкой.")
 
 # --------------- TEACHER: TEST CREATE ---------------
 
-@bot.message_handler(func=lambda m: user_states.get(str(m.from_user.id),{}).get("flow")=="test_create")
-def t_test_create(m):
+@router.flow("test_create")
+async def t_test_create(m):
     uid=str(m.from_user.id); st=user_states[uid]
     if m.text=="❌ Отмена":
-        user_states.pop(uid,None); bot.send_message(m.chat.id,"Отменено.", reply_markup=kb_teacher()); return
+        user_states.pop(uid,None); outbox.send_message(m.chat.id,"Отменено.", reply_markup=kb_teacher()); return
     t=(m.text or "").strip()
     if st["step"]=="topic":
-        st["topic"]=t; st["step"]="num"; bot.send_message(m.chat.id,"Сколько вопросов (3-30)?", reply_markup=kb_cancel()); return
+        st["topic"]=t; st["step"]="num"; outbox.send_message(m.chat.id,"Сколько вопросов (3-30)?", reply_markup=kb_cancel()); return
     if st["step"]=="num":
-        if not t.isdigit(): bot.reply_to(m,"Число."); return
+        if not t.isdigit(): outbox.reply_to(m,"Число."); return
         n=int(t)
-        if n<3 or n>30: bot.reply_to(m,"3..30"); return
+        if n<3 or n>30: outbox.reply_to(m,"3..30"); return
         st["n"]=n; st["step"]="diff"
         kb=types.ReplyKeyboardMarkup(resize_keyboard=True, one_time_keyboard=True, row_width=3)
         kb.add("Лёгкая","Средняя","Сложная"); kb.add("❌ Отмена")
-        bot.send_message(m.chat.id,"Сложность?", reply_markup=kb); return
+        outbox.send_message(m.chat.id,"Сложность?", reply_markup=kb); return
     if st["step"]=="diff":
         mp={"Лёгкая":"easy","Средняя":"medium","Сложная":"hard"}
-        if t not in mp: bot.reply_to(m,"Выберите кнопкой."); return
-        bot.send_message(m.chat.id,"Генерирую…", reply_markup=types.ReplyKeyboardRemove())
+        if t not in mp: outbox.reply_to(m,"Выберите кнопкой."); return
+        outbox.send_message(m.chat.id,"Генерирую…", reply_markup=types.ReplyKeyboardRemove())
         run_async(finalize_test(uid, st["topic"], st["n"], mp[t], m.chat.id))
         user_states.pop(uid,None); return
 
 async def finalize_test(teacher_id: str, topic: str, n: int, diff: str, chat_id: int):
     qs = await gen_test(topic, n, diff)
+    M_GENERATED.labels("test", "ok" if qs else "failed").inc()
     if not qs:
-        bot.send_message(chat_id,"❌ Не удалось сгенерировать тест (проверьте Yandex ключи).", reply_markup=kb_teacher()); return
-    data=load_data()
+        outbox.send_message(chat_id,"❌ Не удалось сгенерировать тест (проверьте Yandex ключи).", reply_markup=kb_teacher()); return
+    data=await aload_data()
     tid=gen_id("T")
     data["tests"][tid]={"id":tid,"teacher_id":teacher_id,"topic":topic,"difficulty":diff,"questions":qs,"created_at":now_iso()}
-    save_data(data)
+    await asave_data(data)
+    menus.add("tt", teacher_id, tid, data["tests"][tid]["created_at"])
     mk=types.InlineKeyboardMarkup()
     mk.add(types.InlineKeyboardButton("📌 Назначить в класс", callback_data=f"assign_test:{tid}"),
            types.InlineKeyboardButton("Позже", callback_data="assign_later"))
-    bot.send_message(chat_id,f"✅ Тест создан: {topic}\nID: {tid}\nВопросов: {len(qs)}", reply_markup=mk)
+    outbox.send_message(chat_id,f"✅ Тест создан: {topic}\nID: {tid}\nВопросов: {len(qs)}", reply_markup=mk)
 
 # --------------- TEACHER: HOMEWORK CREATE ---------------
 
-@bot.message_handler(func=lambda m: user_states.get(str(m.from_user.id),{}).get("flow")=="hw_create")
-def t_hw_create(m):
+@router.flow("hw_create")
+async def t_hw_create(m):
     uid=str(m.from_user.id); st=user_states[uid]
     if m.text=="❌ Отмена":
-        user_states.pop(uid,None); bot.send_message(m.chat.id,"Отменено.", reply_markup=kb_teacher()); return
+        user_states.pop(uid,None); outbox.send_message(m.chat.id,"Отменено.", reply_markup=kb_teacher()); return
     t=(m.text or "").strip()
     if st["step"]=="title":
         if len(t) < 3:
-            bot.reply_to(m,"Коротко. Ещё раз.")
+            outbox.reply_to(m,"Коротко. Ещё раз.")
             return
         st["title"]=t; st["step"]="text"
-        bot.send_message(m.chat.id,"Текст задания/инструкция:", reply_markup=kb_cancel()); return
+        outbox.send_message(m.chat.id,"Текст задания/инструкция:", reply_markup=kb_cancel()); return
     if st["step"]=="text":
         if len(t) < 3:
-            bot.reply_to(m,"Добавьте описание.")
+            outbox.reply_to(m,"Добавьте описание.")
             return
         st["text"]=t; st["step"]="format"
-        bot.send_message(m.chat.id,"Формат ответа (regex) или '-' чтобы без проверки:", reply_markup=kb_cancel()); return
+        outbox.send_message(m.chat.id,"Формат ответа (regex) или '-' чтобы без проверки:", reply_markup=kb_cancel()); return
     if st["step"]=="format":
         st["format_regex"]=None if t=="-" else t
         st["step"]="open_date"
-        bot.send_message(m.chat.id,"Когда открыть? (сейчас или дата ДД.ММ.ГГГГ):", reply_markup=kb_cancel()); return
+        outbox.send_message(m.chat.id,"Когда открыть? (сейчас или дата ДД.ММ.ГГГГ):", reply_markup=kb_cancel()); return
     if st["step"]=="open_date":
         if t.lower()=="сейчас":
             st["open_at"]=None
             st["step"]="due_date"
-            bot.send_message(m.chat.id,"Дедлайн: дата ДД.ММ.ГГГГ или '-' без дедлайна:", reply_markup=kb_cancel()); return
+            outbox.send_message(m.chat.id,"Дедлайн: дата ДД.ММ.ГГГГ или '-' без дедлайна:", reply_markup=kb_cancel()); return
         d=parse_date_token(t)
         if not d:
-            bot.reply_to(m,"Нужна дата: ДД.ММ.ГГГГ или 'сегодня/завтра', либо 'сейчас'.")
+            outbox.reply_to(m,"Нужна дата: ДД.ММ.ГГГГ или 'сегодня/завтра', либо 'сейчас'.")
             return
         st["open_date"]=d; st["step"]="open_time"
-        bot.send_message(m.chat.id,"Время открытия (ЧЧ:ММ, МСК):", reply_markup=kb_cancel()); return
+        outbox.send_message(m.chat.id,"Время открытия (ЧЧ:ММ, МСК):", reply_markup=kb_cancel()); return
     if st["step"]=="open_time":
         hm=parse_time_token(t)
         if not hm:
-            bot.reply_to(m,"Время в формате ЧЧ:ММ.")
+            outbox.reply_to(m,"Время в формате ЧЧ:ММ.")
             return
         open_at=combine_date_time(st["open_date"], hm)
         if open_at <= now_msk():
-            bot.reply_to(m,"Время уже прошло. Укажите будущее.")
+            outbox.reply_to(m,"Время уже прошло. Укажите будущее.")
             return
         st["open_at"]=open_at
         st["step"]="due_date"
-        bot.send_message(m.chat.id,"Дедлайн: дата ДД.ММ.ГГГГ или '-' без дедлайна:", reply_markup=kb_cancel()); return
+        outbox.send_message(m.chat.id,"Дедлайн: дата ДД.ММ.ГГГГ или '-' без дедлайна:", reply_markup=kb_cancel()); return
     if st["step"]=="due_date":
         if t=="-":
             st["due_at"]=None
         else:
             d=parse_date_token(t)
             if not d:
-                bot.reply_to(m,"Нужна дата: ДД.ММ.ГГГГ или '-'.")
+                outbox.reply_to(m,"Нужна дата: ДД.ММ.ГГГГ или '-'.")
                 return
             st["due_date"]=d; st["step"]="due_time"
-            bot.send_message(m.chat.id,"Время дедлайна (ЧЧ:ММ, МСК):", reply_markup=kb_cancel()); return
+            outbox.send_message(m.chat.id,"Время дедлайна (ЧЧ:ММ, МСК):", reply_markup=kb_cancel()); return
         # create homework
-        data=load_data()
+        data=await aload_data()
         hid=gen_id("H")
         data["homeworks"][hid]={
             "id":hid,
@@ -950,28 +1161,28 @@ def t_hw_create(m):
             "due_at": st.get("due_at").isoformat() if st.get("due_at") else None,
             "created_at": now_iso()
         }
-        save_data(data)
+        await asave_data(data)
         user_states.pop(uid,None)
         mk=types.InlineKeyboardMarkup()
         mk.add(types.InlineKeyboardButton("📌 Назначить в класс", callback_data=f"assign_hw:{hid}"),
                types.InlineKeyboardButton("Позже", callback_data="assign_later"))
-        bot.send_message(m.chat.id,f"✅ Домашнее задание создано: {st['title']}\nID: {hid}", reply_markup=mk)
+        outbox.send_message(m.chat.id,f"✅ Домашнее задание создано: {st['title']}\nID: {hid}", reply_markup=mk)
         return
     if st["step"]=="due_time":
         hm=parse_time_token(t)
         if not hm:
-            bot.reply_to(m,"Время в формате ЧЧ:ММ.")
+            outbox.reply_to(m,"Время в формате ЧЧ:ММ.")
             return
         due_at=combine_date_time(st["due_date"], hm)
         open_at=st.get("open_at")
         if open_at and due_at <= open_at:
-            bot.reply_to(m,"Дедлайн должен быть позже открытия.")
+            outbox.reply_to(m,"Дедлайн должен быть позже открытия.")
             return
         if due_at <= now_msk():
-            bot.reply_to(m,"Дедлайн уже прошёл. Укажите будущее.")
+            outbox.reply_to(m,"Дедлайн уже прошёл. Укажите будущее.")
             return
         st["due_at"]=due_at
-        data=load_data()
+        data=await aload_data()
         hid=gen_id("H")
         data["homeworks"][hid]={
             "id":hid,
@@ -983,51 +1194,58 @@ def t_hw_create(m):
             "due_at": due_at.isoformat(),
             "created_at": now_iso()
         }
-        save_data(data)
+        await asave_data(data)
         user_states.pop(uid,None)
         mk=types.InlineKeyboardMarkup()
         mk.add(types.InlineKeyboardButton("📌 Назначить в класс", callback_data=f"assign_hw:{hid}"),
                types.InlineKeyboardButton("Позже", callback_data="assign_later"))
-        bot.send_message(m.chat.id,f"✅ Домашнее задание создано: {st['title']}\nID: {hid}", reply_markup=mk)
+        outbox.send_message(m.chat.id,f"✅ Домашнее задание создано: {st['title']}\nID: {hid}", reply_markup=mk)
         return
 
 # --------------- TEACHER: CTF CREATE ---------------
 
-@bot.message_handler(func=lambda m: user_states.get(str(m.from_user.id),{}).get("flow")=="ctf_create")
-def t_ctf_create(m):
+@router.flow("ctf_create")
+async def t_ctf_create(m):
     uid=str(m.from_user.id); st=user_states[uid]
     if m.text=="❌ Отмена":
-        user_states.pop(uid,None); bot.send_message(m.chat.id,"Отменено.", reply_markup=kb_teacher()); return
+        user_states.pop(uid,None); outbox.send_message(m.chat.id,"Отменено.", reply_markup=kb_teacher()); return
     t=(m.text or "").strip()
     if st["step"]=="kind":
         if t=="🔐 Crypto":
             st["kind"]="crypto"; st["step"]="crypto_type"
             kb=types.ReplyKeyboardMarkup(resize_keyboard=True, one_time_keyboard=True, row_width=2)
             kb.add("Обфускация","Caesar"); kb.add("Vigenère","XOR-hex"); kb.add("Base64+шум"); kb.add("❌ Отмена")
-            bot.send_message(m.chat.id,"Тип crypto?", reply_markup=kb); return
+            outbox.send_message(m.chat.id,"Тип crypto?", reply_markup=kb); return
         if t=="🌐 Web":
             st["kind"]="web"; st["step"]="web_type"
             kb=types.ReplyKeyboardMarkup(resize_keyboard=True, one_time_keyboard=True, row_width=2)
             kb.add("Небезопасный хеш пароля","SQLi (code review)"); kb.add("XSS (code review)"); kb.add("❌ Отмена")
-            bot.send_message(m.chat.id,"Тип web?", reply_markup=kb); return
-        bot.reply_to(m,"Выберите кнопкой."); return
+            outbox.send_message(m.chat.id,"Тип web?", reply_markup=kb); return
+        outbox.reply_to(m,"Выберите кнопкой."); return
 
     if st["step"]=="crypto_type":
         mp={"Обфускация":"obf","Caesar":"caesar","Vigenère":"vig","XOR-hex":"xor","Base64+шум":"b64"}
-        if t not in mp: bot.reply_to(m,"Выберите кнопкой."); return
+        if t not in mp: outbox.reply_to(m,"Выберите кнопкой."); return
         st["sub"]=mp[t]; st["step"]="crypto_text_q"
         kb=types.ReplyKeyboardMarkup(resize_keyboard=True, one_time_keyboard=True, row_width=2)
         kb.add("Да","Нет"); kb.add("❌ Отмена")
-        bot.send_message(m.chat.id,"Есть свой текст?", reply_markup=kb); return
+        outbox.send_message(m.chat.id,"Есть свой текст?", reply_markup=kb); return
 
     if st["step"]=="crypto_text_q":
-        if t not in ("Да","Нет"): bot.reply_to(m,"Да/Нет."); return
+        if t not in ("Да","Нет"): outbox.reply_to(m,"Да/Нет."); return
         st["has_text"]=(t=="Да"); st["step"]="crypto_text" if st["has_text"] else "crypto_topic"
-        bot.send_message(m.chat.id, "Отправьте текст:" if st["has_text"] else "Тема для генерации текста?", reply_markup=kb_cancel()); return
+        outbox.send_message(m.chat.id, "Отправьте текст:" if st["has_text"] else "Тема для генерации текста?", reply_markup=kb_cancel()); return
 
     if st["step"] in ("crypto_text","crypto_topic"):
-        st["val"]=t
-        bot.send_message(m.chat.id,"Создаю CTF…", reply_markup=types.ReplyKeyboardRemove())
+        st["val"]=t; st["step"]="crypto_variants"
+        kb=types.ReplyKeyboardMarkup(resize_keyboard=True, one_time_keyboard=True, row_width=4)
+        kb.add("1","10","20","30"); kb.add("❌ Отмена")
+        outbox.send_message(m.chat.id,f"Сколько вариантов? (1 — одно задание на класс, до {MAX_CTF_VARIANTS} — у каждого ученика свой флаг)", reply_markup=kb); return
+
+    if st["step"]=="crypto_variants":
+        if not t.isdigit() or not (1 <= int(t) <= MAX_CTF_VARIANTS): outbox.reply_to(m,f"Число 1..{MAX_CTF_VARIANTS}."); return
+        st["variants"]=int(t)
+        outbox.send_message(m.chat.id,"Создаю CTF…", reply_markup=types.ReplyKeyboardRemove())
         run_async(finalize_crypto(uid, st, m.chat.id))
         user_states.pop(uid,None); return
 
@@ -1036,119 +1254,130 @@ def t_ctf_create(m):
         if t=="Небезопасный хеш пароля": sub="insecure"
         elif t=="SQLi (code review)": sub="sqli"
         elif t=="XSS (code review)": sub="xss"
-        else: bot.reply_to(m,"Выберите кнопкой."); return
+        else: outbox.reply_to(m,"Выберите кнопкой."); return
         st["sub"]=sub; st["flag"]=gen_flag(); st["step"]="web_expected"
-        bot.send_message(m.chat.id, f"Введите ожидаемый ответ (или '-' чтобы оставить флаг):\n`{st['flag']}`", parse_mode="Markdown", reply_markup=kb_cancel()); return
+        outbox.send_message(m.chat.id, f"Введите ожидаемый ответ (или '-' чтобы оставить флаг):\n`{st['flag']}`", parse_mode="Markdown", reply_markup=kb_cancel()); return
 
     if st["step"]=="web_expected":
         expected = st["flag"] if t=="-" else t
         st["expected"]=expected
-        bot.send_message(m.chat.id,"Создаю web CTF…", reply_markup=types.ReplyKeyboardRemove())
+        outbox.send_message(m.chat.id,"Создаю web CTF…", reply_markup=types.ReplyKeyboardRemove())
         run_async(finalize_web(uid, st, m.chat.id))
         user_states.pop(uid,None); return
 
 async def finalize_crypto(teacher_id: str, st: Dict[str,Any], chat_id: int):
+    # одна трасса на задание: попытки, проверки и шаги хранилища — дочерние спаны
+    with tracing.span("ctf.crypto", subtype=st.get("sub"), variants=int(st.get("variants") or 1)) as job:
+        await _finalize_crypto(teacher_id, st, chat_id, job)
+
+async def _finalize_crypto(teacher_id: str, st: Dict[str,Any], chat_id: int, job):
     # Все crypto CTF генерируем через YandexGPT, чтобы были уникальны и с уникальным объяснением.
     if not YANDEX_API_KEY or not YANDEX_FOLDER_ID:
-        bot.send_message(chat_id,"❌ Не настроены ключи YandexGPT (.env).", reply_markup=kb_teacher())
+        job.set(outcome="no_keys")
+        outbox.send_message(chat_id,"❌ Не настроены ключи YandexGPT (.env).", reply_markup=kb_teacher())
         return
 
-    data = load_data()
+    # только для проверки отпечатков: сохраняем в конце по свежему aload_data()
+    with tracing.span("storage.load"):
+        data = await aload_data()
     sub = st["sub"]
+    n_variants = int(st.get("variants") or 1)
+    meta = crypto_meta(sub)
 
-    # случайные параметры (чтобы задачи отличались)
-    meta: Dict[str,Any] = {"max_attempts": 5}
-    if sub == "caesar":
-        meta["shift"] = random.randint(3, 20)
-    elif sub == "vig":
-        meta["key"] = "".join(random.choices(string.ascii_lowercase, k=6))
-    elif sub == "xor":
-        meta["key"] = "".join(random.choices(string.ascii_lowercase + string.digits, k=8))
-    elif sub == "b64":
-        meta["rule"] = "remove_every_6th"
-    else:
-        meta["rule"] = "remove_every_2nd"
-
-    # Генерация бандла (title/plaintext/hint/teacher_guide) с проверкой уникальности
+    # generate -> encrypt (один раз) -> decrypt-verify -> fingerprint -> store.
+    # Зашифрованный артефакт (art) проходит до сохранения без повторного шифрования,
+    # поэтому для obf/b64 сохраняется ровно тот шум, который попал в fingerprint.
     attempts = 0
-    bundle = None
+    art: Optional[Dict[str,Any]] = None
     flag = gen_flag()
 
     while attempts < 4:
         attempts += 1
-        nonce = gen_id("N", 10)
-        bundle = await gen_crypto_bundle_yagpt(
-            topic_or_text=st["val"],
-            has_text=bool(st.get("has_text")),
-            flag=flag,
-            subtype=sub,
-            params=meta,
-            nonce=nonce
-        )
-        if not bundle:
-            continue
-        plaintext = bundle["plaintext"]
-
-        # проверка: флаг один раз
-        if not flag_once_ok(plaintext):
-            bundle = None
-            continue
+        M_ATTEMPTS.labels("crypto").inc()
+        with tracing.span("attempt", n=attempts) as att:
+            nonce = gen_id("N", 10)
+            with tracing.span("llm"):
+                bundle = await gen_crypto_bundle_yagpt(
+                    topic_or_text=st["val"],
+                    has_text=bool(st.get("has_text")),
+                    flag=flag,
+                    subtype=sub,
+                    params=meta,
+                    nonce=nonce
+                )
+            if not bundle:
+                att.set(outcome="rejected", reason="no_bundle")
+                continue
+            plaintext = bundle["plaintext"]
 
-        # локально шифруем (чтобы проверка ответа была стабильной)
-        if sub == "obf":
-            chall, auto_hint = obfuscate2(plaintext)
-        elif sub == "caesar":
-            chall = caesar(plaintext, int(meta["shift"]))
-            auto_hint = f"Caesar, сдвиг {meta['shift']}."
-        elif sub == "vig":
-            chall = vigenere(plaintext, str(meta["key"]))
-            auto_hint = f"Vigenère, ключ {meta['key']}."
-        elif sub == "xor":
-            chall = xor_hex(plaintext, str(meta["key"]))
-            auto_hint = f"XOR-hex, ключ {meta['key']}."
-        else:
-            chall, auto_hint = base64_noise(plaintext)
+            # проверка: флаг один раз
+            with tracing.span("validate.flag_once"):
+                ok = flag_once_ok(plaintext)
+            if not ok:
+                M_REJECTED.labels("crypto", "flag_once").inc()
+                att.set(outcome="rejected", reason="flag_once")
+                continue
 
-        # student_hint из YandexGPT (уникальный); но если пустой — fallback на авто-подсказку
-        student_hint = bundle.get("student_hint") or auto_hint
-        teacher_guide = bundle.get("teacher_guide") or ""
+            # локально шифруем (чтобы проверка ответа была стабильной)
+            with tracing.span("encrypt"):
+                chall, auto_hint = encrypt_crypto(sub, plaintext, meta)
 
-        expected_hash = sha(norm(flag))
-        fp = ctf_fingerprint("crypto", sub, chall, student_hint, teacher_guide, expected_hash)
+            # проверка: из challenge расшифровкой восстанавливается именно наш флаг
+            with tracing.span("validate.decrypt"):
+                ok = flag in decrypt_crypto(sub, chall, meta)
+            if not ok:
+                M_REJECTED.labels("crypto", "decrypt").inc()
+                att.set(outcome="rejected", reason="decrypt")
+                continue
 
-        if seen_fingerprint(data, fp):
-            bundle = None
-            continue
+            # student_hint из YandexGPT (уникальный); если пустой — шаблон без ключа
+            student_hint = bundle.get("student_hint") or public_hint(sub, auto_hint)
+            teacher_guide = bundle.get("teacher_guide") or ""
+
+            expected_hash = sha(norm(flag))
+            with tracing.span("validate.fingerprint"):
+                fp = ctf_fingerprint("crypto", sub, chall, student_hint, teacher_guide, expected_hash)
+                seen = seen_fingerprint(data, fp)
+            if seen:
+                M_REJECTED.labels("crypto", "duplicate").inc()
+                att.set(outcome="rejected", reason="duplicate")
+                continue
 
-        # сохраним fingerprint и выйдем
-        add_fingerprint(data, fp)
-        break
+            att.set(outcome="ok")
+            art = {"bundle": bundle, "plaintext": plaintext, "challenge": chall,
+                   "hint": student_hint, "teacher_guide": teacher_guide, "expected_hash": expected_hash, "fp": fp}
+            break
 
-    if not bundle:
-        bot.send_message(chat_id,"❌ Не удалось сгенерировать уникальное CTF через YandexGPT (попробуйте ещё раз).", reply_markup=kb_teacher())
+    M_GENERATED.labels("crypto", "ok" if art else "failed").inc()
+    job.set(outcome="ok" if art else "failed", attempts=attempts)
+    if not art:
+        outbox.send_message(chat_id,"❌ Не удалось сгенерировать уникальное CTF через YandexGPT (попробуйте ещё раз).", reply_markup=kb_teacher())
         return
 
-    # Пересобираем challenge ещё раз (после выхода из цикла у нас уже есть plaintext/hint)
-    plaintext = bundle["plaintext"]
-    if sub == "obf":
-        chall, _ = obfuscate2(plaintext)
-        title = bundle["title"] or "Crypto: Обфускация"
-    elif sub == "caesar":
-        chall = caesar(plaintext, int(meta["shift"]))
-        title = bundle["title"] or "Crypto: Caesar"
-    elif sub == "vig":
-        chall = vigenere(plaintext, str(meta["key"]))
-        title = bundle["title"] or "Crypto: Vigenère"
-    elif sub == "xor":
-        chall = xor_hex(plaintext, str(meta["key"]))
-        title = bundle["title"] or "Crypto: XOR-hex"
-    else:
-        chall, _ = base64_noise(plaintext)
-        title = bundle["title"] or "Crypto: Base64+шум"
-
-    hint = bundle["student_hint"]
-    teacher_guide = bundle["teacher_guide"]
-
+    plaintext = art["plaintext"]
+    chall = art["challenge"]
+    title = art["bundle"]["title"] or CRYPTO_TITLES.get(sub, "Crypto CTF")
+    hint = art["hint"]
+    teacher_guide = art["teacher_guide"]
+
+    # автопроверка: насколько легко достать флаг без ключа
+    with tracing.span("solver"):
+        solver = await asyncio.get_running_loop().run_in_executor(None, solve_crypto, sub, chall, flag)
+    difficulty = {k: solver[k] for k in ("difficulty","label","recovered","candidates","elapsed_ms")}
+
+    variants = None
+    if n_variants > 1:
+        # один ответ модели -> N вариантов с разными флагами/ключами (шифрование пакетно, в process pool)
+        base = {"expected_plain": flag, "expected_hash": art["expected_hash"], "meta": meta, "challenge": chall}
+        with tracing.span("variants", n=n_variants):
+            variants = await asyncio.get_running_loop().run_in_executor(None, build_crypto_variants, sub, plaintext, base, n_variants)
+
+    # генерация шла до минуты: за это время другие хендлеры сохранили свои результаты и
+    # регистрации, поэтому перечитываем данные и добавляем в них только задание и отпечаток
+    with tracing.span("storage.load"):
+        data = await aload_data()
+    if not seen_fingerprint(data, art["fp"]):
+        add_fingerprint(data, art["fp"])
     tid = gen_id("C")
     data["ctf_tasks"][tid] = {
         "id": tid,
@@ -1160,12 +1389,18 @@ async def finalize_crypto(teacher_id: str, st: Dict[str,Any], chat_id: int):
         "challenge": chall,
         "instruction": hint,
         "expected_plain": flag,
-        "expected_hash": sha(norm(flag)),
+        "expected_hash": art["expected_hash"],
         "teacher_guide": teacher_guide,
         "meta": meta,
+        "difficulty": difficulty,
         "created_at": now_iso()
     }
-    save_data(data)
+    if variants:
+        data["ctf_tasks"][tid]["variants"] = variants
+        data["ctf_tasks"][tid]["variant_of"] = {}
+    with tracing.span("storage.save"):
+        await asave_data(data)
+    menus.add("tc", teacher_id, tid, data["ctf_tasks"][tid]["created_at"])
 
     mk = types.InlineKeyboardMarkup()
     mk.add(
@@ -1174,18 +1409,27 @@ async def finalize_crypto(teacher_id: str, st: Dict[str,Any], chat_id: int):
     )
 
     # учителю: уникальное решение + ожидаемый ответ
-    bot.send_message(chat_id, f"✅ CTF создан: {title}\nID: {tid}\n\n{teacher_guide}\n\n✅ Ожидаемый ответ: {flag}", reply_markup=types.ReplyKeyboardRemove())
+    outbox.send_message(chat_id, f"✅ CTF создан: {title}\nID: {tid}\n\n{teacher_guide}\n\n✅ Ожидаемый ответ: {flag}\n\n{difficulty_line(difficulty)}", reply_markup=types.ReplyKeyboardRemove())
+    if variants:
+        outbox.send_message(chat_id, f"🎲 Вариантов: {len(variants)} — у каждого ученика свой флаг и ключ. Ответы по вариантам — в «🏁 Ваши CTF» → «👀 Просмотр».")
 
-    bot.send_message(chat_id, f"📌 Вариант задания для ученика:\nПодсказка: {hint}")
+    outbox.send_message(chat_id, f"📌 Вариант задания для ученика:\nПодсказка: {hint}")
     send_code_block(chat_id, chall, reply_markup=mk)
 
 async def finalize_web(teacher_id: str, st: Dict[str,Any], chat_id: int):
+    with tracing.span("ctf.web", subtype=st.get("sub")) as job:
+        await _finalize_web(teacher_id, st, chat_id, job)
+
+async def _finalize_web(teacher_id: str, st: Dict[str,Any], chat_id: int, job):
     # Все web CTF генерируем через YandexGPT, чтобы были уникальны и с уникальным объяснением.
     if not YANDEX_API_KEY or not YANDEX_FOLDER_ID:
-        bot.send_message(chat_id,"❌ Не настроены ключи YandexGPT (.env).", reply_markup=kb_teacher())
+        job.set(outcome="no_keys")
+        outbox.send_message(chat_id,"❌ Не настроены ключи YandexGPT (.env).", reply_markup=kb_teacher())
         return
 
-    data = load_data()
+    # только для проверки отпечатков: сохраняем в конце по свежему aload_data()
+    with tracing.span("storage.load"):
+        data = await aload_data()
     vuln_label = st["sub"]  # мы храним как "insecure"/"sqli"/"xss" сейчас; передадим как есть + человекочит.
     embedded_flag = st["flag"]
     expected = st["expected"]
@@ -1202,34 +1446,53 @@ async def finalize_web(teacher_id: str, st: Dict[str,Any], chat_id: int):
     bundle = None
     while attempts < 4:
         attempts += 1
-        nonce = gen_id("N", 10)
-        bundle = await gen_web_bundle_yagpt(
-            vuln_label=vuln_human,
-            embedded_flag=embedded_flag,
-            expected_answer=expected,
-            nonce=nonce
-        )
-        if not bundle:
-            continue
+        M_ATTEMPTS.labels("web").inc()
+        with tracing.span("attempt", n=attempts) as att:
+            nonce = gen_id("N", 10)
+            with tracing.span("llm"):
+                bundle = await gen_web_bundle_yagpt(
+                    vuln_label=vuln_human,
+                    embedded_flag=embedded_flag,
+                    expected_answer=expected,
+                    nonce=nonce
+                )
+            if not bundle:
+                att.set(outcome="rejected", reason="no_bundle")
+                continue
 
-        code = bundle["code"]
-        # проверка: флаг один раз
-        if len(re.findall(r"lapin\{[^\}]{3,64}\}", code)) != 1:
-            bundle = None
-            continue
+            code = bundle["code"]
+            # проверка: флаг один раз
+            with tracing.span("validate.flag_once"):
+                ok = len(FLAG_RE.findall(code)) == 1
+            if not ok:
+                M_REJECTED.labels("web", "flag_once").inc()
+                att.set(outcome="rejected", reason="flag_once")
+                bundle = None
+                continue
 
-        expected_hash = sha(norm(expected))
-        fp = ctf_fingerprint("web", vuln_label, code, bundle["student_instruction"], bundle["teacher_guide"], expected_hash)
-        if seen_fingerprint(data, fp):
-            bundle = None
-            continue
-        add_fingerprint(data, fp)
-        break
+            expected_hash = sha(norm(expected))
+            with tracing.span("validate.fingerprint"):
+                fp = ctf_fingerprint("web", vuln_label, code, bundle["student_instruction"], bundle["teacher_guide"], expected_hash)
+                seen = seen_fingerprint(data, fp)
+            if seen:
+                M_REJECTED.labels("web", "duplicate").inc()
+                att.set(outcome="rejected", reason="duplicate")
+                bundle = None
+                continue
+            att.set(outcome="ok")
+            break
 
+    M_GENERATED.labels("web", "ok" if bundle else "failed").inc()
+    job.set(outcome="ok" if bundle else "failed", attempts=attempts)
     if not bundle:
-        bot.send_message(chat_id,"❌ Не удалось сгенерировать уникальное Web CTF через YandexGPT (попробуйте ещё раз).", reply_markup=kb_teacher())
+        outbox.send_message(chat_id,"❌ Не удалось сгенерировать уникальное Web CTF через YandexGPT (попробуйте ещё раз).", reply_markup=kb_teacher())
         return
 
+    # как в _finalize_crypto: перечитываем, чтобы не затереть сохранённое за время генерации
+    with tracing.span("storage.load"):
+        data = await aload_data()
+    if not seen_fingerprint(data, fp):
+        add_fingerprint(data, fp)
     tid = gen_id("W")
     data["ctf_tasks"][tid] = {
         "id": tid,
@@ -1246,7 +1509,9 @@ async def finalize_web(teacher_id: str, st: Dict[str,Any], chat_id: int):
         "teacher_guide": bundle["teacher_guide"],
         "created_at": now_iso()
     }
-    save_data(data)
+    with tracing.span("storage.save"):
+        await asave_data(data)
+    menus.add("tc", teacher_id, tid, data["ctf_tasks"][tid]["created_at"])
 
     mk = types.InlineKeyboardMarkup()
     mk.add(
@@ -1255,160 +1520,277 @@ async def finalize_web(teacher_id: str, st: Dict[str,Any], chat_id: int):
     )
 
     # учителю: уникальное решение + ожидаемый ответ
-    bot.send_message(chat_id, f"✅ Web CTF создан: {bundle['title']}\nID: {tid}\n\n{bundle['teacher_guide']}\n\n✅ Ожидаемый ответ: {expected}", reply_markup=types.ReplyKeyboardRemove())
+    outbox.send_message(chat_id, f"✅ Web CTF создан: {bundle['title']}\nID: {tid}\n\n{bundle['teacher_guide']}\n\n✅ Ожидаемый ответ: {expected}", reply_markup=types.ReplyKeyboardRemove())
 
-    bot.send_message(chat_id, "📌 Вариант задания для ученика:")
+    outbox.send_message(chat_id, "📌 Вариант задания для ученика:")
     send_code_block(chat_id, bundle["code"], reply_markup=mk)
 
 # --------------- ASSIGNMENT CALLBACKS ---------------
 
 
-def classes_kb(teacher_id: str, prefix: str):
-    data=load_data()
+# kind в callback_data -> (коллекция, префикс заголовка, поле с названием)
+ASSIGN_KINDS = {"test": ("tests", "Тест: ", "topic"), "ctf": ("ctf_tasks", "CTF: ", "title"), "hw": ("homeworks", "ДЗ: ", "title")}
+SELECTED = "☑️ "
+
+def make_assignment(data: Dict[str, Any], teacher_id: str, kind: str, ref_id: str, class_id: str) -> Optional[Dict[str, Any]]:
+    """Add an assignment of a test/CTF/homework to a class in memory; the caller saves."""
+    coll, prefix, field = ASSIGN_KINDS[kind]
+    src = data[coll].get(ref_id)
+    if not src:
+        return None
+    aid = gen_id("A")
+    while aid in data["assignments"]:
+        aid = gen_id("A")
+    a = {"id":aid,"class_id":class_id,"teacher_id":teacher_id,"kind":"homework" if kind=="hw" else kind,"ref_id":ref_id,
+         "title":f"{prefix}{src.get(field,'')}","created_at":now_iso()}
+    if kind=="test":
+        src["class_id"]=class_id
+    if kind=="hw":
+        a.update({"open_at":src.get("open_at"),"due_at":src.get("due_at"),"remind_hours":[24,1],"remind_sent":{}})
+    data["assignments"][aid] = a
+    return a
+
+async def assign_to_classes(data: Dict[str, Any], teacher_id: str, kind: str, ref_id: str, class_ids: List[str]) -> List[Dict[str, Any]]:
+    made = [a for a in (make_assignment(data, teacher_id, kind, ref_id, cid) for cid in class_ids) if a]
+    if not made:
+        return made
+    await asave_data(data)  # одна запись на все классы
+    now = now_msk()
+    for a in made:
+        timeline.add(a, now)
+        if a.get("remind_hours"):
+            reminders.schedule(a["id"], a)
+    return made
+
+def sel_key(teacher_id: str, kind: str, ref_id: str) -> str:
+    # выбранные классы живут в user_states под своим ключом: переживают листание и рестарт
+    return f"asel:{teacher_id}:{kind}:{ref_id}"
+
+async def classes_kb(teacher_id: str, kind: str, ref_id: str):
+    """Multi-select over the teacher's classes, paged: class buttons toggle a mark,
+    "Назначить" assigns to every marked class at once."""
+    user_states.pop(sel_key(teacher_id, kind, ref_id), None)
+    return classes_page(teacher_id, kind, ref_id, await aload_data())
+
+def classes_page(teacher_id: str, kind: str, ref_id: str, data: Dict[str, Any], cursor: Optional[str] = None, direction: str = paging.NEXT):
+    sel=set(user_states.get(sel_key(teacher_id, kind, ref_id)) or [])
+    pg=menus.get("cl", teacher_id, data).page(cursor, direction)
     mk=types.InlineKeyboardMarkup()
-    cls=[c for c in data["classes"].values() if isinstance(c,dict) and c.get("teacher_id")==teacher_id]
-    for c in cls[:30]:
-        mk.add(types.InlineKeyboardButton(c.get("name","Класс"), callback_data=f"{prefix}:{c['id']}"))
+    for cid in pg.ids:
+        name=data["classes"].get(cid,{}).get("name","Класс")
+        mk.add(types.InlineKeyboardButton((SELECTED if cid in sel else "")+name, callback_data=paging.cb("asel",kind,ref_id,cid)))
+    nav=[]
+    if pg.prev: nav.append(types.InlineKeyboardButton("‹ Назад", callback_data=paging.cb("apg",kind,ref_id,paging.PREV,pg.prev)))
+    if pg.next: nav.append(types.InlineKeyboardButton("Далее ›", callback_data=paging.cb("apg",kind,ref_id,paging.NEXT,pg.next)))
+    if nav: mk.row(*nav)
+    mk.row(types.InlineKeyboardButton("Все", callback_data=paging.cb("asel_all",kind,ref_id)),
+           types.InlineKeyboardButton(f"✅ Назначить ({len(sel)})" if sel else "✅ Назначить", callback_data=paging.cb("asel_go",kind,ref_id)))
     mk.add(types.InlineKeyboardButton("Отмена", callback_data="assign_later"))
     return mk
 
+def selected_classes(mk) -> List[str]:
+    return [b.callback_data.rsplit(":",1)[1] for row in (mk.keyboard if mk else []) for b in row
+            if b.callback_data and b.callback_data.startswith("asel:") and b.text.startswith(SELECTED)]
+
+def first_class(mk) -> Optional[str]:
+    return next((b.callback_data.rsplit(":",1)[1] for row in (mk.keyboard if mk else []) for b in row
+                 if b.callback_data and b.callback_data.startswith("asel:")), None)
+
 @bot.callback_query_handler(func=lambda c: c.data.startswith("assign_test:"))
-def cb_assign_test(c):
+async def cb_assign_test(c):
     uid=str(c.from_user.id); tid=c.data.split(":",1)[1]
-    if load_data()["users"].get(uid,{}).get("role")!="teacher":
-        bot.answer_callback_query(c.id,"Только учителю", show_alert=True); return
-    bot.answer_callback_query(c.id)
-    bot.send_message(c.message.chat.id,"Выберите класс:", reply_markup=classes_kb(uid, f"pick_class_test:{tid}"))
+    if (await aload_data())["users"].get(uid,{}).get("role")!="teacher":
+        await bot.answer_callback_query(c.id,"Только учителю", show_alert=True); return
+    await bot.answer_callback_query(c.id)
+    outbox.send_message(c.message.chat.id,"Выберите классы:", reply_markup=await classes_kb(uid, "test", tid))
 
 @bot.callback_query_handler(func=lambda c: c.data.startswith("assign_ctf:"))
-def cb_assign_ctf(c):
+async def cb_assign_ctf(c):
     uid=str(c.from_user.id); tid=c.data.split(":",1)[1]
-    if load_data()["users"].get(uid,{}).get("role")!="teacher":
-        bot.answer_callback_query(c.id,"Только учителю", show_alert=True); return
-    bot.answer_callback_query(c.id)
-    bot.send_message(c.message.chat.id,"Выберите класс:", reply_markup=classes_kb(uid, f"pick_class_ctf:{tid}"))
+    if (await aload_data())["users"].get(uid,{}).get("role")!="teacher":
+        await bot.answer_callback_query(c.id,"Только учителю", show_alert=True); return
+    await bot.answer_callback_query(c.id)
+    outbox.send_message(c.message.chat.id,"Выберите классы:", reply_markup=await classes_kb(uid, "ctf", tid))
 
 @bot.callback_query_handler(func=lambda c: c.data.startswith("assign_hw:"))
-def cb_assign_hw(c):
+async def cb_assign_hw(c):
     uid=str(c.from_user.id); hid=c.data.split(":",1)[1]
-    if load_data()["users"].get(uid,{}).get("role")!="teacher":
-        bot.answer_callback_query(c.id,"Только учителю", show_alert=True); return
-    bot.answer_callback_query(c.id)
-    bot.send_message(c.message.chat.id,"Выберите класс:", reply_markup=classes_kb(uid, f"pick_class_hw:{hid}"))
+    if (await aload_data())["users"].get(uid,{}).get("role")!="teacher":
+        await bot.answer_callback_query(c.id,"Только учителю", show_alert=True); return
+    await bot.answer_callback_query(c.id)
+    outbox.send_message(c.message.chat.id,"Выберите классы:", reply_markup=await classes_kb(uid, "hw", hid))
+
+@bot.callback_query_handler(func=lambda c: c.data.startswith(("asel:","asel_all:","apg:")))
+async def cb_assign_select(c):
+    uid=str(c.from_user.id); data=await aload_data()
+    head, kind, ref_id, rest = (c.data.split(":",3)+[""])[:4]
+    key=sel_key(uid, kind, ref_id)
+    cursor, direction = first_class(c.message.reply_markup), paging.CURRENT
+    if head=="apg":
+        direction, cursor = rest.split(":",1)
+    else:
+        sel=set(user_states.get(key) or selected_classes(c.message.reply_markup))
+        if head=="asel_all":
+            own=set(menus.get("cl", uid, data).ids())
+            sel = sel-own if own<=sel else sel|own
+        else:
+            sel ^= {rest}
+        user_states[key]=sorted(sel)
+    await bot.answer_callback_query(c.id)
+    outbox.edit_message_reply_markup(c.message.chat.id, c.message.message_id, reply_markup=classes_page(uid, kind, ref_id, data, cursor, direction))
 
-@bot.callback_query_handler(func=lambda c: c.data.startswith("pick_class_test:"))
-def cb_pick_class_test(c):
-    uid=str(c.from_user.id)
-    rest=c.data.split("pick_class_test:",1)[1]
-    tid, cid = rest.split(":",1)
-    data=load_data()
-    t=data["tests"].get(tid)
-    if not t: bot.answer_callback_query(c.id,"Тест не найден", show_alert=True); return
-    aid=gen_id("A")
-    data["assignments"][aid]={"id":aid,"class_id":cid,"teacher_id":uid,"kind":"test","ref_id":tid,"title":f"Тест: {t.get('topic','')}", "created_at": now_iso()}
-    data["tests"][tid]["class_id"]=cid
-    save_data(data)
-    bot.answer_callback_query(c.id,"Назначено ✅")
-    bot.send_message(c.message.chat.id,"✅ Назначено.", reply_markup=kb_teacher())
-
-@bot.callback_query_handler(func=lambda c: c.data.startswith("pick_class_ctf:"))
-def cb_pick_class_ctf(c):
+async def finish_assign(c, kind: str, ref_id: str, class_ids: List[str]):
     uid=str(c.from_user.id)
-    rest=c.data.split("pick_class_ctf:",1)[1]
-    tid, cid = rest.split(":",1)
-    data=load_data()
-    t=data["ctf_tasks"].get(tid)
-    if not t: bot.answer_callback_query(c.id,"CTF не найден", show_alert=True); return
-    aid=gen_id("A")
-    data["assignments"][aid]={"id":aid,"class_id":cid,"teacher_id":uid,"kind":"ctf","ref_id":tid,"title":f"CTF: {t.get('title','')}", "created_at": now_iso()}
-    save_data(data)
-    bot.answer_callback_query(c.id,"Назначено ✅")
-    bot.send_message(c.message.chat.id,"✅ Назначено.", reply_markup=kb_teacher())
-
-@bot.callback_query_handler(func=lambda c: c.data.startswith("pick_class_hw:"))
-def cb_pick_class_hw(c):
-    uid=str(c.from_user.id)
-    rest=c.data.split("pick_class_hw:",1)[1]
-    hid, cid = rest.split(":",1)
-    data=load_data()
-    hw=data["homeworks"].get(hid)
-    if not hw: bot.answer_callback_query(c.id,"ДЗ не найдено", show_alert=True); return
-    aid=gen_id("A")
-    data["assignments"][aid]={
-        "id":aid,
-        "class_id":cid,
-        "teacher_id":uid,
-        "kind":"homework",
-        "ref_id":hid,
-        "title":f"ДЗ: {hw.get('title','')}",
-        "open_at": hw.get("open_at"),
-        "due_at": hw.get("due_at"),
-        "remind_hours":[24,1],
-        "remind_sent": {},
-        "created_at": now_iso()
-    }
-    save_data(data)
-    bot.answer_callback_query(c.id,"Назначено ✅")
-    bot.send_message(c.message.chat.id,"✅ Назначено.", reply_markup=kb_teacher())
+    data=await aload_data()
+    own=[cid for cid in class_ids if data["classes"].get(cid,{}).get("teacher_id")==uid]
+    if not own:
+        await bot.answer_callback_query(c.id,"Выберите хотя бы один класс", show_alert=True); return
+    made=await assign_to_classes(data, uid, kind, ref_id, own)
+    if not made:
+        await bot.answer_callback_query(c.id,"Задание не найдено", show_alert=True); return
+    await bot.answer_callback_query(c.id,"Назначено ✅")
+    outbox.edit_message_reply_markup(c.message.chat.id, c.message.message_id, reply_markup=None)
+    names=", ".join(data["classes"][a["class_id"]].get("name","") for a in made)
+    outbox.send_message(c.message.chat.id,f"✅ Назначено: {names}.", reply_markup=kb_teacher())
+
+@bot.callback_query_handler(func=lambda c: c.data.startswith("asel_go:"))
+async def cb_assign_go(c):
+    _, kind, ref_id = c.data.split(":",2)
+    key=sel_key(str(c.from_user.id), kind, ref_id)
+    await finish_assign(c, kind, ref_id, user_states.get(key) or selected_classes(c.message.reply_markup))
+    user_states.pop(key, None)
+
+# клавиатуры «один класс» из старых сообщений
+@bot.callback_query_handler(func=lambda c: c.data.startswith(("pick_class_test:","pick_class_ctf:","pick_class_hw:")))
+async def cb_pick_class(c):
+    head, ref_id, cid = c.data.split(":",2)
+    await finish_assign(c, head.replace("pick_class_",""), ref_id, [cid])
 
 @bot.callback_query_handler(func=lambda c: c.data=="assign_later")
-def cb_assign_later(c):
-    bot.answer_callback_query(c.id)
-    bot.send_message(c.message.chat.id,"Ок, можно назначить позже.", reply_markup=kb_teacher())
+async def cb_assign_later(c):
+    await bot.answer_callback_query(c.id)
+    outbox.send_message(c.message.chat.id,"Ок, можно назначить позже.", reply_markup=kb_teacher())
+
+# --------------- REMINDERS ---------------
+
+async def send_reminders(aid: str, hours: int):
+    data=await aload_data(); a=data["assignments"].get(aid)
+    if not a or str(hours) in (a.get("remind_sent") or {}): return
+    now=now_msk(); due=dt_from_iso(a.get("due_at"))
+    if not due or now>=due: return
+    sent=a.setdefault("remind_sent",{})
+    if superseded(a, hours, now.timestamp()):
+        sent[str(hours)]=[]; await asave_data(data); return
+    done=submitted_by(data, aid)
+    sids=[sid for sid,_ in get_class_students(data, a.get("class_id")) if sid not in done]
+    # сначала фиксируем, кому отправляем: после рестарта это напоминание уже не повторится
+    sent[str(hours)]=sids
+    await asave_data(data)
+    text=f"⏰ Напоминание: «{a.get('title','')}» — сдать до {fmt_dt_msk(due)}."
+    for sid in sids:
+        outbox.send_message(int(sid), text, priority=BULK)
+
+reminders = ReminderScheduler(send_reminders)
+# индекс назначений по классам для меню ученика; строится при первом открытии меню
+timeline = Timeline(window_label)
+
+# --------------- PAGED MENUS ---------------
+
+def menu_page(menu: str, uid: str, data: Dict[str, Any], cursor: Optional[str] = None, direction: str = paging.NEXT):
+    """Inline keyboard for one page of a list menu ("tt" — tests, "tc" — CTF, "st" — student tasks), or None if empty."""
+    if menu=="st":
+        cid=data["users"].get(uid,{}).get("class_id")
+        if not timeline.built: timeline.build(data["assignments"], now_msk())
+        ct=timeline.get(cid or "")
+        if not ct: return None
+        entries, pg = ct.page(now_msk(), cursor, direction)
+        items=[(e.aid, f"{e.title} · {e.label}") for e in entries]
+    else:
+        pg=menus.get(menu, uid, data).page(cursor, direction)
+        coll=data["tests"] if menu=="tt" else data["ctf_tasks"]
+        items=[(i, coll[i].get("topic" if menu=="tt" else "title") or f"ID {i}") for i in pg.ids if i in coll]
+    if not items: return None
+    mk=types.InlineKeyboardMarkup()
+    for item_id, label in items:
+        mk.add(types.InlineKeyboardButton(label[:60], callback_data=paging.cb("pk",menu,item_id)))
+    nav=[]
+    if pg.prev: nav.append(types.InlineKeyboardButton("‹ Назад", callback_data=paging.cb("pg",menu,paging.PREV,pg.prev)))
+    if pg.next: nav.append(types.InlineKeyboardButton("Далее ›", callback_data=paging.cb("pg",menu,paging.NEXT,pg.next)))
+    if nav: mk.row(*nav)
+    return mk
+
+@bot.callback_query_handler(func=lambda c: c.data.startswith(("pg:","pk:")))
+async def cb_menu(c):
+    uid=str(c.from_user.id); data=await aload_data()
+    kind, menu, direction, item_id = paging.parse(c.data)
+    role=data["users"].get(uid,{}).get("role")
+    if role!=("student" if menu=="st" else "teacher"):
+        await bot.answer_callback_query(c.id,"Недоступно", show_alert=True); return
+    await bot.answer_callback_query(c.id)
+    if kind=="pg":
+        kb=menu_page(menu, uid, data, item_id, direction)
+        if kb: outbox.edit_message_reply_markup(c.message.chat.id, c.message.message_id, reply_markup=kb)
+        return
+    if menu=="st":
+        await open_task(c.message.chat.id, uid, data, item_id or "")
+    elif menu=="tt":
+        open_test(c.message.chat.id, uid, data, item_id or "")
+    elif menu=="tc":
+        open_ctf(c.message.chat.id, uid, data, item_id or "")
 
 # --------------- STUDENT: ASSIGNMENTS ---------------
 
-@bot.message_handler(func=lambda m: m.text=="📚 Мои задания")
-def s_tasks(m):
-    data=load_data(); uid=str(m.from_user.id)
+@router.text("📚 Мои задания")
+async def s_tasks(m):
+    data=await aload_data(); uid=str(m.from_user.id)
     u=data["users"].get(uid,{})
-    if u.get("role")!="student": bot.reply_to(m,"Только ученику."); return
+    if u.get("role")!="student": outbox.reply_to(m,"Только ученику."); return
     cid=u.get("class_id")
-    if not cid: bot.reply_to(m,"Нет класса. /start"); return
-    arr=[a for a in data["assignments"].values() if isinstance(a,dict) and a.get("class_id")==cid]
-    if not arr: bot.send_message(m.chat.id,"Заданий нет.", reply_markup=kb_student()); return
-    arr.sort(key=lambda a:a.get("created_at",""), reverse=True)
-    kb=types.ReplyKeyboardMarkup(resize_keyboard=True, one_time_keyboard=True)
-    for a in arr[:25]:
-        kb.add(f"Задание ID: {a['id']} - {a.get('title','')}")
-    kb.add("❌ Отмена")
-    user_states[uid]={"flow":"open_task"}
-    bot.send_message(m.chat.id,"Выберите задание:", reply_markup=kb)
+    if not cid: outbox.reply_to(m,"Нет класса. /start"); return
+    kb=menu_page("st", uid, data)
+    if not kb: outbox.send_message(m.chat.id,"Заданий нет.", reply_markup=kb_student()); return
+    user_states.pop(uid,None)
+    outbox.send_message(m.chat.id,"Выберите задание:", reply_markup=kb)
 
-@bot.message_handler(func=lambda m: user_states.get(str(m.from_user.id),{}).get("flow")=="open_task")
-def s_open_task(m):
+@router.flow("open_task")
+async def s_open_task(m):
     uid=str(m.from_user.id)
     if m.text=="❌ Отмена":
-        user_states.pop(uid,None); bot.send_message(m.chat.id,"Ок.", reply_markup=kb_student()); return
+        user_states.pop(uid,None); outbox.send_message(m.chat.id,"Ок.", reply_markup=kb_student()); return
     if "Задание ID:" not in (m.text or ""):
-        bot.reply_to(m,"Выберите кнопкой."); return
+        outbox.reply_to(m,"Выберите кнопкой."); return
     aid = m.text.split("Задание ID:",1)[1].strip().split(" - ",1)[0].strip()
-    data=load_data(); a=data["assignments"].get(aid)
-    if not a: bot.reply_to(m,"Не найдено."); return
+    await open_task(m.chat.id, uid, await aload_data(), aid)
+
+async def open_task(chat_id: int, uid: str, data: Dict[str, Any], aid: str):
+    a=data["assignments"].get(aid)
+    if not a or a.get("class_id")!=data["users"].get(uid,{}).get("class_id"): outbox.send_message(chat_id,"Не найдено."); return
     if a.get("kind")=="test":
         tid=a.get("ref_id"); test=data["tests"].get(tid)
-        if not test: bot.reply_to(m,"Тест не найден."); user_states.pop(uid,None); return
-        user_states[uid]={"flow":"take_test","aid":aid,"tid":tid,"i":0,"ans":[],"wrong":[]}
-        q=test["questions"][0]
-        opts="\n".join([f"{j+1}. {o}" for j,o in enumerate(q["options"])])
-        bot.send_message(m.chat.id,f"📝 {test.get('topic')}\n\nВопрос 1:\n{q['question']}\n\n{opts}\n\nОтвет: 1-4", reply_markup=types.ReplyKeyboardRemove()); return
+        if not test: outbox.send_message(chat_id,"Тест не найден."); user_states.pop(uid,None); return
+        user_states[uid]={"flow":"take_test","aid":aid,"tid":tid,"i":0,"ans":[],"wrong":[],"started_at":now_iso()}
+        outbox.send_message(chat_id,f"📝 {test.get('topic')}\n\n"+question_prompt(test["questions"][0], 0), reply_markup=types.ReplyKeyboardRemove()); return
     if a.get("kind")=="ctf":
         tid=a.get("ref_id"); task=data["ctf_tasks"].get(tid)
-        if not task: bot.reply_to(m,"CTF не найден."); user_states.pop(uid,None); return
-        user_states[uid]={"flow":"solve_ctf","aid":aid,"ctf_id":tid,"attempts":0}
-        chall=task.get("challenge","")
-        bot.send_message(
-            m.chat.id,
+        if not task: outbox.send_message(chat_id,"CTF не найден."); user_states.pop(uid,None); return
+        assigned = uid in task.get("variant_of", {})
+        vi, var = ctf_variant(data, task, uid)
+        if vi is not None and not assigned:
+            await asave_data(data)
+        user_states[uid]={"flow":"solve_ctf","aid":aid,"ctf_id":tid,"attempts":0,"variant":vi,"started_at":now_iso()}
+        chall=var.get("challenge","")
+        outbox.send_message(
+            chat_id,
             f"🏁 {task.get('title')}\n\n{task.get('description','')}\n{task.get('instruction','')}\n\nОтвет одним сообщением.",
             reply_markup=types.ReplyKeyboardRemove()
         )
-        send_code_block(m.chat.id, chall)
+        send_code_block(chat_id, chall)
         return
-    bot.reply_to(m,"Неизвестный тип."); user_states.pop(uid,None)
+    outbox.send_message(chat_id,"Неизвестный тип."); user_states.pop(uid,None)
 
 # --------------- STUDENT: HOMEWORK ---------------
 
-def save_homework_res(data: Dict[str,Any], aid: str, sid: str, hw_id: str, answer: str, ok: bool):
+async def save_homework_res(data: Dict[str,Any], aid: str, sid: str, hw_id: str, answer: str, ok: bool):
     rid=gen_id("R")
     data["results"][rid]={
         "id":rid,
@@ -1422,51 +1804,58 @@ def save_homework_res(data: Dict[str,Any], aid: str, sid: str, hw_id: str, answe
         "format_ok":ok,
         "submitted_at":now_iso()
     }
-    save_data(data)
+    record_result(data, data["results"][rid])
+    await asave_data(data)
 
-@bot.message_handler(func=lambda m: user_states.get(str(m.from_user.id),{}).get("flow")=="submit_homework")
-def s_submit_homework(m):
-    uid=str(m.from_user.id); st=user_states[uid]; data=load_data()
+@router.flow("submit_homework")
+async def s_submit_homework(m):
+    uid=str(m.from_user.id); st=user_states[uid]; data=await aload_data()
     if m.text=="❌ Отмена":
-        user_states.pop(uid,None); bot.send_message(m.chat.id,"Ок.", reply_markup=kb_student()); return
+        user_states.pop(uid,None); outbox.send_message(m.chat.id,"Ок.", reply_markup=kb_student()); return
     aid=st.get("aid"); hw_id=st.get("hw_id")
     a=data["assignments"].get(aid)
     if not a:
-        user_states.pop(uid,None); bot.send_message(m.chat.id,"Задание не найдено.", reply_markup=kb_student()); return
+        user_states.pop(uid,None); outbox.send_message(m.chat.id,"Задание не найдено.", reply_markup=kb_student()); return
     ok, msg = assignment_can_submit(a, now_msk())
     if not ok:
-        user_states.pop(uid,None); bot.send_message(m.chat.id,msg, reply_markup=kb_student()); return
+        user_states.pop(uid,None); outbox.send_message(m.chat.id,msg, reply_markup=kb_student()); return
     hw=data["homeworks"].get(hw_id)
     if not hw:
-        user_states.pop(uid,None); bot.send_message(m.chat.id,"ДЗ не найдено.", reply_markup=kb_student()); return
+        user_states.pop(uid,None); outbox.send_message(m.chat.id,"ДЗ не найдено.", reply_markup=kb_student()); return
     ans=(m.text or "").strip()
     fmt=hw.get("format_regex")
     if not format_ok(ans, fmt):
-        bot.reply_to(m,"Неверный формат ответа. Попробуйте снова или отмените.")
+        outbox.reply_to(m,"Неверный формат ответа. Попробуйте снова или отмените.")
         return
-    save_homework_res(data, aid, uid, hw_id, ans, True)
+    await save_homework_res(data, aid, uid, hw_id, ans, True)
     user_states.pop(uid,None)
-    bot.send_message(m.chat.id,"✅ Принято.", reply_markup=kb_student()); return
+    outbox.send_message(m.chat.id,"✅ Принято.", reply_markup=kb_student()); return
 
 # --------------- STUDENT: TAKE TEST ---------------
 
-def save_test_res(data: Dict[str,Any], aid: str, sid: str, tid: str, correct: int, total: int, wrong: list):
+async def save_test_res(data: Dict[str,Any], aid: str, sid: str, tid: str, correct: int, total: int, wrong: list, answers: Optional[list] = None, started_at: Optional[str] = None):
     rid=gen_id("R")
     data["results"][rid]={"id":rid,"kind":"test","assignment_id":aid,"student_id":sid,"student_name":data["users"].get(sid,{}).get("username","student"),
                           "teacher_id":data["tests"].get(tid,{}).get("teacher_id"),"test_id":tid,
                           "correct_answers":correct,"total_questions":total,"wrong_answers":wrong,"submitted_at":now_iso()}
-    save_data(data)
-
-@bot.message_handler(func=lambda m: user_states.get(str(m.from_user.id),{}).get("flow")=="take_test")
-def s_take_test(m):
-    uid=str(m.from_user.id); st=user_states[uid]; data=load_data()
+    if answers is not None:
+        data["results"][rid]["answers"]=answers
+    if started_at:
+        data["results"][rid]["started_at"]=started_at
+    record_result(data, data["results"][rid])
+    await asave_data(data)
+
+@router.flow("take_test")
+async def s_take_test(m):
+    uid=str(m.from_user.id); st=user_states[uid]; data=await aload_data()
+    if st.get("aid") not in data["assignments"]: outbox.send_message(m.chat.id,"Задание не найдено.", reply_markup=kb_student()); user_states.pop(uid,None); return
     tid=st["tid"]; test=data["tests"].get(tid)
-    if not test: bot.send_message(m.chat.id,"Тест не найден.", reply_markup=kb_student()); user_states.pop(uid,None); return
+    if not test: outbox.send_message(m.chat.id,"Тест не найден.", reply_markup=kb_student()); user_states.pop(uid,None); return
     qs=test.get("questions",[]); i=st["i"]
     txt=(m.text or "").strip()
-    if not txt.isdigit(): bot.reply_to(m,"Ответ 1-4."); return
+    if not txt.isdigit(): outbox.reply_to(m,"Ответ 1-4."); return
     ans=int(txt)-1
-    if ans<0 or ans>3: bot.reply_to(m,"Ответ 1-4."); return
+    if ans<0 or ans>3: outbox.reply_to(m,"Ответ 1-4."); return
     q=qs[i]; st["ans"].append(ans)
     if ans!=q["correct"]:
         st["wrong"].append({"question":q["question"],"user_answer":q["options"][ans],"correct_answer":q["options"][q["correct"]],"explanation":q.get("explanation","")})
@@ -1474,49 +1863,55 @@ def s_take_test(m):
     if i>=len(qs):
         correct=sum(1 for k,qq in enumerate(qs) if qq["correct"]==st["ans"][k])
         total=len(qs)
-        save_test_res(data, st["aid"], uid, tid, correct, total, st["wrong"])
+        await save_test_res(data, st["aid"], uid, tid, correct, total, st["wrong"], st["ans"], st.get("started_at"))
         out=[f"✅ Готово: {correct}/{total}"]
         for e in st["wrong"][:10]:
             out.append(f"\n{e['question']}\nВаш: {e['user_answer']}\nПравильный: {e['correct_answer']}")
             if e.get("explanation"): out.append(f"Пояснение: {e['explanation']}")
         user_states.pop(uid,None)
-        bot.send_message(m.chat.id,"\n".join(out), reply_markup=kb_student()); return
-    q=qs[i]; opts="\n".join([f"{j+1}. {o}" for j,o in enumerate(q["options"])])
-    bot.send_message(m.chat.id,f"Вопрос {i+1}:\n{q['question']}\n\n{opts}\n\nОтвет: 1-4")
+        outbox.send_message(m.chat.id,"\n".join(out), reply_markup=kb_student()); return
+    outbox.send_message(m.chat.id,question_prompt(qs[i], i))
 
 # --------------- STUDENT: SOLVE CTF ---------------
 
-def save_ctf_res(data: Dict[str,Any], aid: str, sid: str, ctf_id: str, ok: bool, attempts: int):
+async def save_ctf_res(data: Dict[str,Any], aid: str, sid: str, ctf_id: str, ok: bool, attempts: int, variant: Optional[int] = None, started_at: Optional[str] = None):
     rid=gen_id("R")
     data["results"][rid]={"id":rid,"kind":"ctf","assignment_id":aid,"student_id":sid,"student_name":data["users"].get(sid,{}).get("username","student"),
                           "teacher_id":data["ctf_tasks"].get(ctf_id,{}).get("teacher_id"),"task_id":ctf_id,
                           "is_correct":ok,"attempts":attempts,"submitted_at":now_iso()}
-    save_data(data)
-
-@bot.message_handler(func=lambda m: user_states.get(str(m.from_user.id),{}).get("flow")=="solve_ctf")
-def s_solve_ctf(m):
-    uid=str(m.from_user.id); st=user_states[uid]; data=load_data()
+    if variant is not None:
+        data["results"][rid]["variant"]=variant
+    if started_at:
+        data["results"][rid]["started_at"]=started_at
+    record_result(data, data["results"][rid])
+    await asave_data(data)
+
+@router.flow("solve_ctf")
+async def s_solve_ctf(m):
+    uid=str(m.from_user.id); st=user_states[uid]; data=await aload_data()
+    if st.get("aid") not in data["assignments"]: outbox.send_message(m.chat.id,"Задание не найдено.", reply_markup=kb_student()); user_states.pop(uid,None); return
     ctf_id=st["ctf_id"]; task=data["ctf_tasks"].get(ctf_id)
-    if not task: bot.send_message(m.chat.id,"CTF не найден.", reply_markup=kb_student()); user_states.pop(uid,None); return
+    if not task: outbox.send_message(m.chat.id,"CTF не найден.", reply_markup=kb_student()); user_states.pop(uid,None); return
     st["attempts"]+=1
-    ok = sha(norm(m.text)) == task.get("expected_hash")
+    vi=st.get("variant"); var=ctf_shown_variant(task, vi)
+    ok = sha(norm(m.text)) == var.get("expected_hash")
     max_attempts = int(task.get("meta",{}).get("max_attempts",5)) if isinstance(task.get("meta"),dict) else 5
     if ok:
-        save_ctf_res(data, st["aid"], uid, ctf_id, True, st["attempts"])
-        user_states.pop(uid,None); bot.send_message(m.chat.id,"✅ Верно!", reply_markup=kb_student()); return
+        await save_ctf_res(data, st["aid"], uid, ctf_id, True, st["attempts"], vi, st.get("started_at"))
+        user_states.pop(uid,None); outbox.send_message(m.chat.id,"✅ Верно!", reply_markup=kb_student()); return
     if st["attempts"]>=max_attempts:
-        save_ctf_res(data, st["aid"], uid, ctf_id, False, st["attempts"])
-        user_states.pop(uid,None); bot.send_message(m.chat.id,f"❌ Неверно. Попытки закончились ({max_attempts}).", reply_markup=kb_student()); return
-    bot.reply_to(m, f"❌ Неверно. Осталось попыток: {max_attempts-st['attempts']}")
+        await save_ctf_res(data, st["aid"], uid, ctf_id, False, st["attempts"], vi, st.get("started_at"))
+        user_states.pop(uid,None); outbox.send_message(m.chat.id,f"❌ Неверно. Попытки закончились ({max_attempts}).", reply_markup=kb_student()); return
+    outbox.reply_to(m, f"❌ Неверно. Осталось попыток: {max_attempts-st['attempts']}")
 
 # --------------- RESULTS ---------------
 
-@bot.message_handler(func=lambda m: m.text=="📈 Мои результаты")
-def s_results(m):
-    data=load_data(); uid=str(m.from_user.id)
-    if data["users"].get(uid,{}).get("role")!="student": bot.reply_to(m,"Только ученику."); return
+@router.text("📈 Мои результаты")
+async def s_results(m):
+    data=await aload_data(); uid=str(m.from_user.id)
+    if data["users"].get(uid,{}).get("role")!="student": outbox.reply_to(m,"Только ученику."); return
     res=[r for r in data["results"].values() if isinstance(r,dict) and r.get("student_id")==uid]
-    if not res: bot.send_message(m.chat.id,"Результатов нет.", reply_markup=kb_student()); return
+    if not res: outbox.send_message(m.chat.id,"Результатов нет.", reply_markup=kb_student()); return
     res.sort(key=lambda r:r.get("submitted_at",""), reverse=True)
     out=["📈 Результаты:"]
     for r in res[:30]:
@@ -1524,46 +1919,46 @@ def s_results(m):
             out.append(f"• Тест {r.get('test_id')}: {r.get('correct_answers')}/{r.get('total_questions')}")
         else:
             out.append(f"• CTF {r.get('task_id')}: {'✅' if r.get('is_correct') else '❌'} (попыток {r.get('attempts')})")
-    bot.send_message(m.chat.id,"\n".join(out), reply_markup=kb_student())
+    outbox.send_message(m.chat.id,"\n".join(out), reply_markup=kb_student())
 
-@bot.message_handler(func=lambda m: m.text=="📊 Результаты")
-def t_results(m):
-    data=load_data(); uid=str(m.from_user.id)
-    if data["users"].get(uid,{}).get("role")!="teacher": bot.reply_to(m,"Только учителю."); return
+@router.text("📊 Результаты")
+async def t_results(m):
+    data=await aload_data(); uid=str(m.from_user.id)
+    if data["users"].get(uid,{}).get("role")!="teacher": outbox.reply_to(m,"Только учителю."); return
     cls=[c for c in data["classes"].values() if isinstance(c,dict) and c.get("teacher_id")==uid]
-    if not cls: bot.send_message(m.chat.id,"Классов нет.", reply_markup=kb_teacher()); return
+    if not cls: outbox.send_message(m.chat.id,"Классов нет.", reply_markup=kb_teacher()); return
     kb=types.ReplyKeyboardMarkup(resize_keyboard=True, one_time_keyboard=True)
     for c in cls: kb.add(f"Класс: {c['name']}")
     kb.add("❌ Отмена")
     user_states[uid]={"flow":"tres","step":"class"}
-    bot.send_message(m.chat.id,"Выберите класс:", reply_markup=kb)
+    outbox.send_message(m.chat.id,"Выберите класс:", reply_markup=kb)
 
-@bot.message_handler(func=lambda m: user_states.get(str(m.from_user.id),{}).get("flow")=="tres")
-def t_results_flow(m):
-    uid=str(m.from_user.id); st=user_states[uid]; data=load_data()
+@router.flow("tres")
+async def t_results_flow(m):
+    uid=str(m.from_user.id); st=user_states[uid]; data=await aload_data()
     if m.text=="❌ Отмена":
-        user_states.pop(uid,None); bot.send_message(m.chat.id,"Ок.", reply_markup=kb_teacher()); return
+        user_states.pop(uid,None); outbox.send_message(m.chat.id,"Ок.", reply_markup=kb_teacher()); return
     t=(m.text or "").strip()
     if st["step"]=="class":
-        if not t.startswith("Класс: "): bot.reply_to(m,"Кнопкой."); return
+        if not t.startswith("Класс: "): outbox.reply_to(m,"Кнопкой."); return
         name=t.replace("Класс: ","",1).strip()
         cid=None
         for k,v in data["classes"].items():
             if isinstance(v,dict) and v.get("teacher_id")==uid and v.get("name")==name: cid=k; break
-        if not cid: bot.reply_to(m,"Класс не найден."); return
+        if not cid: outbox.reply_to(m,"Класс не найден."); return
         st["cid"]=cid; st["step"]="student"
         studs=[(sid,u) for sid,u in data["users"].items() if isinstance(u,dict) and u.get("role")=="student" and u.get("class_id")==cid]
-        if not studs: user_states.pop(uid,None); bot.send_message(m.chat.id,"Учеников нет.", reply_markup=kb_teacher()); return
+        if not studs: user_states.pop(uid,None); outbox.send_message(m.chat.id,"Учеников нет.", reply_markup=kb_teacher()); return
         kb=types.ReplyKeyboardMarkup(resize_keyboard=True, one_time_keyboard=True)
         for sid,u in studs:
             p=u.get("profile") or {}
             nm=(" ".join([p.get("last_name",""),p.get("first_name","")]).strip() or u.get("username","Ученик"))
             kb.add(f"Ученик: {nm} ({sid})")
         kb.add("❌ Отмена")
-        bot.send_message(m.chat.id,"Выберите ученика:", reply_markup=kb); return
+        outbox.send_message(m.chat.id,"Выберите ученика:", reply_markup=kb); return
     if st["step"]=="student":
         m2=re.search(r"\((\d+)\)\s*$", t)
-        if not m2: bot.reply_to(m,"Выберите кнопкой."); return
+        if not m2: outbox.reply_to(m,"Выберите кнопкой."); return
         sid=m2.group(1); cid=st["cid"]
         allowed={a["id"] for a in data["assignments"].values() if isinstance(a,dict) and a.get("class_id")==cid}
         res=[r for r in data["results"].values() if isinstance(r,dict) and r.get("student_id")==sid and r.get("assignment_id") in allowed]
@@ -1576,19 +1971,192 @@ def t_results_flow(m):
             if r.get("kind")=="test": out.append(f"• Тест {r.get('test_id')}: {r.get('correct_answers')}/{r.get('total_questions')}")
             else: out.append(f"• CTF {r.get('task_id')}: {'✅' if r.get('is_correct') else '❌'} (попыток {r.get('attempts')})")
         user_states.pop(uid,None)
-        bot.send_message(m.chat.id,"\n".join(out), reply_markup=kb_teacher()); return
+        outbox.send_message(m.chat.id,"\n".join(out), reply_markup=kb_teacher()); return
+
+# --------------- ADMIN: ANALYTICS ---------------
+
+def analytics_text(data: Dict[str, Any]) -> str:
+    names={cid:c.get("name",cid) for cid,c in data["classes"].items() if isinstance(c,dict)}
+    return analytics.render(analytics.report(analytics.load(data)), names)
+
+def analytics_terms(args: List[str]) -> Tuple[List[str], List[str]]:
+    """Archived terms requested after /analytics ("все" — all of them) and the unknown ones."""
+    known=cold.terms()
+    if any(a.lower() in ("все","all") for a in args): return known, []
+    return [a for a in args if a in known], [a for a in args if a not in known]
+
+@bot.message_handler(commands=["analytics"])
+async def t_analytics(m):
+    data=await aload_data(); uid=str(m.from_user.id)
+    if data["users"].get(uid,{}).get("role")!="teacher": outbox.reply_to(m,"Только учителю."); return
+    terms, unknown = analytics_terms((m.text or "").split()[1:])
+    if unknown:
+        outbox.reply_to(m,"Нет таких периодов в архиве: "+", ".join(unknown)+"\nЕсть: "+(", ".join(cold.terms()) or "—")); return
+    # сводка по всей школе; считаем в пуле потоков, data — собственная копия этого хендлера.
+    # архивные периоды подгружаются только если их попросили
+    loop=asyncio.get_running_loop()
+    if terms: data=await loop.run_in_executor(_io_pool, cold.merged, data, terms)
+    text=await loop.run_in_executor(None, analytics_text, data)
+    if terms: text="Архив: "+", ".join(terms)+"\n"+text
+    if len(text)<=gradebook.MESSAGE_LIMIT:
+        send_code_block(m.chat.id, f"📊 Аналитика\n\n{text}")
+    else:
+        outbox.send_document(m.chat.id, text.encode("utf-8"), visible_file_name="analytics.txt", caption="📊 Аналитика")
+
+@bot.message_handler(commands=["archive"])
+async def t_archive(m):
+    data=await aload_data(); uid=str(m.from_user.id)
+    if data["users"].get(uid,{}).get("role")!="teacher": outbox.reply_to(m,"Только учителю."); return
+    cutoff=archive.term_start(now_msk())
+    if (m.text or "").split()[1:2]!=["run"]:
+        segs=cold.manifest().get("segments",{})
+        out=[f"🗄 В работе: заданий {len(data['assignments'])}, результатов {len(data['results'])}"]
+        for term in sorted(segs):
+            sg=segs[term]; out.append(f"• {term}: заданий {sg['assignments']}, результатов {sg['results']}, {sg['bytes']//1024} КБ")
+        out.append(f"\n/archive run — убрать в архив задания со сроком сдачи до {fmt_dt_msk(cutoff)} (тесты и CTF без дедлайна остаются)")
+        out.append("/analytics <период|все> — отчёт с архивом")
+        outbox.send_message(m.chat.id,"\n".join(out)); return
+    moved=await asyncio.get_running_loop().run_in_executor(_io_pool, cold.archive, data, cutoff)
+    if not moved: outbox.send_message(m.chat.id,"Архивировать нечего."); return
+    gradebook.drop(data["gradebooks"], [a for aa in moved.values() for a in aa])
+    await asave_data(data)
+    timeline.reset()
+    outbox.send_message(m.chat.id,"🗄 В архиве:\n"+"\n".join(f"• {t}: заданий {len(aa)}" for t,aa in sorted(moved.items())))
+
+@bot.message_handler(commands=["profile"])
+async def t_profile(m):
+    uid=str(m.from_user.id)
+    if uid not in PROFILE_ADMINS:
+        outbox.reply_to(m,"Только администратору."); return
+    args=(m.text or "").split()[1:]
+    if args[:1]==["stop"]:
+        if not profiler.stop(): outbox.reply_to(m,"Профилирование не запущено.")
+        return
+    if profiler.active: outbox.reply_to(m,f"⏱ Уже идёт: {profiler.status()}.\n/profile stop — завершить."); return
+    mem="mem" in args; args=[a for a in args if a!="mem"]
+    n, sec = 0, 0.0
+    try:
+        for a in args:
+            if a.endswith("s"): sec=float(a[:-1])
+            else: n=int(a)
+    except ValueError:
+        n=sec=0
+    if (not n and not sec) or n<0 or sec<0:
+        outbox.reply_to(m,"/profile <N> — cProfile следующих N апдейтов\n/profile <T>s — в течение T секунд\n"
+                          "/profile mem … — плюс tracemalloc вокруг load_data\n/profile stop — завершить досрочно"); return
+    chat=m.chat.id
+    profiler.start(updates=n, seconds=sec, memory=mem,
+                   on_done=lambda path, summary: outbox.send_message(chat, f"📊 Профиль: {path}\n\n{summary}"[:4000]))
+    outbox.reply_to(m,f"⏱ Профилирую {f'{n} апдейтов' if n else ''}{' или ' if n and sec else ''}{f'{sec:g} с' if sec else ''}"
+                      f"{' + tracemalloc' if mem else ''}. Результат пришлю сюда.")
+
+# --------------- TEACHER: GRADEBOOK ---------------
+
+def student_name(u: Dict[str, Any]) -> str:
+    p=u.get("profile") or {}
+    return " ".join([p.get("last_name",""),p.get("first_name","")]).strip() or u.get("username","Ученик")
+
+@router.text("📒 Журнал")
+async def t_gradebook(m):
+    data=await aload_data(); uid=str(m.from_user.id)
+    if data["users"].get(uid,{}).get("role")!="teacher": outbox.reply_to(m,"Только учителю."); return
+    cls=[c for c in data["classes"].values() if isinstance(c,dict) and c.get("teacher_id")==uid]
+    if not cls: outbox.send_message(m.chat.id,"Классов нет.", reply_markup=kb_teacher()); return
+    kb=types.ReplyKeyboardMarkup(resize_keyboard=True, one_time_keyboard=True)
+    for c in cls: kb.add(f"Класс: {c['name']}")
+    kb.add("❌ Отмена")
+    user_states[uid]={"flow":"gradebook"}
+    outbox.send_message(m.chat.id,"Журнал какого класса?", reply_markup=kb)
+
+@router.flow("gradebook")
+async def t_gradebook_flow(m):
+    uid=str(m.from_user.id); data=await aload_data()
+    t=(m.text or "").strip()
+    if t=="❌ Отмена":
+        user_states.pop(uid,None); outbox.send_message(m.chat.id,"Ок.", reply_markup=kb_teacher()); return
+    if not t.startswith("Класс: "): outbox.reply_to(m,"Кнопкой."); return
+    name=t.replace("Класс: ","",1).strip()
+    cid=next((k for k,v in data["classes"].items() if isinstance(v,dict) and v.get("teacher_id")==uid and v.get("name")==name), None)
+    if not cid: outbox.reply_to(m,"Класс не найден."); return
+    user_states.pop(uid,None)
+    if not timeline.built: timeline.build(data["assignments"], now_msk())
+    ct=timeline.get(cid)
+    cols=[(e.aid, e.title) for e in ct.ordered()] if ct else []
+    studs=sorted(((sid, student_name(u)) for sid,u in get_class_students(data, cid)), key=lambda x:x[1])
+    if not cols or not studs:
+        outbox.send_message(m.chat.id,"В журнале пока пусто: нужны ученики и назначенные задания.", reply_markup=kb_teacher()); return
+    table=gradebook.render(data["gradebooks"].get(cid,{}), studs, cols)
+    if len(table)<=gradebook.MESSAGE_LIMIT:
+        send_code_block(m.chat.id, f"📒 {name}\n\n{table}", reply_markup=kb_teacher())
+    else:
+        outbox.send_document(m.chat.id, table.encode("utf-8"), visible_file_name=f"journal_{name}.txt",
+                             caption=f"📒 {name}: {len(studs)} учеников × {len(cols)} заданий", reply_markup=kb_teacher())
+
+# --------------- TEACHER: EXPORT ---------------
+
+@router.text("📤 Экспорт")
+async def t_export(m):
+    data=await aload_data(); uid=str(m.from_user.id)
+    if data["users"].get(uid,{}).get("role")!="teacher": outbox.reply_to(m,"Только учителю."); return
+    cls=[c for c in data["classes"].values() if isinstance(c,dict) and c.get("teacher_id")==uid]
+    if not cls: outbox.send_message(m.chat.id,"Классов нет.", reply_markup=kb_teacher()); return
+    kb=types.ReplyKeyboardMarkup(resize_keyboard=True, one_time_keyboard=True)
+    for c in cls: kb.add(f"Класс: {c['name']}")
+    kb.add("❌ Отмена")
+    user_states[uid]={"flow":"export","step":"class"}
+    outbox.send_message(m.chat.id,"Результаты какого класса выгрузить?", reply_markup=kb)
+
+@router.flow("export")
+async def t_export_flow(m):
+    uid=str(m.from_user.id); st=user_states[uid]
+    t=(m.text or "").strip()
+    if t=="❌ Отмена":
+        user_states.pop(uid,None); outbox.send_message(m.chat.id,"Ок.", reply_markup=kb_teacher()); return
+    if st["step"]=="class":
+        if not t.startswith("Класс: "): outbox.reply_to(m,"Кнопкой."); return
+        data=await aload_data(); name=t.replace("Класс: ","",1).strip()
+        cid=next((k for k,v in data["classes"].items() if isinstance(v,dict) and v.get("teacher_id")==uid and v.get("name")==name), None)
+        if not cid: outbox.reply_to(m,"Класс не найден."); return
+        if not export.xlsx_available():
+            user_states.pop(uid,None); await send_export(m.chat.id, data, cid, name, "CSV"); return
+        st.update({"cid":cid,"name":name,"step":"format"})
+        kb=types.ReplyKeyboardMarkup(resize_keyboard=True, one_time_keyboard=True)
+        kb.add("CSV","XLSX"); kb.add("❌ Отмена")
+        outbox.send_message(m.chat.id,"Формат?", reply_markup=kb); return
+    if st["step"]=="format":
+        if t not in ("CSV","XLSX"): outbox.reply_to(m,"Кнопкой."); return
+        user_states.pop(uid,None)
+        await send_export(m.chat.id, await aload_data(), st["cid"], st["name"], t)
+
+async def send_export(chat_id: int, data: Dict[str,Any], cid: str, name: str, fmt: str):
+    # строки идут генератором прямо в SpooledTemporaryFile; запись — в пуле, loop не блокируем
+    writer=export.write_xlsx if fmt=="XLSX" else export.write_csv
+    f=await asyncio.get_running_loop().run_in_executor(_io_pool, writer, export.iter_rows(data, cid))
+    try:
+        ok=await outbox.send_document(chat_id, f, visible_file_name=f"results_{name}.{fmt.lower()}",
+                                      caption=f"📤 Результаты: {name}", reply_markup=kb_teacher(), priority=INTERACTIVE)
+    finally:
+        f.close()
+    if not ok: outbox.send_message(chat_id,"Не удалось отправить файл, попробуйте позже.", reply_markup=kb_teacher())
 
 # --------------- TEACHER: TESTS VIEW + ADD/EDIT/DELETE QUESTION ---------------
 
-def qnums_kb(n: int, title_prefix: str = "Вопрос") -> types.ReplyKeyboardMarkup:
+QNUMS_PAGE = 30
+QNUMS_NAV = ("⬅️ Пред.", "След. ➡️")
+
+def qnums_kb(n: int, page: int = 0) -> types.ReplyKeyboardMarkup:
     kb = types.ReplyKeyboardMarkup(resize_keyboard=True, one_time_keyboard=True, row_width=5)
     if n <= 0:
         kb.add("❌ Назад")
         return kb
-    # показываем до 30 кнопок в одном экране
-    nums = [str(i) for i in range(1, min(n, 30) + 1)]
+    # по 30 номеров на экран; номер можно и просто прислать текстом
+    lo = page * QNUMS_PAGE
+    nums = [str(i) for i in range(lo + 1, min(n, lo + QNUMS_PAGE) + 1)]
     for i in range(0, len(nums), 5):
         kb.row(*nums[i:i+5])
+    nav = ([QNUMS_NAV[0]] if page > 0 else []) + ([QNUMS_NAV[1]] if lo + QNUMS_PAGE < n else [])
+    if nav:
+        kb.row(*nav)
     kb.add("❌ Назад")
     return kb
 
@@ -1604,39 +2172,46 @@ def render_question(q: Dict[str, Any], idx: int) -> str:
         lines.append(f"   Пояснение: {expl}")
     return "\n".join(lines)
 
-@bot.message_handler(func=lambda m: m.text=="📚 Ваши тесты")
-def t_tests(m):
-    data=load_data(); uid=str(m.from_user.id)
+@router.text("📚 Ваши тесты")
+async def t_tests(m):
+    data=await aload_data(); uid=str(m.from_user.id)
     if data["users"].get(uid,{}).get("role")!="teacher":
-        bot.reply_to(m,"Только учителю.")
+        outbox.reply_to(m,"Только учителю.")
         return
-    tests=[t for t in data["tests"].values() if isinstance(t,dict) and t.get("teacher_id")==uid]
-    if not tests:
-        bot.send_message(m.chat.id,"Тестов нет.", reply_markup=kb_teacher())
+    kb=menu_page("tt", uid, data)
+    if not kb:
+        outbox.send_message(m.chat.id,"Тестов нет.", reply_markup=kb_teacher())
         return
-    kb=types.ReplyKeyboardMarkup(resize_keyboard=True, one_time_keyboard=True)
-    for t in tests[:25]:
-        kb.add(f"Тест ID: {t['id']} - {t.get('topic','')}")
-    kb.add("❌ Отмена")
-    user_states[uid]={"flow":"t_test_manage","step":"pick"}
-    bot.send_message(m.chat.id,"Выберите тест:", reply_markup=kb)
+    user_states.pop(uid,None)
+    outbox.send_message(m.chat.id,"Выберите тест:", reply_markup=kb)
 
-@bot.message_handler(func=lambda m: user_states.get(str(m.from_user.id),{}).get("flow")=="t_test_manage")
-def t_test_manage(m):
+def test_actions_kb() -> types.ReplyKeyboardMarkup:
+    kb = types.ReplyKeyboardMarkup(resize_keyboard=True, one_time_keyboard=True, row_width=2)
+    kb.add("👀 Просмотр","➕ Добавить вопрос")
+    kb.add("✏️ Редактировать вопрос","🗑️ Удалить вопрос")
+    kb.add("❌ Назад")
+    return kb
+
+def open_test(chat_id: int, uid: str, data: Dict[str, Any], tid: str):
+    test=data["tests"].get(tid)
+    if not test or test.get("teacher_id")!=uid:
+        outbox.send_message(chat_id,"Тест не найден.")
+        return
+    user_states[uid]={"flow":"t_test_manage","step":"action","tid":tid}
+    outbox.send_message(chat_id,f"📚 {test.get('topic')}\nДействие?", reply_markup=test_actions_kb())
+
+@router.flow("t_test_manage")
+async def t_test_manage(m):
     uid=str(m.from_user.id); st=user_states[uid]
-    data=load_data()
+    data=await aload_data()
 
     def back_to_action(tid: str):
-        kb = types.ReplyKeyboardMarkup(resize_keyboard=True, one_time_keyboard=True, row_width=2)
-        kb.add("👀 Просмотр","➕ Добавить вопрос")
-        kb.add("✏️ Редактировать вопрос","🗑️ Удалить вопрос")
-        kb.add("❌ Назад")
         st["step"]="action"
-        bot.send_message(m.chat.id,"Действие?", reply_markup=kb)
+        outbox.send_message(m.chat.id,"Действие?", reply_markup=test_actions_kb())
 
     def cancel_all(msg: str = "Ок."):
         user_states.pop(uid,None)
-        bot.send_message(m.chat.id,msg, reply_markup=kb_teacher())
+        outbox.send_message(m.chat.id,msg, reply_markup=kb_teacher())
 
     if m.text=="❌ Отмена":
         cancel_all("Ок.")
@@ -1644,28 +2219,12 @@ def t_test_manage(m):
 
     t=(m.text or "").strip()
 
-    # 1) выбор теста
-    if st.get("step")=="pick":
-        if "Тест ID:" not in t:
-            bot.reply_to(m,"Кнопкой.")
-            return
-        tid=t.split("Тест ID:",1)[1].strip().split(" - ",1)[0].strip()
-        test=data["tests"].get(tid)
-        if not test:
-            bot.reply_to(m,"Не найден.")
-            return
-        if test.get("teacher_id") != uid:
-            bot.reply_to(m,"Это не ваш тест.")
-            return
-        st["tid"]=tid
-        back_to_action(tid)
-        return
-
+    # тест выбран в постраничном меню (open_test)
     tid=st.get("tid")
     test=data["tests"].get(tid or "", {})
     qs=test.get("questions", []) if isinstance(test, dict) else []
 
-    # 2) меню действий
+    # 1) меню действий
     if st.get("step")=="action":
         if t=="❌ Назад":
             cancel_all("Меню.")
@@ -1675,49 +2234,50 @@ def t_test_manage(m):
             if not qs:
                 cancel_all("В тесте пока нет вопросов.")
                 return
-            head=f"📚 {test.get('topic')} (ID {tid})\nВопросов: {len(qs)}"
+            ist=data.get("item_stats",{}).get(tid)
+            head=f"📚 {test.get('topic')} (ID {tid})\nВопросов: {len(qs)} · ответов: {ist['n'] if ist else 0}"
             buf=[head]
             for i,q in enumerate(qs):
-                buf.append("\n"+render_question(q, i))
+                buf.append("\n"+render_question(q, i)+"\n"+item_stats.line(ist, i, q.get("correct",-1)))
             msg="\n".join(buf)
             for part in [msg[i:i+3800] for i in range(0,len(msg),3800)]:
-                bot.send_message(m.chat.id, part)
+                outbox.send_message(m.chat.id, part, priority=BULK)
             cancel_all("Готово.")
             return
 
         if t=="➕ Добавить вопрос":
             st["step"]="q_text"
             st["new"]={"options":[]}
-            bot.send_message(m.chat.id,"Текст вопроса?", reply_markup=kb_cancel())
+            outbox.send_message(m.chat.id,"Текст вопроса?", reply_markup=kb_cancel())
             return
 
         if t=="✏️ Редактировать вопрос":
             if not qs:
-                bot.reply_to(m,"В тесте нет вопросов для редактирования.")
+                outbox.reply_to(m,"В тесте нет вопросов для редактирования.")
                 return
-            st["step"]="pick_q_edit"
-            bot.send_message(m.chat.id, "Номер вопроса для редактирования:", reply_markup=qnums_kb(len(qs)))
+            st["step"]="pick_q_edit"; st["qpage"]=0
+            outbox.send_message(m.chat.id, "Номер вопроса для редактирования:", reply_markup=qnums_kb(len(qs)))
             return
 
         if t=="🗑️ Удалить вопрос":
             if not qs:
-                bot.reply_to(m,"В тесте нет вопросов для удаления.")
+                outbox.reply_to(m,"В тесте нет вопросов для удаления.")
                 return
-            st["step"]="pick_q_del"
-            bot.send_message(m.chat.id, "Номер вопроса для удаления:", reply_markup=qnums_kb(len(qs)))
+            st["step"]="pick_q_del"; st["qpage"]=0
+            outbox.send_message(m.chat.id, "Номер вопроса для удаления:", reply_markup=qnums_kb(len(qs)))
             return
 
-        bot.reply_to(m,"Выберите кнопкой.")
+        outbox.reply_to(m,"Выберите кнопкой.")
         return
 
-    # 3) добавление вопроса (как раньше)
+    # 2) добавление вопроса (как раньше)
     if st.get("step")=="q_text":
         if t=="❌ Отмена":
             cancel_all("Отменено.")
             return
         st["new"]["question"]=t
         st["step"]="opt1"
-        bot.send_message(m.chat.id,"Вариант 1?", reply_markup=kb_cancel())
+        outbox.send_message(m.chat.id,"Вариант 1?", reply_markup=kb_cancel())
         return
 
     if st.get("step","").startswith("opt"):
@@ -1728,10 +2288,10 @@ def t_test_manage(m):
         st["new"]["options"].append(t)
         if idx<4:
             st["step"]=f"opt{idx+1}"
-            bot.send_message(m.chat.id,f"Вариант {idx+1}?", reply_markup=kb_cancel())
+            outbox.send_message(m.chat.id,f"Вариант {idx+1}?", reply_markup=kb_cancel())
             return
         st["step"]="correct"
-        bot.send_message(m.chat.id,"Номер правильного (1-4)?", reply_markup=kb_cancel())
+        outbox.send_message(m.chat.id,"Номер правильного (1-4)?", reply_markup=kb_cancel())
         return
 
     if st.get("step")=="correct":
@@ -1739,11 +2299,11 @@ def t_test_manage(m):
             cancel_all("Отменено.")
             return
         if not t.isdigit() or int(t) not in (1,2,3,4):
-            bot.reply_to(m,"1-4.")
+            outbox.reply_to(m,"1-4.")
             return
         st["new"]["correct"]=int(t)-1
         st["step"]="expl"
-        bot.send_message(m.chat.id,"Пояснение (или '-')?", reply_markup=kb_cancel())
+        outbox.send_message(m.chat.id,"Пояснение (или '-')?", reply_markup=kb_cancel())
         return
 
     if st.get("step")=="expl":
@@ -1751,27 +2311,32 @@ def t_test_manage(m):
             cancel_all("Отменено.")
             return
         st["new"]["explanation"]="" if t=="-" else t
-        data=load_data()
+        data=await aload_data()
         if tid not in data["tests"]:
             cancel_all("Тест не найден.")
             return
         data["tests"][tid].setdefault("questions", []).append(st["new"])
         data["tests"][tid]["updated_at"]=now_iso()
-        save_data(data)
+        item_stats.reset(data["item_stats"], tid)
+        await asave_data(data)
         cancel_all("✅ Добавлено.")
         return
 
-    # 4) выбор вопроса для редактирования
+    # 3) выбор вопроса для редактирования
     if st.get("step")=="pick_q_edit":
         if t=="❌ Назад":
             back_to_action(tid)
             return
+        if t in QNUMS_NAV:
+            st["qpage"]=max(0, st.get("qpage",0)+(1 if t==QNUMS_NAV[1] else -1))
+            outbox.send_message(m.chat.id, "Номер вопроса:", reply_markup=qnums_kb(len(qs), st["qpage"]))
+            return
         if not t.isdigit():
-            bot.reply_to(m,"Введите номер вопроса кнопкой.")
+            outbox.reply_to(m,"Введите номер вопроса кнопкой.")
             return
         qi=int(t)-1
         if qi<0 or qi>=len(qs):
-            bot.reply_to(m,"Нет такого вопроса.")
+            outbox.reply_to(m,"Нет такого вопроса.")
             return
         st["q_index"]=qi
         st["step"]="edit_menu"
@@ -1781,10 +2346,10 @@ def t_test_manage(m):
         kb.add("✏️ Вариант 3","✏️ Вариант 4")
         kb.add("✅ Изменить правильный","📝 Изменить пояснение")
         kb.add("❌ Назад")
-        bot.send_message(m.chat.id, "Что редактируем?", reply_markup=kb)
+        outbox.send_message(m.chat.id, "Что редактируем?", reply_markup=kb)
         return
 
-    # 5) меню редактирования
+    # 4) меню редактирования
     if st.get("step")=="edit_menu":
         if t=="❌ Назад":
             back_to_action(tid)
@@ -1795,36 +2360,36 @@ def t_test_manage(m):
             return
 
         if t=="👁 Показать вопрос":
-            bot.send_message(m.chat.id, render_question(qs[qi], qi))
+            outbox.send_message(m.chat.id, render_question(qs[qi], qi))
             # остаёмся в edit_menu
             return
 
         if t=="✏️ Изменить текст":
             st["step"]="edit_q_text"
-            bot.send_message(m.chat.id,"Новый текст вопроса:", reply_markup=kb_cancel())
+            outbox.send_message(m.chat.id,"Новый текст вопроса:", reply_markup=kb_cancel())
             return
 
         if t in ("✏️ Вариант 1","✏️ Вариант 2","✏️ Вариант 3","✏️ Вариант 4"):
             opt_i=int(t.split()[-1])-1
             st["opt_i"]=opt_i
             st["step"]="edit_opt"
-            bot.send_message(m.chat.id, f"Новый текст для варианта {opt_i+1}:", reply_markup=kb_cancel())
+            outbox.send_message(m.chat.id, f"Новый текст для варианта {opt_i+1}:", reply_markup=kb_cancel())
             return
 
         if t=="✅ Изменить правильный":
             st["step"]="edit_correct"
-            bot.send_message(m.chat.id,"Номер правильного ответа (1-4)?", reply_markup=kb_cancel())
+            outbox.send_message(m.chat.id,"Номер правильного ответа (1-4)?", reply_markup=kb_cancel())
             return
 
         if t=="📝 Изменить пояснение":
             st["step"]="edit_expl"
-            bot.send_message(m.chat.id,"Новое пояснение (или '-' чтобы очистить):", reply_markup=kb_cancel())
+            outbox.send_message(m.chat.id,"Новое пояснение (или '-' чтобы очистить):", reply_markup=kb_cancel())
             return
 
-        bot.reply_to(m,"Выберите кнопкой.")
+        outbox.reply_to(m,"Выберите кнопкой.")
         return
 
-    # 6) применение редактирования (сохранение сразу)
+    # 5) применение редактирования (сохранение сразу)
     if st.get("step") in ("edit_q_text","edit_opt","edit_correct","edit_expl"):
         if t=="❌ Отмена":
             st["step"]="edit_menu"
@@ -1834,10 +2399,10 @@ def t_test_manage(m):
             kb.add("✏️ Вариант 3","✏️ Вариант 4")
             kb.add("✅ Изменить правильный","📝 Изменить пояснение")
             kb.add("❌ Назад")
-            bot.send_message(m.chat.id,"Ок, не меняем. Что дальше?", reply_markup=kb)
+            outbox.send_message(m.chat.id,"Ок, не меняем. Что дальше?", reply_markup=kb)
             return
 
-        data=load_data()
+        data=await aload_data()
         test=data["tests"].get(tid)
         if not test or test.get("teacher_id")!=uid:
             cancel_all("Тест не найден.")
@@ -1846,7 +2411,7 @@ def t_test_manage(m):
         qi=int(st.get("q_index", 0))
         if qi<0 or qi>=len(qs2):
             st["step"]="edit_menu"
-            bot.reply_to(m,"Вопрос не найден.")
+            outbox.reply_to(m,"Вопрос не найден.")
             return
 
         if st["step"]=="edit_q_text":
@@ -1862,7 +2427,7 @@ def t_test_manage(m):
 
         elif st["step"]=="edit_correct":
             if not t.isdigit() or int(t) not in (1,2,3,4):
-                bot.reply_to(m,"1-4.")
+                outbox.reply_to(m,"1-4.")
                 return
             qs2[qi]["correct"]=int(t)-1
 
@@ -1871,7 +2436,10 @@ def t_test_manage(m):
 
         test["questions"]=qs2
         test["updated_at"]=now_iso()
-        save_data(data)
+        if st["step"] in ("edit_opt","edit_correct"):
+            # смысл вариантов поменялся — старая статистика к ним больше не относится
+            item_stats.reset(data["item_stats"], tid)
+        await asave_data(data)
 
         st["step"]="edit_menu"
         kb = types.ReplyKeyboardMarkup(resize_keyboard=True, one_time_keyboard=True, row_width=2)
@@ -1880,7 +2448,7 @@ def t_test_manage(m):
         kb.add("✏️ Вариант 3","✏️ Вариант 4")
         kb.add("✅ Изменить правильный","📝 Изменить пояснение")
         kb.add("❌ Назад")
-        bot.send_message(m.chat.id,"✅ Изменено. Что дальше?", reply_markup=kb)
+        outbox.send_message(m.chat.id,"✅ Изменено. Что дальше?", reply_markup=kb)
         return
 
     # 7) удаление вопроса
@@ -1888,19 +2456,23 @@ def t_test_manage(m):
         if t=="❌ Назад":
             back_to_action(tid)
             return
+        if t in QNUMS_NAV:
+            st["qpage"]=max(0, st.get("qpage",0)+(1 if t==QNUMS_NAV[1] else -1))
+            outbox.send_message(m.chat.id, "Номер вопроса:", reply_markup=qnums_kb(len(qs), st["qpage"]))
+            return
         if not t.isdigit():
-            bot.reply_to(m,"Введите номер вопроса кнопкой.")
+            outbox.reply_to(m,"Введите номер вопроса кнопкой.")
             return
         qi=int(t)-1
         if qi<0 or qi>=len(qs):
-            bot.reply_to(m,"Нет такого вопроса.")
+            outbox.reply_to(m,"Нет такого вопроса.")
             return
         st["q_index"]=qi
         st["step"]="confirm_del"
         q_preview = render_question(qs[qi], qi)
         kb = types.ReplyKeyboardMarkup(resize_keyboard=True, one_time_keyboard=True, row_width=2)
         kb.add("🗑️ Да, удалить","❌ Нет")
-        bot.send_message(m.chat.id, f"Удалить этот вопрос?\n\n{q_preview}", reply_markup=kb)
+        outbox.send_message(m.chat.id, f"Удалить этот вопрос?\n\n{q_preview}", reply_markup=kb)
         return
 
     if st.get("step")=="confirm_del":
@@ -1908,9 +2480,9 @@ def t_test_manage(m):
             back_to_action(tid)
             return
         if t!="🗑️ Да, удалить":
-            bot.reply_to(m,"Выберите кнопкой.")
+            outbox.reply_to(m,"Выберите кнопкой.")
             return
-        data=load_data()
+        data=await aload_data()
         test=data["tests"].get(tid)
         if not test or test.get("teacher_id")!=uid:
             cancel_all("Тест не найден.")
@@ -1921,77 +2493,71 @@ def t_test_manage(m):
             qs2.pop(qi)
             test["questions"]=qs2
             test["updated_at"]=now_iso()
-            save_data(data)
-            bot.send_message(m.chat.id,"🗑️ Удалено.")
+            item_stats.reset(data["item_stats"], tid)
+            await asave_data(data)
+            outbox.send_message(m.chat.id,"🗑️ Удалено.")
             back_to_action(tid)
             return
         back_to_action(tid)
-        bot.send_message(m.chat.id,"Вопрос уже отсутствует.")
+        outbox.send_message(m.chat.id,"Вопрос уже отсутствует.")
         return
 
     # fallback внутри manage
-    bot.reply_to(m,"Используйте кнопки меню.")
+    outbox.reply_to(m,"Используйте кнопки меню.")
 
 # --------------- TEACHER: CTF VIEW + ASSIGN ---------------
 
-@bot.message_handler(func=lambda m: m.text=="🏁 Ваши CTF")
-def t_ctf_list(m):
-    data=load_data(); uid=str(m.from_user.id)
+@router.text("🏁 Ваши CTF")
+async def t_ctf_list(m):
+    data=await aload_data(); uid=str(m.from_user.id)
     if data["users"].get(uid,{}).get("role")!="teacher":
-        bot.reply_to(m,"Только учителю.")
+        outbox.reply_to(m,"Только учителю.")
         return
-    tasks=[t for t in data["ctf_tasks"].values() if isinstance(t,dict) and t.get("teacher_id")==uid]
-    if not tasks:
-        bot.send_message(m.chat.id,"CTF заданий нет.", reply_markup=kb_teacher())
+    kb=menu_page("tc", uid, data)
+    if not kb:
+        outbox.send_message(m.chat.id,"CTF заданий нет.", reply_markup=kb_teacher())
         return
-    tasks.sort(key=lambda x:x.get("created_at",""), reverse=True)
-    kb=types.ReplyKeyboardMarkup(resize_keyboard=True, one_time_keyboard=True)
-    for t in tasks[:25]:
-        title=t.get("title") or f"CTF {t.get('id','')}"
-        kb.add(f"CTF ID: {t['id']} - {title}")
-    kb.add("❌ Отмена")
-    user_states[uid]={"flow":"t_ctf_manage","step":"pick"}
-    bot.send_message(m.chat.id,"Выберите CTF:", reply_markup=kb)
+    user_states.pop(uid,None)
+    outbox.send_message(m.chat.id,"Выберите CTF:", reply_markup=kb)
+
+def ctf_actions_kb() -> types.ReplyKeyboardMarkup:
+    kb=types.ReplyKeyboardMarkup(resize_keyboard=True, one_time_keyboard=True, row_width=2)
+    kb.add("👀 Просмотр","📌 Назначить в класс")
+    kb.add("❌ Назад")
+    return kb
 
-@bot.message_handler(func=lambda m: user_states.get(str(m.from_user.id),{}).get("flow")=="t_ctf_manage")
-def t_ctf_manage(m):
-    uid=str(m.from_user.id); st=user_states[uid]; data=load_data()
+def open_ctf(chat_id: int, uid: str, data: Dict[str, Any], ctf_id: str):
+    task=data["ctf_tasks"].get(ctf_id)
+    if not task or task.get("teacher_id")!=uid:
+        outbox.send_message(chat_id,"CTF не найден.")
+        return
+    user_states[uid]={"flow":"t_ctf_manage","step":"action","ctf_id":ctf_id}
+    outbox.send_message(chat_id,f"🏁 {task.get('title') or ctf_id}\nДействие?", reply_markup=ctf_actions_kb())
+
+@router.flow("t_ctf_manage")
+async def t_ctf_manage(m):
+    uid=str(m.from_user.id); st=user_states[uid]; data=await aload_data()
     if m.text=="❌ Отмена":
         user_states.pop(uid,None)
-        bot.send_message(m.chat.id,"Ок.", reply_markup=kb_teacher())
+        outbox.send_message(m.chat.id,"Ок.", reply_markup=kb_teacher())
         return
     t=(m.text or "").strip()
-    if st.get("step")=="pick":
-        if "CTF ID:" not in t:
-            bot.reply_to(m,"Выберите кнопкой.")
-            return
-        cid=t.split("CTF ID:",1)[1].strip().split(" - ",1)[0].strip()
-        task=data["ctf_tasks"].get(cid)
-        if not task:
-            bot.reply_to(m,"CTF не найден.")
-            return
-        st["ctf_id"]=cid; st["step"]="action"
-        kb=types.ReplyKeyboardMarkup(resize_keyboard=True, one_time_keyboard=True, row_width=2)
-        kb.add("👀 Просмотр","📌 Назначить в класс")
-        kb.add("❌ Назад")
-        bot.send_message(m.chat.id,"Действие?", reply_markup=kb)
-        return
-
+    # CTF выбран в постраничном меню (open_ctf)
     if st.get("step")=="action":
         if t=="❌ Назад":
             user_states.pop(uid,None)
-            bot.send_message(m.chat.id,"Меню.", reply_markup=kb_teacher())
+            outbox.send_message(m.chat.id,"Меню.", reply_markup=kb_teacher())
             return
         ctf_id=st["ctf_id"]
         task=data["ctf_tasks"].get(ctf_id)
         if not task:
             user_states.pop(uid,None)
-            bot.send_message(m.chat.id,"CTF не найден.", reply_markup=kb_teacher())
+            outbox.send_message(m.chat.id,"CTF не найден.", reply_markup=kb_teacher())
             return
 
         if t=="📌 Назначить в класс":
             user_states.pop(uid,None)
-            bot.send_message(m.chat.id,"Выберите класс:", reply_markup=classes_kb(uid, f"pick_class_ctf:{ctf_id}"))
+            outbox.send_message(m.chat.id,"Выберите классы:", reply_markup=await classes_kb(uid, "ctf", ctf_id))
             return
 
         if t=="👀 Просмотр":
@@ -2007,43 +2573,86 @@ def t_ctf_manage(m):
             if desc: head.append(f"\nОписание: {desc}")
             if instr: head.append(f"Инструкция: {instr}")
             if tguide: head.append(f"\n\n{tguide}")
+            if isinstance(task.get("difficulty"), dict): head.append(f"\n{difficulty_line(task['difficulty'])}")
             if expected:
                 head.append(f"\n✅ Ожидаемый ответ (для учителя): {expected}")
             else:
                 head.append("\n✅ Ожидаемый ответ: (не сохранён, проверка идёт по хешу)")
+            variants=task.get("variants") or []
+            if variants:
+                vmap=task.get("variant_of") or {}
+                head.append(f"\n🎲 Вариантов: {len(variants)}, выдано ученикам: {len(vmap)}")
+                for i,v in enumerate(variants):
+                    vm=v.get("meta") or {}
+                    param=f"сдвиг {vm['shift']}" if "shift" in vm else (f"ключ {vm['key']}" if "key" in vm else vm.get("rule",""))
+                    head.append(f"{i+1}) {v.get('expected_plain')} — {param}")
 
             msg="\n".join(head)
             for part in [msg[i:i+3500] for i in range(0,len(msg),3500)]:
-                bot.send_message(m.chat.id, part)
+                outbox.send_message(m.chat.id, part, priority=BULK)
 
             # challenge отдельно, чтобы не упираться в лимит сообщения
             if chall:
-                bot.send_message(m.chat.id, "\nФайл/код задания:")
-                send_code_block(m.chat.id, chall)
+                outbox.send_message(m.chat.id, "\nФайл/код задания:", priority=BULK)
+                send_code_block(m.chat.id, chall, priority=BULK)
 
             user_states.pop(uid,None)
-            bot.send_message(m.chat.id,"Готово.", reply_markup=kb_teacher())
+            outbox.send_message(m.chat.id,"Готово.", reply_markup=kb_teacher())
             return
 
-        bot.reply_to(m,"Выберите кнопкой.")
+        outbox.reply_to(m,"Выберите кнопкой.")
         return
 
 # --------------- HELP ---------------
 
-@bot.message_handler(func=lambda m: m.text=="ℹ️ Помощь")
-def help_msg(m):
-    data=load_data(); uid=str(m.from_user.id); role=data["users"].get(uid,{}).get("role")
+@router.text("ℹ️ Помощь")
+async def help_msg(m):
+    data=await aload_data(); uid=str(m.from_user.id); role=data["users"].get(uid,{}).get("role")
     if role=="teacher":
-        bot.send_message(m.chat.id,"Учитель: создайте класс → получите код → создайте тест/CTF → назначьте в класс. Результаты: выберите класс и ученика.", reply_markup=kb_teacher())
+        outbox.send_message(m.chat.id,"Учитель: создайте класс → получите код → создайте тест/CTF → назначьте в класс. Результаты: выберите класс и ученика. /analytics — сводка по всей школе, /archive — архив прошлых периодов.", reply_markup=kb_teacher())
     elif role=="student":
-        bot.send_message(m.chat.id,"Ученик: откройте «Мои задания», решайте тесты/CTF. «Мои результаты» — история.", reply_markup=kb_student())
+        outbox.send_message(m.chat.id,"Ученик: откройте «Мои задания», решайте тесты/CTF. «Мои результаты» — история.", reply_markup=kb_student())
     else:
-        bot.send_message(m.chat.id,"Нажмите /start для регистрации.")
+        outbox.send_message(m.chat.id,"Нажмите /start для регистрации.")
 
-@bot.message_handler(func=lambda m: True)
-def fallback(m):
+@router.default
+async def fallback(m):
     if user_states.get(str(m.from_user.id)): return
-    bot.reply_to(m, "Не понял. Нажмите /start или используйте кнопки меню.")
+    outbox.reply_to(m, "Не понял. Нажмите /start или используйте кнопки меню.")
+
+# один обработчик вместо цепочки предикатов: flow или текст кнопки → хендлер за O(1)
+@bot.message_handler(content_types=["text"])
+async def route(m):
+    await router.dispatch(m)
+
+# время каждого хендлера по имени функции: хендлеры роутера замеряет сам dispatch (без лишней
+# корутины), команды и колбэки telebot — обёртка timed(); route только раздаёт, его не меряем
+router.timer = M_HANDLER.labels
+for _h in bot.message_handlers + bot.callback_query_handlers:
+    if _h["function"] is not route:
+        _h["function"] = metrics.timed(_h["function"], M_HANDLER.labels(_h["function"].__name__))
+# профилирование по требованию (/profile, SIGUSR1): обёртки ставятся только на время захвата
+profiler = profiling.Profiler(bot, router, PROFILE_DIR, skip=(route,))
+
+async def main():
+    reminders.load(await aload_data())
+    reminders.start()
+    scrape = await metrics.serve(registry, METRICS_HOST, METRICS_PORT) if METRICS_PORT else None
+    if hasattr(signal, "SIGUSR1"):
+        asyncio.get_running_loop().add_signal_handler(signal.SIGUSR1, profiler.toggle)
+    try:
+        if WEBHOOK_URL:
+            from webhook import run_webhook
+            await run_webhook(bot, WEBHOOK_URL, WEBHOOK_SECRET, WEBHOOK_HOST, WEBHOOK_PORT)
+        else:
+            await bot.remove_webhook()
+            await bot.infinity_polling(skip_pending=True)
+    finally:
+        await outbox.join(timeout=10)
+        await bot.close_session()
+        user_states.close()
+        if scrape:
+            await scrape.cleanup()
 
 if __name__ == "__main__":
-    bot.infinity_polling(skip_pending=True)
+    asyncio.run(main())
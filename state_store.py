@@ -0,0 +1,265 @@
+"""state_store.py
+
+Conversation state (user_states) that survives restarts and does not grow without bound.
+
+StateStore is a dict-like mapping with:
+- per-entry TTL: every access refreshes it (sliding expiry), so LRU order is also expiry order
+  and expired entries are swept from the head of the LRU list;
+- LRU eviction under a cap on entry count and on total pickled size;
+- write-through persistence to an append-only pickle log: set/delete are appended at once,
+  values changed in place (st["i"] += 1) are appended by flush(), which the bot calls after
+  every update with that update's user id. The dirty set is shared by all updates, so a flush
+  that finishes during another handler's await can take that handler's key before it mutates
+  the value; flush(key) checks the key again either way. An entry that is only read gets a
+  fresh record once half its TTL has passed since the last one, so a restart keeps it alive.
+
+Records are pickled in the caller's thread (the value is consistent there), but the file is
+written by a single background thread. Compaction runs there as well: it copies the latest
+record of every live key from the old log by offset, so it never touches the values the event
+loop is changing. On start the log is replayed and compacted; it is compacted again once it
+is mostly superseded records.
+"""
+
+from __future__ import annotations
+
+import hashlib
+import logging
+import os
+import pickle
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, BinaryIO, Dict, Iterator, List, MutableMapping, Optional, Set, Tuple
+
+log = logging.getLogger(__name__)
+
+# запись лога: (key, expires_at, value); удаление — (key, None, None)
+_DELETED = None
+
+
+class StateStore(MutableMapping[str, Any]):
+    def __init__(self, path: Optional[str] = None, ttl: float = 72 * 3600,
+                 max_entries: int = 100_000, max_bytes: int = 64 * 2**20):
+        self.path = path
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        # key -> [expires_at, value, size, digest, expires_at в последней записи лога]
+        self._data: "OrderedDict[str, List[Any]]" = OrderedDict()
+        self._bytes = 0
+        self._dirty: Set[str] = set()
+        # очередь записей для потока лога и то, что знает только он: файл, его размер и
+        # key -> (offset, length, expires_at) последней записи ключа
+        self._pending: List[Tuple[str, Optional[float], bytes]] = []
+        self._lock = threading.Lock()
+        self._log: Optional[BinaryIO] = None
+        self._size = 0
+        self._where: Dict[str, Tuple[int, int, float]] = {}
+        self._records = 0
+        self._compacting = False
+        self._writer: Optional[ThreadPoolExecutor] = None
+        if path:
+            self._replay()
+            self._log = open(path, "ab")
+            self._size = self._log.tell()
+            self._compact()
+            self._writer = ThreadPoolExecutor(max_workers=1, thread_name_prefix="state-log")
+
+    # --------------- mapping ---------------
+
+    def __getitem__(self, key: str) -> Any:
+        e = self._data[key]
+        now = time.time()
+        if e[0] <= now:
+            self._drop(key)
+            raise KeyError(key)
+        e[0] = now + self.ttl
+        self._data.move_to_end(key)
+        # значение могут поменять на месте — проверим при flush()
+        self._dirty.add(key)
+        return e[1]
+
+    def __setitem__(self, key: str, value: Any) -> None:
+        self._sweep()
+        self._put(key, value, time.time() + self.ttl)
+        # ссылку на value могли сохранить и менять дальше в том же апдейте
+        self._dirty.add(key)
+        self._evict()
+        self._sync()
+
+    def __delitem__(self, key: str) -> None:
+        if key not in self._data:
+            raise KeyError(key)
+        self._drop(key)
+        self._sync()
+
+    def __contains__(self, key: object) -> bool:
+        e = self._data.get(key)  # type: ignore[arg-type]
+        return e is not None and e[0] > time.time()
+
+    def __iter__(self) -> Iterator[str]:
+        self._sweep()
+        return iter(list(self._data))
+
+    def __len__(self) -> int:
+        self._sweep()
+        return len(self._data)
+
+    # --------------- persistence ---------------
+
+    def flush(self, *keys: str) -> None:
+        """Write entries that were read since the last flush, or are in `keys`, and whose value has changed."""
+        dirty, self._dirty = self._dirty, set()
+        dirty.update(keys)
+        for key in dirty:
+            e = self._data.get(key)
+            if e is None:
+                continue
+            blob = pickle.dumps(e[1], pickle.HIGHEST_PROTOCOL)
+            digest = hashlib.blake2b(blob, digest_size=8).digest()
+            if digest == e[3]:
+                if e[0] - e[4] > self.ttl / 2:
+                    self._append(key, e[0], e[1])
+                    e[4] = e[0]
+                continue
+            self._bytes += len(blob) - e[2]
+            e[2], e[3], e[4] = len(blob), digest, e[0]
+            self._append(key, e[0], e[1])
+        self._evict()
+        self._sync()
+
+    def close(self) -> None:
+        """Flush, wait for the log thread to write everything and close the file."""
+        self.flush()
+        if self._writer is not None:
+            self._writer.shutdown(wait=True)
+            self._writer = None
+            self._write()
+        if self._log is not None:
+            self._log.close()
+            self._log = None
+
+    def stats(self) -> Dict[str, int]:
+        return {"entries": len(self._data), "bytes": self._bytes, "log_records": self._records}
+
+    # --------------- internals ---------------
+
+    def _put(self, key: str, value: Any, expires: float, log_it: bool = True) -> None:
+        blob = pickle.dumps(value, pickle.HIGHEST_PROTOCOL)
+        old = self._data.pop(key, None)
+        if old is not None:
+            self._bytes -= old[2]
+        self._data[key] = [expires, value, len(blob), hashlib.blake2b(blob, digest_size=8).digest(), expires]
+        self._bytes += len(blob)
+        self._dirty.discard(key)
+        if log_it:
+            self._append(key, expires, value)
+
+    def _drop(self, key: str, log_it: bool = True) -> None:
+        e = self._data.pop(key, None)
+        if e is not None:
+            self._bytes -= e[2]
+        self._dirty.discard(key)
+        if log_it:
+            self._append(key, _DELETED, None)
+
+    def _sweep(self) -> None:
+        # протухшие записи всегда в голове LRU; в лог их не пишем — при replay они отсеются по сроку
+        now = time.time()
+        while self._data:
+            key, e = next(iter(self._data.items()))
+            if e[0] > now:
+                break
+            self._drop(key, log_it=False)
+
+    def _evict(self) -> None:
+        while self._data and (len(self._data) > self.max_entries or self._bytes > self.max_bytes):
+            key = next(iter(self._data))
+            self._drop(key)
+
+    def _append(self, key: str, expires: Optional[float], value: Any) -> None:
+        if not self.path:
+            return
+        rec = pickle.dumps((key, expires, value), pickle.HIGHEST_PROTOCOL)
+        with self._lock:
+            self._pending.append((key, expires, rec))
+
+    def _sync(self) -> None:
+        if self._writer is None or not self._pending:
+            return
+        self._writer.submit(self._write)
+        if not self._compacting and self._records + len(self._pending) > max(1000, 4 * len(self._data)):
+            self._compacting = True
+            self._writer.submit(self._compact)
+
+    # --------------- поток лога ---------------
+
+    def _write(self) -> None:
+        with self._lock:
+            batch, self._pending = self._pending, []
+        if not batch or self._log is None:
+            return
+        try:
+            for key, expires, rec in batch:
+                self._log.write(rec)
+                if expires is _DELETED:
+                    self._where.pop(key, None)
+                else:
+                    self._where[key] = (self._size, len(rec), expires)
+                self._size += len(rec)
+            self._records += len(batch)
+            self._log.flush()
+        except Exception:
+            log.exception("state log %s: write failed", self.path)
+
+    def _replay(self) -> None:
+        if not self.path or not os.path.exists(self.path):
+            return
+        with open(self.path, "rb") as f:
+            while True:
+                off = f.tell()
+                try:
+                    key, expires, value = pickle.load(f)
+                except EOFError:
+                    break
+                except Exception as e:
+                    # обрезанный хвост после аварийной остановки — всё до него валидно
+                    log.warning("state log %s: stopped at offset %d: %s", self.path, off, e)
+                    break
+                if expires is _DELETED:
+                    self._drop(key, log_it=False)
+                    self._where.pop(key, None)
+                else:
+                    self._put(key, value, expires, log_it=False)
+                    self._where[key] = (off, f.tell() - off, expires)
+        self._sweep()
+        self._evict()
+
+    def _compact(self) -> None:
+        try:
+            self._write()
+            if self._log is not None:
+                self._log.close()
+                self._log = None
+            now = time.time()
+            live = sorted((w[0], w[1], w[2], k) for k, w in self._where.items() if w[2] > now)
+            where: Dict[str, Tuple[int, int, float]] = {}
+            tmp = f"{self.path}.tmp"
+            with open(tmp, "wb") as out:
+                if live:
+                    with open(self.path, "rb") as src:
+                        for off, n, expires, key in live:
+                            src.seek(off)
+                            where[key] = (out.tell(), n, expires)
+                            out.write(src.read(n))
+                size = out.tell()
+            os.replace(tmp, self.path)
+            self._where, self._size, self._records = where, size, len(where)
+        except Exception:
+            log.exception("state log %s: compaction failed", self.path)
+        finally:
+            if self._log is None:
+                self._log = open(self.path, "ab")
+                self._size = self._log.tell()
+            self._compacting = False
@@ -0,0 +1,310 @@
+"""storage.py
+
+Where the bot's data dict lives on disk.
+
+Two layouts behind one API:
+
+* SingleFile — the whole dict in one JSON file (bot_data.json, the original layout);
+* Sharded — a directory with
+    global.json            users, classes and everything else that is not per class/teacher
+    class/<class_id>.json  the class's assignments, their results and its gradebook
+    teacher/<user_id>.json the teacher's tests, ctf_tasks and homeworks
+    stats/<test_id>.json   item stats of one test (item_stats.py)
+
+Handlers never see shards: read() returns the joined dict and prepare()/write() split it back.
+read() returns a Snapshot, a dict that remembers the digest of every shard it was built from,
+so prepare() emits only the shards whose content actually changed since that load. Two
+handlers working with different classes therefore write different files. A student's CTF
+submission rewrites that class's shard, not the others, and a test submission also rewrites
+that test's stats shard, so it never touches a teacher's file. Each shard has its own lock, and
+writes carry a sequence number so an older save never overwrites a newer one of the same
+shard. Files are replaced atomically (tmp + os.replace), so readers never see a torn file.
+
+Migration: python -m storage migrate [--src bot_data.json] [--dst data]
+Back to one file: python -m storage pack [--src data] [--dst bot_data.json]
+"""
+
+from __future__ import annotations
+
+import argparse
+import hashlib
+import json
+import os
+import re
+import sys
+import threading
+from typing import Any, Dict, Optional, Tuple
+
+# коллекции, которые раскладываются по шардам; всё остальное — в global
+CLASS_KEYS = ("assignments", "results")
+TEACHER_KEYS = ("tests", "ctf_tasks", "homeworks")
+AGGREGATES = ("gradebooks", "item_stats")
+NONE = "_none"  # владелец не известен (битые или старые записи)
+
+
+def _digest(text: str) -> str:
+    return hashlib.blake2b(text.encode("utf-8"), digest_size=16).hexdigest()
+
+
+def _dumps(obj: Any) -> str:
+    return json.dumps(obj, ensure_ascii=False, indent=2)
+
+
+def _safe(key: Any) -> str:
+    return re.sub(r"[^\w-]", "_", str(key)) or NONE
+
+
+class Snapshot(dict):
+    """The data dict as read, plus {shard name: digest} of the files it came from and their total size."""
+
+    digests: Dict[str, str]
+    nbytes: int
+
+
+class _Store:
+    def __init__(self):
+        self._guard = threading.Lock()
+        self._locks: Dict[str, threading.Lock] = {}
+        self._written: Dict[str, int] = {}
+        self._seq = 0
+        # name -> ((inode, mtime_ns, size), digest): текст не держим, иначе он лежал бы в памяти рядом с dict
+        self._cache: Dict[str, Tuple[Tuple[int, int, int], str]] = {}
+
+    # --- раскладка (переопределяется) ---
+
+    def split(self, data: Dict[str, Any]) -> Dict[str, Any]:
+        raise NotImplementedError
+
+    def join(self, parts: Dict[str, Any]) -> Dict[str, Any]:
+        raise NotImplementedError
+
+    def path(self, name: str) -> str:
+        raise NotImplementedError
+
+    def names(self) -> list:
+        raise NotImplementedError
+
+    # --- общее ---
+
+    def lock(self, name: str) -> threading.Lock:
+        with self._guard:
+            lk = self._locks.get(name)
+            if lk is None:
+                lk = self._locks[name] = threading.Lock()
+            return lk
+
+    def _text(self, name: str) -> Tuple[str, str, int]:
+        """(text, digest, size) of one shard; the digest is recomputed only when the file changed."""
+        path = self.path(name)
+        with open(path, "r", encoding="utf-8") as f:
+            st = os.fstat(f.fileno())
+            text = f.read()
+        key = (st.st_ino, st.st_mtime_ns, st.st_size)
+        hit = self._cache.get(name)
+        if hit and hit[0] == key:
+            return text, hit[1], st.st_size
+        digest = _digest(text)
+        self._cache[name] = (key, digest)
+        return text, digest, st.st_size
+
+    def read(self) -> Snapshot:
+        parts, digests, nbytes = {}, {}, 0
+        for name in self.names():
+            try:
+                text, digests[name], size = self._text(name)
+            except FileNotFoundError:
+                continue
+            parts[name] = json.loads(text)
+            nbytes += size
+        snap = Snapshot(self.join(parts))
+        snap.digests = digests
+        snap.nbytes = nbytes
+        return snap
+
+    def prepare(self, data: Dict[str, Any]) -> Tuple[int, Dict[str, Optional[str]]]:
+        """Serialize data and pick the shards to write: {name: text, or None to delete}.
+
+        Call it where data is not being modified (the event loop); pass the result to write().
+        """
+        texts = {n: _dumps(p) for n, p in self.split(data).items()}
+        digests = {n: _digest(t) for n, t in texts.items()}
+        base = getattr(data, "digests", None)
+        if base is None:
+            changed: Dict[str, Optional[str]] = dict(texts)
+        else:
+            changed = {n: t for n, t in texts.items() if base.get(n) != digests[n]}
+            changed.update({n: None for n in base if n not in texts})
+        if isinstance(data, Snapshot):
+            data.digests = digests  # повторный save того же dict запишет только новые изменения
+        with self._guard:
+            self._seq += 1
+            return self._seq, changed
+
+    def write(self, name: str, text: Optional[str], seq: int) -> int:
+        """Write (or delete) one shard. Returns the bytes written."""
+        size = 0
+        with self.lock(name):
+            if self._written.get(name, 0) > seq:
+                return 0  # уже записан более свежий save этого шарда
+            path = self.path(name)
+            if text is None:
+                try:
+                    os.remove(path)
+                except FileNotFoundError:
+                    pass
+            else:
+                os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+                tmp = f"{path}.{threading.get_ident()}.tmp"
+                with open(tmp, "w", encoding="utf-8") as f:
+                    f.write(text)
+                size = os.path.getsize(tmp)
+                os.replace(tmp, path)
+            self._written[name] = seq
+        return size
+
+    def save(self, data: Dict[str, Any]) -> int:
+        """prepare() + write() in the calling thread. Returns the number of files touched."""
+        seq, changed = self.prepare(data)
+        for name, text in changed.items():
+            self.write(name, text, seq)
+        return len(changed)
+
+
+class SingleFile(_Store):
+    def __init__(self, path: str):
+        super().__init__()
+        self.file = path
+
+    def names(self) -> list:
+        return ["data"]
+
+    def path(self, name: str) -> str:
+        return self.file
+
+    def split(self, data: Dict[str, Any]) -> Dict[str, Any]:
+        return {"data": data}
+
+    def join(self, parts: Dict[str, Any]) -> Dict[str, Any]:
+        return parts.get("data") or {}
+
+
+class Sharded(_Store):
+    def __init__(self, root: str):
+        super().__init__()
+        self.root = root
+
+    def names(self) -> list:
+        out = ["global"]
+        for sub in ("class", "teacher", "stats"):
+            try:
+                out += [f"{sub}/{e.name[:-5]}" for e in os.scandir(os.path.join(self.root, sub))
+                        if e.name.endswith(".json")]
+            except FileNotFoundError:
+                pass
+        return out
+
+    def path(self, name: str) -> str:
+        return os.path.join(self.root, name + ".json")
+
+    def split(self, data: Dict[str, Any]) -> Dict[str, Any]:
+        sharded = set(CLASS_KEYS + TEACHER_KEYS + AGGREGATES)
+        parts: Dict[str, Any] = {"global": {k: v for k, v in data.items() if k not in sharded}}
+        # какие коллекции вообще есть: пустая и отсутствующая различаются (отсутствующие агрегаты ensure() достроит)
+        parts["global"]["_sharded"] = [k for k in CLASS_KEYS + TEACHER_KEYS + AGGREGATES if k in data]
+
+        def cls(cid: Any) -> Dict[str, Any]:
+            name = f"class/{_safe(cid or NONE)}"
+            if name not in parts:
+                parts[name] = {"class_id": cid or None, "assignments": {}, "results": {}}
+            return parts[name]
+
+        def tch(tid: Any) -> Dict[str, Any]:
+            name = f"teacher/{_safe(tid or NONE)}"
+            if name not in parts:
+                parts[name] = {"teacher_id": tid or None, "tests": {}, "ctf_tasks": {}, "homeworks": {}}
+            return parts[name]
+
+        for cid in data.get("classes", {}):
+            cls(cid)
+        assignments = data.get("assignments", {})
+        for aid, a in assignments.items():
+            cls(a.get("class_id") if isinstance(a, dict) else None)["assignments"][aid] = a
+        for rid, r in data.get("results", {}).items():
+            a = assignments.get(r.get("assignment_id")) if isinstance(r, dict) else None
+            cls(a.get("class_id") if isinstance(a, dict) else None)["results"][rid] = r
+        for cid, gb in (data.get("gradebooks") or {}).items():
+            cls(cid)["gradebook"] = gb
+        for key in TEACHER_KEYS:
+            for xid, x in data.get(key, {}).items():
+                tch(x.get("teacher_id") if isinstance(x, dict) else None)[key][xid] = x
+        # статистика пишется при каждой сдаче теста: отдельный файл на тест, иначе сдача
+        # переписывала бы файл учителя и могла затереть его правку вопросов
+        for tid, st in (data.get("item_stats") or {}).items():
+            parts[f"stats/{_safe(tid)}"] = {"test_id": tid, "item_stats": st}
+        return parts
+
+    def join(self, parts: Dict[str, Any]) -> Dict[str, Any]:
+        data = dict(parts.get("global") or {})
+        for key in data.pop("_sharded", CLASS_KEYS + TEACHER_KEYS):
+            data[key] = {}
+        for name, p in parts.items():
+            if name.startswith("class/"):
+                for key in CLASS_KEYS:
+                    if key in data:
+                        data[key].update(p.get(key) or {})
+                if "gradebook" in p and "gradebooks" in data:
+                    data["gradebooks"][p["class_id"]] = p["gradebook"]
+            elif name.startswith("teacher/"):
+                for key in TEACHER_KEYS:
+                    if key in data:
+                        data[key].update(p.get(key) or {})
+                if "item_stats" in p and "item_stats" in data:
+                    data["item_stats"].update(p["item_stats"])  # раскладка до stats/: уйдёт при первом save
+            elif name.startswith("stats/"):
+                if "item_stats" in data:
+                    data["item_stats"][p["test_id"]] = p["item_stats"]
+        return data
+
+
+def open_store(data_file: str, data_dir: str = "") -> _Store:
+    return Sharded(data_dir) if data_dir else SingleFile(data_file)
+
+
+def _same(a: Dict[str, Any], b: Dict[str, Any]) -> bool:
+    return json.dumps(a, sort_keys=True, ensure_ascii=False) == json.dumps(b, sort_keys=True, ensure_ascii=False)
+
+
+def main(argv: Optional[list] = None) -> int:
+    ap = argparse.ArgumentParser(description="Convert bot data between one JSON file and the sharded layout.")
+    sub = ap.add_subparsers(dest="cmd", required=True)
+    mg = sub.add_parser("migrate", help="bot_data.json -> sharded directory")
+    mg.add_argument("--src", default="bot_data.json")
+    mg.add_argument("--dst", default="data")
+    mg.add_argument("--force", action="store_true", help="overwrite an existing sharded directory")
+    pk = sub.add_parser("pack", help="sharded directory -> one JSON file")
+    pk.add_argument("--src", default="data")
+    pk.add_argument("--dst", default="bot_data.json")
+    pk.add_argument("--force", action="store_true", help="overwrite an existing file")
+    args = ap.parse_args(argv)
+
+    if args.cmd == "migrate":
+        src, dst = SingleFile(args.src), Sharded(args.dst)
+        if os.path.exists(dst.path("global")) and not args.force:
+            print(f"{args.dst} already holds sharded data (use --force)", file=sys.stderr)
+            return 1
+    else:
+        src, dst = Sharded(args.src), SingleFile(args.dst)
+        if os.path.exists(args.dst) and not args.force:
+            print(f"{args.dst} exists (use --force)", file=sys.stderr)
+            return 1
+    data = dict(src.read())
+    n = dst.save(data)
+    if not _same(dict(dst.read()), data):
+        print("verification failed: data read back differs from the source", file=sys.stderr)
+        return 2
+    print(f"{args.cmd}: {len(data.get('results', {}))} results, {len(data.get('assignments', {}))} assignments -> {n} file(s) in {args.dst}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,68 @@
+from datetime import datetime, timezone
+
+import archive
+from archive import Archive
+
+CUTOFF = datetime(2025, 1, 1, tzinfo=timezone.utc)
+
+
+def _data():
+    return {
+        "assignments": {
+            # дедлайн прошёл до начала семестра — уходит в архив
+            "A_old": {"id": "A_old", "created_at": "2024-10-01T10:00:00+00:00", "due_at": "2024-10-15T10:00:00+00:00"},
+            # user-043: без дедлайна (тест, CTF) задание открыто всегда
+            "A_test": {"id": "A_test", "created_at": "2024-09-10T10:00:00+00:00", "due_at": None},
+            "A_late": {"id": "A_late", "created_at": "2024-11-01T10:00:00+00:00", "due_at": "2025-02-01T10:00:00+00:00"},
+            "A_new": {"id": "A_new", "created_at": "2025-01-10T10:00:00+00:00", "due_at": "2025-01-20T10:00:00+00:00"},
+        },
+        "results": {
+            "R1": {"assignment_id": "A_old", "submitted_at": "2024-10-10T10:00:00+00:00"},
+            "R2": {"assignment_id": "A_test", "submitted_at": "2024-09-11T10:00:00+00:00"},
+            "R3": {"assignment_id": "A_late", "submitted_at": "2024-11-02T10:00:00+00:00"},
+        },
+    }
+
+
+def test_terms():
+    assert archive.term_of(datetime(2024, 9, 1)) == "2024-2025-1"
+    assert archive.term_of(datetime(2025, 8, 31)) == "2024-2025-2"
+    assert archive.term_start(datetime(2025, 3, 5, 12, tzinfo=timezone.utc)) == datetime(2025, 1, 1, tzinfo=timezone.utc)
+
+
+def test_closed():
+    d = _data()
+    a = d["assignments"]
+    assert archive._closed(a["A_old"], [d["results"]["R1"]], CUTOFF)
+    assert not archive._closed(a["A_test"], [d["results"]["R2"]], CUTOFF)
+    assert not archive._closed(a["A_late"], [], CUTOFF)
+    assert not archive._closed(a["A_new"], [], CUTOFF)
+    late = {"submitted_at": "2025-01-05T10:00:00+00:00"}
+    assert not archive._closed(a["A_old"], [late], CUTOFF)
+
+
+def test_archive_moves_only_closed(tmp_path):
+    arc = Archive(str(tmp_path))
+    data = _data()
+    moved = arc.archive(data, CUTOFF)
+    assert {t: [a["id"] for a in v] for t, v in moved.items()} == {"2024-2025-1": ["A_old"]}
+    assert sorted(data["assignments"]) == ["A_late", "A_new", "A_test"]
+    assert sorted(data["results"]) == ["R2", "R3"]
+    assert arc.terms() == ["2024-2025-1"]
+    part = arc.load("2024-2025-1")
+    assert list(part["assignments"]) == ["A_old"] and list(part["results"]) == ["R1"]
+    merged = arc.merged(data, arc.terms())
+    assert "A_old" in merged["assignments"] and "R1" in merged["results"]
+    assert "A_old" not in data["assignments"]
+    # повторный прогон ничего не двигает
+    assert arc.archive(data, CUTOFF) == {}
+
+
+def test_archive_merges_into_existing_segment(tmp_path):
+    arc = Archive(str(tmp_path))
+    arc.archive(_data(), CUTOFF)
+    data = {"assignments": {"A_more": {"id": "A_more", "created_at": "2024-12-01T10:00:00+00:00",
+                                       "due_at": "2024-12-02T10:00:00+00:00"}}, "results": {}}
+    arc.archive(data, CUTOFF)
+    assert sorted(arc.load("2024-2025-1")["assignments"]) == ["A_more", "A_old"]
+    assert arc.manifest()["segments"]["2024-2025-1"]["assignments"] == 2
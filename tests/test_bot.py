@@ -0,0 +1,60 @@
+"""Regressions in simple_bor_v7 that do not need Telegram: the module is imported with a dummy
+token and every data path pointed into a temporary directory."""
+
+import importlib
+import os
+
+import pytest
+
+
+@pytest.fixture(scope="module")
+def sb(tmp_path_factory):
+    tmp = tmp_path_factory.mktemp("bot")
+    env = {"BOT_TOKEN": os.environ.get("BOT_TOKEN") or "123:test", "DATA_FILE": str(tmp / "bot_data.json"),
+           "DATA_DIR": "", "STATE_FILE": str(tmp / "states.pkl"), "ARCHIVE_DIR": str(tmp / "archive"),
+           "METRICS_PORT": "0", "TRACE_FILE": ""}
+    old = {k: os.environ.get(k) for k in env}
+    os.environ.update(env)
+    try:
+        mod = importlib.import_module("simple_bor_v7")
+        yield mod
+        mod.user_states.close()
+    finally:
+        for k, v in old.items():
+            if v is None:
+                os.environ.pop(k, None)
+            else:
+                os.environ[k] = v
+
+
+@pytest.mark.parametrize("sub", ["caesar", "vig", "xor", "b64", "obf"])
+def test_crypto_variants_decrypt_and_carry_no_key_hint(sb, sub):
+    # user-027: у варианта нет своей instruction (auto_hint называет ключ), у каждого — свой флаг
+    flag = sb.gen_flag()
+    plaintext = f"Найдите флаг {flag} в этом тексте."
+    meta = sb.crypto_meta(sub)
+    challenge, _ = sb.encrypt_crypto(sub, plaintext, meta)
+    base = {"expected_plain": flag, "expected_hash": sb.sha(sb.norm(flag)), "meta": meta, "challenge": challenge}
+    variants = sb.build_crypto_variants(sub, plaintext, base, 4)
+    assert len({v["expected_plain"] for v in variants}) == 4
+    for v in variants:
+        assert "instruction" not in v
+        assert v["expected_plain"] in sb.decrypt_crypto(sub, v["challenge"], v["meta"])
+        assert v["expected_hash"] == sb.sha(sb.norm(v["expected_plain"]))
+
+
+def test_variants_are_dealt_round_robin(sb):
+    task = {"variants": [{"n": 0}, {"n": 1}, {"n": 2}]}
+    got = [sb.ctf_variant({}, task, sid) for sid in ("s1", "s2", "s3", "s4")]
+    assert [i for i, _ in got] == [0, 1, 2, 0]
+    assert sb.ctf_variant({}, task, "s2") == (1, {"n": 1})
+    assert sb.ctf_variant({}, {"title": "x"}, "s1") == (None, {"title": "x"})
+
+
+def test_submission_checks_the_variant_that_was_shown(sb):
+    # user-027: параллельный open_task затёр variant_of ученика — проверяем по варианту из состояния
+    task = {"variants": [{"n": 0}, {"n": 1}], "variant_of": {}}
+    assert sb.ctf_shown_variant(task, 1) == {"n": 1}
+    assert task["variant_of"] == {}
+    assert sb.ctf_shown_variant(task, None) is task
+    assert sb.ctf_shown_variant({"title": "x"}, 1) == {"title": "x"}
@@ -0,0 +1,65 @@
+import pytest
+
+import ciphers
+
+PLAIN = "Some text with lapin{r0und_Trip}, digits 123 and an emoji 😀"
+# Виженер, как и старая посимвольная версия, «сдвигает» и кириллицу по базе a/A — обратимо
+# только для латиницы; для смешанного текста требуется лишь, чтобы выжил флаг
+MIXED = "Текст с флагом lapin{r0und_Trip} и ещё немного слов"
+META = {"caesar": {"shift": 7}, "vig": {"key": "secret"}, "xor": {"key": "k3y"}, "b64": {}, "obf": {}}
+
+
+@pytest.mark.parametrize("sub", sorted(META))
+def test_round_trip(sub):
+    challenge, _ = ciphers.encrypt_crypto(sub, PLAIN, META[sub])
+    assert challenge != PLAIN
+    assert ciphers.decrypt_crypto(sub, challenge, META[sub]) == PLAIN
+
+
+@pytest.mark.parametrize("sub", sorted(META))
+def test_flag_survives_mixed_text(sub):
+    challenge, _ = ciphers.encrypt_crypto(sub, MIXED, META[sub])
+    assert "lapin{r0und_Trip}" in ciphers.decrypt_crypto(sub, challenge, META[sub])
+
+
+@pytest.mark.parametrize("sub", sorted(META))
+def test_round_trip_empty(sub):
+    challenge, _ = ciphers.encrypt_crypto(sub, "", META[sub])
+    assert ciphers.decrypt_crypto(sub, challenge, META[sub]) == ""
+
+
+def test_caesar_leaves_non_ascii():
+    assert ciphers.caesar("abc XYZ 9 ёж", 1) == "bcd YZ0 a ёж"
+
+
+def test_vigenere_shifts_only_letters():
+    out = ciphers.vigenere("a-b c", "bc")
+    assert out == "b-d d"
+    assert ciphers.vigenere_decrypt(out, "bc") == "a-b c"
+
+
+def test_encrypt_batch_keeps_order():
+    jobs = [("caesar", f"lapin{{flag_{i:03d}}}", {"shift": i % 20 + 1}) for i in range(ciphers.POOL_MIN_JOBS + 3)]
+    out = ciphers.encrypt_batch(jobs)
+    assert [ciphers.decrypt_crypto(sub, chall, meta) for (sub, _, meta), (chall, _) in zip(jobs, out)] \
+        == [text for _, text, _ in jobs]
+
+
+def test_flag_re():
+    assert ciphers.FLAG_RE.search("x lapin{abc} y").group(0) == "lapin{abc}"
+    assert ciphers.FLAG_RE.search("lapin{ab}") is None
+
+
+@pytest.mark.parametrize("sub", ["caesar", "vig", "xor"])
+def test_public_hint_does_not_name_the_key(sub):
+    # user-027: auto_hint называет ключ, ученику показываем только шаблон
+    _, auto_hint = ciphers.encrypt_crypto(sub, PLAIN, META[sub])
+    hint = ciphers.public_hint(sub, auto_hint)
+    assert hint != auto_hint
+    assert str(next(iter(META[sub].values()))) not in hint
+
+
+@pytest.mark.parametrize("sub", ["obf", "b64"])
+def test_public_hint_keyless(sub):
+    _, auto_hint = ciphers.encrypt_crypto(sub, PLAIN, META[sub])
+    assert ciphers.public_hint(sub, auto_hint) == auto_hint
@@ -0,0 +1,57 @@
+import csv
+import io
+
+import pytest
+
+import export
+
+
+def _data(answer, last_name="Иванов"):
+    return {
+        "assignments": {"A1": {"id": "A1", "class_id": "C1", "title": "ДЗ: шифры", "kind": "homework"}},
+        "users": {"S1": {"profile": {"last_name": last_name, "first_name": "Пётр"}}},
+        "results": {"R1": {"kind": "homework", "assignment_id": "A1", "student_id": "S1",
+                           "answer": answer, "format_ok": True, "submitted_at": "2025-01-10T10:00:00+00:00"}},
+    }
+
+
+def _csv_rows(data):
+    f = export.write_csv(export.iter_rows(data, "C1"))
+    try:
+        return list(csv.reader(io.StringIO(f.read().decode("utf-8-sig"))))
+    finally:
+        f.close()
+
+
+@pytest.mark.parametrize("answer", ["=HYPERLINK(\"http://x\",\"y\")", "+1", "-2+3", "@SUM(A1)", "\tX", "\rX"])
+def test_csv_formula_is_quoted(answer):
+    header, row = _csv_rows(_data(answer))
+    assert row[header.index("answer")] == "'" + answer
+
+
+def test_csv_plain_text_unchanged():
+    header, row = _csv_rows(_data("lapin{ok}"))
+    assert row[header.index("answer")] == "lapin{ok}"
+    assert row[header.index("student_name")] == "Иванов Пётр"
+
+
+def test_control_characters_removed():
+    header, row = _csv_rows(_data("a\x00b\x07c\x1bd", last_name="=Ив\x0bанов"))
+    assert row[header.index("answer")] == "abcd"
+    assert row[header.index("student_name")] == "'=Иванов Пётр"
+
+
+def test_numbers_untouched():
+    assert export.safe_row([-1, 0.5, None, True]) == [-1, 0.5, None, True]
+
+
+def test_xlsx_keeps_text_as_text():
+    openpyxl = pytest.importorskip("openpyxl")
+    f = export.write_xlsx(export.iter_rows(_data("=1+1\x01", last_name="-Петров"), "C1"))
+    try:
+        ws = openpyxl.load_workbook(f).active
+        header, row = [c.value for c in ws[1]], [c.value for c in ws[2]]
+    finally:
+        f.close()
+    assert row[header.index("answer")] == "'=1+1"
+    assert row[header.index("student_name")] == "'-Петров Пётр"
@@ -0,0 +1,52 @@
+import pytest
+
+import paging
+
+
+def _index(n, desc=True):
+    idx = paging.SortedIndex(desc)
+    for i in range(n):
+        idx.add(f"T{i:08d}", i)
+    return idx
+
+
+def test_cb_limit():
+    assert paging.cb("pg", "tests", "n", "T12345678") == "pg:tests:n:T12345678"
+    with pytest.raises(ValueError):
+        paging.cb("pk", "tests", "x" * 64)
+    # лимит в байтах, не в символах
+    with pytest.raises(ValueError):
+        paging.cb("pk", "m", "ж" * 30)
+
+
+def test_parse_round_trip():
+    assert paging.parse(paging.cb("pg", "tests", paging.NEXT, "T1")) == ("pg", "tests", "n", "T1")
+    assert paging.parse(paging.cb("pk", "tests", "a:b")) == ("pk", "tests", None, "a:b")
+    assert paging.parse("other") == ("other", "", None, None)
+
+
+def test_pages_walk_forward_and_back():
+    idx = _index(20)
+    p1 = idx.page(size=8)
+    assert p1.ids == [f"T{i:08d}" for i in range(19, 11, -1)] and p1.prev is None
+    p2 = idx.page(p1.next, paging.NEXT, size=8)
+    p3 = idx.page(p2.next, paging.NEXT, size=8)
+    assert p3.ids == [f"T{i:08d}" for i in range(3, -1, -1)] and p3.next is None
+    assert idx.page(p3.prev, paging.PREV, size=8).ids == p2.ids
+    assert idx.page(p2.prev, paging.CURRENT, size=8).ids == p2.ids
+
+
+def test_page_stays_put_when_items_are_added():
+    idx = _index(10, desc=False)
+    p1 = idx.page(size=4)
+    idx.add("T_new", -1)  # в начало списка
+    assert idx.page(p1.next, paging.NEXT, size=4).ids == [f"T{i:08d}" for i in range(4, 8)]
+
+
+def test_add_moves_and_remove():
+    idx = _index(3, desc=False)
+    idx.add("T00000000", 10)
+    assert idx.ids() == ["T00000001", "T00000002", "T00000000"]
+    idx.remove("T00000001")
+    idx.remove("missing")
+    assert idx.ids() == ["T00000002", "T00000000"] and len(idx) == 2
@@ -0,0 +1,89 @@
+import asyncio
+from types import SimpleNamespace
+
+from router import Router
+
+
+def _router(calls):
+    r = Router(lambda m: m.flow)
+
+    def handler(name):
+        async def fn(message):
+            calls.append(name)
+        fn.__name__ = name
+        return fn
+    return r, handler
+
+
+def _msg(text, flow=None):
+    return SimpleNamespace(text=text, flow=flow)
+
+
+def test_first_registered_wins():
+    calls = []
+    r, h = _router(calls)
+    r.text("Меню")(h("menu"))
+    r.flow("quiz")(h("quiz"))
+    r.text("Ответ")(h("answer"))
+    assert r.resolve(_msg("Меню", "quiz")).__name__ == "menu"
+    assert r.resolve(_msg("Ответ", "quiz")).__name__ == "quiz"
+    assert r.resolve(_msg("другое", "quiz")).__name__ == "quiz"
+    assert r.resolve(_msg("Ответ")).__name__ == "answer"
+
+
+def test_duplicate_registration_keeps_first():
+    calls = []
+    r, h = _router(calls)
+    r.text("A")(h("first"))
+    r.text("A")(h("second"))
+    assert r.resolve(_msg("A")).__name__ == "first"
+
+
+def test_default_and_none():
+    calls = []
+    r, h = _router(calls)
+    assert r.resolve(_msg("x")) is None
+    asyncio.run(r.dispatch(_msg("x")))
+    r.default(h("fallback"))
+    asyncio.run(r.dispatch(_msg("x", "unknown")))
+    assert calls == ["fallback"]
+
+
+def test_timer_observes_once_per_dispatch():
+    calls, seen = [], []
+    r, h = _router(calls)
+    r.text("A")(h("a"))
+    made = []
+
+    class Child:
+        def observe(self, dt):
+            seen.append(dt)
+
+    def timer(name):
+        made.append(name)
+        return Child()
+
+    r.timer = timer
+    for _ in range(3):
+        asyncio.run(r.dispatch(_msg("A")))
+    assert calls == ["a"] * 3
+    assert made == ["a"]  # дочерний таймер кэшируется по имени
+    assert len(seen) == 3 and all(dt >= 0 for dt in seen)
+
+
+def test_wrap_keeps_precedence():
+    calls = []
+    r, h = _router(calls)
+    r.flow("f")(h("flow"))
+    r.text("A")(h("text"))
+
+    def wrapper(fn):
+        async def w(message):
+            calls.append("wrapped")
+            await fn(message)
+        w.__name__ = fn.__name__
+        return w
+
+    r.wrap(wrapper)
+    asyncio.run(r.dispatch(_msg("A", "f")))
+    assert calls == ["wrapped", "flow"]
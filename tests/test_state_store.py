@@ -0,0 +1,142 @@
+import os
+from types import SimpleNamespace
+
+import pytest
+
+import state_store
+from state_store import StateStore
+
+
+class Clock:
+    def __init__(self):
+        self.now = 1_000_000.0
+
+    def time(self):
+        return self.now
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    c = Clock()
+    monkeypatch.setattr(state_store, "time", SimpleNamespace(time=c.time))
+    return c
+
+
+@pytest.fixture
+def path(tmp_path):
+    return str(tmp_path / "states.pkl")
+
+
+def _reopen(store, path, **kw):
+    store.close()
+    return StateStore(path, **kw)
+
+
+def test_ttl_expiry_and_sliding_refresh(clock):
+    s = StateStore(ttl=100)
+    s["a"] = {"step": 1}
+    s["b"] = {"step": 2}
+    clock.now += 60
+    assert s["a"] == {"step": 1}  # чтение продлевает срок
+    clock.now += 60
+    assert "a" in s and "b" not in s
+    with pytest.raises(KeyError):
+        s["b"]
+    assert list(s) == ["a"] and len(s) == 1
+
+
+def test_lru_eviction_by_count(clock):
+    s = StateStore(max_entries=3)
+    for k in "abc":
+        s[k] = k
+    s["a"]
+    s["d"] = "d"
+    assert sorted(s) == ["a", "c", "d"]
+
+
+def test_eviction_by_bytes(clock):
+    s = StateStore(max_bytes=3000)
+    for k in "abcd":
+        s[k] = "x" * 1000
+    assert sorted(s) == ["c", "d"]
+    assert s.stats()["bytes"] <= 3000
+
+
+def test_persists_set_delete_and_in_place_changes(clock, path):
+    s = StateStore(path)
+    s["a"] = {"i": 0}
+    s["b"] = {"i": 0}
+    s["a"]["i"] += 1
+    s.flush()
+    del s["b"]
+    s = _reopen(s, path)
+    assert dict(s.items()) == {"a": {"i": 1}}
+    s.close()
+
+
+def test_flush_key_after_foreign_flush(clock, path):
+    # user-033: чужой flush() забрал ключ из общего dirty до того, как обработчик поменял значение
+    s = StateStore(path)
+    s["u"] = {"i": 0}
+    s.flush()
+    st = s["u"]
+    s.flush()
+    st["i"] += 1
+    s.flush("u")
+    s = _reopen(s, path)
+    assert s["u"] == {"i": 1}
+    s.close()
+
+
+def test_expired_entries_are_not_restored(clock, path):
+    s = StateStore(path, ttl=100)
+    s["a"] = 1
+    s.close()
+    clock.now += 101
+    s = StateStore(path, ttl=100)
+    assert len(s) == 0
+    s.close()
+
+
+def test_read_only_entry_is_relogged_before_it_expires(clock, path):
+    s = StateStore(path, ttl=100)
+    s["a"] = 1
+    s.flush()
+    clock.now += 60
+    assert s["a"] == 1
+    s.flush()  # прошло больше ttl/2 с последней записи — пишем новый срок
+    clock.now += 60
+    s = _reopen(s, path, ttl=100)
+    assert s["a"] == 1
+    s.close()
+
+
+def test_compaction_keeps_only_live_records(clock, path):
+    s = StateStore(path)
+    for i in range(300):
+        s["a"] = {"i": i}
+        s["b"] = {"i": i}
+    del s["b"]
+    s = _reopen(s, path)
+    assert dict(s.items()) == {"a": {"i": 299}}
+    assert s.stats()["log_records"] == 1
+    size = os.path.getsize(path)
+    s["c"] = 1
+    s = _reopen(s, path)
+    assert os.path.getsize(path) > size and sorted(s) == ["a", "c"]
+    s.close()
+
+
+def test_truncated_tail_is_ignored(clock, path):
+    s = StateStore(path)
+    s["a"] = 1
+    s["b"] = 2
+    s.close()
+    with open(path, "r+b") as f:
+        f.truncate(os.path.getsize(path) - 3)
+    s = StateStore(path)
+    assert dict(s.items()) == {"a": 1}
+    s["c"] = 3
+    s = _reopen(s, path)
+    assert dict(s.items()) == {"a": 1, "c": 3}
+    s.close()
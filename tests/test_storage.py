@@ -0,0 +1,104 @@
+import json
+import os
+
+import pytest
+
+import storage
+
+
+def _data():
+    return {
+        "users": {"T1": {"role": "teacher"}, "S1": {"role": "student"}},
+        "classes": {"C1": {"teacher_id": "T1"}, "C2": {"teacher_id": "T1"}},
+        "assignments": {"A1": {"class_id": "C1", "test_id": "X1"}, "A2": {"class_id": "C2"}},
+        "results": {"R1": {"assignment_id": "A1", "score": 3}, "R2": {"assignment_id": "A2"}},
+        "gradebooks": {"C1": {"S1": [5]}},
+        "tests": {"X1": {"teacher_id": "T1", "questions": []}},
+        "ctf_tasks": {},
+        "homeworks": {},
+        "item_stats": {"X1": {"q1": [1, 2]}},
+    }
+
+
+def _files(root):
+    return sorted(os.path.relpath(os.path.join(d, f), root) for d, _, fs in os.walk(root) for f in fs)
+
+
+def test_migrate_and_pack_round_trip(tmp_path):
+    src, shards, back = tmp_path / "bot_data.json", tmp_path / "data", tmp_path / "back.json"
+    src.write_text(json.dumps(_data()), encoding="utf-8")
+    assert storage.main(["migrate", "--src", str(src), "--dst", str(shards)]) == 0
+    assert _files(shards) == ["class/C1.json", "class/C2.json", "global.json", "stats/X1.json", "teacher/T1.json"]
+    assert storage.main(["migrate", "--src", str(src), "--dst", str(shards)]) == 1
+    assert storage.main(["pack", "--src", str(shards), "--dst", str(back)]) == 0
+    assert storage._same(json.loads(back.read_text(encoding="utf-8")), _data())
+    assert storage.main(["pack", "--src", str(shards), "--dst", str(back)]) == 1
+
+
+@pytest.mark.parametrize("sharded", [False, True])
+def test_save_writes_only_changed(tmp_path, sharded):
+    store = storage.Sharded(str(tmp_path / "d")) if sharded else storage.SingleFile(str(tmp_path / "d.json"))
+    assert store.save(_data()) > 0
+    snap = store.read()
+    assert storage._same(dict(snap), _data())
+    assert snap.nbytes > 0
+    assert store.save(snap) == 0
+
+
+def test_test_submission_does_not_touch_teacher_shard(tmp_path):
+    # user-044: статистика теста живёт в stats/<test_id>, сдача не переписывает файл учителя
+    store = storage.Sharded(str(tmp_path))
+    store.save(_data())
+    snap = store.read()
+    snap["results"]["R3"] = {"assignment_id": "A1", "score": 5}
+    snap["item_stats"]["X1"]["q1"].append(5)
+    seq, changed = store.prepare(snap)
+    assert sorted(changed) == ["class/C1", "stats/X1"]
+
+
+def test_old_layout_item_stats_are_read(tmp_path):
+    store = storage.Sharded(str(tmp_path))
+    store.save(_data())
+    os.remove(store.path("stats/X1"))
+    with open(store.path("teacher/T1"), "r+", encoding="utf-8") as f:
+        part = json.load(f)
+        part["item_stats"] = {"X1": {"q1": [9]}}
+        f.seek(0)
+        f.truncate()
+        json.dump(part, f)
+    snap = store.read()
+    assert snap["item_stats"] == {"X1": {"q1": [9]}}
+    # первый save переносит статистику в stats/ и убирает её из файла учителя
+    store.save(snap)
+    with open(store.path("teacher/T1"), encoding="utf-8") as f:
+        assert "item_stats" not in json.load(f)
+    assert store.read()["item_stats"] == {"X1": {"q1": [9]}}
+
+
+def test_deleted_class_shard_is_removed(tmp_path):
+    store = storage.Sharded(str(tmp_path))
+    store.save(_data())
+    snap = store.read()
+    del snap["classes"]["C2"]
+    del snap["assignments"]["A2"]
+    del snap["results"]["R2"]
+    store.save(snap)
+    assert not os.path.exists(store.path("class/C2"))
+
+
+def test_older_write_does_not_overwrite_newer(tmp_path):
+    store = storage.SingleFile(str(tmp_path / "d.json"))
+    store.write("data", "{\"v\": 2}", 2)
+    assert store.write("data", "{\"v\": 1}", 1) == 0
+    assert store.read() == {"v": 2}
+
+
+def test_digest_cache_follows_file_changes(tmp_path):
+    store = storage.SingleFile(str(tmp_path / "d.json"))
+    store.save({"v": 1})
+    first = store.read().digests["data"]
+    assert store.read().digests["data"] == first
+    with open(store.path("data"), "w", encoding="utf-8") as f:
+        json.dump({"v": 22}, f)
+    assert store.read() == {"v": 22}
+    assert store.read().digests["data"] != first
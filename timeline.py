@@ -0,0 +1,138 @@
+"""timeline.py
+
+Per-class assignment timeline for the student task menu.
+
+Each assignment is parsed once (open_at/due_at -> datetime) when it enters the index. A class
+keeps its assignments sorted newest-first and bucketed into upcoming / open / closed; two heaps
+(by open time and by due time) move entries between buckets as the clock passes those points,
+so a menu render touches only the entries whose status actually changed. The task
+menu itself is paged with paging.window() over the sorted order, so a page costs O(page size).
+
+Status boundaries match assignment_window_status(): not yet open while now < open_at,
+closed once now > due_at.
+"""
+
+from __future__ import annotations
+
+import bisect
+import heapq
+from datetime import datetime
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+import paging
+
+UPCOMING = "not_open"
+OPEN = "open"
+CLOSED = "closed"
+
+
+def _parse(s: Optional[str]) -> Optional[datetime]:
+    if not s:
+        return None
+    try:
+        return datetime.fromisoformat(s)
+    except (TypeError, ValueError):
+        return None
+
+
+class Entry:
+    __slots__ = ("aid", "title", "created_at", "open_at", "due_at", "status", "label")
+
+    def __init__(self, a: Dict[str, Any]):
+        self.aid = a["id"]
+        self.title = a.get("title", "")
+        self.created_at = a.get("created_at", "")
+        self.open_at = _parse(a.get("open_at"))
+        self.due_at = _parse(a.get("due_at"))
+        self.status = ""
+        self.label = ""
+
+
+class ClassTimeline:
+    def __init__(self, label: Callable[[str, Optional[datetime], Optional[datetime]], str]):
+        self._label = label
+        self.entries: Dict[str, Entry] = {}
+        self.buckets: Dict[str, set] = {UPCOMING: set(), OPEN: set(), CLOSED: set()}
+        self._order: List[Tuple[str, str]] = []                  # (created_at, aid), по возрастанию
+        self._opening: List[Tuple[datetime, str]] = []           # когда upcoming станет open
+        self._closing: List[Tuple[datetime, str]] = []           # когда open станет closed
+
+    def _set(self, e: Entry, status: str) -> None:
+        if e.status:
+            self.buckets[e.status].discard(e.aid)
+        e.status = status
+        e.label = self._label(status, e.open_at, e.due_at)
+        self.buckets[status].add(e.aid)
+
+    def add(self, a: Dict[str, Any], now: datetime) -> None:
+        if a.get("id") in self.entries:
+            return
+        e = Entry(a)
+        self.entries[e.aid] = e
+        bisect.insort(self._order, (e.created_at, e.aid))
+        if e.open_at and now < e.open_at:
+            self._set(e, UPCOMING)
+            heapq.heappush(self._opening, (e.open_at, e.aid))
+        elif e.due_at and now > e.due_at:
+            self._set(e, CLOSED)
+        else:
+            self._set(e, OPEN)
+            if e.due_at:
+                heapq.heappush(self._closing, (e.due_at, e.aid))
+
+    def advance(self, now: datetime) -> None:
+        while self._opening and self._opening[0][0] <= now:
+            _, aid = heapq.heappop(self._opening)
+            e = self.entries[aid]
+            if e.due_at and now > e.due_at:
+                self._set(e, CLOSED)
+            else:
+                self._set(e, OPEN)
+                if e.due_at:
+                    heapq.heappush(self._closing, (e.due_at, aid))
+        while self._closing and self._closing[0][0] < now:
+            _, aid = heapq.heappop(self._closing)
+            self._set(self.entries[aid], CLOSED)
+
+    def ordered(self) -> List[Entry]:
+        """All entries oldest-first (creation order), e.g. for gradebook columns."""
+        return [self.entries[aid] for _, aid in self._order]
+
+    def page(self, now: datetime, cursor: Optional[str] = None, direction: str = paging.NEXT,
+             size: int = paging.PAGE_SIZE) -> Tuple[List[Entry], paging.Page]:
+        """Newest-first page of entries around a cursor (an assignment id), with current labels."""
+        self.advance(now)
+        e = self.entries.get(cursor or "")
+        pos = bisect.bisect_left(self._order, (e.created_at, e.aid)) if e else None
+        pg = paging.window(self._order, pos, direction, size)
+        return [self.entries[aid] for aid in pg.ids], pg
+
+
+class Timeline:
+    """class_id -> ClassTimeline, built once from data["assignments"] and then fed new assignments."""
+
+    def __init__(self, label: Callable[[str, Optional[datetime], Optional[datetime]], str]):
+        self._label = label
+        self.classes: Dict[str, ClassTimeline] = {}
+        self.built = False
+
+    def build(self, assignments: Dict[str, Any], now: datetime) -> None:
+        for a in assignments.values():
+            self.add(a, now)
+        self.built = True
+
+    def reset(self) -> None:
+        """Forget everything; the next menu render rebuilds from data (after assignments are removed)."""
+        self.classes.clear()
+        self.built = False
+
+    def add(self, a: Dict[str, Any], now: datetime) -> None:
+        if not isinstance(a, dict) or not a.get("class_id") or not a.get("id"):
+            return
+        ct = self.classes.get(a["class_id"])
+        if ct is None:
+            ct = self.classes[a["class_id"]] = ClassTimeline(self._label)
+        ct.add(a, now)
+
+    def get(self, class_id: str) -> Optional[ClassTimeline]:
+        return self.classes.get(class_id)
@@ -0,0 +1,188 @@
+"""tracing.py
+
+Spans for the CTF generation pipeline, written as JSON lines.
+
+    with tracing.span("ctf.crypto", subtype=sub) as root:
+        with tracing.span("attempt", n=1) as sp:
+            ...
+            sp.set(outcome="rejected", reason="flag_once")
+
+The current span lives in a contextvar. A span opened inside another one, in the same task
+or in a task started from it, becomes its child; a span opened outside any trace starts a
+new one. child() is for shared code (the YandexGPT call): it records only inside a trace, so
+generating a test leaves nothing behind. A finished span is appended to the trace file as
+one line: {"trace", "span", "parent", "name", "start", "ms", "attrs"[, "error"]}. Nothing is
+recorded until configure() is given a path; the bot passes TRACE_FILE, and
+ctf_yagpt_unique on its own picks the same variable up from the environment at import.
+
+Summary per kind and subtype: latency, time by step (self time, so steps add up to 100%),
+and retry waste (time in attempts that were rejected):
+
+    python -m tracing summary [traces.jsonl]
+"""
+
+from __future__ import annotations
+
+import argparse
+import json
+import os
+import secrets
+import sys
+import time
+from collections import Counter, defaultdict
+from contextvars import ContextVar
+from typing import Any, Dict, IO, List, Optional
+
+_current: ContextVar[Optional["Span"]] = ContextVar("tracing_span", default=None)
+_out: Optional[IO[str]] = None
+
+
+def configure(path: str) -> None:
+    """Append spans to `path` (an empty path turns tracing off)."""
+    global _out
+    if _out is not None:
+        _out.close()
+    _out = open(path, "a", encoding="utf-8", buffering=1) if path else None
+
+
+class Span:
+    __slots__ = ("name", "trace", "id", "parent", "start", "t0", "attrs", "_token")
+
+    def __init__(self, name: str, parent: Optional["Span"], attrs: Dict[str, Any]):
+        self.name = name
+        self.trace = parent.trace if parent else secrets.token_hex(8)
+        self.id = secrets.token_hex(4)
+        self.parent = parent.id if parent else None
+        self.attrs = attrs
+
+    def set(self, **attrs: Any) -> "Span":
+        self.attrs.update(attrs)
+        return self
+
+    def __enter__(self) -> "Span":
+        self.start, self.t0 = time.time(), time.perf_counter()
+        self._token = _current.set(self)
+        return self
+
+    def __exit__(self, et, ev, tb) -> None:
+        ms = (time.perf_counter() - self.t0) * 1000
+        _current.reset(self._token)
+        rec = {"trace": self.trace, "span": self.id, "parent": self.parent, "name": self.name,
+               "start": round(self.start, 3), "ms": round(ms, 3), "attrs": self.attrs}
+        if ev is not None:
+            rec["error"] = f"{et.__name__}: {ev}"
+        if _out is not None:
+            _out.write(json.dumps(rec, ensure_ascii=False, default=str) + "\n")
+
+
+class _Noop:
+    __slots__ = ()
+
+    def set(self, **attrs: Any) -> "_Noop":
+        return self
+
+    def __enter__(self) -> "_Noop":
+        return self
+
+    def __exit__(self, et, ev, tb) -> None:
+        pass
+
+
+NOOP = _Noop()
+
+
+def span(name: str, **attrs: Any):
+    """Child of the current span, or the root of a new trace."""
+    if _out is None:
+        return NOOP
+    return Span(name, _current.get(), attrs)
+
+
+def child(name: str, **attrs: Any):
+    """Like span(), but a no-op outside a trace."""
+    parent = _current.get()
+    if _out is None or parent is None:
+        return NOOP
+    return Span(name, parent, attrs)
+
+
+# --------------- summary ---------------
+
+def _read(path: str) -> Dict[str, List[Dict[str, Any]]]:
+    traces: Dict[str, List[Dict[str, Any]]] = defaultdict(list)
+    with open(path, "r", encoding="utf-8") as f:
+        for line in f:
+            try:
+                rec = json.loads(line)
+                traces[rec["trace"]].append(rec)
+            except (ValueError, KeyError):
+                continue  # оборванная последняя строка и т.п.
+    return traces
+
+
+def _pct(xs: List[float], q: float) -> float:
+    xs = sorted(xs)
+    return xs[min(len(xs) - 1, int(q * len(xs)))] if xs else 0.0
+
+
+def summarize(path: str) -> str:
+    groups: Dict[tuple, Dict[str, Any]] = {}
+    for spans in _read(path).values():
+        roots = [s for s in spans if s["parent"] is None]
+        if len(roots) != 1:
+            continue  # незавершённая трасса: корень пишется последним
+        root = roots[0]
+        key = (root["name"], str(root["attrs"].get("subtype", "-")))
+        g = groups.setdefault(key, {"ms": [], "outcome": Counter(), "attempts": [], "waste": 0.0,
+                                    "reasons": Counter(), "self": Counter(), "errors": 0})
+        g["ms"].append(root["ms"])
+        g["outcome"][root["attrs"].get("outcome", "error" if "error" in root else "?")] += 1
+        kids: Dict[str, float] = Counter()
+        for s in spans:
+            if s["parent"]:
+                kids[s["parent"]] += s["ms"]
+        attempts = 0
+        for s in spans:
+            g["self"][s["name"]] += max(0.0, s["ms"] - kids.get(s["span"], 0.0))
+            if s["name"] == "attempt":
+                attempts += 1
+                if s["attrs"].get("outcome") != "ok":
+                    g["waste"] += s["ms"]
+                    g["reasons"][s["attrs"].get("reason") or ("error" if "error" in s else "?")] += 1
+            g["errors"] += "error" in s
+        g["attempts"].append(attempts)
+
+    out: List[str] = []
+    for (name, sub), g in sorted(groups.items()):
+        n, total = len(g["ms"]), sum(g["ms"]) or 1.0
+        outcomes = ", ".join(f"{k} {v}" for k, v in g["outcome"].most_common())
+        out.append(f"{name} [{sub}]: {n} jobs ({outcomes}), p50 {_pct(g['ms'], 0.5):.0f} ms, "
+                   f"p90 {_pct(g['ms'], 0.9):.0f} ms, attempts/job {sum(g['attempts']) / n:.2f}")
+        reasons = ", ".join(f"{k} {v}" for k, v in g["reasons"].most_common()) or "none"
+        out.append(f"  retry waste: {g['waste'] / n:.0f} ms/job ({g['waste'] / total:.0%} of job time); rejected: {reasons}")
+        out.append("  time by step (self time):")
+        for step, ms in g["self"].most_common():
+            out.append(f"    {step:<20}{ms / n:>10.1f} ms/job{ms / total:>8.1%}")
+        if g["errors"]:
+            out.append(f"  spans with exceptions: {g['errors']}")
+        out.append("")
+    return "\n".join(out) if out else "no complete traces"
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    ap = argparse.ArgumentParser(description="Summarize CTF generation traces (JSON lines).")
+    sub = ap.add_subparsers(dest="cmd", required=True)
+    sm = sub.add_parser("summary", help="latency breakdown and retry waste per kind/subtype")
+    sm.add_argument("file", nargs="?", default=os.getenv("TRACE_FILE") or "traces.jsonl")
+    args = ap.parse_args(argv)
+    if not os.path.exists(args.file):
+        print(f"{args.file} not found", file=sys.stderr)
+        return 1
+    print(summarize(args.file))
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
+else:
+    configure(os.getenv("TRACE_FILE", ""))  # для ctf_yagpt_unique без бота; бот передаёт свой TRACE_FILE
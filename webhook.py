@@ -0,0 +1,139 @@
+"""webhook.py
+
+Webhook ingestion for the bot (polling stays available as a fallback).
+
+An aiohttp app receives Telegram updates on POST <path>, checks the
+X-Telegram-Bot-Api-Secret-Token header (always: without a configured secret
+run_webhook generates one and registers it with set_webhook), puts the raw update on an internal
+asyncio queue and answers 200 right away. A consumer task on the same event
+loop drains the queue in batches and awaits bot.process_new_updates()
+(bot is an AsyncTeleBot).
+
+Local testing without Telegram — POST recorded updates (one JSON update per line):
+
+    python webhook.py replay updates.jsonl --url http://127.0.0.1:8080/webhook --secret s3cr3t
+"""
+
+from __future__ import annotations
+
+import argparse
+import asyncio
+import hmac
+import json
+import secrets
+import time
+from typing import Any, Dict, List, Optional, Set
+
+import aiohttp
+from aiohttp import web
+
+SECRET_HEADER = "X-Telegram-Bot-Api-Secret-Token"
+BATCH = 100
+
+
+def make_app(secret: str, updates: "asyncio.Queue[Dict[str, Any]]", path: str = "/webhook") -> web.Application:
+    if not secret:
+        # без секрета любой, кто достучится до порта, подделает апдейт от имени учителя
+        raise ValueError("webhook secret is required")
+
+    async def receive(request: web.Request) -> web.Response:
+        if not hmac.compare_digest(request.headers.get(SECRET_HEADER, ""), secret):
+            return web.Response(status=401)
+        try:
+            upd = await request.json(loads=json.loads)
+        except ValueError:
+            return web.Response(status=400)
+        if not isinstance(upd, dict) or "update_id" not in upd:
+            return web.Response(status=400)
+        updates.put_nowait(upd)
+        return web.Response(status=200)
+
+    app = web.Application()
+    app.router.add_post(path, receive)
+    return app
+
+
+def start_consumer(bot, updates: "asyncio.Queue[Dict[str, Any]]") -> "asyncio.Task[None]":
+    """Task that feeds queued raw updates into bot.process_new_updates in batches."""
+    from telebot import types
+
+    async def run() -> None:
+        running: Set["asyncio.Task[None]"] = set()
+        while True:
+            batch: List[Dict[str, Any]] = [await updates.get()]
+            while len(batch) < BATCH:
+                try:
+                    batch.append(updates.get_nowait())
+                except asyncio.QueueEmpty:
+                    break
+            # как и infinity_polling: пачка обрабатывается отдельной задачей, приём следующей не ждёт
+            task = asyncio.ensure_future(bot.process_new_updates([types.Update.de_json(u) for u in batch]))
+            running.add(task)
+            task.add_done_callback(running.discard)
+
+    return asyncio.get_running_loop().create_task(run(), name="webhook-consumer")
+
+
+async def run_webhook(bot, url: str, secret: str, host: str = "0.0.0.0", port: int = 8080, path: str = "/webhook") -> None:
+    """Register the webhook with Telegram and serve it until cancelled.
+
+    An empty secret is replaced by a random one for this run (set_webhook registers it anew).
+    """
+    secret = secret or secrets.token_urlsafe(32)
+    updates: "asyncio.Queue[Dict[str, Any]]" = asyncio.Queue()
+    consumer = start_consumer(bot, updates)
+    runner = web.AppRunner(make_app(secret, updates, path))
+    await runner.setup()
+    await web.TCPSite(runner, host, port).start()
+    # pending-апдейты не сбрасываем: после рестарта Telegram дошлёт всё, что накопилось
+    await bot.set_webhook(url=url.rstrip("/") + path, secret_token=secret, drop_pending_updates=False)
+    try:
+        await asyncio.Event().wait()
+    finally:
+        consumer.cancel()
+        await runner.cleanup()
+
+
+# --------------- replay ---------------
+
+async def replay(lines: List[str], url: str, secret: str, concurrency: int = 20) -> Dict[str, Any]:
+    """POST recorded updates to a webhook. Returns counts by HTTP status and ack latencies."""
+    sem = asyncio.Semaphore(concurrency)
+    statuses: Dict[int, int] = {}
+    lat: List[float] = []
+    headers = {SECRET_HEADER: secret} if secret else {}
+
+    async def post(session: aiohttp.ClientSession, body: str) -> None:
+        async with sem:
+            t0 = time.perf_counter()
+            async with session.post(url, data=body, headers={**headers, "Content-Type": "application/json"}) as r:
+                await r.read()
+                statuses[r.status] = statuses.get(r.status, 0) + 1
+            lat.append(time.perf_counter() - t0)
+
+    async with aiohttp.ClientSession() as session:
+        await asyncio.gather(*(post(session, ln) for ln in lines if ln.strip()))
+    return {"statuses": statuses, "latencies": lat}
+
+
+def main(argv: Optional[List[str]] = None) -> None:
+    ap = argparse.ArgumentParser(description="Webhook tools")
+    sub = ap.add_subparsers(dest="cmd", required=True)
+    rp = sub.add_parser("replay", help="POST recorded update JSON lines to a webhook")
+    rp.add_argument("file")
+    rp.add_argument("--url", default="http://127.0.0.1:8080/webhook")
+    rp.add_argument("--secret", default="")
+    rp.add_argument("--concurrency", type=int, default=20)
+    args = ap.parse_args(argv)
+
+    with open(args.file, "r", encoding="utf-8") as f:
+        lines = f.readlines()
+    t0 = time.perf_counter()
+    res = asyncio.run(replay(lines, args.url, args.secret, args.concurrency))
+    dt = time.perf_counter() - t0
+    n = sum(res["statuses"].values())
+    print(f"sent {n} updates in {dt:.2f}s ({n / dt if dt else 0:.0f}/s), statuses: {res['statuses']}")
+
+
+if __name__ == "__main__":
+    main()